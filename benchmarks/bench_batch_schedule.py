@@ -0,0 +1,47 @@
+"""
+Compares the makespan of a skewed batch, many small repositories and one large
+one listed last, when run in list order, longest first, and longest first
+with the large history split into shards.
+
+Run with `python -m benchmarks.bench_batch_schedule [small repos] [large commits] [workers]`
+"""
+
+import sys
+
+from trufflehog_api import SearchConfig, batch_execute_find_secrets_request
+from trufflehog_api.find_secrets import FindSecretsRequest
+from trufflehog_api.scheduler import BatchScheduler
+
+from benchmarks.common import make_synthetic_repo, remove_repo, report, timed
+
+
+def main(small_repos=12, large_commits=3000, workers=4):
+    small_repos, large_commits, workers = int(small_repos), int(large_commits), int(workers)
+    small_commits = max(large_commits // 20, 1)
+    repos = [make_synthetic_repo(commits=small_commits, seed=seed)
+             for seed in range(small_repos)]
+    repos.append(make_synthetic_repo(commits=large_commits, seed=small_repos))
+    try:
+        config = SearchConfig(regexes=SearchConfig.default_regexes())
+        requests = [FindSecretsRequest(repo_path, search_config=config) for repo_path in repos]
+        schedules = (("list order", None),
+                     ("longest first", BatchScheduler()),
+                     ("longest first, sharded", BatchScheduler(shard_commits=small_commits)))
+        rows = []
+        baseline = None
+        for label, scheduler in schedules:
+            seconds, futures = timed(batch_execute_find_secrets_request, requests,
+                                     concurrency_level=workers, scheduler=scheduler)
+            secrets = sum(len(future.result()) for future in futures)
+            baseline = baseline or seconds
+            rows.append((label, "{0:6.2f}s makespan  {1:4.2f}x  {2} secrets"
+                         .format(seconds, baseline / seconds, secrets)))
+        report("Skewed batch, {0} x {1} commits + 1 x {2} commits, {3} workers"
+               .format(small_repos, small_commits, large_commits, workers), rows)
+    finally:
+        for repo_path in repos:
+            remove_repo(repo_path)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,90 @@
+"""
+Compares fixed concurrency levels with an AdaptiveConcurrency on a mixed batch:
+repositories with long histories searched in place next to small ones cloned
+from file:// URLs, so that CPU bound searches and clone bound ones alternate.
+Reports the makespan, the peak resident set size of the process and its git
+subprocesses, and for the adaptive run the limits it moved through.
+
+Run with `python -m benchmarks.bench_concurrency [large repos] [small repos] [max workers]`
+"""
+
+import os
+import sys
+import threading
+
+from trufflehog_api import SearchConfig, batch_execute_find_secrets_request
+from trufflehog_api.concurrency import AdaptiveConcurrency
+from trufflehog_api.find_secrets import FindSecretsRequest
+from trufflehog_api.memory import current_rss
+
+from benchmarks.common import make_synthetic_repo, remove_repo, report, timed
+
+
+class PeakRss:
+    """Polls the resident set size of the process and its children in a thread"""
+
+    def __init__(self, interval=0.05):
+        self.peak = 0
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _poll(self):
+        while not self._stop.wait(self._interval):
+            self.peak = max(self.peak, current_rss(include_children=True) or 0)
+
+
+def run(requests, **options):
+    with PeakRss() as rss:
+        futures = batch_execute_find_secrets_request(requests, **options)
+    return sum(len(future.result()) for future in futures), rss.peak
+
+
+def main(large_repos=4, small_repos=16, max_workers=None):
+    large_repos, small_repos = int(large_repos), int(small_repos)
+    max_workers = int(max_workers) if max_workers else 2 * (os.cpu_count() or 1)
+    repos = [make_synthetic_repo(commits=1500, seed=seed) for seed in range(large_repos)]
+    repos.extend(make_synthetic_repo(commits=100, seed=large_repos + seed)
+                 for seed in range(small_repos))
+    try:
+        config = SearchConfig(regexes=SearchConfig.default_regexes())
+        requests = []
+        for number, repo_path in enumerate(repos):
+            path = repo_path if number < large_repos else "file://" + repo_path
+            requests.append(FindSecretsRequest(path, search_config=config))
+        # Interleave the CPU bound and the clone bound requests
+        requests = requests[large_repos:] + requests[:large_repos]
+        requests = [request for pair in zip(requests[::2], requests[1::2]) for request in pair]
+
+        rows = []
+        levels = sorted({1, 2, max(max_workers // 2, 1), max_workers})
+        for level in levels:
+            seconds, (secrets, peak) = timed(run, requests, concurrency_level=level)
+            rows.append(("fixed {0}".format(level), "{0:6.2f}s  peak rss {1:6.1f} MB  {2} secrets"
+                         .format(seconds, peak / 1024 / 1024, secrets)))
+        controller = AdaptiveConcurrency(max_workers=max_workers, sample_interval=0.25)
+        seconds, (secrets, peak) = timed(run, requests, concurrency_level=max_workers,
+                                         adaptive_concurrency=controller)
+        limits = [decision.limit for decision in controller.decisions]
+        rows.append(("adaptive 1..{0}".format(max_workers),
+                     "{0:6.2f}s  peak rss {1:6.1f} MB  {2} secrets  limits {3}..{4}, {5} changes"
+                     .format(seconds, peak / 1024 / 1024, secrets, min(limits, default=0),
+                             max(limits, default=0),
+                             sum(decision.action != "hold" for decision in controller.decisions))))
+        report("Mixed batch, {0} x 1500 commits in place + {1} x 100 commits cloned, {2} CPUs"
+               .format(large_repos, small_repos, os.cpu_count()), rows)
+    finally:
+        for repo_path in repos:
+            remove_repo(repo_path)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
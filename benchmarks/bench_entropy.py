@@ -0,0 +1,87 @@
+"""
+Compares the entropy check of truffleHog.find_entropy, which splits every line of a
+diff into words, with the Scanner's, which first skips the lines without a long
+enough base64 or hex run, on hunks of ordinary source code (the standard library's
+own modules) with a few keys mixed in.
+
+Run with `python -m benchmarks.bench_entropy [hunks]`
+"""
+
+import inspect
+import json
+import sys
+
+from trufflehog_api import SearchConfig
+from trufflehog_api.git_log import CommitInfo, DiffHunk
+from trufflehog_api.scanner import Scanner
+
+from benchmarks.common import report, timed
+
+_KEY_LINE = "+    secret = 'kX9pL2qR7mN4vB8cZ1wE5tY3uI6oA0sD'"
+
+
+def make_source_hunks(count=2000, lines_per_hunk=40):
+    """
+    :return: count DiffHunk records adding lines of standard library modules, every
+    tenth with a high entropy key
+    """
+    lines = []
+    for module in (json.decoder, json.encoder, inspect):
+        lines.extend(inspect.getsource(module).splitlines())
+    commit = CommitInfo("0" * 40, 1500000000, "bench", "master")
+    hunks = []
+    for number in range(count):
+        start = (number * lines_per_hunk) % max(len(lines) - lines_per_hunk, 1)
+        hunk_lines = ["@@ -0,0 +1,{0} @@".format(lines_per_hunk)]
+        hunk_lines.extend("+" + line for line in lines[start:start + lines_per_hunk])
+        if number % 10 == 0:
+            hunk_lines.append(_KEY_LINE)
+        hunks.append(DiffHunk(commit, "src/module.py", ("\n".join(hunk_lines) + "\n").encode()))
+    return hunks
+
+
+def find_entropy_unfiltered(hunks):
+    """truffleHog's word by word entropy check over every line, for reference
+
+    :return: number of hunks with findings
+    """
+    from truffleHog import truffleHog
+    found = 0
+    for hunk in hunks:
+        strings = []
+        for word in hunk.hunk.decode("utf-8", errors="replace").split():
+            for string in truffleHog.get_strings_of_set(word, truffleHog.BASE64_CHARS):
+                if truffleHog.shannon_entropy(string, truffleHog.BASE64_CHARS) > 4.5:
+                    strings.append(string)
+            for string in truffleHog.get_strings_of_set(word, truffleHog.HEX_CHARS):
+                if truffleHog.shannon_entropy(string, truffleHog.HEX_CHARS) > 3:
+                    strings.append(string)
+        found += bool(strings)
+    return found
+
+
+def scan(hunks, config):
+    """:return: number of hunks with findings"""
+    scanner = Scanner(config)
+    return sum(bool(scanner.scan_hunk(hunk)) for hunk in hunks)
+
+
+def main(hunks=2000):
+    source_hunks = make_source_hunks(int(hunks))
+    size = sum(len(hunk.hunk) for hunk in source_hunks) / 1024 / 1024
+    rows = []
+    seconds, found = timed(find_entropy_unfiltered, source_hunks, repeat=3)
+    rows.append(("word by word (truffleHog)",
+                 "{0:7.1f} MB/s  {1:6.3f}s  {2} hunks found".format(size / seconds, seconds, found)))
+    for label, config in (
+            ("run-length prefilter", SearchConfig()),
+            ("prefilter, added lines", SearchConfig(added_lines_only=True)),
+            ("prefilter, min length 32", SearchConfig(entropy_min_length=32))):
+        seconds, found = timed(scan, source_hunks, config, repeat=3)
+        rows.append((label, "{0:7.1f} MB/s  {1:6.3f}s  {2} hunks found"
+                     .format(size / seconds, seconds, found)))
+    report("Entropy check, {0} hunks of source code ({1:.1f} MB)".format(hunks, size), rows)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
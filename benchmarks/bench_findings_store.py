@@ -0,0 +1,78 @@
+"""
+Compares ingesting findings into SQLite one committed row at a time, as a
+client piping Secret.to_dict() into its own table would, with the batched
+transactions of FindingsStore, and times the "new since the previous scan"
+query between two scans of the same findings with a few percent changed.
+
+Run with `python -m benchmarks.bench_findings_store [findings]`
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+
+from trufflehog_api.findings_store import FindingsStore
+from trufflehog_api.secret import Secret
+
+from benchmarks.common import remove_repo, report, timed
+
+
+def make_secrets(count, changed_every=0, offset=0):
+    """:return: count secrets over 100 repositories, every changed_every one different"""
+    secrets = []
+    for number in range(count):
+        key = number + offset if changed_every and number % changed_every == 0 else number
+        secrets.append(("repo{0}".format(number % 100), Secret(
+            commit_time="2020-09-13 12:26:40", branch_name="master", commit="commit\n",
+            diff="+aws_key = AKIA{0:016d}\n".format(key), commit_hash="{0:040x}".format(number),
+            reason="AWS API Key", path="src/file_{0}.py".format(number % 50),
+            strings_found=["AKIA{0:016d}".format(key)])))
+    return secrets
+
+
+def insert_row_by_row(path, secrets):
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE IF NOT EXISTS findings (repo TEXT, secret TEXT)")
+    for repo, secret in secrets:
+        with connection:
+            connection.execute("INSERT INTO findings VALUES (?, ?)",
+                               (repo, json.dumps(secret.to_dict(), default=str)))
+    connection.close()
+
+
+def insert_batched(path, secrets):
+    with FindingsStore(path) as store:
+        scan = store.begin_scan()
+        for repo, secret in secrets:
+            store.add(scan, repo, secret)
+        store.finish_scan(scan)
+    return scan
+
+
+def main(findings=20000):
+    findings = int(findings)
+    work_dir = tempfile.mkdtemp(prefix="trufflehog-bench-")
+    try:
+        old = make_secrets(findings)
+        new = make_secrets(findings, changed_every=50, offset=10 ** 9)
+        row_seconds, _ = timed(insert_row_by_row, os.path.join(work_dir, "rows.db"), old[:2000])
+        store_path = os.path.join(work_dir, "findings.db")
+        batch_seconds, _ = timed(insert_batched, store_path, old)
+        insert_batched(store_path, new)
+        with FindingsStore(store_path) as store:
+            first, second = [scan["id"] for scan in store.scans()][-2:]
+            diff_seconds, introduced = timed(lambda: list(store.introduced(first, second)))
+        rows = [("row by row commits", "{0:9.0f} findings/s"
+                 .format(2000 / row_seconds)),
+                ("FindingsStore batches", "{0:9.0f} findings/s".format(findings / batch_seconds)),
+                ("introduced since previous", "{0:9.3f}s  {1} findings"
+                 .format(diff_seconds, len(introduced)))]
+        report("Findings store, {0} findings per scan".format(findings), rows)
+    finally:
+        remove_repo(work_dir)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
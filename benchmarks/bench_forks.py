@@ -0,0 +1,88 @@
+"""
+Compares a batch of forks of one repository cloned and searched separately
+with a batch given a ForkStore, which fetches them into one shared object
+store and diffs every commit of their common history once. Every fork adds a
+few commits of its own on top of the upstream history. Reports the makespan,
+the commits diffed and the disk space of the repositories searched or of the
+fork store.
+
+Run with `python -m benchmarks.bench_forks [forks] [upstream commits]`
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+from trufflehog_api import SearchConfig, batch_execute_find_secrets_request
+from trufflehog_api import git_log
+from trufflehog_api.find_secrets import FindSecretsRequest
+from trufflehog_api.forks import ForkStore
+
+from benchmarks.common import _git, make_synthetic_repo, remove_repo, report, timed
+
+
+def make_fork(upstream, number, commits=5):
+    """:return: a clone of upstream with commits fork only commits on master"""
+    fork = tempfile.mkdtemp(prefix="trufflehog-bench-fork-")
+    _git(fork, "clone", "-q", upstream, ".")
+    _git(fork, "remote", "remove", "origin")
+    for commit in range(commits):
+        with open(os.path.join(fork, "fork.py"), "a") as fork_file:
+            fork_file.write("fork_{0} = {1}\n".format(number, commit))
+        _git(fork, "add", "-A")
+        _git(fork, "-c", "user.name=Bench", "-c", "user.email=bench@example.com",
+             "commit", "-q", "-m", "fork {0} commit {1}".format(number, commit))
+    return fork
+
+
+def disk_usage(path):
+    return int(subprocess.run(["du", "-sk", path], stdout=subprocess.PIPE, check=True)
+               .stdout.split()[0]) * 1024
+
+
+def history(repo_path):
+    """:return: the commits of every branch of a repository"""
+    return set(git_log.walk_commits(repo_path, git_log.list_branches(repo_path)))
+
+
+def main(forks=8, commits=2000):
+    forks, commits = int(forks), int(commits)
+    upstream = make_synthetic_repo(commits=commits)
+    fork_paths = [make_fork(upstream, number) for number in range(forks)]
+    store_dir = tempfile.mkdtemp(prefix="trufflehog-bench-store-")
+    try:
+        config = SearchConfig(regexes=SearchConfig.default_regexes())
+        requests = [FindSecretsRequest("file://" + path, search_config=config)
+                    for path in [upstream] + fork_paths]
+
+        def separately():
+            futures = batch_execute_find_secrets_request(requests, concurrency_level=4)
+            return sum(len(future.result()) for future in futures)
+
+        def shared():
+            futures = batch_execute_find_secrets_request(requests, concurrency_level=4,
+                                                         fork_store=ForkStore(store_dir))
+            return sum(len(future.result()) for future in futures)
+
+        histories = [history(path) for path in [upstream] + fork_paths]
+        separate_diffed = sum(len(commits) for commits in histories)
+        shared_diffed = len(set().union(*histories))
+        separate_seconds, separate_secrets = timed(separately)
+        clone_bytes = sum(disk_usage(path) for path in fork_paths + [upstream])
+        shared_seconds, shared_secrets = timed(shared)
+        rows = [("separate clones", "{0:6.2f}s  {1:6d} commits diffed  {2:7.1f} MB  {3} secrets"
+                 .format(separate_seconds, separate_diffed, clone_bytes / 1024 / 1024,
+                         separate_secrets)),
+                ("shared fork store", "{0:6.2f}s  {1:6d} commits diffed  {2:7.1f} MB  {3} secrets"
+                 .format(shared_seconds, shared_diffed, disk_usage(store_dir) / 1024 / 1024,
+                         shared_secrets))]
+        report("Upstream of {0} commits and {1} forks of 5 more commits each"
+               .format(commits, forks), rows)
+    finally:
+        for path in [upstream, store_dir] + fork_paths:
+            remove_repo(path)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,65 @@
+"""
+Measures the cost of ``import trufflehog_api`` with ``python -X importtime`` in
+fresh interpreters and fails when it exceeds a budget, so that eager imports of
+GitPython, truffleHog or the regex tables do not creep back in.
+
+Run with `python -m benchmarks.bench_import_time [budget_ms] [runs]`
+"""
+
+import os
+import subprocess
+import sys
+
+from benchmarks.common import report
+
+# Modules that must only be imported once they are needed
+DEFERRED_MODULES = ("git", "truffleHog", "truffleHogRegexes", "concurrent.futures",
+                    "tempfile", "argparse", "http.server", "sqlite3")
+
+DEFAULT_BUDGET_MS = 120.0
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module="trufflehog_api"):
+    """Imports module in a fresh interpreter and returns (cumulative microseconds per
+    imported module, set of modules loaded afterwards)
+    """
+    code = "import sys, {0}; print(' '.join(sys.modules))".format(module)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=_ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    times = dict()
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times, set(result.stdout.decode().split())
+
+
+def main(budget_ms=DEFAULT_BUDGET_MS, runs=5):
+    samples = []
+    loaded = set()
+    times = dict()
+    for _ in range(int(runs)):
+        times, loaded = import_times()
+        samples.append(times["trufflehog_api"] / 1000)
+    best = min(samples)
+    eager = sorted(module for module in DEFERRED_MODULES if module in loaded)
+
+    slowest = sorted((name for name in times if name.startswith("trufflehog_api.")),
+                     key=times.get, reverse=True)[:5]
+    rows = [("import trufflehog_api", "{0:7.1f} ms best of {1}, budget {2:.0f} ms"
+             .format(best, len(samples), budget_ms)),
+            ("deferred modules loaded", ", ".join(eager) or "none")]
+    rows += [(name, "{0:7.1f} ms".format(times[name] / 1000)) for name in slowest]
+    report("Import time", rows)
+
+    if eager or best > budget_ms:
+        print("FAILED: import time regression")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(*[float(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,67 @@
+"""
+Compares the cost of counting from many threads with a counter guarded by a
+single lock, as a naive registry would, and with the per thread cells of
+trufflehog_api.metrics, and times rendering the standard ScanMetrics.
+
+Run with `python -m benchmarks.bench_metrics [updates per thread] [max threads]`
+"""
+
+import sys
+import threading
+
+from trufflehog_api.metrics import MetricsRegistry, ScanMetrics
+
+from benchmarks.common import report, timed
+
+
+class LockedCounter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+def run_threads(counter, threads, updates):
+    def work():
+        for _ in range(updates):
+            counter.inc()
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def main(updates=200000, max_threads=8):
+    updates, max_threads = int(updates), int(max_threads)
+    rows = []
+    threads = 1
+    while threads <= max_threads:
+        locked_seconds, _ = timed(run_threads, LockedCounter(), threads, updates)
+        registry = MetricsRegistry()
+        cells_seconds, _ = timed(run_threads, registry.counter("updates_total", "Updates"),
+                                 threads, updates)
+        total = threads * updates
+        rows.append(("{0} threads".format(threads),
+                     "locked {0:6.0f} ns/update   per thread cells {1:6.0f} ns/update"
+                     .format(locked_seconds / total * 1e9, cells_seconds / total * 1e9)))
+        threads *= 2
+    registry = MetricsRegistry()
+    scan = ScanMetrics(registry)
+    for reason in ("AWS API Key", "Generic Secret", "High Entropy"):
+        scan.findings.labels(reason).inc()
+    for seconds in (0.02, 0.3, 4.0):
+        scan.scan_seconds.observe(seconds)
+        scan.clone_seconds.observe(seconds)
+    render_seconds, text = timed(registry.render, repeat=20)
+    rows.append(("render ScanMetrics", "{0:6.3f} ms  {1} lines".format(
+        render_seconds * 1e3, len(text.splitlines()))))
+    report("Counter updates, {0} per thread".format(updates), rows)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,61 @@
+"""
+Compares the regex engines on SearchConfig.default_regexes() over a large
+generated corpus of source like lines.
+
+Run with `python -m benchmarks.bench_regex_backends [megabytes]`
+"""
+
+import random
+import sys
+import warnings
+
+from trufflehog_api import SearchConfig
+from trufflehog_api.regex_engine import ENGINES
+from trufflehog_api.regex_profile import validate_regexes
+
+from benchmarks.common import AWS_KEY, WORDS, report, timed
+
+
+def make_corpus(megabytes, seed=0):
+    """Generates hunk sized texts adding up to roughly megabytes of data"""
+    rng = random.Random(seed)
+    hunks = []
+    size = 0
+    while size < megabytes * 1024 * 1024:
+        lines = ["+" + " ".join(rng.choice(WORDS) for _ in range(10)) for _ in range(40)]
+        if rng.random() < 0.01:
+            lines.append('+aws_key = "{0}"'.format(AWS_KEY))
+        hunk = "\n".join(lines)
+        hunks.append(hunk)
+        size += len(hunk)
+    return hunks, size
+
+
+def search_all(regexes, hunks):
+    hits = 0
+    for hunk in hunks:
+        for compiled in regexes.values():
+            if compiled.pattern.search(hunk):
+                hits += 1
+    return hits
+
+
+def main(megabytes=20):
+    hunks, size = make_corpus(megabytes)
+    rows = []
+    for name, engine in ENGINES.items():
+        if not engine.available():
+            rows.append((name, "not installed"))
+            continue
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            regexes = validate_regexes(SearchConfig.default_regexes(), name)
+        fallbacks = sum(1 for compiled in regexes.values() if compiled.engine.name != name)
+        seconds, hits = timed(search_all, regexes, hunks, repeat=3)
+        rows.append((name, "{0:8.1f} MB/s  {1:6.2f}s  {2} hits  {3} fallbacks to re"
+                     .format(size / seconds / 1024 / 1024, seconds, hits, fallbacks)))
+    report("Regex backends, default regexes over {0:.1f} MB".format(size / 1024 / 1024), rows)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,35 @@
+"""
+Compares commits scanned per second by the git_log and truffleHog backends,
+and by the git_log backend searching only the lines commits add.
+
+Run with `python -m benchmarks.bench_scan_backends [commits]`
+"""
+
+import sys
+
+from trufflehog_api import SearchConfig, find_secrets
+from trufflehog_api.search_config import GIT_LOG_BACKEND, TRUFFLEHOG_BACKEND
+
+from benchmarks.common import make_synthetic_repo, remove_repo, report, timed
+
+
+def main(commits=1000):
+    repo_path = make_synthetic_repo(commits=commits)
+    try:
+        rows = []
+        for label, backend, added_lines_only in (
+                (TRUFFLEHOG_BACKEND, TRUFFLEHOG_BACKEND, False),
+                (GIT_LOG_BACKEND, GIT_LOG_BACKEND, False),
+                (GIT_LOG_BACKEND + ", added lines", GIT_LOG_BACKEND, True)):
+            config = SearchConfig(regexes=SearchConfig.default_regexes(), scan_backend=backend,
+                                  added_lines_only=added_lines_only)
+            seconds, secrets = timed(find_secrets, repo_path, search_config=config, repeat=3)
+            rows.append((label, "{0:8.1f} commits/s  {1:6.2f}s  {2} secrets"
+                         .format(commits / seconds, seconds, len(secrets))))
+        report("Scan backends, {0} commits".format(commits), rows)
+    finally:
+        remove_repo(repo_path)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
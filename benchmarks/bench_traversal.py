@@ -0,0 +1,110 @@
+"""
+Compares the diff bytes produced and the time taken by the git_log walk with
+the RepoConfig traversal options, on a history of feature branches merged
+into master with --no-ff and occasional refactors renaming whole files.
+
+Run with `python -m benchmarks.bench_traversal [features] [commits per feature]`
+"""
+
+import random
+import subprocess
+import sys
+import tempfile
+
+from trufflehog_api import RepoConfig, git_log
+
+from benchmarks.common import WORDS, remove_repo, report, timed
+
+
+def make_merge_repo(features=40, commits_per_feature=8, files=30, seed=0):
+    """Creates a repository whose master merges one feature branch after another,
+    every fifth merge followed by a commit renaming a file
+
+    :return: path to the repository, remove it with remove_repo
+    """
+    rng = random.Random(seed)
+    repo_path = tempfile.mkdtemp(prefix="trufflehog-bench-")
+    subprocess.run(["git", "init", "-q", "-b", "master"], cwd=repo_path, check=True)
+    paths = ["src/file_{0}.py".format(number) for number in range(files)]
+    contents = {path: [" ".join(rng.choice(WORDS) for _ in range(8)) for _ in range(40)]
+                for path in paths}
+    stream = []
+    mark = 0
+    date = 1500000000
+
+    def commit(branch, message, changes, parent=None, merge=None):
+        nonlocal mark, date
+        mark += 1
+        date += 60
+        stream.append("commit refs/heads/{0}\nmark :{1}\n".format(branch, mark).encode())
+        stream.append("committer Bench <bench@example.com> {0} +0000\n".format(date).encode())
+        stream.append(b"data %d\n%s\n" % (len(message), message.encode()))
+        if parent:
+            stream.append("from :{0}\n".format(parent).encode())
+        if merge:
+            stream.append("merge :{0}\n".format(merge).encode())
+        stream.extend(changes)
+        return mark
+
+    def modify(path):
+        data = ("\n".join(contents[path]) + "\n").encode()
+        return b"M 100644 inline %s\ndata %d\n%s\n" % (path.encode(), len(data), data)
+
+    master = commit("master", "initial", [modify(path) for path in paths])
+    for feature in range(features):
+        branch = "feature-{0}".format(feature)
+        head = master
+        for number in range(commits_per_feature):
+            path = rng.choice(paths)
+            start = rng.randrange(len(contents[path]))
+            contents[path][start:start + 5] = [" ".join(rng.choice(WORDS) for _ in range(8))
+                                               for _ in range(5)]
+            head = commit(branch, "{0} change {1}".format(branch, number), [modify(path)],
+                          parent=head)
+        master = commit("master", "Merge " + branch, [modify(path) for path in paths],
+                        parent=master, merge=head)
+        if feature % 5 == 4:
+            old = rng.choice(paths)
+            new = old.replace(".py", "_{0}.py".format(feature))
+            paths[paths.index(old)] = new
+            contents[new] = contents.pop(old)
+            master = commit("master", "rename " + old,
+                            [b"R %s %s\n" % (old.encode(), new.encode())], parent=master)
+
+    subprocess.run(["git", "fast-import", "--quiet"], cwd=repo_path, check=True,
+                   input=b"".join(stream))
+    subprocess.run(["git", "checkout", "-q", "master"], cwd=repo_path, check=True)
+    return repo_path
+
+
+def diff_bytes(repo_path, repo_config):
+    """:return: (number of hunks, total bytes) of the walk of master"""
+    hunks = list(git_log.iter_diff_hunks(repo_path, repo_config))
+    return len(hunks), sum(len(hunk.hunk) for hunk in hunks)
+
+
+def main(features=40, commits_per_feature=8):
+    repo_path = make_merge_repo(int(features), int(commits_per_feature))
+    try:
+        options = (("default", {}),
+                   ("skip_merges", {"skip_merges": True}),
+                   ("merges_against_first_parent", {"merges_against_first_parent": True}),
+                   ("first_parent", {"first_parent": True}),
+                   ("detect_renames=False", {"detect_renames": False}),
+                   ("detect_copies", {"detect_copies": True}))
+        rows = []
+        baseline = None
+        for label, option in options:
+            config = RepoConfig(branch="master", **option)
+            seconds, (hunks, size) = timed(diff_bytes, repo_path, config, repeat=3)
+            baseline = baseline or size
+            rows.append((label, "{0:10,d} diff bytes  {1:5.2f}x  {2:6d} hunks  {3:6.2f}s"
+                         .format(size, size / baseline, hunks, seconds)))
+        report("Traversal options, {0} merged feature branches of {1} commits"
+               .format(features, commits_per_feature), rows)
+    finally:
+        remove_repo(repo_path)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -25,3 +25,28 @@ from trufflehog_api.find_secrets import (Secret,
                                          FindSecretsRequest,
                                          execute_find_secrets_request,
                                          batch_execute_find_secrets_request)
+from trufflehog_api import git_log
+from trufflehog_api.scanner import Scanner
+from trufflehog_api import regex_profile
+from trufflehog_api.regex_profile import RegexProfile
+from trufflehog_api import regex_engine
+from trufflehog_api.dedup import SecretIndex, UniqueSecret
+from trufflehog_api.find_secrets import find_unique_secrets, iter_find_secrets_request
+from trufflehog_api import baseline
+from trufflehog_api.result_cache import ResultCache
+from trufflehog_api import service
+from trufflehog_api.checkpoint import ScanCheckpoint
+from trufflehog_api import cli
+from trufflehog_api.scratch import ScratchSpace
+from trufflehog_api import pipeline
+from trufflehog_api import scheduler
+from trufflehog_api import memory
+from trufflehog_api import shared_walk
+from trufflehog_api import scanner
+from trufflehog_api import triage
+from trufflehog_api import estimate
+from trufflehog_api.mirror import MirrorCache
+from trufflehog_api import concurrency
+from trufflehog_api.findings_store import FindingsStore
+from trufflehog_api import forks
+from trufflehog_api import metrics
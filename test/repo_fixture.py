@@ -0,0 +1,60 @@
+"""Builds small throwaway git repositories for tests that need real history."""
+
+import os
+import shutil
+import subprocess
+import tempfile
+
+_GIT_ENV = {
+    "GIT_AUTHOR_NAME": "Test Author",
+    "GIT_AUTHOR_EMAIL": "author@example.com",
+    "GIT_COMMITTER_NAME": "Test Committer",
+    "GIT_COMMITTER_EMAIL": "committer@example.com",
+}
+
+
+def git(repo_path, *args, env=None):
+    """Runs a git command inside repo_path and returns its stdout"""
+    full_env = dict(os.environ, **_GIT_ENV)
+    if env:
+        full_env.update(env)
+    return subprocess.run(["git"] + list(args), cwd=repo_path, env=full_env, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout.decode()
+
+
+def make_repo(commits, branch="master"):
+    """Creates a repository with one commit per entry of commits.
+
+    Each entry is a dict mapping file paths to their new content, a value of None
+    deletes the file. Returns the path of the repository, remove it with
+    remove_repo once done.
+    """
+    repo_path = tempfile.mkdtemp()
+    git(repo_path, "init", "-q", "-b", branch)
+    for index, files in enumerate(commits):
+        commit(repo_path, files, "commit {0}".format(index), timestamp=1600000000 + index)
+    return repo_path
+
+
+def commit(repo_path, files, message, timestamp=1600000000, env=None):
+    """Writes files and commits them, returns the new commit hash"""
+    for path, content in files.items():
+        full_path = os.path.join(repo_path, path)
+        if content is None:
+            os.remove(full_path)
+            continue
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as file:
+            file.write(content)
+    git(repo_path, "add", "-A")
+    date = "{0} +0000".format(timestamp)
+    commit_env = {"GIT_AUTHOR_DATE": date, "GIT_COMMITTER_DATE": date}
+    if env:
+        commit_env.update(env)
+    git(repo_path, "commit", "-q", "-m", message, env=commit_env)
+    return git(repo_path, "rev-parse", "HEAD").strip()
+
+
+def remove_repo(repo_path):
+    """Deletes a repository created by make_repo"""
+    shutil.rmtree(repo_path, ignore_errors=True)
@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import unittest
+
+from .context import (FindSecretsRequest, SearchConfig, ScanCheckpoint, find_secrets,
+                      git_log, iter_find_secrets_request)
+from .repo_fixture import make_repo, commit, remove_repo
+
+KEYS = ["AKIAABCDEFGHIJKLMN{0:02d}".format(number) for number in range(6)]
+
+
+def _keys(secrets):
+    return sorted(string for secret in secrets for string in secret.strings_found)
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_path = make_repo([{"file{0}.txt".format(number): key + "\n"}
+                                    for number, key in enumerate(KEYS)])
+        self.checkpoint_dir = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.checkpoint_dir, "scan.checkpoint")
+        self.config = SearchConfig(entropy_checks_enabled=False,
+                                   regexes=SearchConfig.default_regexes())
+
+    def tearDown(self):
+        remove_repo(self.repo_path)
+        remove_repo(self.checkpoint_dir)
+
+    def _iter(self, resume):
+        request = FindSecretsRequest(self.repo_path, search_config=self.config)
+        return iter_find_secrets_request(request, resume=resume,
+                                         checkpoint=ScanCheckpoint(self.checkpoint_path,
+                                                                   interval=0))
+
+    def test_complete_scan_is_replayed(self):
+        secrets = find_secrets(self.repo_path, search_config=self.config,
+                               checkpoint=ScanCheckpoint(self.checkpoint_path))
+        self.assertEqual(_keys(secrets), KEYS)
+        with open(self.checkpoint_path) as checkpoint_file:
+            self.assertEqual(json.loads(checkpoint_file.readlines()[-1]), {"complete": True})
+
+        replayed = list(self._iter(resume=True))
+        self.assertEqual([secret.commit_hash for secret in replayed],
+                         [secret.commit_hash for secret in secrets])
+
+    def test_resume_after_interruption(self):
+        scan = self._iter(resume=False)
+        first = [next(scan), next(scan)]
+        scan.close()
+
+        # The first secret is replayed from the checkpoint, the second one's commit was
+        # not finished so it is scanned again
+        resumed = list(self._iter(resume=True))
+        self.assertEqual(_keys(resumed), KEYS)
+        self.assertEqual([secret.commit_hash for secret in resumed[:2]],
+                         [secret.commit_hash for secret in first])
+
+    def test_unfinished_commits_are_dropped(self):
+        scan = self._iter(resume=False)
+        next(scan)
+        scan.close()
+        with open(self.checkpoint_path, "a") as checkpoint_file:
+            checkpoint_file.write(json.dumps({"secret": {"commit_hash": "lost"}}) + "\n")
+            checkpoint_file.write('{"position": [0,')
+
+        secrets = list(self._iter(resume=True))
+        self.assertEqual(_keys(secrets), KEYS)
+        self.assertNotIn("lost", [secret.commit_hash for secret in secrets])
+
+    def test_resume_walks_the_recorded_heads(self):
+        scan = self._iter(resume=False)
+        next(scan)
+        scan.close()
+        # A commit added after the checkpoint is not part of the resumed scan
+        commit(self.repo_path, {"new.txt": "AKIAQRSTUVWXYZ012345\n"}, "new", 1700000000)
+        self.assertEqual(_keys(self._iter(resume=True)), KEYS)
+
+    def test_other_request_starts_over(self):
+        scan = self._iter(resume=False)
+        next(scan)
+        scan.close()
+        self.config = SearchConfig(entropy_checks_enabled=False, max_depth=2,
+                                   regexes=SearchConfig.default_regexes())
+        self.assertEqual(_keys(self._iter(resume=True)), KEYS[-2:])
+
+    def test_walk_position_skips_commits(self):
+        refs = list(git_log.resolve_refs(self.repo_path).items())
+        positions = []
+        hunks = list(git_log.iter_diff_hunks(self.repo_path, refs=refs, position=(0, 2),
+                                             on_progress=lambda *p: positions.append(p)))
+        self.assertEqual(len(hunks), len(KEYS) - 2)
+        self.assertEqual(positions[0], (0, 3))
+        self.assertEqual(positions[-1], (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import threading
+import unittest
+
+from .context import (SearchConfig, FindSecretsRequest, TrufflehogApiError,
+                      batch_execute_find_secrets_request, concurrency)
+from .repo_fixture import make_repo, remove_repo
+
+
+def sample(cpu=0.5, rss=None, scratch_bytes=None, active=2, waiting=1):
+    return concurrency.ResourceSample(cpu, rss, scratch_bytes, None, active, waiting)
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+
+    def test_aimd(self):
+        controller = concurrency.AdaptiveConcurrency(min_workers=1, max_workers=4,
+                                                     initial_workers=2, max_rss_bytes=100,
+                                                     max_scratch_bytes=100)
+        with self.assertLogs("trufflehog_api.concurrency", level="DEBUG") as logs:
+            steps = [controller.adjust(sample()),
+                     controller.adjust(sample()),
+                     controller.adjust(sample()),
+                     controller.adjust(sample(cpu=0.99)),
+                     controller.adjust(sample(waiting=0)),
+                     controller.adjust(sample(cpu=0.9)),
+                     controller.adjust(sample(rss=200)),
+                     controller.adjust(sample(scratch_bytes=200))]
+        self.assertEqual([(step.action, step.limit) for step in steps],
+                         [(concurrency.INCREASE, 3), (concurrency.INCREASE, 4),
+                          (concurrency.HOLD, 4), (concurrency.DECREASE, 2),
+                          (concurrency.HOLD, 2), (concurrency.HOLD, 2),
+                          (concurrency.DECREASE, 1), (concurrency.HOLD, 1)])
+        self.assertEqual(controller.limit, 1)
+        self.assertEqual(controller.decisions, steps)
+        self.assertIn("over threshold: rss 200 bytes", steps[6].reason)
+        self.assertEqual(len(logs.records), 8)
+        self.assertIn("decrease to 2 searches", logs.output[3])
+
+    def test_bounds(self):
+        with self.assertRaises(TrufflehogApiError):
+            concurrency.AdaptiveConcurrency(min_workers=3, max_workers=2)
+        with self.assertRaises(TrufflehogApiError):
+            concurrency.AdaptiveConcurrency(decrease_factor=1.0)
+        controller = concurrency.AdaptiveConcurrency(min_workers=2, max_workers=3,
+                                                     initial_workers=10)
+        self.assertEqual(controller.limit, 3)
+
+    def test_acquire_waits_for_limit(self):
+        controller = concurrency.AdaptiveConcurrency(max_workers=1, sample_interval=3600)
+        controller.acquire()
+        admitted = threading.Event()
+
+        def search():
+            controller.acquire()
+            admitted.set()
+            controller.release()
+
+        thread = threading.Thread(target=search)
+        thread.start()
+        self.assertFalse(admitted.wait(0.2))
+        controller.release()
+        self.assertTrue(admitted.wait(5))
+        thread.join()
+        self.assertEqual(controller.active, 0)
+
+    def test_sample(self):
+        controller = concurrency.AdaptiveConcurrency(max_rss_bytes=1)
+        result = controller.sample()
+        self.assertEqual((result.active, result.waiting, result.scratch_bytes), (0, 0, None))
+        self.assertIsNotNone(result.rss)
+
+
+class TestAdaptiveBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.repos = [make_repo([{"key.txt": "AKIAABCDEFGHIJKLMN{0:02d}\n".format(number)}])
+                      for number in range(4)]
+
+    def tearDown(self):
+        for repo in self.repos:
+            remove_repo(repo)
+
+    def test_batch(self):
+        controller = concurrency.AdaptiveConcurrency(min_workers=1, max_workers=3,
+                                                     initial_workers=1, sample_interval=0)
+        config = SearchConfig(entropy_checks_enabled=False, regexes=SearchConfig.default_regexes())
+        futures = batch_execute_find_secrets_request(
+            [FindSecretsRequest(repo, search_config=config) for repo in self.repos],
+            adaptive_concurrency=controller)
+        self.assertEqual([len(future.result()) for future in futures], [1, 1, 1, 1])
+        self.assertEqual(controller.active, 0)
+        self.assertTrue(controller.decisions)
+        self.assertTrue(1 <= controller.limit <= 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+
+from .context import FindSecretsRequest, RepoConfig, SearchConfig, TrufflehogApiError, estimate
+from .context import scheduler
+from .context import MirrorCache
+from .repo_fixture import make_repo, remove_repo, git
+
+
+class TestEstimate(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = make_repo([{"a.txt": "x" * 100 + "\n", "docs/readme.md": "y" * 10 + "\n"},
+                               {"a.txt": "z" * 50 + "\n"},
+                               {"docs/readme.md": "w" * 20 + "\n"},
+                               {"a.txt": "x" * 100 + "\n"}])
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        remove_repo(self.repo)
+        remove_repo(self.work_dir)
+
+    def test_measures_history(self):
+        result = estimate.estimate(FindSecretsRequest(self.repo))
+        # The last commit brings back a version of a.txt that is already counted
+        self.assertEqual(result.commits, 4)
+        self.assertEqual(result.blobs, 4)
+        self.assertEqual(result.blob_bytes, 101 + 11 + 51 + 21)
+        self.assertEqual(result.diff_bytes, result.blob_bytes)
+        self.assertAlmostEqual(result.seconds, 4 * 0.002 + result.diff_bytes * 2e-8)
+        self.assertEqual(result.to_dict()["blobs"], 4)
+
+    def test_filters(self):
+        second = git(self.repo, "rev-list", "HEAD").split()[2]
+        config = SearchConfig(exclude_search_paths=[r"docs/.*"])
+        result = estimate.estimate(FindSecretsRequest(self.repo, RepoConfig(since_commit=second),
+                                                      search_config=config))
+        self.assertEqual((result.commits, result.blobs, result.blob_bytes, result.diff_bytes),
+                         (2, 2, 21 + 101, 101))
+        result = estimate.estimate(FindSecretsRequest(self.repo, RepoConfig(paths=["docs/"])))
+        self.assertEqual((result.commits, result.blobs, result.blob_bytes), (2, 2, 11 + 21))
+        result = estimate.estimate(FindSecretsRequest(self.repo,
+                                                      search_config=SearchConfig(max_depth=1)))
+        # The whole tree of the oldest commit of a depth limited walk counts
+        self.assertEqual((result.commits, result.blobs), (1, 2))
+
+    def test_remote_needs_mirror(self):
+        url = "file://" + os.path.abspath(self.repo)
+        mirrors = MirrorCache(os.path.join(self.work_dir, "mirrors"))
+        with self.assertRaises(TrufflehogApiError):
+            estimate.estimate(FindSecretsRequest(url), mirror_cache=mirrors)
+        mirrors.update(url)
+        self.assertEqual(estimate.estimate(FindSecretsRequest(url), mirror_cache=mirrors),
+                         estimate.estimate(FindSecretsRequest(self.repo)))
+
+    def test_calibration(self):
+        path = os.path.join(self.work_dir, "estimates.json")
+        other = make_repo([{"b.txt": "b" * 1000 + "\n"}])
+        try:
+            estimator = estimate.CostEstimator(path)
+            requests = [FindSecretsRequest(self.repo), FindSecretsRequest(other)]
+            for request in requests:
+                estimator.estimate(request)
+            history = scheduler.DurationHistory()
+            history.record(scheduler.repository_key(self.repo), 1.0)
+            self.assertEqual(estimator.calibrate(history), 1)
+            # A single sample scales the default coefficients
+            self.assertAlmostEqual(estimator.estimate(requests[0]).seconds, 1.0)
+            estimator.record(requests[1], 2.0)
+            estimator.save()
+
+            loaded = estimate.CostEstimator(path)
+            self.assertEqual(loaded.samples, 2)
+            self.assertAlmostEqual(loaded.estimate(requests[0]).seconds, 1.0)
+            self.assertAlmostEqual(loaded.estimate(requests[1]).seconds, 2.0)
+            self.assertGreaterEqual(loaded.seconds_per_commit, 0)
+        finally:
+            remove_repo(other)
+
+    def test_scheduler_uses_estimator(self):
+        estimator = estimate.CostEstimator(seconds_per_commit=1.0, seconds_per_byte=0.0)
+        batch_scheduler = scheduler.BatchScheduler(estimator=estimator)
+        request = FindSecretsRequest(self.repo)
+        cost = batch_scheduler.cost(request)
+        self.assertEqual((cost.source, cost.seconds, cost.commits),
+                         (scheduler.ESTIMATE, 4.0, 4))
+        batch_scheduler.record(request, 8.0)
+        self.assertEqual(estimator.samples, 1)
+        self.assertEqual(batch_scheduler.cost(request).source, scheduler.HISTORY)
+        remote = batch_scheduler.cost(FindSecretsRequest("https://example.com/missing.git"))
+        self.assertEqual(remote.source, scheduler.DEFAULT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from .context import FindingsStore, FindSecretsRequest, SearchConfig, Secret, TrufflehogApiError
+from .context import iter_find_secrets_request
+from .repo_fixture import make_repo, remove_repo
+
+
+def make_secret(string, path="a.txt", commit_hash="abc"):
+    return Secret(commit_time="2020-09-13 12:26:40", branch_name="master", commit="message\n",
+                  diff="+" + string + "\n", commit_hash=commit_hash, reason="AWS API Key",
+                  path=path, strings_found=[string])
+
+
+class TestFindingsStore(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.work_dir, "findings.db")
+
+    def tearDown(self):
+        remove_repo(self.work_dir)
+
+    def test_round_trip_and_batches(self):
+        with FindingsStore(self.path, batch_size=2) as store:
+            scan = store.begin_scan("nightly")
+            secrets = [make_secret("KEY{0}".format(number)) for number in range(5)]
+            self.assertEqual(store.add_all(scan, "repo", iter(secrets)), 5)
+            store.finish_scan(scan)
+        with FindingsStore(self.path) as store:
+            found = list(store.findings(scan))
+            self.assertEqual([repo for repo, _ in found], ["repo"] * 5)
+            self.assertEqual([secret.to_dict() for _, secret in found],
+                             [secret.to_dict() for secret in secrets])
+            self.assertEqual(store.scans()[0]["label"], "nightly")
+            self.assertEqual(store.scans()[0]["findings"], 5)
+            self.assertIsNotNone(store.scans()[0]["finished"])
+
+    def test_introduced_and_resolved(self):
+        with FindingsStore(self.path) as store:
+            old = store.begin_scan()
+            store.add(old, "repo1", make_secret("KEEP"))
+            store.add(old, "repo1", make_secret("GONE"))
+            store.add(old, "repo2", make_secret("MOVED"))
+            new = store.begin_scan()
+            store.add(new, "repo1", make_secret("KEEP", commit_hash="def"))
+            store.add(new, "repo1", make_secret("NEW"))
+            store.add(new, "repo1", make_secret("NEW", commit_hash="def"))
+            store.add(new, "repo1", make_secret("MOVED"))
+            self.assertEqual(store.previous_scan(new), old)
+            self.assertIsNone(store.previous_scan(old))
+
+            introduced = [(repo, secret.strings_found[0], secret.commit_hash)
+                          for repo, secret in store.introduced(old, new)]
+            self.assertEqual(introduced, [("repo1", "NEW", "abc"), ("repo1", "NEW", "def"),
+                                          ("repo1", "MOVED", "abc")])
+            resolved = [(repo, secret.strings_found[0])
+                        for repo, secret in store.resolved(old, new)]
+            self.assertEqual(resolved, [("repo1", "GONE"), ("repo2", "MOVED")])
+            self.assertEqual([secret.strings_found for _, secret
+                              in store.resolved(old, new, repo="repo2")], [["MOVED"]])
+
+    def test_diff_by_matched_string(self):
+        paired = make_secret("KEEP")
+        paired = Secret.from_dict(dict(paired.to_dict(), strings_found=["KEEP", "OTHER"]))
+        with FindingsStore(self.path) as store:
+            old = store.begin_scan()
+            store.add(old, "repo", paired)
+            new = store.begin_scan()
+            store.add(new, "repo", make_secret("KEEP", commit_hash="def"))
+            self.assertEqual(list(store.introduced(old, new)), [])
+            self.assertEqual([secret.strings_found for _, secret in store.resolved(old, new)],
+                             [["KEEP", "OTHER"]])
+
+    def test_failed_repositories_are_not_compared(self):
+        with FindingsStore(self.path) as store:
+            old = store.begin_scan()
+            store.add(old, "repo1", make_secret("KEEP"))
+            store.add(old, "repo2", make_secret("BROKEN"))
+            store.add(old, "repo3", make_secret("FIXED"))
+            new = store.begin_scan()
+            store.add(new, "repo1", make_secret("KEEP"))
+            store.add_failure(new, "repo2", "clone failed")
+            self.assertEqual(store.failures(new), [("repo2", "clone failed")])
+            self.assertEqual([scan["failures"] for scan in store.scans()], [0, 1])
+            self.assertEqual([repo for repo, _ in store.resolved(old, new)], ["repo3"])
+
+            newest = store.begin_scan()
+            store.add(newest, "repo2", make_secret("NEW"))
+            self.assertEqual(list(store.introduced(new, newest)), [])
+            self.assertEqual([repo for repo, _ in store.introduced(old, newest)], ["repo2"])
+
+    def test_upgrades_version_2(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA user_version = 2")
+        connection.close()
+        with FindingsStore(self.path) as store:
+            store.add_failure(store.begin_scan(), "repo", None)
+        with self.assertRaises(TrufflehogApiError):
+            connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA user_version = 1")
+            connection.close()
+            FindingsStore(self.path)
+
+    def test_concurrent_writers(self):
+        with FindingsStore(self.path, batch_size=7) as store:
+            scan = store.begin_scan()
+
+            def write(number):
+                store.add_all(scan, "repo{0}".format(number),
+                              (make_secret("KEY{0}".format(key)) for key in range(50)))
+
+            threads = [threading.Thread(target=write, args=(number,)) for number in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(list(store.findings(scan))), 200)
+            self.assertEqual(len(list(store.findings(scan, repo="repo3"))), 50)
+
+    def test_streaming_sink(self):
+        repo = make_repo([{"a.txt": "AKIAABCDEFGHIJKLMN00\n"}, {"b.txt": "AKIAABCDEFGHIJKLMN01\n"}])
+        try:
+            config = SearchConfig(entropy_checks_enabled=False,
+                                  regexes=SearchConfig.default_regexes())
+            with FindingsStore(self.path) as store:
+                scan = store.begin_scan()
+                added = store.add_all(scan, repo, iter_find_secrets_request(
+                    FindSecretsRequest(repo, search_config=config)))
+                self.assertEqual(added, 2)
+                self.assertEqual(sorted(secret.path for _, secret in store.findings(scan)),
+                                 ["a.txt", "b.txt"])
+        finally:
+            remove_repo(repo)
+
+    def test_errors(self):
+        with self.assertRaises(TrufflehogApiError):
+            FindingsStore(self.path, batch_size=0)
+        with self.assertRaises(TrufflehogApiError):
+            FindingsStore(os.path.join(self.work_dir, "missing", "findings.db"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from .context import SearchConfig, regex_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED_MODULES = ["git", "truffleHog", "truffleHogRegexes", "concurrent.futures"]
+
+
+class TestImports(unittest.TestCase):
+
+    def test_heavy_modules_are_deferred(self):
+        code = ("import sys, trufflehog_api; "
+                "print(' '.join(m for m in {0} if m in sys.modules))".format(DEFERRED_MODULES))
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                                stdout=subprocess.PIPE).stdout.decode().strip()
+        self.assertEqual(output, "")
+
+    def test_default_regexes_are_compiled_once(self):
+        regexes = SearchConfig.default_regexes()
+        self.assertTrue(regexes)
+        description, pattern = next(iter(regexes.items()))
+        first = regex_engine.compile_regex(pattern, description=description)
+        self.assertIs(first, regex_engine.compile_regex(pattern))
+        self.assertIsNot(SearchConfig.default_regexes(), SearchConfig.default_regexes())
+
+
+if __name__ == '__main__':
+    unittest.main()
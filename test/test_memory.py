@@ -0,0 +1,92 @@
+import os
+import threading
+import unittest
+
+from .context import (FindSecretsRequest, SearchConfig, batch_execute_find_secrets_request,
+                      execute_find_secrets_request, find_secrets, git_log, memory, pipeline)
+from .repo_fixture import make_repo, remove_repo
+
+KEYS = ["AKIAABCDEFGHIJKLMN{0:02d}".format(number) for number in range(5)]
+
+
+def _keys(secrets):
+    return sorted(string for secret in secrets for string in secret.strings_found)
+
+
+class TestBoundedMemory(unittest.TestCase):
+
+    def setUp(self):
+        filler = "".join("line {0}\n".format(number) for number in range(200))
+        self.repo = make_repo([{"file{0}.txt".format(number): filler + key + "\n" + filler}
+                               for number, key in enumerate(KEYS)])
+        self.config = SearchConfig(entropy_checks_enabled=False,
+                                   regexes=SearchConfig.default_regexes())
+
+    def tearDown(self):
+        remove_repo(self.repo)
+
+    def test_spool_spills_to_disk(self):
+        secrets = find_secrets(self.repo, search_config=self.config)
+        spool = memory.SecretSpool(2)
+        spool.extend(secrets)
+        self.assertEqual((len(spool), spool.spilled), (len(KEYS), len(KEYS) - 2))
+        self.assertTrue(os.path.exists(spool.path))
+        self.assertEqual(_keys(spool), KEYS)
+        self.assertEqual(spool[-1].to_dict(), secrets[-1].to_dict())
+        self.assertEqual([secret.commit_hash for secret in spool[1:3]],
+                         [secret.commit_hash for secret in secrets[1:3]])
+        path = spool.path
+        spool.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_findings_over_the_cap_are_spooled(self):
+        config = SearchConfig.from_dict(dict(self.config.to_dict(), max_findings_in_memory=1))
+        self.assertEqual(config.fingerprint(), self.config.fingerprint())
+        secrets = execute_find_secrets_request(FindSecretsRequest(self.repo,
+                                                                  search_config=config))
+        self.assertIsInstance(secrets, memory.SecretSpool)
+        self.assertEqual(secrets.spilled, len(KEYS) - 1)
+        self.assertEqual(_keys(secrets), KEYS)
+
+    def test_long_hunks_are_read_in_chunks(self):
+        hunks = list(git_log.iter_diff_hunks(self.repo, max_hunk_bytes=256))
+        self.assertGreater(len(hunks), len(KEYS))
+        self.assertTrue(all(len(hunk.hunk) <= 256 for hunk in hunks))
+        config = SearchConfig.from_dict(dict(self.config.to_dict(), max_hunk_bytes=256))
+        self.assertEqual(_keys(find_secrets(self.repo, search_config=config)), KEYS)
+
+    def test_long_lines_are_cut(self):
+        config = SearchConfig(entropy_checks_enabled=False, max_hunk_bytes=64,
+                              regexes=SearchConfig.default_regexes())
+        repo = make_repo([{"long.txt": "x" * 1000 + "\n" + KEYS[0] + "\n"}])
+        self.addCleanup(remove_repo, repo)
+        hunks = list(git_log.iter_diff_hunks(repo, max_hunk_bytes=64))
+        self.assertTrue(all(len(hunk.hunk) <= 64 for hunk in hunks))
+        self.assertEqual(b"".join(hunk.hunk for hunk in hunks),
+                         b"".join(hunk.hunk for hunk in git_log.iter_diff_hunks(repo)))
+        self.assertEqual(_keys(find_secrets(repo, search_config=config)), KEYS[:1])
+
+    def test_memory_guard_keeps_one_search_running(self):
+        guard = memory.MemoryGuard(1, poll_interval=0.01)
+        self.assertTrue(guard.over_limit())
+        self.assertEqual(guard.acquire(), 0.0)
+        waiter = threading.Thread(target=guard.acquire)
+        waiter.start()
+        waiter.join(0.05)
+        self.assertTrue(waiter.is_alive())
+        guard.release()
+        waiter.join()
+        self.assertEqual((guard.active, guard.throttled), (1, 1))
+        self.assertGreater(guard.throttled_seconds, 0.0)
+
+    def test_batch_under_memory_pressure(self):
+        metrics = pipeline.PipelineMetrics()
+        requests = [FindSecretsRequest(self.repo, search_config=self.config)] * 4
+        futures = batch_execute_find_secrets_request(requests, concurrency_level=2,
+                                                     max_rss_bytes=1, metrics=metrics)
+        self.assertEqual([_keys(future.result()) for future in futures], [KEYS] * 4)
+        self.assertEqual(metrics.to_dict()["throttled"], metrics.throttled)
+
+
+if __name__ == '__main__':
+    unittest.main()
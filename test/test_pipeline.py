@@ -0,0 +1,111 @@
+import tempfile
+import unittest
+
+from .context import (FindSecretsRequest, ResultCache, SearchConfig, ScratchSpace,
+                      TrufflehogApiError, batch_execute_find_secrets_request)
+from .context import pipeline
+from .repo_fixture import make_repo, remove_repo
+
+KEYS = ["AKIAABCDEFGHIJKLMN{0:02d}".format(number) for number in range(4)]
+
+
+class TestScanPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.repos = [make_repo([{"key.txt": key + "\n"}]) for key in KEYS]
+        self.scratch_root = tempfile.mkdtemp()
+        self.scratch = ScratchSpace(self.scratch_root)
+        self.config = SearchConfig(entropy_checks_enabled=False,
+                                   regexes=SearchConfig.default_regexes())
+
+    def tearDown(self):
+        self.scratch.close()
+        for repo_path in self.repos + [self.scratch_root]:
+            remove_repo(repo_path)
+
+    def _requests(self, remote=True):
+        return [FindSecretsRequest("file://" + repo_path if remote else repo_path,
+                                   search_config=self.config) for repo_path in self.repos]
+
+    def test_repository_host(self):
+        self.assertIsNone(pipeline.repository_host(self.repos[0]))
+        self.assertEqual(pipeline.repository_host("https://GitHub.com/a/b.git"), "github.com")
+        self.assertEqual(pipeline.repository_host("git@gitlab.com:a/b.git"), "gitlab.com")
+        self.assertEqual(pipeline.repository_host("file:///tmp/missing"), "")
+
+    def test_batch_keeps_request_order(self):
+        metrics = pipeline.PipelineMetrics()
+        futures = batch_execute_find_secrets_request(
+            self._requests(), concurrency_level=2, clone_concurrency_level=3,
+            max_clones_per_host=1, scratch_space=self.scratch, metrics=metrics)
+        self.assertEqual([future.result()[0].strings_found for future in futures],
+                         [[key] for key in KEYS])
+        self.assertEqual(metrics.clones, len(KEYS))
+        self.assertEqual(metrics.scans, len(KEYS))
+        self.assertEqual(metrics.queue_depth, 0)
+        self.assertLessEqual(metrics.max_queue_depth, 4)
+        for stage in (pipeline.CLONE_STAGE, pipeline.SCAN_STAGE):
+            self.assertGreater(metrics.utilization(stage), 0.0)
+            self.assertLessEqual(metrics.utilization(stage), 1.0)
+        self.assertEqual(metrics.to_dict()["clone_workers"], 3)
+        self.scratch.drain()
+        self.assertEqual(self.scratch.usage, 0)
+
+    def test_local_repositories_are_not_cloned(self):
+        metrics = pipeline.PipelineMetrics()
+        scan = pipeline.ScanPipeline(clone_concurrency_level=1, scan_concurrency_level=2,
+                                     scratch_space=self.scratch, metrics=metrics)
+        results = {request.path: future.result()
+                   for request, future in scan.run(self._requests(remote=False))}
+        self.assertEqual(sorted(secrets[0].strings_found[0] for secrets in results.values()),
+                         KEYS)
+        self.assertEqual(metrics.clones, 0)
+        self.assertEqual(metrics.scans, len(KEYS))
+
+    def test_metrics_are_reset_between_runs(self):
+        scan = pipeline.ScanPipeline(clone_concurrency_level=1, scan_concurrency_level=2,
+                                     scratch_space=self.scratch)
+        for _ in range(2):
+            futures = scan.run_all(self._requests(remote=False))
+            self.assertEqual([future.result()[0].strings_found for future in futures],
+                             [[key] for key in KEYS])
+            self.assertEqual(scan.metrics.scans, len(KEYS))
+        scan.metrics.reset()
+        self.assertEqual(scan.metrics.to_dict()["scans"], 0)
+        self.assertEqual(scan.metrics.elapsed, 0.0)
+
+    def test_cache_hits_skip_the_clone(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(remove_repo, cache_dir)
+        cache = ResultCache(cache_dir)
+        batch_execute_find_secrets_request(self._requests(), result_cache=cache,
+                                           scratch_space=self.scratch)
+        metrics = pipeline.PipelineMetrics()
+        futures = batch_execute_find_secrets_request(self._requests(), result_cache=cache,
+                                                     scratch_space=self.scratch,
+                                                     metrics=metrics)
+        self.assertEqual([future.result()[0].strings_found for future in futures],
+                         [[key] for key in KEYS])
+        self.assertEqual(metrics.cache_hits, len(KEYS))
+        self.assertEqual(metrics.clones, 0)
+
+    def test_failures_are_reported_per_request(self):
+        requests = self._requests()[:1] + [FindSecretsRequest("file:///nonexistent/repo.git")]
+        futures = batch_execute_find_secrets_request(requests, scratch_space=self.scratch)
+        self.assertEqual(len(futures[0].result()), 1)
+        with self.assertRaises(TrufflehogApiError):
+            futures[1].result()
+
+    def test_closing_early_stops_the_workers(self):
+        scan = pipeline.ScanPipeline(clone_concurrency_level=1, scan_concurrency_level=1,
+                                     scratch_space=self.scratch)
+        results = scan.run(self._requests() * 5)
+        _, future = next(results)
+        self.assertEqual(len(future.result()), 1)
+        results.close()
+        self.scratch.drain()
+        self.assertEqual(self.scratch.usage, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
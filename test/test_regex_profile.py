@@ -0,0 +1,71 @@
+import unittest
+import warnings
+
+from .context import (regex_profile, RegexProfile, Scanner, SearchConfig, TrufflehogApiError,
+                      git_log, find_secrets)
+from .repo_fixture import make_repo, remove_repo
+
+
+def _hunk(text):
+    commit = git_log.CommitInfo("abc", 1600000000, "message", "master")
+    return git_log.DiffHunk(commit, "file.txt", text.encode())
+
+
+class TestRegexProfile(unittest.TestCase):
+
+    def test_invalid_regex(self):
+        with self.assertRaises(TrufflehogApiError) as context:
+            Scanner(SearchConfig(regexes={"broken": "(unclosed"}))
+        self.assertIn("broken", str(context.exception))
+
+    def test_default_regexes_are_safe(self):
+        compiled = regex_profile.validate_regexes(SearchConfig.default_regexes())
+        self.assertEqual(regex_profile.find_unsafe_regexes(compiled, 0.05), {})
+
+    def test_catastrophic_regex_is_disabled(self):
+        config = SearchConfig(regexes={"evil": "(a+)+$", "fine": "tok_[0-9]+"},
+                              regex_time_budget=0.01)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            scanner = Scanner(config)
+
+        self.assertTrue(any("evil" in str(warning.message) for warning in caught))
+        self.assertTrue(scanner.regex_profile.stats("evil").disabled)
+        secrets = scanner.scan_hunk(_hunk("+" + "a" * 40 + "! tok_1\n"))
+        self.assertEqual([secret.reason for secret in secrets], ["fine"])
+
+    def test_cost_accounting(self):
+        profile = RegexProfile()
+        scanner = Scanner(SearchConfig(entropy_checks_enabled=False,
+                                       regexes={"one": "one", "two": "two"}), profile)
+        scanner.scan_hunk(_hunk("+one\n"))
+        scanner.scan_hunk(_hunk("+one two\n"))
+
+        self.assertEqual(profile.stats("one").calls, 2)
+        self.assertEqual(profile.stats("one").hits, 2)
+        self.assertEqual(profile.stats("two").hits, 1)
+        self.assertEqual(len(profile.most_expensive(1)), 1)
+        self.assertIn("two", str(profile))
+        self.assertEqual(profile.to_dict()["two"]["calls"], 2)
+
+    def test_chunked_search_with_budget(self):
+        scanner = Scanner(SearchConfig(entropy_checks_enabled=False, regexes={"tok": "tok_1"},
+                                       regex_time_budget=1.0))
+        long_line = "+" + "x" * 10000 + " tok_1 " + "y" * 10000 + "\n"
+        self.assertEqual(len(scanner.scan_hunk(_hunk(long_line))), 1)
+
+    def test_find_secrets_fills_profile(self):
+        repo_path = make_repo([{"a.txt": "tok_1\n"}])
+        try:
+            profile = RegexProfile()
+            config = SearchConfig(entropy_checks_enabled=False, regexes={"tok": "tok_[0-9]"})
+            secrets = find_secrets(repo_path, search_config=config, regex_profile=profile)
+        finally:
+            remove_repo(repo_path)
+
+        self.assertEqual(len(secrets), 1)
+        self.assertEqual(profile.stats("tok").hits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+from .context import Scanner, SearchConfig, TrufflehogApiError, git_log
+from .context import scanner as scanner_module
+
+
+def _hunk(text, path="file.txt"):
+    commit = git_log.CommitInfo("abc", 1600000000, "message", "master")
+    return git_log.DiffHunk(commit, path, text.encode())
+
+
+class TestScanner(unittest.TestCase):
+
+    def test_regex_match(self):
+        scanner = Scanner(SearchConfig(entropy_checks_enabled=False,
+                                       regexes={"token": "tok_[0-9]{4}"}))
+        secrets = scanner.scan_hunk(_hunk("@@ -0,0 +1 @@\n+x = tok_1234\n"))
+
+        self.assertEqual(len(secrets), 1)
+        self.assertEqual(secrets[0].reason, "token")
+        self.assertEqual(secrets[0].commit_hash, "abc")
+        self.assertEqual(secrets[0].path, "file.txt")
+
+    def test_entropy_match(self):
+        scanner = Scanner(SearchConfig())
+        secrets = scanner.scan_hunk(_hunk("+key = 'kX9pL2qR7mN4vB8cZ1wE5tY3uI6oA0sD'\n"))
+        self.assertEqual([secret.reason for secret in secrets], ["High Entropy"])
+
+        self.assertEqual(scanner.scan_hunk(_hunk("+just some ordinary words here\n")), [])
+
+    def test_path_included(self):
+        scanner = Scanner(SearchConfig(include_search_paths=[r".*\.py"],
+                                       exclude_search_paths=["vendor/"]))
+        self.assertTrue(scanner.path_included("src/main.py"))
+        self.assertFalse(scanner.path_included("README.md"))
+        self.assertFalse(scanner.path_included("vendor/lib.py"))
+
+    def test_added_lines_only(self):
+        config = SearchConfig(added_lines_only=True, regexes={"token": "tok_[0-9]{4}",
+                                                              "accent": "clé_[0-9]+",
+                                                              "escape": "\\u00e9t[0-9]+"})
+        scanner = Scanner(config)
+        hunk = _hunk("@@ -1,3 +1,3 @@ tok_0000\n tok_1111\n-tok_2222 clé_1 ét1\n"
+                     "+tok_3333 clé_2 ét2 'kX9pL2qR7mN4vB8cZ1wE5tY3uI6oA0sD'\n")
+        secrets = {secret.reason: secret for secret in scanner.scan_hunk(hunk)}
+        self.assertEqual(sorted(secrets), ["High Entropy", "accent", "escape", "token"])
+        self.assertEqual(secrets["token"].strings_found, ["tok_3333"])
+        self.assertEqual(secrets["accent"].strings_found, ["clé_2"])
+        self.assertEqual(secrets["escape"].strings_found, ["ét2"])
+        self.assertEqual(secrets["High Entropy"].strings_found,
+                         ["kX9pL2qR7mN4vB8cZ1wE5tY3uI6oA0sD"])
+        self.assertEqual(secrets["token"].diff, hunk.hunk.decode())
+
+        removed = _hunk("@@ -1 +0,0 @@\n-x = tok_1234\n")
+        self.assertEqual(scanner.scan_hunk(removed), [])
+        self.assertEqual(len(Scanner(SearchConfig(regexes=config.regexes)).scan_hunk(removed)), 1)
+
+    def test_bytes_entropy_matches_truffle_hog(self):
+        text = ("+a = 'kX9pL2qR7mN4vB8cZ1wE5tY3uI6oA0sD' b=0123456789abcdef0123456789abcdef\n"
+                "+c = aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa\n")
+        full = Scanner(SearchConfig()).scan_hunk(_hunk(text))
+        added = Scanner(SearchConfig(added_lines_only=True)).scan_hunk(_hunk(text))
+        self.assertEqual(sorted(added[0].strings_found), sorted(full[0].strings_found))
+
+    def test_entropy_prefilter(self):
+        data = (b"+short words only\n+key = kX9pL2qR7mN4vB8cZ1wE5tY3uI6oA0sD\n"
+                b"+snake_case_identifiers_are_cut_at_underscores\n+0123456789abcdef01234")
+        self.assertEqual(list(scanner_module._candidate_lines(data, 21)),
+                         [b"+key = kX9pL2qR7mN4vB8cZ1wE5tY3uI6oA0sD", b"+0123456789abcdef01234"])
+        self.assertEqual(list(scanner_module._candidate_lines(data, 40)), [])
+
+    def test_entropy_thresholds(self):
+        text = "+key = 'kX9pL2qR7mN4vB8cZ1wE5tY3uI6oA0sD' hex = 0123456789abcdef\n"
+        self.assertEqual(Scanner(SearchConfig()).scan_hunk(_hunk(text))[0].strings_found,
+                         ["kX9pL2qR7mN4vB8cZ1wE5tY3uI6oA0sD"])
+        for added_lines_only in (False, True):
+            short = Scanner(SearchConfig(entropy_min_length=16, added_lines_only=added_lines_only))
+            self.assertEqual(short.scan_hunk(_hunk(text))[0].strings_found,
+                             ["kX9pL2qR7mN4vB8cZ1wE5tY3uI6oA0sD", "0123456789abcdef"])
+            strict = Scanner(SearchConfig(base64_entropy_threshold=5.5,
+                                          added_lines_only=added_lines_only))
+            self.assertEqual(strict.scan_hunk(_hunk(text)), [])
+        with self.assertRaises(TrufflehogApiError):
+            Scanner(SearchConfig(entropy_min_length=0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+
+from .context import (FindSecretsRequest, SearchConfig, batch_execute_find_secrets_request,
+                      find_secrets, git_log, pipeline, scheduler)
+from .repo_fixture import git, make_repo, remove_repo
+
+KEYS = ["AKIAABCDEFGHIJKLMN{0:02d}".format(number) for number in range(10)]
+
+
+def _keys(secrets):
+    return sorted(string for secret in secrets for string in secret.strings_found)
+
+
+class TestBatchScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.config = SearchConfig(entropy_checks_enabled=False,
+                                   regexes=SearchConfig.default_regexes())
+        self.small = make_repo([{"key.txt": KEYS[0] + "\n"}])
+        self.large = make_repo([{"file{0}.txt".format(number): key + "\n"}
+                                for number, key in enumerate(KEYS)])
+
+    def tearDown(self):
+        remove_repo(self.small)
+        remove_repo(self.large)
+
+    def test_cost_of_local_repositories(self):
+        batch_scheduler = scheduler.BatchScheduler()
+        small = batch_scheduler.cost(FindSecretsRequest(self.small))
+        large = batch_scheduler.cost(FindSecretsRequest(self.large))
+        self.assertEqual((small.source, small.commits), (scheduler.LOCAL, 1))
+        self.assertEqual((large.source, large.commits), (scheduler.LOCAL, len(KEYS)))
+        self.assertGreater(large.seconds, small.seconds)
+
+    def test_history_and_hints(self):
+        history_dir = tempfile.mkdtemp()
+        self.addCleanup(remove_repo, history_dir)
+        history = scheduler.DurationHistory(os.path.join(history_dir, "durations.json"))
+        batch_scheduler = scheduler.BatchScheduler(
+            history=history, size_hints={"https://example.com/a.git": 10 ** 9})
+
+        remote = FindSecretsRequest("https://example.com/a.git")
+        self.assertEqual(batch_scheduler.cost(remote).source, scheduler.HINT)
+        self.assertEqual(batch_scheduler.cost(FindSecretsRequest("https://example.com/b.git")),
+                         scheduler.RequestCost(1.0, scheduler.DEFAULT))
+
+        batch_scheduler.record(FindSecretsRequest(self.small), 4.0)
+        batch_scheduler.record(FindSecretsRequest(self.small), 2.0)
+        history.save()
+        reloaded = scheduler.DurationHistory(history.path)
+        self.assertEqual(reloaded.get(os.path.abspath(self.small)), 3.0)
+        cost = scheduler.BatchScheduler(history=reloaded).cost(FindSecretsRequest(self.small))
+        self.assertEqual(cost, scheduler.RequestCost(3.0, scheduler.HISTORY))
+
+    def test_longest_first(self):
+        requests = [FindSecretsRequest(self.small, search_config=self.config)] * 3
+        requests.append(FindSecretsRequest(self.large, search_config=self.config))
+        scan = pipeline.ScanPipeline(clone_concurrency_level=1, scan_concurrency_level=1,
+                                     scheduler=scheduler.BatchScheduler(),
+                                     lookahead=len(requests))
+        order = [request.path for request, _ in scan.run(requests)]
+        self.assertEqual(order, [self.large] + [self.small] * 3)
+
+    def test_sharded_scan_finds_every_secret_once(self):
+        git(self.large, "checkout", "-q", "-b", "feature")
+        git(self.large, "commit", "-q", "--allow-empty", "-m", "feature")
+        metrics = pipeline.PipelineMetrics()
+        batch_scheduler = scheduler.BatchScheduler(shard_commits=3)
+        futures = batch_execute_find_secrets_request(
+            [FindSecretsRequest(self.large, search_config=self.config)], concurrency_level=3,
+            scheduler=batch_scheduler, metrics=metrics)
+        secrets = futures[0].result()
+        self.assertEqual(_keys(secrets), _keys(find_secrets(self.large,
+                                                            search_config=self.config)))
+        self.assertEqual(_keys(secrets), KEYS)
+        self.assertEqual(metrics.shards, 4)  # 11 commits, every one walked once
+        self.assertEqual(metrics.scans, 1)
+        self.assertIsNotNone(batch_scheduler.history.get(os.path.abspath(self.large)))
+
+    def test_split_walk(self):
+        refs = list(git_log.resolve_refs(self.large).items())
+        slices = git_log.split_walk(self.large, refs, 4)
+        self.assertEqual([position for position, _ in slices], [(0, 0), (0, 4), (0, 8)])
+        hunks = [hunk for position, end_position in slices
+                 for hunk in git_log.iter_diff_hunks(self.large, refs=refs, position=position,
+                                                     end_position=end_position)]
+        self.assertEqual(len({hunk.commit.hexsha for hunk in hunks}), len(KEYS))
+        self.assertEqual(len(hunks), len(KEYS))
+
+
+if __name__ == '__main__':
+    unittest.main()
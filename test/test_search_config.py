@@ -95,6 +95,17 @@ class TestSearchConfig(unittest.TestCase):
         self.assertTrue(config.exclude_search_paths == exclude_search_paths)
         self.assertTrue(config.regexes == regexes)
 
+    def test_entropy_settings(self):
+        config = SearchConfig()
+        self.assertEqual((config.entropy_min_length, config.base64_entropy_threshold,
+                          config.hex_entropy_threshold), (21, 4.5, 3.0))
+        config = SearchConfig.from_dict({"entropy_min_length": 32,
+                                         "base64_entropy_threshold": 5.0,
+                                         "hex_entropy_threshold": 3.5})
+        self.assertEqual(SearchConfig.from_dict(config.to_dict()).to_dict(), config.to_dict())
+        self.assertEqual(config.to_dict()["entropy_min_length"], 32)
+        self.assertNotEqual(config.fingerprint(), SearchConfig().fingerprint())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,99 @@
+import tempfile
+import unittest
+
+from .context import (FindSecretsRequest, RepoConfig, ResultCache, ScratchSpace, SearchConfig,
+                      batch_execute_find_secrets_request, find_secrets, pipeline, shared_walk)
+from .repo_fixture import commit, git, make_repo, remove_repo
+
+KEYS = ["AKIAABCDEFGHIJKLMN{0:02d}".format(number) for number in range(6)]
+
+
+def _findings(secrets):
+    return sorted((secret.commit_hash, secret.branch_name, secret.path, secret.reason,
+                   tuple(secret.strings_found)) for secret in secrets)
+
+
+class TestSharedWalk(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = make_repo([{"a/key.txt": KEYS[0] + "\n"},
+                               {"b/key.txt": KEYS[1] + "\n"},
+                               {"a/key.txt": KEYS[2] + "\n"}])
+        self.first = git(self.repo, "rev-list", "--max-parents=0", "HEAD").strip()
+        git(self.repo, "checkout", "-q", "-b", "feature", "HEAD~1")
+        commit(self.repo, {"b/other.txt": KEYS[3] + "\n"}, "feature", timestamp=1600000100)
+        git(self.repo, "checkout", "-q", "master")
+        self.regexes = SearchConfig(entropy_checks_enabled=False,
+                                    regexes=SearchConfig.default_regexes())
+        self.only_a = SearchConfig(entropy_checks_enabled=False, include_search_paths=["a/"],
+                                   regexes=SearchConfig.default_regexes())
+        self.scratch_root = tempfile.mkdtemp()
+        self.scratch = ScratchSpace(self.scratch_root)
+
+    def tearDown(self):
+        self.scratch.close()
+        remove_repo(self.repo)
+        remove_repo(self.scratch_root)
+
+    def _requests(self, path):
+        return [FindSecretsRequest(path, search_config=self.regexes),
+                FindSecretsRequest(path, search_config=self.only_a),
+                FindSecretsRequest(path, RepoConfig(branch="feature"), self.regexes),
+                FindSecretsRequest(path, RepoConfig(branch="master"),
+                                   SearchConfig.from_dict(dict(self.regexes.to_dict(),
+                                                               max_depth=1))),
+                FindSecretsRequest(path, RepoConfig(since_commit=self.first), self.only_a)]
+
+    def _separately(self, requests):
+        return [_findings(find_secrets(request.path, repo_config=request.repo_config,
+                                       search_config=request.search_config))
+                for request in requests]
+
+    def test_search_shared_matches_separate_searches(self):
+        requests = self._requests(self.repo)
+        results = shared_walk.search_shared(
+            self.repo, [request.repo_config or RepoConfig() for request in requests],
+            [request.search_config for request in requests])
+        self.assertEqual([_findings(secrets) for secrets in results],
+                         self._separately(requests))
+
+    def test_same_walk_with_different_configs(self):
+        requests = self._requests(self.repo)[:2]
+        results = shared_walk.search_shared(self.repo, [RepoConfig()] * 2,
+                                            [self.regexes, self.only_a])
+        self.assertEqual([_findings(secrets) for secrets in results],
+                         self._separately(requests))
+
+    def test_batch_clones_once(self):
+        requests = self._requests("file://" + self.repo)
+        requests.append(FindSecretsRequest("file://" + self.repo,
+                                           search_config=SearchConfig(scan_backend="truffleHog")))
+        metrics = pipeline.PipelineMetrics()
+        futures = batch_execute_find_secrets_request(requests[:-1], scratch_space=self.scratch,
+                                                     metrics=metrics)
+        self.assertEqual((metrics.clones, metrics.scans, metrics.shared), (1, 1, 5))
+        self.assertEqual([_findings(future.result()) for future in futures],
+                         self._separately(requests[:-1]))
+        self.assertIsNone(shared_walk.shared_walk_key(requests[-1]))
+
+        metrics = pipeline.PipelineMetrics()
+        batch_execute_find_secrets_request(requests[:2], scratch_space=self.scratch,
+                                           metrics=metrics, share_traversal=False)
+        self.assertEqual((metrics.clones, metrics.shared), (2, 0))
+
+    def test_cached_members_are_left_out(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(remove_repo, cache_dir)
+        cache = ResultCache(cache_dir)
+        requests = self._requests(self.repo)
+        batch_execute_find_secrets_request(requests[:2], result_cache=cache)
+        metrics = pipeline.PipelineMetrics()
+        futures = batch_execute_find_secrets_request(requests[:3], result_cache=cache,
+                                                     metrics=metrics)
+        self.assertEqual((metrics.cache_hits, metrics.shared), (2, 0))
+        self.assertEqual([_findings(future.result()) for future in futures],
+                         self._separately(requests[:3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
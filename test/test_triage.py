@@ -0,0 +1,99 @@
+import tempfile
+import unittest
+
+from .context import (FindSecretsRequest, ScratchSpace, SearchConfig, find_secrets, git_log,
+                      triage)
+from .repo_fixture import make_repo, remove_repo
+
+KEYS = ["AKIAABCDEFGHIJKLMN{0:02d}".format(number) for number in range(40)]
+
+
+class TestTriage(unittest.TestCase):
+
+    def setUp(self):
+        # Every fourth commit adds a key to one of five files, the last one deletes a file
+        commits = []
+        for number in range(40):
+            content = KEYS[number] + "\n" if number % 4 == 0 else "line {0}\n".format(number)
+            commits.append({"src/file_{0}.txt".format(number % 5): content})
+        commits.append({"src/file_0.txt": None})
+        self.repo = make_repo(commits)
+        self.config = SearchConfig(entropy_checks_enabled=False,
+                                   regexes=SearchConfig.default_regexes(), added_lines_only=True)
+
+    def tearDown(self):
+        remove_repo(self.repo)
+
+    def test_full_sample_matches_find_secrets(self):
+        result = triage.triage_find_secrets(self.repo, search_config=self.config,
+                                            recent_commits=5, sampled_commits=100)
+        full = find_secrets(self.repo, search_config=self.config)
+        self.assertEqual(result.commits_total, 41)
+        self.assertEqual(result.commits_scanned, 41)
+        self.assertEqual(sorted(secret.commit_hash for secret in result.secrets),
+                         sorted(secret.commit_hash for secret in full))
+        self.assertAlmostEqual(result.estimated_findings, len(full))
+        self.assertFalse(result.budget_exhausted)
+        # Every other key was overwritten or deleted since
+        self.assertEqual([secret.strings_found for secret in result.snapshot_secrets],
+                         [[KEYS[36]]])
+
+    def test_sample_is_seeded(self):
+        first = triage.triage_find_secrets(self.repo, search_config=self.config,
+                                           recent_commits=4, sampled_commits=12, seed=3)
+        second = triage.triage_find_secrets(self.repo, search_config=self.config,
+                                            recent_commits=4, sampled_commits=12, seed=3)
+        self.assertEqual(first.commits_scanned, 16)
+        self.assertEqual([secret.commit_hash for secret in first.secrets],
+                         [secret.commit_hash for secret in second.secrets])
+        self.assertGreater(first.estimated_findings, len(first.secrets))
+        self.assertIsNotNone(first.estimated_seconds)
+        self.assertEqual(first.to_dict()["sampled_commits"], 12)
+
+    def test_remote_request_is_cloned_and_released(self):
+        scratch_root = tempfile.mkdtemp()
+        self.addCleanup(remove_repo, scratch_root)
+        scratch = ScratchSpace(scratch_root)
+        self.addCleanup(scratch.close)
+        request = FindSecretsRequest("file://" + self.repo, search_config=self.config)
+        result = triage.execute_triage_request(request, recent_commits=5, sampled_commits=100,
+                                               scratch_space=scratch)
+        self.assertEqual(result.commits_scanned, 41)
+        self.assertEqual(result.to_dict()["path"], request.path)
+        scratch.drain()
+        self.assertEqual(scratch.usage, 0)
+
+    def test_time_budget(self):
+        result = triage.triage_find_secrets(self.repo, search_config=self.config,
+                                            time_budget=0.0)
+        self.assertTrue(result.budget_exhausted)
+        self.assertEqual(result.commits_scanned, 0)
+        self.assertIsNone(result.estimated_seconds)
+
+    def test_commit_and_snapshot_hunks(self):
+        commits = git_log.walk_commits(self.repo, ["master"])
+        oldest = list(commits)[-1]
+        hunks = list(git_log.iter_commit_hunks(self.repo, {oldest: "sampled"}))
+        self.assertEqual([(hunk.commit.hexsha, hunk.commit.branch_name, hunk.path)
+                          for hunk in hunks], [(oldest, "sampled", "src/file_0.txt")])
+        paths = {hunk.path for hunk in git_log.iter_snapshot_hunks(self.repo)}
+        self.assertEqual(paths, {"src/file_{0}.txt".format(number) for number in range(1, 5)})
+
+    def test_order_by_risk(self):
+        clean = make_repo([{"a.txt": "nothing here\n"}])
+        try:
+            requests = [FindSecretsRequest(clean, search_config=self.config),
+                        FindSecretsRequest("/does/not/exist", search_config=self.config),
+                        FindSecretsRequest(self.repo, search_config=self.config)]
+            with self.assertWarns(UserWarning):
+                triaged = triage.batch_triage_requests(requests, concurrency_level=2,
+                                                       sampled_commits=5)
+            self.assertIsNone(triaged[1][1])
+            self.assertEqual(triage.order_by_risk(triaged),
+                             [requests[2], requests[0], requests[1]])
+        finally:
+            remove_repo(clean)
+
+
+if __name__ == '__main__':
+    unittest.main()
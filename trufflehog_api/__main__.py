@@ -0,0 +1,9 @@
+"""
+Allows running the command line interface with ``python -m trufflehog_api``,
+see trufflehog_api.cli.
+"""
+import sys
+
+from trufflehog_api.cli import main
+
+sys.exit(main())
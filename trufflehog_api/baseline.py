@@ -0,0 +1,224 @@
+"""
+Baselines of known findings (triaged false positives, test fixtures, known
+UUIDs, lockfile hashes) that are suppressed while scanning, before a Secret
+is built. Lookups are exact, in sets of hashes.
+
+A baseline is a JSON file of the form
+
+    {
+        "version": 1,
+        "fingerprints": [sha256 of reason, matched string and path, ...],
+        "string_hashes": [sha256 of a normalized matched string, ...]
+    }
+
+Fingerprints suppress one finding at one path, string hashes suppress a
+string wherever it is found. Neither stores the matched strings themselves.
+Generate one from the JSON lines output of a previous scan with
+
+    python -m trufflehog_api.baseline scan_output.jsonl -o baseline.json
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.secret import fingerprint, normalize_string
+
+BASELINE_VERSION = 1
+
+# Absolute path to the modification time and Baseline of its latest load
+_cache: Dict[str, Tuple[float, "Baseline"]] = dict()
+_cache_lock = threading.Lock()
+
+
+def string_hash(string: str) -> str:
+    """
+    :param str string:
+        Matched string
+
+    :return: hex encoded sha256 of the normalized string
+    """
+    return hashlib.sha256(normalize_string(string).encode('utf-8', errors='replace')).hexdigest()
+
+
+class Baseline:
+    """In memory index of a baseline, answering whether a finding is already known
+    """
+
+    def __init__(self, fingerprints: Iterable[str] = None, string_hashes: Iterable[str] = None):
+        """Creates a new Baseline
+
+        :param fingerprints:
+            Fingerprints of known findings (see secret.fingerprint)
+
+        :param string_hashes:
+            Hashes of strings to suppress at any path (see string_hash)
+        """
+        self._fingerprints = frozenset(fingerprints or [])
+        self._string_hashes = frozenset(string_hashes or [])
+
+    @property
+    def fingerprints(self) -> List[str]:
+        """
+        :return: sorted fingerprints of the known findings
+        """
+        return sorted(self._fingerprints)
+
+    @property
+    def string_hashes(self) -> List[str]:
+        """
+        :return: sorted hashes of the strings suppressed at any path
+        """
+        return sorted(self._string_hashes)
+
+    def __len__(self):
+        return len(self._fingerprints) + len(self._string_hashes)
+
+    def is_known(self, reason: str, string_found: str, path: str) -> bool:
+        """
+        :param str reason:
+            Reason of the check that matched
+
+        :param str string_found:
+            Matched string
+
+        :param str path:
+            Path to file in which the string was found
+
+        :return: True if the baseline suppresses the string
+        """
+        if self._fingerprints and fingerprint(reason, string_found, path) in self._fingerprints:
+            return True
+        return bool(self._string_hashes) and string_hash(string_found) in self._string_hashes
+
+    def filter_strings(self, reason: str, strings_found: List[str], path: str) -> List[str]:
+        """
+        :return: the strings of strings_found that the baseline does not suppress
+        """
+        if not self._fingerprints and not self._string_hashes:
+            return strings_found
+        return [string for string in strings_found if not self.is_known(reason, string, path)]
+
+    def to_dict(self):
+        """
+        :return: A dict in the baseline file format
+        """
+        baseline_dict = dict()
+        baseline_dict["version"] = BASELINE_VERSION
+        baseline_dict["fingerprints"] = self.fingerprints
+        baseline_dict["string_hashes"] = self.string_hashes
+        return baseline_dict
+
+    @staticmethod
+    def from_dict(baseline_dict: dict):
+        """
+        Takes a dictionary in the baseline file format and generates a Baseline object
+
+        :raises TrufflehogApiError:
+            if the version is not supported
+        """
+        version = baseline_dict.get("version", BASELINE_VERSION)
+        if version != BASELINE_VERSION:
+            raise TrufflehogApiError('Unsupported baseline version: {0}'.format(version))
+        return Baseline(fingerprints=baseline_dict.get("fingerprints"),
+                        string_hashes=baseline_dict.get("string_hashes"))
+
+    def save(self, path: str):
+        """Writes the baseline to a JSON file"""
+        with open(path, "w") as baseline_file:
+            json.dump(self.to_dict(), baseline_file, indent=2)
+
+    @staticmethod
+    def load(path: str):
+        """
+        Reads a baseline file. The latest load of every path is cached with the file's
+        modification time, so that concurrent requests sharing a baseline index it only
+        once and a rewritten file replaces its previous version.
+
+        :raises TrufflehogApiError:
+            if the file cannot be read or parsed
+        """
+        try:
+            abs_path = os.path.abspath(path)
+            mtime = os.path.getmtime(path)
+            with _cache_lock:
+                cached = _cache.get(abs_path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            with open(path) as baseline_file:
+                baseline = Baseline.from_dict(json.load(baseline_file))
+            with _cache_lock:
+                _cache[abs_path] = (mtime, baseline)
+            return baseline
+        except (OSError, ValueError) as e:
+            raise TrufflehogApiError('Cannot load baseline {0}: {1}'.format(path, e))
+
+
+def generate_baseline(findings: Iterable[dict], suppress_strings: bool = False) -> Baseline:
+    """Builds a baseline from the findings of a previous scan
+
+    :param findings:
+        Dicts as produced by Secret.to_dict or UniqueSecret.to_dict
+
+    :param bool suppress_strings:
+        If True the matched strings are suppressed at every path, otherwise only at the
+        path they were found at (default is False)
+
+    :return: Baseline suppressing every finding
+    """
+    fingerprints = set()
+    string_hashes = set()
+    for finding in findings:
+        if "string_found" in finding:
+            strings = [finding["string_found"]]
+        else:
+            strings = finding.get("strings_found") or []
+        for string in strings:
+            if suppress_strings:
+                string_hashes.add(string_hash(string))
+            else:
+                fingerprints.add(fingerprint(finding["reason"], string, finding["path"]))
+    return Baseline(fingerprints=fingerprints, string_hashes=string_hashes)
+
+
+def read_scan_output(path: str) -> Iterable[dict]:
+    """Reads JSON lines scan output, one finding dict per line ('-' for stdin)"""
+    stream = sys.stdin if path == "-" else open(path)
+    try:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def main(argv: List[str] = None):
+    """Generates a baseline file from JSON lines scan output"""
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Generate a trufflehog_api baseline from JSON lines scan output")
+    parser.add_argument("scan_output", nargs="+",
+                        help="files of Secret.to_dict() JSON lines, '-' for stdin")
+    parser.add_argument("-o", "--output", required=True, help="baseline file to write")
+    parser.add_argument("--merge", action="store_true",
+                        help="keep the entries of an existing baseline at --output")
+    parser.add_argument("--suppress-strings", action="store_true",
+                        help="suppress the matched strings at every path")
+    args = parser.parse_args(argv)
+
+    findings = (finding for path in args.scan_output for finding in read_scan_output(path))
+    baseline = generate_baseline(findings, suppress_strings=args.suppress_strings)
+    if args.merge and os.path.exists(args.output):
+        previous = Baseline.load(args.output)
+        baseline = Baseline(fingerprints=previous.fingerprints + baseline.fingerprints,
+                            string_hashes=previous.string_hashes + baseline.string_hashes)
+    baseline.save(args.output)
+    print("Wrote {0} entries to {1}".format(len(baseline), args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Checkpoints of long running scans, so that a scan that was interrupted can be
+resumed where it stopped instead of starting over.
+
+A checkpoint is an append-only JSON lines file. The first line identifies the
+scan and the commits its branches resolved to, followed by the secrets found
+and, at most every interval seconds, the position of the walk:
+
+    {"version": 1, "key": ..., "refs": [[branch name, commit hash], ...]}
+    {"secret": Secret.to_dict()}
+    {"position": [branch index, commits done on that branch]}
+    ...
+    {"complete": true}
+
+Only the secrets written before the last position line are trusted on resume,
+anything after it belongs to commits that will be scanned again.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import IO, List, NamedTuple, Optional, Tuple
+
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.search_config import SearchConfig
+from trufflehog_api.secret import Secret
+
+CHECKPOINT_VERSION = 1
+
+
+def checkpoint_key(path: str, search_config: SearchConfig, repo_config: RepoConfig) -> str:
+    """
+    :param str path:
+        Repository URL or absolute local path, without credentials
+
+    :param SearchConfig search_config:
+        Search configuration of the scan
+
+    :param RepoConfig repo_config:
+        Repository configuration of the scan
+
+    :return: hex digest identifying the scan a checkpoint belongs to
+    """
+    key = dict()
+    key["version"] = CHECKPOINT_VERSION
+    key["path"] = path
+    key["search_config"] = search_config.fingerprint()
+    key["repo_config"] = repo_config.fingerprint()
+    key_string = json.dumps(key, sort_keys=True)
+    return hashlib.sha256(key_string.encode("utf-8")).hexdigest()
+
+
+class CheckpointState(NamedTuple):
+    """What a checkpoint file recorded about a previous run of a scan"""
+    refs: List[Tuple[str, str]]
+    position: Tuple[int, int]
+    secrets: List[Secret]
+    complete: bool
+    size: int
+
+
+class ScanCheckpoint:
+    """Writes the progress of one scan to a checkpoint file and reads it back"""
+
+    def __init__(self, path: str, interval: float = 30.0):
+        """Creates a new ScanCheckpoint
+
+        :param str path:
+            File the checkpoint is written to
+
+        :param float interval:
+            Minimum number of seconds between two positions written to disk, 0 to write
+            one after every commit (default is 30.0)
+        """
+        self._path: str = path
+        self._interval: float = interval
+        self._file: Optional[IO] = None
+        self._last_write: float = 0.0
+        self._position: Optional[Tuple[int, int]] = None
+        self._pending: List[Secret] = []
+
+    @property
+    def path(self) -> str:
+        """
+        :return: file the checkpoint is written to
+        """
+        return self._path
+
+    @property
+    def interval(self) -> float:
+        """
+        :return: minimum number of seconds between two positions written to disk
+        """
+        return self._interval
+
+    def load(self, key: str) -> Optional[CheckpointState]:
+        """Reads the checkpoint file
+
+        :param str key:
+            Key of the scan to resume, see checkpoint_key
+
+        :return: the recorded state, None if there is no checkpoint for this scan
+        """
+        try:
+            checkpoint_file = open(self._path, "rb")
+        except FileNotFoundError:
+            return None
+        with checkpoint_file:
+            try:
+                header = json.loads(checkpoint_file.readline())
+            except ValueError:
+                return None
+            if header.get("version") != CHECKPOINT_VERSION or header.get("key") != key:
+                return None
+            size = checkpoint_file.tell()
+            position = (0, 0)
+            secrets = []
+            pending = []
+            complete = False
+            for line in checkpoint_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn write of the last line when the process died
+                    break
+                if "secret" in entry:
+                    pending.append(entry["secret"])
+                    continue
+                if "position" in entry:
+                    position = tuple(entry["position"])
+                elif entry.get("complete"):
+                    complete = True
+                secrets.extend(pending)
+                pending = []
+                size = checkpoint_file.tell()
+        return CheckpointState(refs=[tuple(ref) for ref in header["refs"]], position=position,
+                               secrets=[Secret.from_dict(secret) for secret in secrets],
+                               complete=complete, size=size)
+
+    def start(self, key: str, refs: List[Tuple[str, str]]):
+        """Starts a new checkpoint file, replacing any previous one
+
+        :param str key:
+            Key of the scan, see checkpoint_key
+
+        :param list refs:
+            (branch name, commit hash) pairs the scan walks
+        """
+        header = dict()
+        header["version"] = CHECKPOINT_VERSION
+        header["key"] = key
+        header["refs"] = [list(ref) for ref in refs]
+        self._open("w")
+        self._write(header)
+        self._sync()
+
+    def resume(self, state: CheckpointState):
+        """Reopens the checkpoint file of a loaded state to continue writing it, dropping
+        the secrets written after its last position
+        """
+        self._open("r+")
+        self._file.truncate(state.size)
+        self._file.seek(state.size)
+
+    def add_secret(self, secret: Secret):
+        """Records a secret found by the scan. It is written once the commit it was found
+        in is reported done by progress.
+        """
+        self._pending.append(secret)
+
+    def progress(self, branch_index: int, commits_done: int):
+        """Records the position of the walk once the interval since the previous one has
+        passed. Every secret of the commits before the position must have been added.
+
+        :param int branch_index:
+            Index of the branch being walked
+
+        :param int commits_done:
+            Number of commits of that branch that have been scanned
+        """
+        self._write_pending()
+        self._position = (branch_index, commits_done)
+        if time.monotonic() - self._last_write >= self._interval:
+            self._write_position()
+
+    def complete(self):
+        """Records that the scan finished"""
+        entry = dict()
+        entry["complete"] = True
+        self._write_pending()
+        self._position = None
+        self._write(entry)
+        self._sync()
+
+    def close(self):
+        """Writes out the last position and closes the checkpoint file. Secrets of a
+        commit that was not finished are dropped, it is scanned again on resume.
+        """
+        self._pending = []
+        if self._file is not None:
+            if self._position is not None:
+                self._write_position()
+            self._file.close()
+            self._file = None
+
+    def _open(self, mode: str):
+        self.close()
+        try:
+            self._file = open(self._path, mode)
+        except OSError as e:
+            raise TrufflehogApiError('Cannot open checkpoint {0}: {1}'.format(self._path, e))
+        self._last_write = time.monotonic()
+
+    def _write_position(self):
+        entry = dict()
+        entry["position"] = list(self._position)
+        self._write(entry)
+        self._sync()
+        self._position = None
+
+    def _write_pending(self):
+        for secret in self._pending:
+            entry = dict()
+            entry["secret"] = secret.to_dict()
+            self._write(entry)
+        self._pending = []
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry, default=str) + "\n")
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_write = time.monotonic()
@@ -0,0 +1,296 @@
+"""
+Command line entry point for scanning many repositories in one run.
+
+    python -m trufflehog_api repos.txt --search-config search.json --workers 8 -o out.jsonl
+
+Repository paths or URLs are read one per line from a file or stdin ('#'
+starts a comment line). Every repository is searched with the same RepoConfig and
+SearchConfig, given as JSON dicts in the from_dict formats, either inline or
+as the path of a JSON file. Secrets are written as JSON lines as soon as the
+search of their repository finishes, and a summary of the throughput and the
+failures is printed to stderr at the end. With --dry-run nothing is searched,
+a cost estimate of every repository is written instead. With --fork-store the
+forks among the repositories are fetched into shared object stores and their
+common history is searched once.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import IO, Iterator, List
+
+from trufflehog_api.concurrency import AdaptiveConcurrency
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.estimate import CostEstimator
+from trufflehog_api.findings_store import FindingsStore
+from trufflehog_api.forks import ForkStore
+from trufflehog_api.metrics import default_registry
+from trufflehog_api.find_secrets import (FindSecretsRequest,
+                                         iter_batch_execute_find_secrets_request)
+from trufflehog_api.pipeline import PipelineMetrics
+from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.result_cache import ResultCache
+from trufflehog_api.scheduler import BatchScheduler, DurationHistory
+from trufflehog_api.scratch import ScratchSpace
+from trufflehog_api.search_config import SearchConfig
+
+# Exit codes
+EXIT_OK = 0
+EXIT_FINDINGS = 1
+EXIT_FAILURES = 2
+
+
+def read_repositories(stream: IO) -> Iterator[str]:
+    """
+    :param stream:
+        Text stream with one repository path or URL per line
+
+    :return: generator of the paths, skipping blank lines and '#' comments
+    """
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def load_json_argument(value: str) -> dict:
+    """
+    :param str value:
+        Inline JSON object or path to a file containing one
+
+    :raises TrufflehogApiError:
+        if the JSON cannot be read or parsed
+
+    :return: the parsed dict
+    """
+    try:
+        if value.lstrip().startswith("{"):
+            return json.loads(value)
+        with open(value) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError) as e:
+        raise TrufflehogApiError('Cannot read JSON configuration {0}: {1}'.format(value, e))
+
+
+def _parse_args(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m trufflehog_api",
+        description="Search many git repositories for secrets, writing JSON lines")
+    parser.add_argument("repositories", nargs="?", default="-",
+                        help="file with one repository path or URL per line, '-' for stdin "
+                             "(default)")
+    parser.add_argument("-s", "--search-config",
+                        help="SearchConfig as a JSON dict or the path of a JSON file")
+    parser.add_argument("-r", "--repo-config",
+                        help="RepoConfig as a JSON dict or the path of a JSON file")
+    parser.add_argument("-w", "--workers", type=int, default=4,
+                        help="repositories searched concurrently (default is 4)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="adjust the number of repositories searched concurrently between "
+                             "1 and --workers from the CPU, memory and scratch space usage")
+    parser.add_argument("--clone-workers", type=int,
+                        help="remote repositories cloned concurrently (default is --workers)")
+    parser.add_argument("--max-clones-per-host", type=int,
+                        help="remote repositories cloned concurrently from the same host")
+    parser.add_argument("--separate-walks", action="store_true",
+                        help="search every request on its own, even when several name the "
+                             "same repository")
+    parser.add_argument("--max-rss", type=int,
+                        help="bytes of resident memory above which no further searches "
+                             "start until running ones finish")
+    parser.add_argument("-o", "--output", default="-",
+                        help="file to write the JSON lines to, '-' for stdout (default)")
+    parser.add_argument("--no-diff", action="store_true",
+                        help="leave the diffs out of the output")
+    parser.add_argument("--store",
+                        help="also add the secrets to this SQLite findings store as a new scan")
+    parser.add_argument("--cache-dir", help="cache whole-scan results in this directory")
+    parser.add_argument("--checkpoint-dir", help="write a checkpoint per repository here")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the searches recorded in --checkpoint-dir")
+    parser.add_argument("--scratch-dir",
+                        help="clone remote repositories under this directory, e.g. a tmpfs")
+    parser.add_argument("--scratch-quota", type=int,
+                        help="bytes of clones above which new clones wait for space")
+    parser.add_argument("--schedule", action="store_true",
+                        help="search the largest of the repositories read ahead first")
+    parser.add_argument("--lookahead", type=int,
+                        help="repositories read ahead of the results and ordered by "
+                             "--schedule (default is a few per worker)")
+    parser.add_argument("--durations",
+                        help="JSON file of previous scan durations to order by, updated at "
+                             "the end (implies --schedule)")
+    parser.add_argument("--shard-commits", type=int,
+                        help="split histories longer than this many commits into shards "
+                             "searched in parallel (implies --schedule)")
+    parser.add_argument("--estimates",
+                        help="JSON file of cost measurements to order by and calibrate on, "
+                             "updated at the end (implies --schedule)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="write a cost estimate per local repository instead of "
+                             "searching, calibrated on --durations if given")
+    parser.add_argument("--fork-store",
+                        help="fetch remote repositories into shared object stores per group "
+                             "of forks under this directory and search shared commits once "
+                             "(cannot be combined with --checkpoint-dir)")
+    parser.add_argument("--fork-groups",
+                        help="JSON object of repository path or URL to group name, for "
+                             "--fork-store (default: group by shared root commits)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics on this local port while the batch runs")
+    parser.add_argument("--fail-on-findings", action="store_true",
+                        help="exit with status 1 when secrets are found")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> int:
+    """Runs the command line interface
+
+    :param list argv:
+        Arguments without the program name (default is None, sys.argv is used)
+
+    :return: exit status, 0 on success, 1 if secrets were found and --fail-on-findings
+    was given, 2 if the search of a repository failed
+    """
+    args = _parse_args(argv)
+    try:
+        search_config = (SearchConfig.from_dict(load_json_argument(args.search_config))
+                         if args.search_config else None)
+        repo_config = (RepoConfig.from_dict(load_json_argument(args.repo_config))
+                       if args.repo_config else None)
+        result_cache = ResultCache(args.cache_dir) if args.cache_dir else None
+        scratch_space = None
+        if args.scratch_dir or args.scratch_quota:
+            scratch_space = ScratchSpace(args.scratch_dir, max_bytes=args.scratch_quota)
+        estimator = CostEstimator(args.estimates) if args.estimates or args.dry_run else None
+        store = FindingsStore(args.store) if args.store and not args.dry_run else None
+        if args.fork_store and args.checkpoint_dir:
+            raise TrufflehogApiError("--fork-store cannot be combined with --checkpoint-dir")
+        fork_store = ForkStore(args.fork_store) if args.fork_store else None
+        fork_groups = load_json_argument(args.fork_groups) if args.fork_groups else None
+        adaptive_concurrency = None
+        if args.adaptive:
+            adaptive_concurrency = AdaptiveConcurrency(max_workers=args.workers,
+                                                       max_rss_bytes=args.max_rss,
+                                                       max_scratch_bytes=args.scratch_quota)
+        scheduler = None
+        if args.dry_run:
+            if args.durations:
+                estimator.calibrate(DurationHistory(args.durations))
+        elif args.schedule or args.durations or args.shard_commits or args.estimates:
+            scheduler = BatchScheduler(history=DurationHistory(args.durations),
+                                       shard_commits=args.shard_commits, estimator=estimator)
+        metrics_server = (default_registry().serve(args.metrics_port)
+                          if args.metrics_port is not None and not args.dry_run else None)
+    except TrufflehogApiError as e:
+        print("Error: {0}".format(e), file=sys.stderr)
+        return EXIT_FAILURES
+
+    input_stream = sys.stdin if args.repositories == "-" else open(args.repositories)
+    output_stream = sys.stdout if args.output == "-" else open(args.output, "w")
+    requests = (FindSecretsRequest(path, repo_config=repo_config, search_config=search_config)
+                for path in read_repositories(input_stream))
+    if args.dry_run:
+        return _dry_run(requests, estimator, input_stream, output_stream)
+    start = time.perf_counter()
+    repositories = 0
+    secrets_found = 0
+    failures = []
+    metrics = PipelineMetrics()
+    scan_id = store.begin_scan("python -m trufflehog_api") if store is not None else None
+    try:
+        results = iter_batch_execute_find_secrets_request(
+            requests, concurrency_level=args.workers, result_cache=result_cache,
+            checkpoint_dir=args.checkpoint_dir, resume=args.resume,
+            scratch_space=scratch_space, clone_concurrency_level=args.clone_workers,
+            max_clones_per_host=args.max_clones_per_host, metrics=metrics,
+            scheduler=scheduler, lookahead=args.lookahead,
+            max_rss_bytes=args.max_rss, share_traversal=not args.separate_walks,
+            adaptive_concurrency=adaptive_concurrency, fork_store=fork_store,
+            fork_groups=fork_groups)
+        for request, future in results:
+            repositories += 1
+            try:
+                secrets = future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                failures.append((request.path, str(e) or repr(e)))
+                print("Error: {0}: {1}".format(request.path, failures[-1][1]), file=sys.stderr)
+                if store is not None:
+                    store.add_failure(scan_id, request.path, failures[-1][1])
+                continue
+            for secret in secrets:
+                secret_dict = secret.to_dict()
+                if args.no_diff:
+                    del secret_dict["diff"]
+                secret_dict["repository"] = request.path
+                output_stream.write(json.dumps(secret_dict, default=str) + "\n")
+            output_stream.flush()
+            if store is not None:
+                store.add_all(scan_id, request.path, secrets)
+            secrets_found += len(secrets)
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+        if scratch_space is not None:
+            scratch_space.close()
+        if scheduler is not None:
+            scheduler.history.save()
+        if estimator is not None:
+            estimator.save()
+        if store is not None:
+            store.finish_scan(scan_id)
+            store.close()
+        if metrics_server is not None:
+            metrics_server.close()
+
+    elapsed = time.perf_counter() - start
+    _print_summary(repositories, secrets_found, failures, elapsed, metrics)
+    if failures:
+        return EXIT_FAILURES
+    if secrets_found and args.fail_on_findings:
+        return EXIT_FINDINGS
+    return EXIT_OK
+
+
+def _dry_run(requests: Iterator[FindSecretsRequest], estimator: CostEstimator,
+             input_stream: IO, output_stream: IO) -> int:
+    """Writes the estimate of every request as a JSON line
+
+    :return: exit status, 2 if a repository could not be estimated
+    """
+    failures = 0
+    try:
+        for request in requests:
+            try:
+                estimate = estimator.estimate(request)
+            except TrufflehogApiError as e:
+                failures += 1
+                print("Error: {0}: {1}".format(request.path, e), file=sys.stderr)
+                continue
+            estimate_dict = estimate.to_dict()
+            estimate_dict["repository"] = request.path
+            output_stream.write(json.dumps(estimate_dict) + "\n")
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+        estimator.save()
+    return EXIT_FAILURES if failures else EXIT_OK
+
+
+def _print_summary(repositories: int, secrets_found: int, failures: list, elapsed: float,
+                   metrics: PipelineMetrics):
+    rate = repositories / elapsed if elapsed > 0 else 0.0
+    print("Searched {0} repositories in {1:.1f}s ({2:.2f} repositories/s): {3} secrets found, "
+          "{4} failed".format(repositories, elapsed, rate, secrets_found, len(failures)),
+          file=sys.stderr)
+    print("  pipeline: {0}".format(metrics), file=sys.stderr)
+    for path, error in failures:
+        print("  failed: {0}: {1}".format(path, error), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
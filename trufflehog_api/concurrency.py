@@ -0,0 +1,328 @@
+"""
+Adaptive concurrency for batches. Instead of a fixed number of scan workers,
+an AdaptiveConcurrency admits searches up to a limit that it moves between
+configured bounds, AIMD style: the limit grows by one while searches are
+waiting and the CPUs have headroom, and is cut by a factor as soon as CPU
+utilization, the resident set size or the scratch space in use is over its
+threshold. Samples are only taken when a search asks to start, so an idle
+batch costs nothing. Every decision is logged to the "trufflehog_api.concurrency"
+logger and kept in a bounded list for tuning.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, List, NamedTuple, Optional, Tuple
+
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.memory import current_rss
+from trufflehog_api.scratch import ScratchSpace
+
+INCREASE = "increase"
+DECREASE = "decrease"
+HOLD = "hold"
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ResourceSample(NamedTuple):
+    """Resource usage read by an AdaptiveConcurrency, None where it cannot be read"""
+    cpu: Optional[float]
+    rss: Optional[int]
+    scratch_bytes: Optional[int]
+    clones_per_second: Optional[float]
+    active: int
+    waiting: int
+
+
+class ConcurrencyDecision(NamedTuple):
+    """A change, or the lack of one, of the limit of an AdaptiveConcurrency"""
+    elapsed: float
+    action: str
+    limit: int
+    reason: str
+    sample: ResourceSample
+
+
+class AdaptiveConcurrency:
+    """Admission control for the searches of a batch. A ScanPipeline given an
+    AdaptiveConcurrency starts max_workers scan workers, each of which asks the
+    controller before it starts a search and waits while limit searches are running.
+    """
+
+    def __init__(self,
+                 min_workers: int = 1,
+                 max_workers: int = None,
+                 initial_workers: int = None,
+                 target_cpu: float = 0.85,
+                 max_cpu: float = 0.98,
+                 max_rss_bytes: int = None,
+                 max_scratch_bytes: int = None,
+                 sample_interval: float = 1.0,
+                 decrease_factor: float = 0.5,
+                 poll_interval: float = 0.05,
+                 max_decisions: int = 1000):
+        """Creates a new AdaptiveConcurrency
+
+        :param int min_workers:
+            Lowest limit (default is 1)
+
+        :param int max_workers:
+            Highest limit and number of scan workers started
+            (default is None, twice the number of CPUs)
+
+        :param int initial_workers:
+            Limit to start from (default is None, the number of CPUs within the bounds)
+
+        :param float target_cpu:
+            Utilization of all CPUs, between 0 and 1, below which the limit may grow
+            (default is 0.85)
+
+        :param float max_cpu:
+            Utilization of all CPUs above which the limit is cut (default is 0.98)
+
+        :param int max_rss_bytes:
+            Resident set size of the process and its children above which the limit
+            is cut (default is None, not considered)
+
+        :param int max_scratch_bytes:
+            Bytes of clones in the scratch space above which the limit is cut
+            (default is None, not considered)
+
+        :param float sample_interval:
+            Seconds between two decisions (default is 1.0)
+
+        :param float decrease_factor:
+            Factor the limit is multiplied by on a cut (default is 0.5)
+
+        :param float poll_interval:
+            Seconds between two checks of a waiting search (default is 0.05)
+
+        :param int max_decisions:
+            Number of the latest decisions kept in decisions (default is 1000)
+
+        :raises TrufflehogApiError:
+            if the bounds are not positive and ordered or decrease_factor is not
+            between 0 and 1
+        """
+        cpus = os.cpu_count() or 1
+        if max_workers is None:
+            max_workers = max(2 * cpus, min_workers)
+        if not 1 <= min_workers <= max_workers:
+            raise TrufflehogApiError('Concurrency bounds must satisfy 1 <= min_workers <= '
+                                     'max_workers')
+        if not 0 < decrease_factor < 1:
+            raise TrufflehogApiError('decrease_factor must be between 0 and 1')
+        if initial_workers is None:
+            initial_workers = cpus
+        self._min_workers: int = min_workers
+        self._max_workers: int = max_workers
+        self._limit: int = min(max(initial_workers, min_workers), max_workers)
+        self._target_cpu: float = target_cpu
+        self._max_cpu: float = max_cpu
+        self._max_rss_bytes: Optional[int] = max_rss_bytes
+        self._max_scratch_bytes: Optional[int] = max_scratch_bytes
+        self._sample_interval: float = sample_interval
+        self._decrease_factor: float = decrease_factor
+        self._poll_interval: float = poll_interval
+        self._lock = threading.Condition()
+        self._active: int = 0
+        self._waiting: int = 0
+        self._decisions: Deque[ConcurrencyDecision] = deque(maxlen=max_decisions)
+        self._started: float = time.monotonic()
+        self._sampled: float = self._started
+        self._cpu_times: Optional[Tuple[float, float]] = _cpu_times()
+        self._metrics = None
+        self._scratch_space: Optional[ScratchSpace] = None
+        self._clones: int = 0
+
+    @property
+    def min_workers(self) -> int:
+        """
+        :return: lowest limit
+        """
+        return self._min_workers
+
+    @property
+    def max_workers(self) -> int:
+        """
+        :return: highest limit
+        """
+        return self._max_workers
+
+    @property
+    def limit(self) -> int:
+        """
+        :return: number of searches currently allowed to run at the same time
+        """
+        return self._limit
+
+    @property
+    def active(self) -> int:
+        """
+        :return: number of searches currently running
+        """
+        return self._active
+
+    @property
+    def decisions(self) -> List[ConcurrencyDecision]:
+        """
+        :return: the latest decisions, oldest first
+        """
+        with self._lock:
+            return list(self._decisions)
+
+    def attach(self, metrics: "PipelineMetrics" = None, scratch_space: ScratchSpace = None):
+        """Sets where the clone throughput and the scratch space usage are read from,
+        done by the ScanPipeline the controller is given to
+
+        :param PipelineMetrics metrics:
+            Metrics of the running pipeline
+
+        :param ScratchSpace scratch_space:
+            Scratch space the pipeline clones into
+        """
+        with self._lock:
+            self._metrics = metrics
+            self._scratch_space = scratch_space
+            self._clones = metrics.clones if metrics is not None else 0
+
+    def acquire(self) -> float:
+        """Admits a search, waiting while limit searches are running
+
+        :return: seconds the search waited
+        """
+        start = time.monotonic()
+        with self._lock:
+            self._maybe_adjust()
+            if self._active >= self._limit:
+                self._waiting += 1
+                try:
+                    while self._active >= self._limit:
+                        self._lock.wait(self._poll_interval)
+                        self._maybe_adjust()
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+        return time.monotonic() - start
+
+    def release(self):
+        """Ends a search admitted by acquire"""
+        with self._lock:
+            self._active -= 1
+            self._lock.notify_all()
+
+    def sample(self) -> ResourceSample:
+        """Reads the current resource usage. CPU utilization and clone throughput are
+        averaged since the previous sample.
+
+        :return: the sample
+        """
+        with self._lock:
+            return self._sample(time.monotonic())
+
+    def adjust(self, sample: ResourceSample) -> ConcurrencyDecision:
+        """Moves the limit according to a sample and logs the decision
+
+        :param ResourceSample sample:
+            Resource usage to decide on
+
+        :return: the decision
+        """
+        with self._lock:
+            return self._adjust(sample)
+
+    def _maybe_adjust(self):
+        """Samples and decides once sample_interval has passed, with the lock held"""
+        now = time.monotonic()
+        if now - self._sampled >= self._sample_interval:
+            self._adjust(self._sample(now))
+
+    def _sample(self, now: float) -> ResourceSample:
+        elapsed = now - self._sampled
+        self._sampled = now
+        cpu = None
+        cpu_times = _cpu_times()
+        if cpu_times is not None and self._cpu_times is not None:
+            busy = cpu_times[0] - self._cpu_times[0]
+            total = cpu_times[1] - self._cpu_times[1]
+            cpu = busy / total if total > 0 else None
+        self._cpu_times = cpu_times
+        rss = current_rss(include_children=True) if self._max_rss_bytes is not None else None
+        scratch_bytes = self._scratch_space.usage if self._scratch_space is not None else None
+        clones_per_second = None
+        if self._metrics is not None:
+            clones = self._metrics.clones
+            if elapsed > 0:
+                clones_per_second = (clones - self._clones) / elapsed
+            self._clones = clones
+        return ResourceSample(cpu, rss, scratch_bytes, clones_per_second, self._active,
+                              self._waiting)
+
+    def _adjust(self, sample: ResourceSample) -> ConcurrencyDecision:
+        over = []
+        if sample.cpu is not None and sample.cpu > self._max_cpu:
+            over.append("cpu {0:.0%}".format(sample.cpu))
+        if self._max_rss_bytes is not None and sample.rss is not None \
+                and sample.rss > self._max_rss_bytes:
+            over.append("rss {0} bytes".format(sample.rss))
+        if self._max_scratch_bytes is not None and sample.scratch_bytes is not None \
+                and sample.scratch_bytes > self._max_scratch_bytes:
+            over.append("scratch {0} bytes".format(sample.scratch_bytes))
+
+        action = HOLD
+        limit = self._limit
+        if over:
+            reason = "over threshold: " + ", ".join(over)
+            if limit > self._min_workers:
+                action = DECREASE
+                limit = max(self._min_workers, int(limit * self._decrease_factor))
+        elif not sample.waiting:
+            # The searches are held up by the clone stage, not by the limit
+            reason = "no search waiting"
+        elif limit >= self._max_workers:
+            reason = "at max_workers"
+        elif sample.cpu is not None and sample.cpu >= self._target_cpu:
+            reason = "cpu {0:.0%} at target".format(sample.cpu)
+        else:
+            action = INCREASE
+            limit += 1
+            reason = "{0} searches waiting".format(sample.waiting)
+
+        self._limit = limit
+        decision = ConcurrencyDecision(time.monotonic() - self._started, action, limit,
+                                       reason, sample)
+        self._decisions.append(decision)
+        _LOGGER.log(logging.DEBUG if action == HOLD else logging.INFO,
+                    "%s to %d searches: %s (cpu %s, rss %s, scratch %s, clones/s %s, "
+                    "%d active, %d waiting)", action, limit, reason, sample.cpu, sample.rss,
+                    sample.scratch_bytes, sample.clones_per_second, sample.active,
+                    sample.waiting)
+        if action == INCREASE:
+            self._lock.notify_all()
+        return decision
+
+
+def _cpu_times() -> Optional[Tuple[float, float]]:
+    """
+    :return: (busy, total) CPU time of all CPUs since boot from /proc/stat, or from
+    psutil where there is no /proc, None if neither is available
+    """
+    try:
+        with open("/proc/stat") as stat:
+            values = [float(value) for value in stat.readline().split()[1:]]
+        # user nice system idle iowait irq softirq steal, guest time is part of user
+        idle = sum(values[3:5])
+        total = sum(values[:8])
+        return total - idle, total
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    times = psutil.cpu_times()
+    idle = times.idle + getattr(times, "iowait", 0.0)
+    total = sum(times)
+    return total - idle, total
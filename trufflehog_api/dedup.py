@@ -0,0 +1,172 @@
+"""
+Collapses the Secrets found across commits and branches into one record per
+unique secret, keyed by fingerprint, while the scan is running.
+"""
+from typing import Dict, Iterable, List
+
+from trufflehog_api.secret import Secret, fingerprint
+
+
+class UniqueSecret:
+    """
+    A distinct secret (reason, matched string and path) together with the first
+    and last commits it was seen in and the number of times it was found.
+    """
+
+    def __init__(self, secret: Secret, string_found: str):
+        """Creates a new UniqueSecret from its first occurrence
+
+        :param Secret secret:
+            First Secret containing the string
+
+        :param str string_found:
+            The matched string this record stands for
+        """
+        self._fingerprint: str = fingerprint(secret.reason, string_found, secret.path)
+        self._reason: str = secret.reason
+        self._path: str = secret.path
+        self._string_found: str = string_found
+        self._first_seen: Secret = secret
+        self._last_seen: Secret = secret
+        self._occurrences: int = 1
+        self._branch_names: Dict[str, None] = {secret.branch_name: None}
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        :return: fingerprint of the reason, normalized string and path
+        """
+        return self._fingerprint
+
+    @property
+    def reason(self) -> str:
+        """
+        :return: reason why the secret was flagged
+        """
+        return self._reason
+
+    @property
+    def path(self) -> str:
+        """
+        :return: path to file in which the secret can be found
+        """
+        return self._path
+
+    @property
+    def string_found(self) -> str:
+        """
+        :return: the matched string, as found in its first occurrence
+        """
+        return self._string_found
+
+    @property
+    def first_seen(self) -> Secret:
+        """
+        :return: the occurrence with the oldest commit time
+        """
+        return self._first_seen
+
+    @property
+    def last_seen(self) -> Secret:
+        """
+        :return: the occurrence with the newest commit time
+        """
+        return self._last_seen
+
+    @property
+    def occurrences(self) -> int:
+        """
+        :return: number of Secrets the string was found in
+        """
+        return self._occurrences
+
+    @property
+    def branch_names(self) -> List[str]:
+        """
+        :return: branches the secret was found on, in order of discovery
+        """
+        return list(self._branch_names)
+
+    def add(self, secret: Secret):
+        """Records another occurrence of the secret"""
+        self._occurrences += 1
+        self._branch_names[secret.branch_name] = None
+        # truffleHog formats commit times as '%Y-%m-%d %H:%M:%S', which sorts as text
+        if str(secret.commit_time) < str(self._first_seen.commit_time):
+            self._first_seen = secret
+        if str(secret.commit_time) > str(self._last_seen.commit_time):
+            self._last_seen = secret
+
+    def to_dict(self):
+        """
+        :return: Returns a dict containing all the attributes of a UniqueSecret, with the
+        first and last occurrences reduced to their commit hash and time
+        """
+        unique_dict = dict()
+        unique_dict["fingerprint"] = self._fingerprint
+        unique_dict["reason"] = self._reason
+        unique_dict["path"] = self._path
+        unique_dict["string_found"] = self._string_found
+        unique_dict["first_seen_commit_hash"] = self._first_seen.commit_hash
+        unique_dict["first_seen_commit_time"] = self._first_seen.commit_time
+        unique_dict["last_seen_commit_hash"] = self._last_seen.commit_hash
+        unique_dict["last_seen_commit_time"] = self._last_seen.commit_time
+        unique_dict["occurrences"] = self._occurrences
+        unique_dict["branch_names"] = self.branch_names
+        return unique_dict
+
+    def __repr__(self):
+        return ("UniqueSecret(fingerprint={0}, reason={1}, path={2}, occurrences={3}, "
+                "first_seen={4}, last_seen={5})"
+                .format(self._fingerprint, self._reason, self._path, self._occurrences,
+                        self._first_seen.commit_hash, self._last_seen.commit_hash))
+
+
+class SecretIndex:
+    """Hash index from fingerprint to UniqueSecret, filled one Secret at a time.
+    Secrets without matched strings are indexed by their own fingerprint.
+    """
+
+    def __init__(self):
+        """Creates an empty index"""
+        self._unique: Dict[str, UniqueSecret] = dict()
+        self._secrets_added: int = 0
+
+    def add(self, secret: Secret):
+        """Indexes every matched string of a Secret
+
+        :param Secret secret:
+            Secret to index
+        """
+        self._secrets_added += 1
+        for string_found in secret.strings_found or [""]:
+            key = fingerprint(secret.reason, string_found, secret.path)
+            unique = self._unique.get(key)
+            if unique is None:
+                self._unique[key] = UniqueSecret(secret, string_found)
+            else:
+                unique.add(secret)
+
+    def add_all(self, secrets: Iterable[Secret]):
+        """Indexes every Secret of an iterable, consuming it lazily"""
+        for secret in secrets:
+            self.add(secret)
+
+    @property
+    def secrets_added(self) -> int:
+        """
+        :return: number of Secrets indexed so far
+        """
+        return self._secrets_added
+
+    def __len__(self):
+        return len(self._unique)
+
+    def __contains__(self, key: str):
+        return key in self._unique
+
+    def results(self) -> List[UniqueSecret]:
+        """
+        :return: one UniqueSecret per distinct secret, in order of discovery
+        """
+        return list(self._unique.values())
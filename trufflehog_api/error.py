@@ -13,7 +13,8 @@ class TrufflehogApiError(Exception):
         super(TrufflehogApiError, self).__init__(reason)
 
     def __str__(self):
-        return self.reason
+        # reason may be the wrapped exception itself
+        return str(self.reason)
 
     def __repr__(self):
         return ('TrufflehogApiError(reason={0}, response={1}, api_code={2})'
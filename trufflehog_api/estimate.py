@@ -0,0 +1,335 @@
+"""
+Dry-run cost estimates of find secrets requests. A CostEstimator lists the
+commits a search would walk and the file versions they introduce, straight from
+the object database of a local repository or of a cached mirror, without
+producing a single diff or running any check. The runtime prediction is linear
+in the commit count and the bytes left after the path filters, with
+coefficients fitted to the durations of previous scans, so a BatchScheduler or a
+budget check can use it before anything is cloned or searched.
+"""
+import json
+import os
+import subprocess
+import tempfile
+import threading
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from trufflehog_api import git_log
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.repository import FindSecretsRequest, is_local_repository
+from trufflehog_api.mirror import MirrorCache
+from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.scanner import Scanner
+from trufflehog_api.scheduler import DurationHistory, repository_key
+from trufflehog_api.search_config import SearchConfig
+
+# Type, size and path of every object listed by git rev-list --objects
+_BATCH_CHECK_FORMAT = '--batch-check=%(objecttype) %(objectsize) %(rest)'
+
+
+class ScanEstimate(NamedTuple):
+    """Estimated size and duration of the search of a request"""
+    commits: int
+    blobs: int
+    blob_bytes: int
+    diff_bytes: int
+    seconds: float
+
+    def to_dict(self) -> dict:
+        """
+        :return: the estimate as a JSON serializable dict
+        """
+        return dict(self._asdict())
+
+
+class CostEstimator:
+    """Measures requests from the object database and predicts their search time.
+    The measurements of every repository are remembered, optionally in a JSON file,
+    so that the durations of their scans can later be added as samples and the
+    seconds per commit and per byte fitted to them.
+    """
+
+    def __init__(self,
+                 path: str = None,
+                 seconds_per_commit: float = 0.002,
+                 seconds_per_byte: float = 2e-8,
+                 mirror_cache: MirrorCache = None):
+        """Creates a new CostEstimator, loading path if it exists
+
+        :param str path:
+            JSON file the measurements and durations are loaded from and saved to
+            (default is None, they are only kept in memory)
+
+        :param float seconds_per_commit:
+            Search time per commit used until there are durations to fit it to
+
+        :param float seconds_per_byte:
+            Search time per byte of file versions used until there are durations to
+            fit it to
+
+        :param MirrorCache mirror_cache:
+            Mirrors of remote repositories. A remote request can only be estimated if
+            its mirror exists, it is never fetched
+            (default is None, only local repositories can be estimated)
+
+        :raises TrufflehogApiError:
+            if the file exists but cannot be read
+        """
+        self._path: Optional[str] = path
+        self._default_seconds_per_commit: float = seconds_per_commit
+        self._default_seconds_per_byte: float = seconds_per_byte
+        self._seconds_per_commit: float = seconds_per_commit
+        self._seconds_per_byte: float = seconds_per_byte
+        self._mirror_cache: Optional[MirrorCache] = mirror_cache
+        self._lock = threading.Lock()
+        # Repository to [commits, diff bytes] and, once scanned, the seconds it took
+        self._measurements: Dict[str, Tuple[int, int]] = dict()
+        self._durations: Dict[str, float] = dict()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as estimator_file:
+                    for key, values in json.load(estimator_file).items():
+                        self._measurements[key] = (int(values[0]), int(values[1]))
+                        if len(values) > 2:
+                            self._durations[key] = float(values[2])
+            except (OSError, ValueError, AttributeError, IndexError, TypeError) as e:
+                raise TrufflehogApiError('Cannot read cost estimates {0}: {1}'.format(path, e))
+            self._fit()
+
+    @property
+    def path(self) -> Optional[str]:
+        """
+        :return: JSON file the measurements and durations are saved to
+        """
+        return self._path
+
+    @property
+    def seconds_per_commit(self) -> float:
+        """
+        :return: the current search time per commit
+        """
+        return self._seconds_per_commit
+
+    @property
+    def seconds_per_byte(self) -> float:
+        """
+        :return: the current search time per byte of file versions
+        """
+        return self._seconds_per_byte
+
+    @property
+    def samples(self) -> int:
+        """
+        :return: number of repositories with both a measurement and a duration
+        """
+        return len(self._durations)
+
+    def estimate(self, request: FindSecretsRequest) -> ScanEstimate:
+        """Measures the history a request searches and predicts how long it takes
+
+        :param FindSecretsRequest request:
+            Request to estimate
+
+        :raises TrufflehogApiError:
+            if there is no local copy of the repository, git fails or the search
+            configuration is invalid
+
+        :return: the estimate
+        """
+        commits, blobs, blob_bytes, diff_bytes = measure(self._local_path(request.path),
+                                                         request.repo_config,
+                                                         request.search_config)
+        with self._lock:
+            self._measurements[repository_key(request.path)] = (commits, diff_bytes)
+            seconds = self._predict(commits, diff_bytes)
+        return ScanEstimate(commits, blobs, blob_bytes, diff_bytes, seconds)
+
+    def record(self, request: FindSecretsRequest, seconds: float):
+        """Adds the duration of a scan of a previously estimated request as a sample
+        and fits the coefficients again
+
+        :param FindSecretsRequest request:
+            Request that finished
+
+        :param float seconds:
+            Time its clone and search took
+        """
+        key = repository_key(request.path)
+        with self._lock:
+            if key in self._measurements:
+                self._durations[key] = seconds
+                self._fit()
+
+    def calibrate(self, history: DurationHistory) -> int:
+        """Adds the durations of every measured repository found in a history, e.g.
+        the one kept by a BatchScheduler, and fits the coefficients again
+
+        :param DurationHistory history:
+            Durations of previous scans
+
+        :return: number of samples the coefficients are now fitted to
+        """
+        with self._lock:
+            for key in self._measurements:
+                seconds = history.get(key)
+                if seconds is not None:
+                    self._durations[key] = seconds
+            self._fit()
+            return len(self._durations)
+
+    def save(self):
+        """Writes the measurements and durations to the JSON file, if there is one"""
+        if not self._path:
+            return
+        with self._lock:
+            entries = dict()
+            for key, measurement in self._measurements.items():
+                entries[key] = list(measurement)
+                if key in self._durations:
+                    entries[key].append(self._durations[key])
+        temp_path = self._path + ".tmp"
+        with open(temp_path, "w") as estimator_file:
+            json.dump(entries, estimator_file, indent=1, sort_keys=True)
+        os.replace(temp_path, self._path)
+
+    def _local_path(self, path: str) -> str:
+        """:return: the local repository or the cached mirror to measure path in"""
+        if is_local_repository(path):
+            return path
+        if self._mirror_cache is not None:
+            mirror_path = self._mirror_cache.path_for(path)
+            if os.path.isdir(mirror_path):
+                return mirror_path
+        raise TrufflehogApiError('No local copy of {0} to estimate'.format(path))
+
+    def _predict(self, commits: int, diff_bytes: int) -> float:
+        return commits * self._seconds_per_commit + diff_bytes * self._seconds_per_byte
+
+    def _fit(self):
+        """Least squares fit of the seconds per commit and per byte, without an
+        intercept. With a single sample, or when the fit is degenerate or gives a
+        negative coefficient, the default coefficients are scaled to the samples
+        instead. Called with the lock held (or from the constructor).
+        """
+        samples = [self._measurements[key] + (seconds,)
+                   for key, seconds in self._durations.items()]
+        self._seconds_per_commit = self._default_seconds_per_commit
+        self._seconds_per_byte = self._default_seconds_per_byte
+        if not samples:
+            return
+        if len(samples) >= 2:
+            scc = sum(c * c for c, _, _ in samples)
+            sdd = sum(d * d for _, d, _ in samples)
+            scd = sum(c * d for c, d, _ in samples)
+            scs = sum(c * s for c, _, s in samples)
+            sds = sum(d * s for _, d, s in samples)
+            determinant = scc * sdd - scd * scd
+            if determinant > 1e-9 * scc * sdd:
+                per_commit = (scs * sdd - sds * scd) / determinant
+                per_byte = (sds * scc - scs * scd) / determinant
+                if per_commit >= 0 and per_byte >= 0:
+                    self._seconds_per_commit = per_commit
+                    self._seconds_per_byte = per_byte
+                    return
+        predicted = sum(self._predict(c, d) for c, d, _ in samples)
+        if predicted > 0:
+            scale = sum(s for _, _, s in samples) / predicted
+            self._seconds_per_commit *= scale
+            self._seconds_per_byte *= scale
+
+
+def estimate(request: FindSecretsRequest, mirror_cache: MirrorCache = None) -> ScanEstimate:
+    """Estimates a request with the default, uncalibrated coefficients
+
+    :param FindSecretsRequest request:
+        Request to estimate
+
+    :param MirrorCache mirror_cache:
+        Mirrors to measure remote repositories in (default is None, local only)
+
+    :raises TrufflehogApiError:
+        if there is no local copy of the repository or git fails
+
+    :return: the estimate
+    """
+    return CostEstimator(mirror_cache=mirror_cache).estimate(request)
+
+
+def measure(repo_path: str,
+            repo_config: RepoConfig = None,
+            search_config: SearchConfig = None) -> Tuple[int, int, int, int]:
+    """Measures the history a search of a local repository walks with one
+    ``git rev-list --objects`` per branch, the same walk iter_diff_hunks makes, piped
+    into ``git cat-file --batch-check``. The file versions listed are those in the
+    trees of the walked commits and not in those of the commits the walk stops at;
+    their total size bounds the added lines the search reads from the diffs. With a
+    max_depth the whole tree of the oldest commit counts.
+
+    :param str repo_path:
+        Path to the local repository or bare mirror
+
+    :param RepoConfig repo_config:
+        Repository options, as for find_secrets
+
+    :param SearchConfig search_config:
+        Search options, max_depth and the include and exclude paths are honoured
+
+    :raises TrufflehogApiError:
+        if git fails or a path pattern does not compile
+
+    :return: (commit count, distinct file versions, their bytes, bytes of those
+    passing the include and exclude paths)
+    """
+    repo_config = repo_config or RepoConfig()
+    search_config = search_config or SearchConfig()
+    scanner = Scanner(search_config)
+    commits = blobs = blob_bytes = diff_bytes = 0
+    walked = []
+    for ref in git_log.list_branches(repo_path, repo_config.branch):
+        command = ['git', 'rev-list', '--objects'] + git_log.traversal_arguments(repo_config)
+        if search_config.max_depth:
+            command.append('--max-count={0}'.format(search_config.max_depth))
+        command.append(ref)
+        if repo_config.since_commit:
+            command.append('^' + repo_config.since_commit)
+        command.extend('^' + walked_ref for walked_ref in walked)
+        command.append('--')
+        command.extend(repo_config.paths or [])
+        for object_type, size, path in _list_objects(repo_path, command):
+            if object_type == 'commit':
+                commits += 1
+            elif object_type == 'blob':
+                blobs += 1
+                blob_bytes += size
+                if scanner.path_included(path):
+                    diff_bytes += size
+        walked.append(ref)
+    return commits, blobs, blob_bytes, diff_bytes
+
+
+def _list_objects(repo_path: str, command: List[str]) -> Iterator[Tuple[str, int, str]]:
+    """Pipes a ``git rev-list --objects`` command into ``git cat-file --batch-check``
+
+    :return: generator of the (type, size, path) of every object listed, the path is
+    empty for commits
+    """
+    # Errors go to files, pipes only read at the end would block git once they fill up
+    with tempfile.TemporaryFile() as rev_list_errors, tempfile.TemporaryFile() as cat_file_errors:
+        try:
+            rev_list = subprocess.Popen(command, cwd=repo_path, stdout=subprocess.PIPE,
+                                        stderr=rev_list_errors)
+            cat_file = subprocess.Popen(['git', 'cat-file', _BATCH_CHECK_FORMAT], cwd=repo_path,
+                                        stdin=rev_list.stdout, stdout=subprocess.PIPE,
+                                        stderr=cat_file_errors)
+        except OSError as e:
+            raise TrufflehogApiError('git command failed: {0}'.format(e))
+        rev_list.stdout.close()
+        for line in cat_file.stdout:
+            object_type, size, path = (line.decode('utf-8', errors='replace').rstrip('\n')
+                                       .split(' ', 2))
+            yield object_type, int(size), path
+        cat_file.stdout.close()
+        if rev_list.wait() != 0 or cat_file.wait() != 0:
+            errors = (git_log.read_stderr(rev_list_errors) + '\n'
+                      + git_log.read_stderr(cat_file_errors)).strip()
+            raise TrufflehogApiError('git rev-list --objects failed: {0}'.format(errors))
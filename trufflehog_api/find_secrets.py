@@ -4,251 +4,33 @@ by RepoConfig and SearchConfig. Presents the output as a list of Secret
 objects that can be easily parsed or outputted.
 """
 
-import concurrent.futures
-import datetime
-import json
-import os
-import shutil
-import stat
-import tempfile
-import warnings
-from typing import List
-
-from git import Repo
-from git.repo.fun import is_git_dir
-from truffleHog import truffleHog
+from typing import Dict, Iterable, Iterator, List, Tuple
 
+from trufflehog_api.checkpoint import ScanCheckpoint
+from trufflehog_api.concurrency import AdaptiveConcurrency
+from trufflehog_api.dedup import SecretIndex, UniqueSecret
 from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.forks import ForkStore
+from trufflehog_api.memory import collect_secrets
+from trufflehog_api.pipeline import PipelineMetrics, ScanPipeline
+from trufflehog_api.regex_profile import RegexProfile
+from trufflehog_api.repository import (FindSecretsRequest, RepositoryCheckout, result_cache_key,
+                                       search_repository)
 from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.result_cache import ResultCache
+from trufflehog_api.scanner import Scanner
+from trufflehog_api.scheduler import BatchScheduler
+from trufflehog_api.scratch import ScratchSpace
 from trufflehog_api.search_config import SearchConfig
+from trufflehog_api.secret import Secret
 
 
-class Secret:
-    """
-    A secret found in a repository. Contains information about where the secret
-    is found and why it was flagged.
-    """
-
-    def __init__(self, *,
-                 commit_time: datetime.datetime,
-                 branch_name: str,
-                 commit: str,
-                 diff: str,
-                 commit_hash: str,
-                 reason: str,
-                 path: str):
-        """Creates a new Secret
-
-        :param str commit_time:
-            Time when the secret was committed
-
-        :param str branch_name:
-            Branch where the secret was committed
-
-        :param str commit:
-            Commit where the secret was found
-
-        :param str diff:
-            Git diff where secret can be found
-
-        :param str commit_hash:
-            Commit hash for the commit where the secret was found
-
-        :param str reason:
-            Reason why the secret was flagged (Eg. regex description or High Entropy)
-
-        :param str path:
-            Path to file in which secret can be found
-        """
-        self._commit_time: datetime.datetime = commit_time
-        self._branch_name: str = branch_name
-        self._commit: str = commit
-        self._diff: str = diff
-        self._commit_hash: str = commit_hash
-        self._reason: str = reason
-        self._path: str = path
-
-    @property
-    def commit_time(self) -> datetime.datetime:
-        """
-        :return: time when the secret was committed
-        """
-        return self._commit_time
-
-    @property
-    def branch_name(self) -> str:
-        """
-        :return: branch where the secret was committed
-        """
-        return self._branch_name
-
-    @property
-    def commit(self) -> str:
-        """
-        :return: commit where the secret was found
-        """
-        return self._commit
-
-    @property
-    def diff(self) -> str:
-        """
-        :return: git diff where secret can be found
-        """
-        return self._diff
-
-    @property
-    def commit_hash(self) -> str:
-        """
-        :return: commit hash for the commit where the secret was found
-        """
-        return self._commit_hash
-
-    @property
-    def reason(self) -> str:
-        """
-        :return: reason why the secret was flagged
-        (Eg. regex description or High Entropy)
-        """
-        return self._reason
-
-    @property
-    def path(self) -> str:
-        """
-        :return: path to file in which secret can be found
-        """
-        return self._path
-
-    def to_dict(self):
-        """
-        :return: Returns a dict containing all the attributes of a Secret
-        """
-        secret_dict = dict()
-        secret_dict["commit_time"] = self._commit_time
-        secret_dict["branch_name"] = self._branch_name
-        secret_dict["commit"] = self._commit
-        secret_dict["diff"] = self._diff
-        secret_dict["commit_hash"] = self._commit_hash
-        secret_dict["reason"] = self._reason
-        secret_dict["path"] = self._path
-        return secret_dict
-
-    def __str__(self):
-        """
-        :return: Returns a string containing all the attributes of a Secret
-        besides the diff.
-        """
-        return ("commit_time: {commit_time}\n"
-                "branch_name: {branch_name}\n"
-                "commit: {commit}\n"
-                "commit_hash: {commit_hash}\n"
-                "reason: {reason}\n"
-                "path: {path}\n".format(commit_time=self._commit_time,
-                                        branch_name=self._branch_name,
-                                        commit=self._commit.strip('\n'),
-                                        commit_hash=self._commit_hash,
-                                        reason=self._reason,
-                                        path=self._path))
-
-    def __repr__(self):
-        """
-        :return: Returns a string containing all the attributes of a Secret
-        """
-        return ("Secret(commit_time={commit_time}, "
-                "branch_name={branch_name}, "
-                "commit={commit}, "
-                "commit_hash={commit_hash}, "
-                "diff={diff}, "
-                "reason={reason},"
-                "path={path})".format(commit_time=self._commit_time,
-                                      branch_name=self._branch_name,
-                                      commit=self._commit,
-                                      commit_hash=self._commit_hash,
-                                      diff=self._diff,
-                                      reason=self._reason,
-                                      path=self._path))
-
-
-class FindSecretsRequest:
-    """
-    Represents a request to search for secrets in a specific repository
-    with RepoConfig and SearchConfig
-    """
-
-    def __init__(self,
-                 path: str,
-                 repo_config: RepoConfig = None,
-                 search_config: SearchConfig = None):
-        """Creates a new FindSecretsRequest object
-
-        :param str path:
-        Path to the git repository
-
-        :param repo_config:
-        Configuration object to specify repository specific attributes for the search
-        Default is None which gives the default RepoConfig object
-
-        :param search_config:
-        Configuration object to specify other attributes for the search that can be
-        generalized to many searches
-        Default is None which gives the default SearchConfig object
-        """
-        self._path = path
-        self._repo_config = repo_config
-        self._search_config = search_config
-
-    @property
-    def path(self) -> str:
-        """
-        :return: request's path to git repository
-        """
-        return self._path
-
-    @property
-    def repo_config(self) -> RepoConfig:
-        """
-        :return: request's repository specific attributes for the search
-        """
-        return self._repo_config
-
-    @property
-    def search_config(self) -> SearchConfig:
-        """
-        :return: request's other attributes for the search
-        """
-        return self._search_config
-
-    def __str__(self):
-        """
-        :return: Returns a json string containing all the attributes of the FindSecretsRequest
-        """
-        n_config = dict()
-        s_config = self._search_config
-        n_config["max_depth"] = s_config.max_depth
-        n_config["entropy_checks_enabled"] = s_config.entropy_checks_enabled
-        n_config["include_search_paths"] = s_config.include_search_paths
-        n_config["exclude_search_paths"] = s_config.exclude_search_paths
-
-        request = dict()
-        request["path"] = self._path
-        request["repo_config"] = self._repo_config.to_dict()
-        request["search_config"] = n_config
-        request_string = json.dumps(request, indent=2)
-        return request_string
-
-    def __repr__(self):
-        """
-        :return: Returns a string containing all the attributes of the FindSecretsRequest
-        """
-        repr_repo = repr(self._repo_config)
-        repr_search = repr(self._search_config)
-        return ("FindSecretsRequest(path={path}, "
-                "repo_config={repo_config}, "
-                "search_config={search_config})").format(path=self._path,
-                                                         repo_config=repr_repo,
-                                                         search_config=repr_search)
-
-
-def execute_find_secrets_request(request: FindSecretsRequest) -> List[Secret]:
+def execute_find_secrets_request(request: FindSecretsRequest,
+                                 regex_profile: RegexProfile = None,
+                                 result_cache: ResultCache = None,
+                                 checkpoint: ScanCheckpoint = None,
+                                 resume: bool = False,
+                                 scratch_space: ScratchSpace = None) -> List[Secret]:
     """
     Executes the search for secrets with the given request
 
@@ -256,137 +38,138 @@ def execute_find_secrets_request(request: FindSecretsRequest) -> List[Secret]:
         request object containing the path to the git repository and
         other configurations for the search
 
-    :return: list of secret objects that represent the secrets found by the search
-    """
-    path = request.path
-    repo_config = request.repo_config
-    search_config = request.search_config
+    :param RegexProfile regex_profile:
+        Optional report that is filled in with the time spent and hits of every regex
+        (only supported by the "git_log" scan backend, not filled on cache hits)
 
-    if not repo_config:
-        repo_config = RepoConfig()
+    :param ResultCache result_cache:
+        Optional cache of previous results. The branches to search are resolved to
+        commits first (with ``git ls-remote`` for remote repositories) and a repeated
+        request whose branches have not moved is answered without cloning
 
-    if not search_config:
-        search_config = SearchConfig()
+    :param ScanCheckpoint checkpoint:
+        Optional checkpoint the progress and findings of the search are written to,
+        see iter_find_secrets_request
 
-    token_key = repo_config.access_token_env_key
-    token_exists = token_key and token_key in os.environ
-
-    repo = None
-    repo_path = path
-
-    if is_git_dir(path + os.path.sep + ".git"):
-        # If repo is local and env key for access token is present, display warning
-        if token_exists:
-            warnings.warn("Warning: local repository path provided with an access token - "
-                          "Token will be ignored")
-    else:
-        # If repo is remote, append access token to path from its env key
-        git_url = path
-        if token_exists:
-            git_url = _append_env_access_token_to_path(path, token_key)
-
-        # We pre-clone the repo to fix a bug that causes truffleHog to crash
-        # on Windows machines when run on remote repositories.
-        try:
-            repo_path = tempfile.mkdtemp()
-            repo = Repo.clone_from(git_url, repo_path)
-        except Exception as e:
-            _delete_tempdir(repo_path)
-            raise TrufflehogApiError(e)
-
-    do_regex = search_config.regexes
-
-    secrets = None
-    try:
-        output = truffleHog.find_strings(git_url=None,
-                                         since_commit=repo_config.since_commit,
-                                         max_depth=search_config.max_depth,
-                                         do_regex=do_regex,
-                                         do_entropy=search_config.entropy_checks_enabled,
-                                         custom_regexes=search_config.regexes,
-                                         branch=repo_config.branch,
-                                         repo_path=repo_path,
-                                         path_inclusions=search_config.include_search_paths,
-                                         path_exclusions=search_config.exclude_search_paths)
-        secrets = _convert_default_output_to_secrets(output)
-        _clean_up(output)
-    except Exception as e:
-        raise TrufflehogApiError(e)
+    :param bool resume:
+        If True, continue the search recorded in checkpoint instead of starting over
 
-    # Delete our clone of the remote repo (if it exists)
-    if repo is not None:
-        repo.close()  # truffleHog doesn't do this, which causes a bug on Windows
-        _delete_tempdir(repo_path)
+    :param ScratchSpace scratch_space:
+        Optional place to clone remote repositories in, see iter_find_secrets_request
 
+    :return: list of secret objects that represent the secrets found by the search, a
+    SecretSpool when the search config sets max_findings_in_memory
+    """
+    max_in_memory = (request.search_config.max_findings_in_memory
+                     if request.search_config else None)
+    if result_cache is None:
+        return collect_secrets(iter_find_secrets_request(request, regex_profile=regex_profile,
+                                                         checkpoint=checkpoint, resume=resume,
+                                                         scratch_space=scratch_space),
+                               max_in_memory)
+
+    key = result_cache_key(request)
+    secrets = result_cache.get(key) if key is not None else None
+    if secrets is None:
+        secrets = collect_secrets(iter_find_secrets_request(request, regex_profile=regex_profile,
+                                                            checkpoint=checkpoint, resume=resume,
+                                                            scratch_space=scratch_space),
+                                  max_in_memory)
+        if key is not None:
+            result_cache.put(key, secrets)
     return secrets
 
 
-def _delete_tempdir(path: str):
-    """Deletes a Repo that was cloned to path.  For use in execute_find_secrets_request.
+def execute_find_unique_secrets_request(request: FindSecretsRequest,
+                                        regex_profile: RegexProfile = None
+                                        ) -> List[UniqueSecret]:
     """
-    def del_rw(func, path, _exc):
-        os.chmod(path, stat.S_IWRITE)
-        func(path)
-    shutil.rmtree(path, onerror=del_rw)
+    Executes the search for secrets with the given request, collapsing the secrets
+    found in many commits or branches into one record per distinct secret as they
+    are found
 
+    :param FindSecretsRequest request:
+        request object containing the path to the git repository and
+        other configurations for the search
 
-def _convert_default_output_to_secrets(output: dict) -> List[Secret]:
+    :param RegexProfile regex_profile:
+        Optional report that is filled in with the time spent and hits of every regex
+
+    :return: list of unique secrets with their first and last seen commits and
+    occurrence counts
     """
-    Takes the output from truffleHog.find_strings() and converts
-    to a list of Secret objects that are easier to programmatically
-    parse and output.
+    index = SecretIndex()
+    index.add_all(iter_find_secrets_request(request, regex_profile=regex_profile))
+    return index.results()
 
-    :param dict output:
-        Output from truffleHog.find_strings()
 
-    :return: List of Secret Objects
+def iter_find_secrets_request(request: FindSecretsRequest,
+                              regex_profile: RegexProfile = None,
+                              scanner: Scanner = None,
+                              checkpoint: ScanCheckpoint = None,
+                              resume: bool = False,
+                              scratch_space: ScratchSpace = None) -> Iterator[Secret]:
     """
-    secrets = []
-    issues = output["foundIssues"]
-    for issue_file in issues:
-        with open(issue_file) as result_file:
-            issue = json.loads(result_file.read())
-            secret = Secret(commit_time=issue['date'],
-                            branch_name=issue['branch'],
-                            commit=issue['commit'],
-                            diff=issue['printDiff'],
-                            commit_hash=issue['commitHash'],
-                            reason=issue['reason'],
-                            path=issue['path'])
-            secrets.append(secret)
-    return secrets
+    Executes the search for secrets with the given request lazily, yielding every
+    secret as soon as it is found. With the "git_log" scan backend no list of
+    secrets is ever materialized. A cloned remote repository is deleted once the
+    generator is exhausted or closed, without waiting for the deletion.
 
+    :param FindSecretsRequest request:
+        request object containing the path to the git repository and
+        other configurations for the search
 
-def _clean_up(output: dict):
-    """Removes files containing the output from truffleHog.find_strings()
-    from the file system.
+    :param RegexProfile regex_profile:
+        Optional report that is filled in with the time spent and hits of every regex
+        (only supported by the "git_log" scan backend)
 
-    :param dict output:
-        Output from truffleHog.find_strings()
-    """
-    issues_path = output.get("issues_path", None)
-    if issues_path and os.path.isdir(issues_path):
-        shutil.rmtree(output["issues_path"])
+    :param Scanner scanner:
+        Optional Scanner already built for the request's SearchConfig, so that long
+        running callers compile the checks once for many requests
+        (only used by the "git_log" scan backend, regex_profile is ignored when given)
 
+    :param ScanCheckpoint checkpoint:
+        Optional checkpoint the position of the walk and the secrets found are written
+        to, so that an interrupted search can be resumed (only supported by the
+        "git_log" scan backend)
 
-def _append_env_access_token_to_path(path, token_key):
-    """Appends the secret token to a valid git url
+    :param bool resume:
+        If True and checkpoint holds an unfinished run of the same request, the secrets
+        it recorded are yielded first and the walk continues after the last recorded
+        commit of the same branch heads, so no secret is yielded twice.
+        Otherwise any previous checkpoint is replaced (default is False)
 
-    :param str path:
-        Repository path
-    :param str token_key:
-        Env variable key which stores the secret token
+    :param ScratchSpace scratch_space:
+        Where a remote repository is cloned. The clone is deleted in the background once
+        the search is over (default is None, the system temporary directory)
+
+    :raises TrufflehogApiError:
+        wraps an exception that occurred while cloning or searching the repository
+
+    :return: generator of secret objects
     """
-    # FIXME - This only supports github!
-    idx = path.find("github.com/")
-    if idx > -1:
-        path = path[:idx] + os.environ.get(token_key) + ":x-oauth-basic@" + path[idx:]
-    return path
+    repo_config = request.repo_config
+    search_config = request.search_config
+
+    if not repo_config:
+        repo_config = RepoConfig()
+
+    if not search_config:
+        search_config = SearchConfig()
+
+    checkout = RepositoryCheckout(request, scratch_space)
+    with checkout as repo_path:
+        yield from search_repository(repo_path, checkout.origin, repo_config, search_config,
+                                     regex_profile, scanner, checkpoint, resume)
 
 
 def find_secrets(path: str,
                  repo_config: RepoConfig = None,
-                 search_config: SearchConfig = None) -> List[Secret]:
+                 search_config: SearchConfig = None,
+                 regex_profile: RegexProfile = None,
+                 result_cache: ResultCache = None,
+                 checkpoint: ScanCheckpoint = None,
+                 resume: bool = False) -> List[Secret]:
     """
     Searches for secrets in the repository repo using the search configuration config
     Does so by creating and executing a request to search.
@@ -403,6 +186,24 @@ def find_secrets(path: str,
         generalized to many searches
         Default is None which will give the default SearchConfig object
 
+    :param regex_profile:
+        Optional RegexProfile that is filled in with the time spent and hits of every
+        regex during the search, e.g. to find the most expensive custom regexes
+        Default is None, no report is kept
+
+    :param result_cache:
+        Optional ResultCache, a repeated search of branches that have not moved since the
+        cached search is answered without cloning the repository
+        Default is None, nothing is cached
+
+    :param checkpoint:
+        Optional ScanCheckpoint the progress of the search is periodically written to
+        Default is None, no checkpoints are written
+
+    :param resume:
+        If True, continue the search recorded in checkpoint where it stopped
+        Default is False, the search starts over
+
     :raises TrufflehogApiError:
         wraps an exception that occurred on calling truffleHog.find_strings()
 
@@ -412,33 +213,251 @@ def find_secrets(path: str,
     """
 
     return execute_find_secrets_request(
+        FindSecretsRequest(path, repo_config=repo_config, search_config=search_config),
+        regex_profile=regex_profile, result_cache=result_cache, checkpoint=checkpoint,
+        resume=resume)
+
+
+def find_unique_secrets(path: str,
+                        repo_config: RepoConfig = None,
+                        search_config: SearchConfig = None) -> List[UniqueSecret]:
+    """
+    Searches for secrets like find_secrets, but returns one record per distinct secret
+    (reason, matched string and path) with the first and last commits it was seen in
+    and the number of times it was found, instead of one Secret per commit and branch.
+
+    :param str path:
+        Path to the git repository
+
+    :param repo_config:
+        Configuration object to specify repository specific attributes for the search
+        Default is None which will give the default RepoConfig object
+
+    :param search_config:
+        Configuration object to specify other attributes for the search
+        Default is None which will give the default SearchConfig object
+
+    :raises TrufflehogApiError:
+        wraps an exception that occurred while cloning or searching the repository
+
+    :return: list of unique secrets in order of discovery
+
+    :rtype: List[UniqueSecret]
+    """
+    return execute_find_unique_secrets_request(
         FindSecretsRequest(path, repo_config=repo_config, search_config=search_config))
 
 
 def batch_execute_find_secrets_request(requests: List[FindSecretsRequest],
-                                       concurrency_level=4):
+                                       concurrency_level=4,
+                                       result_cache: ResultCache = None,
+                                       checkpoint_dir: str = None,
+                                       resume: bool = False,
+                                       scratch_space: ScratchSpace = None,
+                                       clone_concurrency_level: int = None,
+                                       max_clones_per_host: int = None,
+                                       metrics: PipelineMetrics = None,
+                                       scheduler: BatchScheduler = None,
+                                       lookahead: int = None,
+                                       max_rss_bytes: int = None,
+                                       share_traversal: bool = True,
+                                       adaptive_concurrency: AdaptiveConcurrency = None,
+                                       fork_store: ForkStore = None,
+                                       fork_groups: Dict[str, str] = None):
     """
-    Executes a search for secrets for the list of requests concurrently
+    Executes a search for secrets for the list of requests concurrently. Remote
+    repositories are cloned and searched by separate pools of workers, see ScanPipeline
 
      :param list requests:
          List of FindSecretRequest objects
 
      :param int concurrency_level:
-         Maximum number of threads to spawn while creating a ThreadPoolExecutor
-         instance which manages the execution of the jobs.
+         Maximum number of repositories searched at the same time
+
+     :param ResultCache result_cache:
+         Optional cache shared by the requests, see execute_find_secrets_request
+
+     :param str checkpoint_dir:
+         Optional directory every request writes a checkpoint to, named after the request
+
+     :param bool resume:
+         If True, requests continue from their checkpoints in checkpoint_dir
+
+     :param ScratchSpace scratch_space:
+         Optional place the requests clone remote repositories in, e.g. on a tmpfs and
+         with a quota holding back clones while it is full
+
+     :param int clone_concurrency_level:
+         Maximum number of remote repositories cloned at the same time
+         (default is None, concurrency_level)
+
+     :param int max_clones_per_host:
+         Maximum number of repositories cloned from the same host at the same time
+         (default is None, no limit besides clone_concurrency_level)
+
+     :param PipelineMetrics metrics:
+         Optional metrics that are filled in with the queue depth and stage utilization
+
+     :param BatchScheduler scheduler:
+         Optional scheduler estimating the cost of the requests so that the most
+         expensive ones taken in run first and long histories are split into shards
+
+     :param int lookahead:
+         Number of requests taken in ahead of the results, the window the scheduler
+         orders. The cost of every request in the window is estimated before it is
+         handed to the workers (default is None, a few per worker)
+
+     :param int max_rss_bytes:
+         Soft limit on the resident set size. While it is exceeded no further searches
+         are started until the running ones finish, down to one at a time
+         (default is None, no limit)
+
+     :param bool share_traversal:
+         If True, requests for the same repository are cloned once and searched with one
+         walk of its history, running every request's checks over the union of the commits
+         they need (default is True, not used with checkpoint_dir)
+
+     :param AdaptiveConcurrency adaptive_concurrency:
+         Optional controller moving the number of repositories searched at the same time
+         between its bounds from CPU, memory, scratch space and clone throughput samples.
+         concurrency_level is then only the default of clone_concurrency_level
+
+     :param ForkStore fork_store:
+         Optional stores the remote repositories are fetched into. Forks among the
+         requests are then grouped and the commits they share are searched once, see
+         forks (not used with checkpoint_dir)
+
+     :param dict fork_groups:
+         Repository path or URL to a declared group name, with fork_store
+         (default is None, repositories are grouped by their root commits)
 
      :raises TrufflehogApiError:
-         wraps an exception that occurred on calling truffleHog.find_strings(),
-         creating a ThreadPoolExecutor instance or submitting jobs
+         wraps an exception that occurred on starting the workers or reading requests
 
-     :return: list of futures jobs that were submitted to the ThreadPoolExecutor for processing
+     :return: list of finished futures in the order of requests. A future's result is the
+     list of secrets, or it raises the search's TrufflehogApiError
      """
-    res = []
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency_level) as executor:
-            for request in requests:
-                future_result = executor.submit(execute_find_secrets_request, request)
-                res.append(future_result)
-        return res
+        pipeline = _batch_pipeline(concurrency_level, result_cache, checkpoint_dir, resume,
+                                   scratch_space, clone_concurrency_level, max_clones_per_host,
+                                   metrics, scheduler, lookahead, max_rss_bytes,
+                                   share_traversal, adaptive_concurrency, fork_store, fork_groups)
+        return pipeline.run_all(requests)
+    except TrufflehogApiError:
+        raise
     except Exception as e:
         raise TrufflehogApiError(e)
+
+
+def iter_batch_execute_find_secrets_request(requests: Iterable[FindSecretsRequest],
+                                            concurrency_level=4,
+                                            result_cache: ResultCache = None,
+                                            checkpoint_dir: str = None,
+                                            resume: bool = False,
+                                            scratch_space: ScratchSpace = None,
+                                            clone_concurrency_level: int = None,
+                                            max_clones_per_host: int = None,
+                                            metrics: PipelineMetrics = None,
+                                            scheduler: BatchScheduler = None,
+                                            lookahead: int = None,
+                                            max_rss_bytes: int = None,
+                                            share_traversal: bool = True,
+                                            adaptive_concurrency: AdaptiveConcurrency = None,
+                                            fork_store: ForkStore = None,
+                                            fork_groups: Dict[str, str] = None
+                                            ) -> Iterator[Tuple[FindSecretsRequest,
+                                                                "concurrent.futures.Future"]]:
+    """
+    Executes a search for secrets for the requests concurrently like
+    batch_execute_find_secrets_request, but yields every request as soon as its search
+    is finished. requests is consumed lazily and only a bounded number of searches is
+    taken in ahead, so it can be a stream of any length.
+
+     :param requests:
+         Iterable of FindSecretRequest objects
+
+     :param int concurrency_level:
+         Maximum number of repositories searched at the same time
+
+     :param ResultCache result_cache:
+         Optional cache shared by the requests, see execute_find_secrets_request
+
+     :param str checkpoint_dir:
+         Optional directory every request writes a checkpoint to, named after the request
+
+     :param bool resume:
+         If True, requests continue from their checkpoints in checkpoint_dir
+
+     :param ScratchSpace scratch_space:
+         Optional place the requests clone remote repositories in, e.g. on a tmpfs and
+         with a quota holding back clones while it is full
+
+     :param int clone_concurrency_level:
+         Maximum number of remote repositories cloned at the same time
+         (default is None, concurrency_level)
+
+     :param int max_clones_per_host:
+         Maximum number of repositories cloned from the same host at the same time
+         (default is None, no limit besides clone_concurrency_level)
+
+     :param PipelineMetrics metrics:
+         Optional metrics that are filled in with the queue depth and stage utilization
+
+     :param BatchScheduler scheduler:
+         Optional scheduler estimating the cost of the requests so that the most
+         expensive ones taken in run first and long histories are split into shards
+
+     :param int lookahead:
+         Number of requests taken in ahead of the results, the window the scheduler
+         orders (default is None, a few per worker)
+
+     :param int max_rss_bytes:
+         Soft limit on the resident set size. While it is exceeded no further searches
+         are started until the running ones finish, down to one at a time
+         (default is None, no limit)
+
+     :param bool share_traversal:
+         If True, requests for the same repository are cloned once and searched with one
+         walk of its history, running every request's checks over the union of the commits
+         they need (default is True, not used with checkpoint_dir)
+
+     :param AdaptiveConcurrency adaptive_concurrency:
+         Optional controller moving the number of repositories searched at the same time
+         between its bounds from CPU, memory, scratch space and clone throughput samples.
+         concurrency_level is then only the default of clone_concurrency_level
+
+     :param ForkStore fork_store:
+         Optional stores the remote repositories are fetched into. Forks among the
+         requests are then grouped and the commits they share are searched once, see
+         forks (not used with checkpoint_dir)
+
+     :param dict fork_groups:
+         Repository path or URL to a declared group name, with fork_store
+         (default is None, repositories are grouped by their root commits)
+
+     :return: generator of (request, finished future) pairs in order of completion. The
+     future's result is the list of secrets, or it raises the search's TrufflehogApiError
+     """
+    pipeline = _batch_pipeline(concurrency_level, result_cache, checkpoint_dir, resume,
+                               scratch_space, clone_concurrency_level, max_clones_per_host,
+                               metrics, scheduler, lookahead, max_rss_bytes, share_traversal,
+                               adaptive_concurrency, fork_store, fork_groups)
+    yield from pipeline.run(requests)
+
+
+def _batch_pipeline(concurrency_level: int, result_cache: ResultCache, checkpoint_dir: str,
+                    resume: bool, scratch_space: ScratchSpace, clone_concurrency_level: int,
+                    max_clones_per_host: int, metrics: PipelineMetrics,
+                    scheduler: BatchScheduler, lookahead: int, max_rss_bytes: int,
+                    share_traversal: bool, adaptive_concurrency: AdaptiveConcurrency,
+                    fork_store: ForkStore, fork_groups: Dict[str, str]) -> ScanPipeline:
+    """Creates the ScanPipeline running a batch"""
+    return ScanPipeline(clone_concurrency_level=clone_concurrency_level or concurrency_level,
+                        scan_concurrency_level=concurrency_level,
+                        max_clones_per_host=max_clones_per_host,
+                        result_cache=result_cache, checkpoint_dir=checkpoint_dir, resume=resume,
+                        scratch_space=scratch_space, metrics=metrics, scheduler=scheduler,
+                        lookahead=lookahead, max_rss_bytes=max_rss_bytes,
+                        share_traversal=share_traversal,
+                        adaptive_concurrency=adaptive_concurrency,
+                        fork_store=fork_store, fork_groups=fork_groups)
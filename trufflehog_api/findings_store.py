@@ -0,0 +1,362 @@
+"""
+Persistent store of findings in a SQLite database. Every run of a batch is a
+scan; secrets are written to it in batches of one transaction each, straight
+from the streaming scanners if need be, and indexed by repository, commit, path,
+reason and the fingerprint of every matched string. The findings introduced or
+resolved between two scans are computed by SQLite itself with EXCEPT over the
+(repository, fingerprint) pairs of both scans, so nothing has to be loaded into
+memory to compare them. Repositories whose search failed in either scan are
+recorded as failures and left out of the comparison, so that their findings
+are not reported as resolved.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.secret import Secret
+
+# Bump when the schema changes
+SCHEMA_VERSION = 3
+# Earlier versions _SCHEMA upgrades in place by creating the tables they lack
+_UPGRADABLE_VERSIONS = (2,)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    label TEXT,
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS findings (
+    id INTEGER PRIMARY KEY,
+    scan_id INTEGER NOT NULL REFERENCES scans (id),
+    repo TEXT NOT NULL,
+    commit_hash TEXT NOT NULL,
+    path TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    branch_name TEXT,
+    commit_time TEXT,
+    commit_message TEXT,
+    diff TEXT,
+    strings_found TEXT
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    finding_id INTEGER NOT NULL REFERENCES findings (id),
+    scan_id INTEGER NOT NULL REFERENCES scans (id),
+    repo TEXT NOT NULL,
+    fingerprint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS failures (
+    scan_id INTEGER NOT NULL REFERENCES scans (id),
+    repo TEXT NOT NULL,
+    error TEXT,
+    PRIMARY KEY (scan_id, repo)
+);
+CREATE INDEX IF NOT EXISTS findings_scan ON findings (scan_id, repo);
+CREATE INDEX IF NOT EXISTS fingerprints_scan ON fingerprints (scan_id, repo, fingerprint);
+CREATE INDEX IF NOT EXISTS fingerprints_repo ON fingerprints (repo, fingerprint);
+CREATE INDEX IF NOT EXISTS findings_commit ON findings (commit_hash);
+CREATE INDEX IF NOT EXISTS findings_path ON findings (path);
+CREATE INDEX IF NOT EXISTS findings_reason ON findings (reason);
+"""
+
+_COLUMNS = ("repo, commit_hash, path, reason, branch_name, commit_time, commit_message, diff, "
+            "strings_found")
+
+# Findings of scan :new with a matched string whose (repo, fingerprint) does not occur
+# in scan :old, among the repositories searched successfully by both scans
+_DIFF_QUERY = """
+WITH failed (repo) AS (
+    SELECT repo FROM failures WHERE scan_id IN (:old, :new)
+), changed (repo, fingerprint) AS (
+    SELECT repo, fingerprint FROM fingerprints
+    WHERE scan_id = :new AND repo NOT IN failed {repo_filter}
+    EXCEPT
+    SELECT repo, fingerprint FROM fingerprints
+    WHERE scan_id = :old AND repo NOT IN failed {repo_filter}
+)
+SELECT {columns} FROM findings WHERE id IN (
+    SELECT finding_id FROM fingerprints JOIN changed USING (repo, fingerprint)
+    WHERE scan_id = :new
+) ORDER BY id
+"""
+
+
+class FindingsStore:
+    """SQLite database of the findings of successive scans. It can be shared by the
+    threads of a batch; writes are buffered and committed batch_size rows at a time.
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000):
+        """Opens the database at path, creating it if needed
+
+        :param str path:
+            Database file, ':memory:' for a temporary in memory database
+
+        :param int batch_size:
+            Number of findings buffered before they are inserted in one transaction
+            (default is 1000)
+
+        :raises TrufflehogApiError:
+            if the database cannot be opened or was written by another schema version
+        """
+        if batch_size < 1:
+            raise TrufflehogApiError('batch_size must be at least 1')
+        self._path: str = path
+        self._batch_size: int = batch_size
+        self._lock = threading.Lock()
+        # (findings row, fingerprints of its matched strings) pairs
+        self._pending: List[Tuple[tuple, List[str]]] = []
+        try:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, SCHEMA_VERSION) + _UPGRADABLE_VERSIONS:
+                raise TrufflehogApiError('Findings store {0} has schema version {1}, expected {2}'
+                                         .format(path, version, SCHEMA_VERSION))
+            # Readers do not block the batches being written, which only sync at checkpoints
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+            with self._connection:
+                self._connection.executescript(_SCHEMA)
+                self._connection.execute("PRAGMA user_version = {0}".format(SCHEMA_VERSION))
+        except sqlite3.Error as e:
+            raise TrufflehogApiError('Cannot open findings store {0}: {1}'.format(path, e))
+
+    @property
+    def path(self) -> str:
+        """
+        :return: the database file
+        """
+        return self._path
+
+    def begin_scan(self, label: str = None) -> int:
+        """Starts a new scan
+
+        :param str label:
+            Free form description, e.g. the name of the nightly job (default is None)
+
+        :return: id of the scan, to pass to add and finish_scan
+        """
+        with self._lock:
+            with self._connection:
+                cursor = self._connection.execute(
+                    "INSERT INTO scans (label, started) VALUES (?, ?)", (label, time.time()))
+            return cursor.lastrowid
+
+    def finish_scan(self, scan_id: int):
+        """Writes the buffered findings and records the end time of a scan
+
+        :param int scan_id:
+            Scan returned by begin_scan
+        """
+        with self._lock:
+            self._flush()
+            with self._connection:
+                self._connection.execute("UPDATE scans SET finished = ? WHERE id = ?",
+                                         (time.time(), scan_id))
+
+    def add(self, scan_id: int, repo: str, secret: Secret):
+        """Buffers a finding, inserting the buffer once it holds batch_size findings
+
+        :param int scan_id:
+            Scan returned by begin_scan
+
+        :param str repo:
+            Repository URL or path the secret was found in
+
+        :param Secret secret:
+            The finding
+        """
+        row = (scan_id, repo, secret.commit_hash, secret.path, secret.reason,
+               secret.branch_name, str(secret.commit_time), secret.commit, secret.diff,
+               json.dumps(secret.strings_found))
+        with self._lock:
+            self._pending.append((row, secret.fingerprints))
+            if len(self._pending) >= self._batch_size:
+                self._flush()
+
+    def add_failure(self, scan_id: int, repo: str, error: str = None):
+        """Records that the search of a repository failed in a scan. Its findings in this
+        and any other scan are then left out when comparing the two, see introduced
+
+        :param int scan_id:
+            Scan returned by begin_scan
+
+        :param str repo:
+            Repository URL or path whose search failed
+
+        :param str error:
+            Description of the error (default is None)
+        """
+        with self._lock:
+            try:
+                with self._connection:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO failures (scan_id, repo, error) VALUES (?, ?, ?)",
+                        (scan_id, repo, error))
+            except sqlite3.Error as e:
+                raise TrufflehogApiError('Cannot write to findings store {0}: {1}'
+                                         .format(self._path, e))
+
+    def failures(self, scan_id: int) -> List[Tuple[str, Optional[str]]]:
+        """
+        :param int scan_id:
+            Scan to read
+
+        :return: (repository, error) pairs of the repositories whose search failed in the
+        scan, in the order they were recorded
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT repo, error FROM failures WHERE scan_id = ? ORDER BY rowid",
+                (scan_id,)).fetchall()
+
+    def add_all(self, scan_id: int, repo: str, secrets: Iterable[Secret]) -> int:
+        """Adds every secret of an iterable, e.g. the lazy result of
+        iter_find_secrets_request, without materializing it
+
+        :return: number of secrets added
+        """
+        count = 0
+        for secret in secrets:
+            self.add(scan_id, repo, secret)
+            count += 1
+        return count
+
+    def flush(self):
+        """Inserts the buffered findings"""
+        with self._lock:
+            self._flush()
+
+    def scans(self) -> List[dict]:
+        """
+        :return: id, label, started and finished time, finding count and failed repository
+        count of every scan, oldest first
+        """
+        self.flush()
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT scans.id, label, started, finished, COUNT(findings.id), "
+                "(SELECT COUNT(*) FROM failures WHERE failures.scan_id = scans.id) FROM scans "
+                "LEFT JOIN findings ON findings.scan_id = scans.id "
+                "GROUP BY scans.id ORDER BY scans.id").fetchall()
+        return [{"id": row[0], "label": row[1], "started": row[2], "finished": row[3],
+                 "findings": row[4], "failures": row[5]} for row in rows]
+
+    def previous_scan(self, scan_id: int) -> Optional[int]:
+        """
+        :param int scan_id:
+            A scan
+
+        :return: the scan started before it, None for the first scan
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT MAX(id) FROM scans WHERE id < ?",
+                                           (scan_id,)).fetchone()
+        return row[0]
+
+    def findings(self, scan_id: int, repo: str = None) -> Iterator[Tuple[str, Secret]]:
+        """
+        :param int scan_id:
+            Scan to read
+
+        :param str repo:
+            Only read the findings of this repository (default is None, all of them)
+
+        :return: generator of (repository, secret) pairs in the order they were added
+        """
+        query = "SELECT {0} FROM findings WHERE scan_id = ?".format(_COLUMNS)
+        parameters = [scan_id]
+        if repo is not None:
+            query += " AND repo = ?"
+            parameters.append(repo)
+        return self._query(query + " ORDER BY id", parameters)
+
+    def introduced(self, old_scan_id: int, new_scan_id: int,
+                   repo: str = None) -> Iterator[Tuple[str, Secret]]:
+        """Findings of the new scan with a matched string whose fingerprint the old scan
+        did not find in the same repository. Repositories recorded as failures of either
+        scan are left out
+
+        :param int old_scan_id:
+            Earlier scan, e.g. previous_scan(new_scan_id)
+
+        :param int new_scan_id:
+            Later scan
+
+        :param str repo:
+            Only compare the findings of this repository (default is None, all of them)
+
+        :return: generator of (repository, secret) pairs, every finding with an
+        introduced fingerprint
+        """
+        return self._diff(old_scan_id, new_scan_id, repo)
+
+    def resolved(self, old_scan_id: int, new_scan_id: int,
+                 repo: str = None) -> Iterator[Tuple[str, Secret]]:
+        """Findings of the old scan with a matched string whose fingerprint the new scan
+        no longer finds in the same repository, see introduced
+        """
+        return self._diff(new_scan_id, old_scan_id, repo)
+
+    def close(self):
+        """Inserts the buffered findings and closes the database"""
+        with self._lock:
+            self._flush()
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _diff(self, old_scan_id: int, new_scan_id: int,
+              repo: Optional[str]) -> Iterator[Tuple[str, Secret]]:
+        query = _DIFF_QUERY.format(columns=_COLUMNS,
+                                   repo_filter="AND repo = :repo" if repo is not None else "")
+        return self._query(query, {"old": old_scan_id, "new": new_scan_id, "repo": repo})
+
+    def _query(self, query: str, parameters) -> Iterator[Tuple[str, Secret]]:
+        """Runs a query selecting _COLUMNS, the rows are fetched while iterating"""
+        self.flush()
+        with self._lock:
+            cursor = self._connection.execute(query, parameters)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(self._batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0], _row_to_secret(row)
+
+    def _flush(self):
+        """Inserts the buffered findings in one transaction, with the lock held"""
+        if not self._pending:
+            return
+        insert = "INSERT INTO findings (scan_id, {0}) VALUES ({1})".format(
+            _COLUMNS, ", ".join("?" * 10))
+        try:
+            with self._connection:
+                fingerprint_rows = []
+                for row, fingerprints in self._pending:
+                    finding_id = self._connection.execute(insert, row).lastrowid
+                    fingerprint_rows.extend((finding_id, row[0], row[1], fingerprint)
+                                            for fingerprint in fingerprints)
+                self._connection.executemany(
+                    "INSERT INTO fingerprints (finding_id, scan_id, repo, fingerprint) "
+                    "VALUES (?, ?, ?, ?)", fingerprint_rows)
+        except sqlite3.Error as e:
+            raise TrufflehogApiError('Cannot write to findings store {0}: {1}'
+                                     .format(self._path, e))
+        self._pending = []
+
+
+def _row_to_secret(row: tuple) -> Secret:
+    """Builds the Secret of a row selecting _COLUMNS"""
+    return Secret(commit_time=row[5], branch_name=row[4], commit=row[6], diff=row[7],
+                  commit_hash=row[1], reason=row[3], path=row[2],
+                  strings_found=json.loads(row[8]))
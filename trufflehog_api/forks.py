@@ -0,0 +1,611 @@
+"""
+Batches of forks and other related repositories. Requests are grouped by a
+user-declared group name or by the root commits their histories share. The
+remote members of a group are fetched into one bare object store per group,
+so the history they have in common is downloaded and stored once, and every
+member gets a small repository of its own whose objects/info/alternates points
+at the store. A commit searched for one member of a group (with the same search
+and traversal options) is not diffed again for the others, its findings are
+handed to every member whose walk reaches it, named after that member's branch.
+
+ScanPipeline runs a batch this way when it is given a ForkStore: the clone stage
+fetches remote members into the store, and the scan workers search the members
+of a group with the GroupSearch the ForkBatch of the run keeps for it.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterator, List, Optional, Sequence, Tuple
+
+from trufflehog_api import git_log
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.memory import SecretSpool, collect_secrets
+from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.repository import FindSecretsRequest, authenticated_url, is_local_repository
+from trufflehog_api.scanner import Scanner
+from trufflehog_api.search_config import GIT_LOG_BACKEND, SearchConfig
+from trufflehog_api.secret import Secret
+
+# Namespace of the branches of every member in a group's object store
+_MEMBER_REFS = 'refs/members/'
+
+# Prefixes of the store names of declared groups, of groups found by their root
+# commits and of a remote whose group is only known once its root commits are
+_DECLARED_PREFIX = 'group-'
+_ROOTS_PREFIX = 'roots-'
+_PENDING_PREFIX = 'pending-'
+
+
+class ForkStore:
+    """Directory of bare object stores, one per group of related repositories, and of
+    the per member repositories borrowing their objects through git alternates. Like a
+    MirrorCache it is meant to be kept between batches, so that the next one only
+    fetches what changed.
+    """
+
+    def __init__(self, directory: str):
+        """Creates a new ForkStore, creating directory if needed
+
+        :param str directory:
+            Directory the stores and member repositories are kept in
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory: str = directory
+        self._lock = threading.Lock()
+        self._group_locks: Dict[str, threading.Lock] = dict()
+        # Group name to the root commits of its store, filled in lazily
+        self._roots: Dict[str, FrozenSet[str]] = dict()
+
+    @property
+    def directory(self) -> str:
+        """
+        :return: directory the stores are kept in
+        """
+        return self._directory
+
+    def store_path(self, group: str) -> str:
+        """
+        :param str group:
+            Group name
+
+        :return: where the bare object store of the group is (or would be) kept
+        """
+        return os.path.join(self._directory, group_name(group) + '.git')
+
+    def member_path(self, group: str, url: str) -> str:
+        """
+        :param str group:
+            Group name
+
+        :param str url:
+            Repository URL without credentials
+
+        :return: where the repository of the member url of the group is kept
+        """
+        return os.path.join(self._directory, group_name(group) + '.members', _name(url) + '.git')
+
+    def add(self, url: str, group: str = None, fetch_url: str = None) -> Tuple[str, str]:
+        """Fetches the branches of a remote repository into the store of its group and
+        updates the member repository borrowing from it
+
+        :param str url:
+            Repository URL without credentials
+
+        :param str group:
+            Declared group of the repository (default is None, the group sharing a root
+            commit with it). Without a declared group the store already holding one of
+            the remote's branch heads is fetched into; a fork whose heads are all new
+            is downloaded in full once and then moved into its group's store
+
+        :param str fetch_url:
+            URL to actually fetch from, e.g. with an access token appended
+            (default is None, url is used)
+
+        :raises TrufflehogApiError:
+            if git fails
+
+        :return: (name of the group's store, path of the member repository)
+        """
+        fetch_url = fetch_url or url
+        member = _name(url)
+        if group is not None:
+            group = group_name(group)
+        else:
+            group = self._group_with_heads(fetch_url) or _PENDING_PREFIX + member
+        with self._group_lock(group):
+            store = self._init_store(group)
+            _git(store, 'fetch', '--quiet', '--prune', '--no-tags', fetch_url,
+                 '+refs/heads/*:{0}{1}/heads/*'.format(_MEMBER_REFS, member))
+            with self._lock:
+                self._roots.pop(group, None)
+        if group.startswith(_PENDING_PREFIX):
+            group = self._settle(group, member)
+        return group, self._link_member(group, url)
+
+    def roots(self, group: str) -> FrozenSet[str]:
+        """
+        :param str group:
+            Group name
+
+        :return: the root commits of every member fetched into the group's store
+        """
+        with self._lock:
+            roots = self._roots.get(group)
+        if roots is None:
+            store = self.store_path(group)
+            roots = frozenset(root_commits(store, ['--glob=' + _MEMBER_REFS + '*'])
+                              if os.path.isdir(store) else [])
+            with self._lock:
+                self._roots[group] = roots
+        return roots
+
+    def groups(self) -> List[str]:
+        """
+        :return: names of the stores in the directory, see group_name
+        """
+        return [entry[:-len('.git')] for entry in sorted(os.listdir(self._directory))
+                if entry.endswith('.git') and not entry.startswith(_PENDING_PREFIX)]
+
+    def _group_lock(self, group: str) -> threading.Lock:
+        with self._lock:
+            lock = self._group_locks.get(group)
+            if lock is None:
+                lock = self._group_locks[group] = threading.Lock()
+            return lock
+
+    def _init_store(self, group: str) -> str:
+        store = self.store_path(group)
+        if not os.path.isdir(store):
+            _git(None, 'init', '--quiet', '--bare', store)
+        return store
+
+    def _group_with_heads(self, fetch_url: str) -> Optional[str]:
+        """:return: the group whose store already has one of the remote's branch heads"""
+        heads = {line.split('\t')[0] for line in _git_output(
+            None, ['git', 'ls-remote', '--heads', fetch_url]).splitlines() if line}
+        if not heads:
+            return None
+        for group in self.groups():
+            if _has_commits(self.store_path(group), heads):
+                return group
+        return None
+
+    def _settle(self, pending: str, member: str) -> str:
+        """Moves the refs of a member fetched into a pending store into the store of the
+        group sharing a root commit with it, or makes the pending store its own group
+
+        :return: the group name
+        """
+        pending_store = self.store_path(pending)
+        roots = frozenset(root_commits(pending_store, ['--glob=' + _MEMBER_REFS + '*']))
+        group = next((group for group in self.groups() if self.roots(group) & roots),
+                     _root_group(roots))
+        with self._group_lock(group):
+            store = self.store_path(group)
+            if os.path.isdir(store):
+                _git(store, 'fetch', '--quiet', '--no-tags', pending_store,
+                     '+{0}{1}/*:{0}{1}/*'.format(_MEMBER_REFS, member))
+                shutil.rmtree(pending_store, ignore_errors=True)
+            else:
+                os.replace(pending_store, store)
+            with self._lock:
+                self._roots.pop(group, None)
+        return group
+
+    def _link_member(self, group: str, url: str) -> str:
+        """Creates or updates the member repository of url, whose origin branches are the
+        member's branches in the group's store"""
+        store = self.store_path(group)
+        path = self.member_path(group, url)
+        if not os.path.isdir(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _git(None, 'init', '--quiet', '--bare', path)
+        with open(os.path.join(path, 'objects', 'info', 'alternates'), 'w') as alternates:
+            alternates.write(os.path.abspath(os.path.join(store, 'objects')) + '\n')
+        prefix = '{0}{1}/heads/'.format(_MEMBER_REFS, _name(url))
+        wanted = {line.split(' ', 1)[0][len(prefix):]: line.split(' ', 1)[1]
+                  for line in _git_output(store, ['git', 'for-each-ref',
+                                                  '--format=%(refname) %(objectname)', prefix])
+                  .splitlines() if line}
+        current = [line for line in _git_output(path, ['git', 'for-each-ref',
+                                                       '--format=%(refname)',
+                                                       'refs/remotes/origin/']).splitlines()
+                   if line]
+        commands = ['delete {0}'.format(ref) for ref in current
+                    if ref[len('refs/remotes/origin/'):] not in wanted]
+        commands.extend('update refs/remotes/origin/{0} {1}'.format(branch, oid)
+                        for branch, oid in sorted(wanted.items()))
+        _git_output(path, ['git', 'update-ref', '--stdin'], '\n'.join(commands) + '\n')
+        return path
+
+
+def group_name(group: str) -> str:
+    """
+    :param str group:
+        A declared group, or the name of a store
+
+    :return: the name of the group's store, which is the group itself for the groups
+    found by their root commits
+    """
+    if group.startswith((_DECLARED_PREFIX, _ROOTS_PREFIX, _PENDING_PREFIX)):
+        return group
+    return _DECLARED_PREFIX + _name(group)
+
+
+def root_commits(repo_path: str, revisions: List[str] = None) -> List[str]:
+    """
+    :param str repo_path:
+        Path to a local repository
+
+    :param list revisions:
+        Revisions whose history is searched (default is None, every branch)
+
+    :raises TrufflehogApiError:
+        if git fails
+
+    :return: the commits without parents reachable from revisions
+    """
+    output = _git_output(repo_path, ['git', 'rev-list', '--max-parents=0']
+                         + (revisions or ['--branches', '--remotes']))
+    return sorted(line for line in output.splitlines() if line)
+
+
+def group_requests(requests: Sequence[FindSecretsRequest],
+                   groups: Dict[str, str] = None) -> Dict[str, List[int]]:
+    """Groups the local repositories among requests by their declared group or by the
+    root commits they share. Remote repositories are only grouped by declaration here,
+    ForkStore.add groups the others when it fetches them.
+
+    :param list requests:
+        FindSecretsRequest objects
+
+    :param dict groups:
+        Repository path or URL to a declared group name (default is None)
+
+    :raises TrufflehogApiError:
+        if git fails on a local repository
+
+    :return: group store name (see group_name) to the indexes of its requests, in
+    order; undeclared remote requests are left out
+    """
+    groups = groups or dict()
+    grouped: Dict[str, List[int]] = OrderedDict()
+    root_groups: List[Tuple[FrozenSet[str], str]] = []
+    for index, request in enumerate(requests):
+        group = groups.get(request.path)
+        if group is None and is_local_repository(request.path):
+            roots = frozenset(root_commits(request.path))
+            group = next((name for known, name in root_groups if known & roots), None)
+            if group is None:
+                group = _root_group(roots)
+                root_groups.append((roots, group))
+        if group is not None:
+            grouped.setdefault(group_name(group), []).append(index)
+    return grouped
+
+
+def search_group(members: Sequence[Tuple[str, RepoConfig, SearchConfig]]
+                 ) -> List[Optional[List[Secret]]]:
+    """Searches the repositories of a group one after the other, diffing every commit
+    only for the first member whose walk reaches it
+
+    :param list members:
+        (local repository path, RepoConfig, SearchConfig) of every member, all with the
+        "git_log" scan backend
+
+    :return: the secrets of every member, in order, as a separate search of it would
+    find them. A member whose search failed gets None and a warning
+    """
+    group_search = GroupSearch()
+    results = []
+    try:
+        for repo_path, repo_config, search_config in members:
+            try:
+                results.append(list(group_search.search(repo_path, repo_config,
+                                                        search_config)))
+            except Exception as e:  # pylint: disable=broad-except
+                warnings.warn("Warning: search of {0} failed: {1}".format(repo_path, e))
+                results.append(None)
+    finally:
+        group_search.close()
+    return results
+
+
+def groupable(request: FindSecretsRequest) -> bool:
+    """
+    :param FindSecretsRequest request:
+        Request of a batch
+
+    :return: True if the request can be searched as a member of a group, i.e. it uses
+    the "git_log" scan backend
+    """
+    return (request.search_config or SearchConfig()).scan_backend == GIT_LOG_BACKEND
+
+
+class GroupSearch:
+    """The commits searched for the members of one group, which may be searched at the
+    same time by different threads. Every commit is diffed by the first member whose
+    walk reaches it, the other members wait for that diff and read its findings back
+    from a list shared by the group, which spills to disk like a SecretSpool.
+    """
+
+    def __init__(self, max_findings_in_memory: int = None):
+        """Creates a new, empty GroupSearch
+
+        :param int max_findings_in_memory:
+            Number of findings of the group kept in memory before spilling to disk
+            (default is None, all of them)
+        """
+        self._changed = threading.Condition()
+        # (diff options, commit hash) to the claim of the member diffing it
+        self._claims: Dict[Tuple, _Claim] = dict()
+        self._found = (SecretSpool(max_findings_in_memory)
+                       if max_findings_in_memory is not None else [])
+
+    def search(self, repo_path: str, repo_config: RepoConfig,
+               search_config: SearchConfig) -> Iterator[Secret]:
+        """Diffs the commits of a member that no other member has diffed, and waits for
+        the others. Only a complete diff marks its commits as searched, the commits of a
+        member whose search failed are diffed again by the next member reaching them.
+
+        :param str repo_path:
+            Path to the local repository of the member
+
+        :param RepoConfig repo_config:
+            Configuration of the member's walk
+
+        :param SearchConfig search_config:
+            Configuration of the member's search, with the "git_log" scan backend
+
+        :raises TrufflehogApiError:
+            if git fails
+
+        :return: generator of the member's secrets as a separate search of it would find
+        them, named after the member's branches
+        """
+        scanner = Scanner(search_config)
+        # The diff of a commit only depends on the search and diff options, not on the
+        # refs, dates or authors that select the commits
+        options_key = (search_config.fingerprint(), repo_config.detect_renames,
+                       repo_config.detect_copies, repo_config.merges_against_first_parent,
+                       repo_config.first_parent, repo_config.paths)
+        commits = git_log.walk_commits(repo_path,
+                                       git_log.list_branches(repo_path, repo_config.branch),
+                                       since_commit=repo_config.since_commit,
+                                       max_depth=search_config.max_depth,
+                                       options=git_log.traversal_arguments(repo_config),
+                                       paths=repo_config.paths)
+        claims: Dict[str, _Claim] = dict()
+        pending = list(commits)
+        while pending:
+            own = OrderedDict()
+            with self._changed:
+                for hexsha in pending:
+                    claim = self._claims.get((options_key, hexsha))
+                    if claim is None:
+                        claim = self._claims[(options_key, hexsha)] = _Claim()
+                        own[hexsha] = commits[hexsha]
+                    claims[hexsha] = claim
+            # A member diffs all of its own commits before waiting for the others, so
+            # that members never wait for each other in a cycle
+            if own:
+                self._diff(repo_path, repo_config, search_config, scanner, options_key,
+                           own, {hexsha: claims[hexsha] for hexsha in own})
+            with self._changed:
+                for hexsha in pending:
+                    while not claims[hexsha].done:
+                        self._changed.wait()
+                pending = [hexsha for hexsha in pending if claims[hexsha].failed]
+        return self._read(commits, claims)
+
+    def close(self):
+        """Deletes the findings spilled to disk, the group cannot be searched afterwards"""
+        if isinstance(self._found, SecretSpool):
+            self._found.close()
+
+    def _diff(self, repo_path: str, repo_config: RepoConfig, search_config: SearchConfig,
+              scanner: Scanner, options_key: Tuple, commits: Dict[str, str],
+              claims: Dict[str, "_Claim"]):
+        """Diffs commits claimed by a member and stores their findings"""
+        try:
+            hunks = git_log.iter_commit_hunks(repo_path, commits, repo_config,
+                                              path_filter=scanner.path_included,
+                                              max_hunk_bytes=search_config.max_hunk_bytes)
+            for hunk in hunks:
+                secrets = scanner.scan_hunk(hunk)
+                with self._changed:
+                    positions = claims[hunk.commit.hexsha].positions
+                    for secret in secrets:
+                        positions.append(len(self._found))
+                        self._found.append(secret)
+        except BaseException:
+            with self._changed:
+                for hexsha, claim in claims.items():
+                    claim.failed = True
+                    if self._claims.get((options_key, hexsha)) is claim:
+                        del self._claims[(options_key, hexsha)]
+            raise
+        finally:
+            with self._changed:
+                for claim in claims.values():
+                    claim.done = True
+                self._changed.notify_all()
+
+    def _read(self, commits: Dict[str, str], claims: Dict[str, "_Claim"]) -> Iterator[Secret]:
+        """:return: generator of the findings of commits in walk order, named after the
+        member's branches"""
+        for hexsha, branch in commits.items():
+            for position in claims[hexsha].positions:
+                with self._changed:
+                    secret = self._found[position]
+                if secret.branch_name != branch:
+                    secret_dict = secret.to_dict()
+                    secret_dict["branch_name"] = branch
+                    secret = Secret.from_dict(secret_dict)
+                yield secret
+
+
+class _Claim:
+    """A commit diffed, or being diffed, for one member of a group"""
+
+    def __init__(self):
+        self.done: bool = False
+        self.failed: bool = False
+        # Positions of the commit's findings in the group's list
+        self.positions: List[int] = []
+
+
+class ForkBatch:
+    """The groups of one batch of requests, see ScanPipeline's fork_store. Remote members
+    are fetched into a ForkStore, local ones are grouped by their declared group or by
+    the root commits they share, and every group is searched by one GroupSearch.
+    """
+
+    def __init__(self, fork_store: ForkStore, groups: Dict[str, str] = None):
+        """Creates a new ForkBatch
+
+        :param ForkStore fork_store:
+            Stores the remote repositories are fetched into
+
+        :param dict groups:
+            Repository path or URL to a declared group name (default is None,
+            repositories are grouped by their root commits)
+        """
+        self._fork_store: ForkStore = fork_store
+        self._groups: Dict[str, str] = groups or dict()
+        self._lock = threading.Lock()
+        self._root_groups: List[Tuple[FrozenSet[str], str]] = []
+        self._searches: Dict[str, GroupSearch] = dict()
+
+    def fetch(self, request: FindSecretsRequest) -> Tuple[str, str]:
+        """Adds the repository of a remote request to the ForkStore, with its access token
+
+        :param FindSecretsRequest request:
+            Request for a remote repository
+
+        :raises TrufflehogApiError:
+            if git fails
+
+        :return: (name of the group's store, path of the member repository)
+        """
+        fetch_url = authenticated_url(request.path, request.repo_config or RepoConfig())
+        return self._fork_store.add(request.path, self._groups.get(request.path), fetch_url)
+
+    def local_group(self, request: FindSecretsRequest) -> str:
+        """
+        :param FindSecretsRequest request:
+            Request for a local repository
+
+        :raises TrufflehogApiError:
+            if git fails
+
+        :return: the name of the group of the repository, see group_requests
+        """
+        group = self._groups.get(request.path)
+        if group is None:
+            roots = frozenset(root_commits(request.path))
+            with self._lock:
+                group = next((name for known, name in self._root_groups if known & roots),
+                             None)
+                if group is None:
+                    group = _root_group(roots)
+                    self._root_groups.append((roots, group))
+        return group_name(group)
+
+    def search(self, group: str, repo_path: str, repo_config: RepoConfig,
+               search_config: SearchConfig) -> Iterator[Secret]:
+        """Searches a member with the GroupSearch of its group, see GroupSearch.search.
+        The group's findings spill to disk after the max_findings_in_memory of the
+        first member searched.
+
+        :param str group:
+            Name of the member's group
+
+        :param str repo_path:
+            Path to the local repository of the member
+
+        :param RepoConfig repo_config:
+            Configuration of the member's walk
+
+        :param SearchConfig search_config:
+            Configuration of the member's search
+
+        :return: generator of the member's secrets
+        """
+        with self._lock:
+            group_search = self._searches.get(group)
+            if group_search is None:
+                group_search = self._searches[group] = GroupSearch(
+                    search_config.max_findings_in_memory)
+        return group_search.search(repo_path, repo_config, search_config)
+
+    def search_member(self, request: FindSecretsRequest, repo_path: str,
+                      group: str = None) -> Sequence[Secret]:
+        """Scan stage of a request grouped by forks
+
+        :param FindSecretsRequest request:
+            Request with the "git_log" scan backend
+
+        :param str repo_path:
+            Its member repository, or the local repository itself
+
+        :param str group:
+            Group of a fetched remote member (default is None, the group of a local
+            repository is looked up, see local_group)
+
+        :raises TrufflehogApiError:
+            if git fails
+
+        :return: the request's secrets, spilled to disk after its max_findings_in_memory
+        """
+        search_config = request.search_config or SearchConfig()
+        secrets = self.search(group or self.local_group(request), repo_path,
+                              request.repo_config or RepoConfig(), search_config)
+        return collect_secrets(secrets, search_config.max_findings_in_memory)
+
+    def close(self):
+        """Deletes the findings the groups spilled to disk"""
+        with self._lock:
+            for group_search in self._searches.values():
+                group_search.close()
+            self._searches = dict()
+
+
+def _has_commits(repo_path: str, hexshas) -> bool:
+    """:return: True if the repository has at least one of the commits"""
+    output = _git_output(repo_path, ['git', 'cat-file', '--batch-check=%(objecttype)'],
+                         '\n'.join(hexshas) + '\n')
+    return 'commit' in output.split()
+
+
+def _root_group(roots: FrozenSet[str]) -> str:
+    """:return: the name of a group found by its root commits"""
+    return _ROOTS_PREFIX + (min(roots) if roots else 'empty')
+
+
+def _name(value: str) -> str:
+    """:return: the file name a URL is stored under"""
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:32]
+
+
+def _git(cwd: Optional[str], *args):
+    _git_output(cwd, ['git'] + list(args))
+
+
+def _git_output(cwd: Optional[str], command: List[str], stdin: str = None) -> str:
+    """Runs a git command without ever prompting for credentials"""
+    env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+    try:
+        return subprocess.run(command, cwd=cwd, env=env, check=True,
+                              input=stdin.encode('utf-8') if stdin is not None else None,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                              ).stdout.decode('utf-8', errors='replace')
+    except subprocess.CalledProcessError as e:
+        raise TrufflehogApiError('git {0} failed: {1}'.format(
+            command[1], e.stderr.decode('utf-8', errors='replace').strip()))
+    except OSError as e:
+        raise TrufflehogApiError(e)
@@ -0,0 +1,811 @@
+"""
+Streams the history of a git repository through a single ``git log -p``
+subprocess per branch and parses the patch output incrementally into
+(commit, path, hunk) records. This avoids building GitPython Commit and
+Diff objects for every commit in the history.
+"""
+import os
+import subprocess
+import tempfile
+from typing import BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.metrics import scan_metrics
+from trufflehog_api.repo_config import RepoConfig
+
+# Markers framing the per-commit header emitted by _LOG_FORMAT. NUL bytes
+# cannot appear in paths or in the patch text git prints for text files.
+_COMMIT_MARKER = b'\x00C '
+_MESSAGE_END = b'\x00E'
+_LOG_FORMAT = '--format=%x00C %H %ct%n%B%x00E'
+
+_PIPE_BUFFER_SIZE = 1024 * 1024
+
+# Commits listed on the command line of a single git log by iter_commit_hunks
+_COMMITS_PER_COMMAND = 500
+
+
+class CommitInfo(NamedTuple):
+    """Metadata of a commit read from the ``git log`` header"""
+    hexsha: str
+    committed_date: int
+    message: str
+    branch_name: str
+
+
+class DiffHunk(NamedTuple):
+    """A single hunk of a file patch, including its ``@@`` header line"""
+    commit: CommitInfo
+    path: str
+    hunk: bytes
+
+
+def build_log_command(ref: str,
+                      max_depth: int = None,
+                      since_commit: str = None,
+                      exclude_refs: List[str] = None,
+                      skip: int = 0,
+                      options: List[str] = None,
+                      paths: List[str] = None) -> List[str]:
+    """Builds the ``git log -p`` command line used to walk a single ref
+
+    :param str ref:
+        Branch or ref to walk
+
+    :param int max_depth:
+        Maximum number of commits to walk (default is None, no limit)
+
+    :param str since_commit:
+        Commit hash to stop at, exclusive (default is None, full history)
+
+    :param list exclude_refs:
+        Refs whose history has already been walked and can be skipped
+
+    :param int skip:
+        Number of commits at the start of the walk to leave out, counted towards
+        max_depth (default is 0)
+
+    :param list options:
+        Further git log options, e.g. from traversal_arguments and diff_arguments
+
+    :param list paths:
+        Pathspecs restricting the walk and the diffs (default is None, every path)
+
+    :return: the argument list to pass to subprocess
+    """
+    command = ['git', 'log', '-p', '--no-color', '--no-ext-diff', '--no-textconv',
+               '--src-prefix=a/', '--dst-prefix=b/', _LOG_FORMAT]
+    command.extend(options or [])
+    if skip:
+        command.append('--skip={0}'.format(skip))
+    if max_depth:
+        command.append('--max-count={0}'.format(max(max_depth - skip, 0)))
+    command.append(ref)
+    if since_commit:
+        command.append('^' + since_commit)
+    for exclude_ref in exclude_refs or []:
+        command.append('^' + exclude_ref)
+    command.append('--')
+    command.extend(paths or [])
+    return command
+
+
+def traversal_arguments(repo_config: RepoConfig) -> List[str]:
+    """
+    :param RepoConfig repo_config:
+        Repository options
+
+    :return: the git log and git rev-list options selecting the commits walked, the
+    paths of repo_config are passed separately after '--'
+    """
+    arguments = []
+    if repo_config.first_parent:
+        arguments.append('--first-parent')
+    if repo_config.skip_merges:
+        arguments.append('--no-merges')
+    if repo_config.since:
+        arguments.append('--since=' + repo_config.since)
+    if repo_config.until:
+        arguments.append('--until=' + repo_config.until)
+    if repo_config.author:
+        arguments.append('--author=' + repo_config.author)
+    if repo_config.committer:
+        arguments.append('--committer=' + repo_config.committer)
+    if repo_config.paths:
+        # Otherwise git drops the side branches of merges that leave the paths as they
+        # were on one parent, together with their commits to the paths
+        arguments.append('--full-history')
+    return arguments
+
+
+def diff_arguments(repo_config: RepoConfig) -> List[str]:
+    """
+    :param RepoConfig repo_config:
+        Repository options
+
+    :return: the git log options selecting how the changes of a commit are diffed
+    """
+    arguments = []
+    if repo_config.merges_against_first_parent:
+        arguments.append('--diff-merges=first-parent')
+    if repo_config.detect_copies:
+        arguments.append('-C')
+    elif repo_config.detect_renames:
+        arguments.append('-M')
+    elif repo_config.detect_renames is not None:
+        arguments.append('--no-renames')
+    return arguments
+
+
+def is_git_dir(path: str) -> bool:
+    """Same check as GitPython's git.repo.fun.is_git_dir, without importing GitPython
+
+    :param str path:
+        Directory to check
+
+    :return: True if path looks like a git directory (a .git folder or a bare repository)
+    """
+    if not os.path.isdir(path):
+        return False
+    if not os.path.isfile(os.path.join(path, 'HEAD')):
+        return False
+    has_objects = ('GIT_OBJECT_DIRECTORY' in os.environ
+                   or os.path.isdir(os.path.join(path, 'objects')))
+    return has_objects and os.path.isdir(os.path.join(path, 'refs'))
+
+
+def list_branches(repo_path: str, branch: str = None) -> List[str]:
+    """Lists the refs that should be walked for a repository. Remote tracking
+    branches are preferred, falling back to local branches, which matches the
+    branches truffleHog searches after fetching from origin.
+
+    :param str repo_path:
+        Path to the local git repository
+
+    :param str branch:
+        Branch to restrict the search to (default is None, all branches)
+
+    :return: list of short ref names
+    """
+    return _select_branches(_ref_oids(repo_path), branch)
+
+
+def resolve_refs(repo_path: str, branch: str = None) -> Dict[str, str]:
+    """Resolves the refs list_branches would walk to the commits they point at
+
+    :param str repo_path:
+        Path to the local git repository
+
+    :param str branch:
+        Branch to restrict the search to (default is None, all branches)
+
+    :raises TrufflehogApiError:
+        if branch cannot be resolved
+
+    :return: dict of short ref name to commit hash
+    """
+    refs = _ref_oids(repo_path)
+    resolved = dict()
+    for ref in _select_branches(refs, branch):
+        resolved[ref] = refs.get(ref) or _git_lines(repo_path, ['git', 'rev-parse', '--verify',
+                                                                 ref + '^{commit}'])[0]
+    return resolved
+
+
+def resolve_remote_refs(git_url: str, branch: str = None) -> Dict[str, str]:
+    """Resolves the branches of a remote repository without cloning it, named like
+    the remote tracking branches a clone of it would have
+
+    :param str git_url:
+        URL of the remote repository
+
+    :param str branch:
+        Branch or tag to restrict the search to (default is None, all branches)
+
+    :raises TrufflehogApiError:
+        if the remote cannot be listed
+
+    :return: dict of short ref name (origin/<branch>, or the tag name) to commit hash
+    """
+    if not branch:
+        command = ['git', 'ls-remote', '--heads', git_url]
+    else:
+        command = ['git', 'ls-remote', git_url, 'refs/heads/' + branch, 'refs/tags/' + branch,
+                   'refs/tags/' + branch + '^{}']
+    heads = dict()
+    tags = dict()
+    for line in _git_lines(None, command):
+        oid, ref = line.split('\t', 1)
+        if ref.startswith('refs/heads/'):
+            heads['origin/' + ref[len('refs/heads/'):]] = oid
+        elif ref.endswith('^{}'):
+            # The commit an annotated tag points to
+            tags[ref[len('refs/tags/'):-len('^{}')]] = oid
+        else:
+            tags.setdefault(ref[len('refs/tags/'):], oid)
+    # Like _select_branches, a branch wins over a tag of the same name
+    return heads or tags
+
+
+def parse_patch_stream(stream: BinaryIO,
+                       branch_name: str,
+                       path_filter: Callable[[str], bool] = None,
+                       on_commit: Callable[[CommitInfo], None] = None,
+                       max_hunk_bytes: int = None) -> Iterator[DiffHunk]:
+    """Parses the output of ``git log -p`` produced with _LOG_FORMAT line by line
+
+    :param stream:
+        Binary file-like object the patch is read from
+
+    :param str branch_name:
+        Branch the commits were reached from
+
+    :param path_filter:
+        Optional predicate on the file path, hunks of files for which it returns
+        False are skipped without being buffered
+
+    :param on_commit:
+        Optional callback invoked with every commit header once it is parsed, after
+        every hunk of the previous commit was yielded (and so consumed)
+
+    :param int max_hunk_bytes:
+        Largest hunk held in memory. Longer hunks are yielded as consecutive DiffHunk
+        chunks of at most this many bytes, cut at line ends, and lines longer than this
+        are read in pieces and cut themselves (default is None, hunks are yielded whole)
+
+    :return: generator of DiffHunk records in the order git prints them
+    """
+    commit = None
+    message_lines = None
+    path = None
+    old_path = None
+    in_header = False
+    skip_file = False
+    hunk_lines = []
+    hunk_size = 0
+    continued = False
+
+    for line in _read_lines(stream, max_hunk_bytes):
+        if continued:
+            # The rest of a line longer than max_hunk_bytes
+            continued = not line.endswith(b'\n')
+            if message_lines is not None:
+                message_lines.append(line)
+            elif not in_header and not skip_file and path is not None:
+                if hunk_size + len(line) > max_hunk_bytes:
+                    yield DiffHunk(commit, path, b''.join(hunk_lines))
+                    hunk_lines, hunk_size = [], 0
+                hunk_lines.append(line)
+                hunk_size += len(line)
+            continue
+        continued = max_hunk_bytes is not None and not line.endswith(b'\n')
+
+        if line.startswith(_COMMIT_MARKER):
+            if hunk_lines:
+                yield DiffHunk(commit, path, b''.join(hunk_lines))
+                hunk_lines, hunk_size = [], 0
+            hexsha, committed_date = line[len(_COMMIT_MARKER):].split()
+            commit = (hexsha.decode('ascii'), int(committed_date))
+            message_lines = []
+            path = None
+            continue
+
+        if message_lines is not None:
+            stripped = line.rstrip(b'\n')
+            if stripped.endswith(_MESSAGE_END):
+                # Messages without a final newline, e.g. written by git fast-import,
+                # end on the line of the marker
+                message_lines.append(stripped[:-len(_MESSAGE_END)])
+                message = b''.join(message_lines).decode('utf-8', errors='replace')
+                commit = CommitInfo(commit[0], commit[1], message, branch_name)
+                message_lines = None
+                if on_commit is not None:
+                    on_commit(commit)
+            else:
+                message_lines.append(line)
+            continue
+
+        if line.startswith(b'diff --git '):
+            if hunk_lines:
+                yield DiffHunk(commit, path, b''.join(hunk_lines))
+                hunk_lines, hunk_size = [], 0
+            path = None
+            old_path = None
+            in_header = True
+            skip_file = False
+            continue
+
+        if in_header:
+            if line.startswith(b'--- '):
+                old_path = _parse_patch_path(line[4:], b'a/')
+            elif line.startswith(b'+++ '):
+                path = _parse_patch_path(line[4:], b'b/') or old_path
+                skip_file = path_filter is not None and not path_filter(path)
+            elif line.startswith(b'@@'):
+                in_header = False
+                if not skip_file and path is not None:
+                    hunk_lines.append(line)
+                    hunk_size = len(line)
+            continue
+
+        if skip_file or path is None:
+            continue
+        if hunk_lines and (line.startswith(b'@@') or (
+                max_hunk_bytes is not None and hunk_size + len(line) > max_hunk_bytes)):
+            yield DiffHunk(commit, path, b''.join(hunk_lines))
+            hunk_lines, hunk_size = [], 0
+        hunk_lines.append(line)
+        hunk_size += len(line)
+
+    if hunk_lines:
+        yield DiffHunk(commit, path, b''.join(hunk_lines))
+
+
+def _read_lines(stream: BinaryIO, max_line_bytes: int = None) -> Iterator[bytes]:
+    """Iterates over the lines of stream, in pieces of at most max_line_bytes"""
+    if max_line_bytes is None:
+        yield from stream
+        return
+    while True:
+        line = stream.readline(max_line_bytes)
+        if not line:
+            return
+        yield line
+
+
+def iter_diff_hunks(repo_path: str,
+                    repo_config: RepoConfig = None,
+                    max_depth: int = None,
+                    path_filter: Callable[[str], bool] = None,
+                    refs: List[Tuple[str, str]] = None,
+                    position: Tuple[int, int] = (0, 0),
+                    on_progress: Callable[[int, int], None] = None,
+                    end_position: Tuple[int, int] = None,
+                    max_hunk_bytes: int = None) -> Iterator[DiffHunk]:
+    """Walks every branch of the repository with one ``git log -p`` subprocess per
+    branch and yields the hunks of each commit. Commits reachable from a branch
+    walked earlier are excluded from the later walks.
+
+    The walk is deterministic for given refs, so a walk that was interrupted can be
+    continued from the last position reported to on_progress.
+
+    :param str repo_path:
+        Path to the local git repository
+
+    :param RepoConfig repo_config:
+        Repository options (branch, since_commit and the traversal options are honoured)
+
+    :param int max_depth:
+        Maximum commit depth per branch
+
+    :param path_filter:
+        Optional predicate on file paths, see parse_patch_stream
+
+    :param list refs:
+        (branch name, commit hash) pairs to walk in order, e.g. a walk's refs saved
+        earlier (default is None, the branches list_branches returns as they are now)
+
+    :param tuple position:
+        (index of the branch in refs, number of its commits) to start the walk after
+        (default is (0, 0), from the start)
+
+    :param on_progress:
+        Optional callback invoked with the position after every fully yielded commit
+
+    :param tuple end_position:
+        Position to stop the walk at, e.g. the start of the next slice returned by
+        split_walk (default is None, walk to the end)
+
+    :param int max_hunk_bytes:
+        Largest hunk held in memory, see parse_patch_stream
+
+    :raises TrufflehogApiError:
+        if git exits with an error
+
+    :return: generator of DiffHunk records
+    """
+    if not repo_config:
+        repo_config = RepoConfig()
+    if refs is None:
+        refs = [(ref, ref) for ref in list_branches(repo_path, repo_config.branch)]
+
+    options = traversal_arguments(repo_config) + diff_arguments(repo_config)
+    start_branch, start_commits = position
+    end_branch, end_commits = end_position or (len(refs), 0)
+    walked = []
+    for index, (branch_name, ref) in enumerate(refs):
+        if index < start_branch:
+            walked.append(ref)
+            continue
+        if index > end_branch or (index == end_branch and not end_commits):
+            return
+        skip = start_commits if index == start_branch else 0
+        depth = max_depth
+        if index == end_branch:
+            depth = min(max_depth or end_commits, end_commits)
+        command = build_log_command(ref, max_depth=depth,
+                                    since_commit=repo_config.since_commit,
+                                    exclude_refs=walked, skip=skip, options=options,
+                                    paths=repo_config.paths)
+        on_commit = None
+        if on_progress is not None:
+            on_commit = _ProgressReporter(on_progress, index, skip)
+        yield from _stream_command(repo_path, command, branch_name, path_filter, on_commit,
+                                   max_hunk_bytes)
+        if on_progress is not None:
+            on_progress(index + 1, 0)
+        walked.append(ref)
+
+
+class _ProgressReporter:
+    """on_commit callback of iter_diff_hunks reporting the position in the walk"""
+
+    def __init__(self, on_progress: Callable[[int, int], None], index: int, skip: int):
+        self._on_progress = on_progress
+        self._index: int = index
+        self._skip: int = skip
+        self._commits_seen: int = skip - 1
+
+    def __call__(self, _commit: CommitInfo):
+        # Every commit before this one has been consumed
+        self._commits_seen += 1
+        if self._commits_seen > self._skip:
+            self._on_progress(self._index, self._commits_seen)
+
+
+def count_commits(repo_path: str,
+                  ref: str,
+                  since_commit: str = None,
+                  exclude_refs: List[str] = None,
+                  max_depth: int = None,
+                  options: List[str] = None,
+                  paths: List[str] = None) -> int:
+    """Counts the commits a walk of ref by iter_diff_hunks would visit
+
+    :param str repo_path:
+        Path to the local git repository
+
+    :param str ref:
+        Branch or ref to walk
+
+    :param str since_commit:
+        Commit hash to stop at, exclusive (default is None, full history)
+
+    :param list exclude_refs:
+        Refs whose history is left out (default is None)
+
+    :param int max_depth:
+        Maximum number of commits to count (default is None, no limit)
+
+    :param list options:
+        Further options selecting the commits, see traversal_arguments
+
+    :param list paths:
+        Pathspecs restricting the walk (default is None, every path)
+
+    :raises TrufflehogApiError:
+        if git exits with an error
+
+    :return: number of commits
+    """
+    command = ['git', 'rev-list', '--count'] + (options or [])
+    if max_depth:
+        command.append('--max-count={0}'.format(max_depth))
+    command.append(ref)
+    if since_commit:
+        command.append('^' + since_commit)
+    for exclude_ref in exclude_refs or []:
+        command.append('^' + exclude_ref)
+    command.append('--')
+    command.extend(paths or [])
+    lines = _git_lines(repo_path, command)
+    return int(lines[0]) if lines else 0
+
+
+def walk_commits(repo_path: str,
+                 refs: List[str],
+                 since_commit: str = None,
+                 max_depth: int = None,
+                 options: List[str] = None,
+                 paths: List[str] = None) -> Dict[str, str]:
+    """Lists the commits a walk of refs by iter_diff_hunks would visit, without
+    producing any patches
+
+    :param str repo_path:
+        Path to the local git repository
+
+    :param list refs:
+        Refs to walk in order, e.g. as returned by list_branches
+
+    :param str since_commit:
+        Commit hash to stop at, exclusive (default is None, full history)
+
+    :param int max_depth:
+        Maximum commit depth per ref (default is None, no limit)
+
+    :param list options:
+        Further options selecting the commits, see traversal_arguments
+
+    :param list paths:
+        Pathspecs restricting the walk (default is None, every path)
+
+    :raises TrufflehogApiError:
+        if git exits with an error
+
+    :return: dict of commit hash to the ref the walk reaches it from
+    """
+    commits = dict()
+    walked = []
+    for ref in refs:
+        command = ['git', 'rev-list'] + (options or [])
+        if max_depth:
+            command.append('--max-count={0}'.format(max_depth))
+        command.append(ref)
+        if since_commit:
+            command.append('^' + since_commit)
+        for exclude_ref in walked:
+            command.append('^' + exclude_ref)
+        command.append('--')
+        command.extend(paths or [])
+        for hexsha in _git_lines(repo_path, command):
+            commits[hexsha] = ref
+        walked.append(ref)
+    return commits
+
+
+def iter_commit_hunks(repo_path: str,
+                      commits: Dict[str, str],
+                      repo_config: RepoConfig = None,
+                      path_filter: Callable[[str], bool] = None,
+                      on_commit: Callable[[CommitInfo], None] = None,
+                      max_hunk_bytes: int = None) -> Iterator[DiffHunk]:
+    """Yields the hunks of the given commits only, e.g. a sample of a walk_commits
+    result, diffed as iter_diff_hunks would diff them
+
+    :param str repo_path:
+        Path to the local git repository
+
+    :param dict commits:
+        Commit hash to the branch name its hunks are attributed to, walked in order
+
+    :param RepoConfig repo_config:
+        Repository options (the traversal options and paths are honoured)
+
+    :param path_filter:
+        Optional predicate on file paths, see parse_patch_stream
+
+    :param on_commit:
+        Optional callback invoked with every commit header, see parse_patch_stream
+
+    :param int max_hunk_bytes:
+        Largest hunk held in memory, see parse_patch_stream
+
+    :raises TrufflehogApiError:
+        if git exits with an error
+
+    :return: generator of DiffHunk records
+    """
+    if not repo_config:
+        repo_config = RepoConfig()
+    options = (['--no-walk=unsorted'] + traversal_arguments(repo_config)
+               + diff_arguments(repo_config))
+    hexshas = list(commits)
+    for start in range(0, len(hexshas), _COMMITS_PER_COMMAND):
+        chunk = hexshas[start:start + _COMMITS_PER_COMMAND]
+        # git log takes revisions anywhere before '--', in the order they are walked
+        command = build_log_command(chunk[-1], options=options + chunk[:-1],
+                                    paths=repo_config.paths)
+        for hunk in _stream_command(repo_path, command, '', path_filter, on_commit,
+                                    max_hunk_bytes):
+            yield hunk._replace(commit=hunk.commit._replace(
+                branch_name=commits[hunk.commit.hexsha]))
+
+
+def iter_snapshot_hunks(repo_path: str,
+                        ref: str = 'HEAD',
+                        repo_config: RepoConfig = None,
+                        path_filter: Callable[[str], bool] = None,
+                        max_hunk_bytes: int = None) -> Iterator[DiffHunk]:
+    """Yields the contents of every file at ref as hunks adding them, attributed to
+    the commit ref points at, so the current tree can be searched without its history
+
+    :param str repo_path:
+        Path to the local git repository
+
+    :param str ref:
+        Branch or ref whose tree is searched (default is 'HEAD')
+
+    :param RepoConfig repo_config:
+        Repository options (the paths are honoured)
+
+    :param path_filter:
+        Optional predicate on file paths, see parse_patch_stream
+
+    :param int max_hunk_bytes:
+        Largest hunk held in memory, see parse_patch_stream
+
+    :raises TrufflehogApiError:
+        if ref cannot be resolved or git exits with an error
+
+    :return: generator of DiffHunk records
+    """
+    if not repo_config:
+        repo_config = RepoConfig()
+    commits = []
+    for _ in _stream_command(repo_path, ['git', 'log', '-1', '--no-patch', _LOG_FORMAT, ref, '--'],
+                             ref, None, commits.append):
+        pass
+    commit = commits[0]
+    empty_tree = _git_lines(repo_path, ['git', 'hash-object', '-t', 'tree', os.devnull])[0]
+    command = ['git', 'diff', '--no-color', '--no-ext-diff', '--no-textconv', '--no-renames',
+               '--src-prefix=a/', '--dst-prefix=b/', empty_tree, commit.hexsha, '--']
+    command.extend(repo_config.paths or [])
+    for hunk in _stream_command(repo_path, command, ref, path_filter, None, max_hunk_bytes):
+        yield hunk._replace(commit=commit)
+
+
+def object_size(repo_path: str) -> int:
+    """
+    :param str repo_path:
+        Path to the local git repository
+
+    :raises TrufflehogApiError:
+        if git exits with an error
+
+    :return: size in bytes of the loose and packed objects of the repository
+    """
+    counts = dict(line.split(': ', 1) for line
+                  in _git_lines(repo_path, ['git', 'count-objects', '-v']))
+    return (int(counts.get('size', 0)) + int(counts.get('size-pack', 0))) * 1024
+
+
+def split_walk(repo_path: str,
+               refs: List[Tuple[str, str]],
+               commits_per_slice: int,
+               repo_config: RepoConfig = None,
+               max_depth: int = None) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """Cuts the walk of refs by iter_diff_hunks into slices of about commits_per_slice
+    commits that can be walked independently and together visit every commit once
+
+    :param str repo_path:
+        Path to the local git repository
+
+    :param list refs:
+        (branch name, commit hash) pairs to walk in order, see iter_diff_hunks
+
+    :param int commits_per_slice:
+        Number of commits per slice, the last slice of a branch may be shorter
+
+    :param RepoConfig repo_config:
+        Repository options (since_commit and the traversal options are honoured)
+
+    :param int max_depth:
+        Maximum commit depth per branch
+
+    :raises TrufflehogApiError:
+        if git exits with an error
+
+    :return: list of (position, end_position) pairs to pass to iter_diff_hunks
+    """
+    if not repo_config:
+        repo_config = RepoConfig()
+    slices = []
+    walked = []
+    for index, (_, ref) in enumerate(refs):
+        commits = count_commits(repo_path, ref, since_commit=repo_config.since_commit,
+                                exclude_refs=walked, max_depth=max_depth,
+                                options=traversal_arguments(repo_config),
+                                paths=repo_config.paths)
+        for start in range(0, commits, commits_per_slice):
+            end = start + commits_per_slice
+            end_position = (index, end) if end < commits else (index + 1, 0)
+            slices.append(((index, start), end_position))
+        walked.append(ref)
+    return slices
+
+
+def _stream_command(repo_path: str, command: List[str], branch_name: str,
+                    path_filter: Optional[Callable[[str], bool]],
+                    on_commit: Callable[[CommitInfo], None] = None,
+                    max_hunk_bytes: int = None) -> Iterator[DiffHunk]:
+    """Runs a git log command and parses its stdout while it is being produced, counting
+    the commits, diff bytes and skipped files in the ScanMetrics
+    """
+    metrics = scan_metrics()
+    commits, diff_bytes, blobs_skipped = metrics.commits, metrics.diff_bytes, metrics.blobs_skipped
+
+    def counted_path_filter(path: str) -> bool:
+        if path_filter(path):
+            return True
+        blobs_skipped.inc()
+        return False
+
+    def counted_on_commit(commit: CommitInfo):
+        commits.inc()
+        if on_commit is not None:
+            on_commit(commit)
+
+    # stderr goes to a file: a pipe only read after stdout ends blocks git, and with it
+    # this reader, as soon as git writes more warnings than the pipe buffer holds
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, cwd=repo_path, stdout=subprocess.PIPE,
+                                   stderr=stderr, bufsize=_PIPE_BUFFER_SIZE)
+        completed = False
+        try:
+            for hunk in parse_patch_stream(process.stdout, branch_name,
+                                           counted_path_filter if path_filter is not None
+                                           else None,
+                                           counted_on_commit, max_hunk_bytes):
+                diff_bytes.inc(len(hunk.hunk))
+                yield hunk
+            completed = True
+        finally:
+            if not completed:
+                # The consumer stopped early, there is no point in letting git finish
+                process.kill()
+            process.stdout.close()
+            return_code = process.wait()
+
+        if return_code != 0:
+            raise TrufflehogApiError('git log failed for {0}: {1}'
+                                     .format(branch_name, read_stderr(stderr)))
+
+
+def read_stderr(stderr: BinaryIO) -> str:
+    """Reads back the standard error a git subprocess wrote to a temporary file
+
+    :param stderr:
+        Temporary file passed as stderr to the subprocess, after it exited
+
+    :return: the decoded and stripped error output
+    """
+    stderr.seek(0)
+    return stderr.read().decode('utf-8', errors='replace').strip()
+
+
+def _ref_oids(repo_path: str) -> Dict[str, str]:
+    """Maps the short names of the origin remote tracking and local branches to
+    their commit hashes
+    """
+    lines = _git_lines(repo_path, ['git', 'for-each-ref', '--format=%(refname:short) %(objectname)',
+                                   'refs/remotes/origin/', 'refs/heads/'])
+    return dict(line.rsplit(' ', 1) for line in lines)
+
+
+def _select_branches(refs: Dict[str, str], branch: str = None) -> List[str]:
+    """Picks the refs to walk out of the names returned by _ref_oids"""
+    remote_refs = [ref for ref in refs if ref.startswith('origin/') and ref != 'origin/HEAD']
+    local_refs = [ref for ref in refs if not ref.startswith('origin/')]
+
+    if branch:
+        for candidate in ('origin/' + branch, branch):
+            if candidate in refs:
+                return [candidate]
+        # Let git resolve anything else (tags, hashes) and report bad refs itself
+        return [branch]
+    return remote_refs or local_refs
+
+
+def _git_lines(repo_path: str, command: List[str]) -> List[str]:
+    """Runs a short git command and returns its non empty output lines"""
+    try:
+        # Never block on a credential prompt, e.g. when listing a private remote
+        env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+        output = subprocess.run(command, cwd=repo_path, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, check=True, env=env).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise TrufflehogApiError('git command failed: {0}'.format(e))
+    return [line for line in output.decode('utf-8', errors='replace').splitlines() if line]
+
+
+def _parse_patch_path(raw: bytes, prefix: bytes) -> Optional[str]:
+    """Extracts the path from a ``---``/``+++`` line, None for /dev/null"""
+    raw = raw.rstrip(b'\n').rstrip(b'\t')
+    if raw == b'/dev/null':
+        return None
+    if raw.startswith(b'"') and raw.endswith(b'"'):
+        # git C-quotes paths with unusual characters
+        raw = raw[1:-1].decode('unicode_escape').encode('latin-1')
+    if raw.startswith(prefix):
+        raw = raw[len(prefix):]
+    return raw.decode('utf-8', errors='replace')
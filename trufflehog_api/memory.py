@@ -0,0 +1,268 @@
+"""
+Memory controls for large scans: a list of secrets that spills to a temporary
+JSON lines file once it holds too many findings, and a guard reading the
+resident set size of the process so that batches can hold back new scans
+while it is over a soft limit.
+"""
+import json
+import os
+import threading
+import time
+from typing import IO, Iterable, Iterator, List, Optional, Sequence
+
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.secret import Secret
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss(include_children: bool = False) -> Optional[int]:
+    """
+    :param bool include_children:
+        If True, add the resident set size of the direct child processes, e.g. git
+        subprocesses (default is False)
+
+    :return: resident set size of the process in bytes, None if it cannot be read
+    (e.g. without /proc and without psutil)
+    """
+    rss = _statm_rss("self")
+    if rss is not None:
+        if include_children:
+            rss += sum(_statm_rss(pid) or 0 for pid in _child_pids())
+        return rss
+    try:
+        import psutil
+    except ImportError:
+        return None
+    process = psutil.Process()
+    processes = [process] + (process.children() if include_children else [])
+    return sum(child.memory_info().rss for child in processes)
+
+
+class MemoryGuard:
+    """Soft limit on the resident set size of the process and its children. A batch
+    asks the guard before starting a scan and waits while the limit is exceeded and
+    other scans are still running, so concurrency drops under memory pressure instead
+    of the process being killed. The guard never holds back the only scan.
+    """
+
+    def __init__(self, max_rss_bytes: int, poll_interval: float = 0.1):
+        """Creates a new MemoryGuard
+
+        :param int max_rss_bytes:
+            Resident set size above which new scans wait
+
+        :param float poll_interval:
+            Seconds between two readings while waiting (default is 0.1)
+
+        :raises TrufflehogApiError:
+            if max_rss_bytes is not positive
+        """
+        if max_rss_bytes <= 0:
+            raise TrufflehogApiError('max_rss_bytes must be positive')
+        self._max_rss_bytes: int = max_rss_bytes
+        self._poll_interval: float = poll_interval
+        self._lock = threading.Condition()
+        self._active: int = 0
+        self._throttled: int = 0
+        self._throttled_seconds: float = 0.0
+        self._available: bool = current_rss() is not None
+        if not self._available:
+            import warnings
+            warnings.warn("Warning: the resident set size of the process cannot be read - "
+                          "the memory guard is disabled")
+
+    @property
+    def max_rss_bytes(self) -> int:
+        """
+        :return: resident set size above which new scans wait
+        """
+        return self._max_rss_bytes
+
+    @property
+    def active(self) -> int:
+        """
+        :return: number of scans currently admitted
+        """
+        return self._active
+
+    @property
+    def throttled(self) -> int:
+        """
+        :return: number of scans that had to wait for memory
+        """
+        return self._throttled
+
+    @property
+    def throttled_seconds(self) -> float:
+        """
+        :return: total seconds scans waited for memory
+        """
+        return self._throttled_seconds
+
+    def over_limit(self) -> bool:
+        """
+        :return: True if the resident set size is above the limit
+        """
+        rss = current_rss(include_children=True) if self._available else None
+        return rss is not None and rss > self._max_rss_bytes
+
+    def acquire(self) -> float:
+        """Admits a scan, waiting while other scans run and the limit is exceeded
+
+        :return: seconds the scan waited
+        """
+        waited = 0.0
+        with self._lock:
+            if self._active and self.over_limit():
+                start = time.monotonic()
+                self._throttled += 1
+                while self._active and self.over_limit():
+                    self._lock.wait(self._poll_interval)
+                waited = time.monotonic() - start
+                self._throttled_seconds += waited
+            self._active += 1
+        return waited
+
+    def release(self):
+        """Ends a scan admitted by acquire"""
+        with self._lock:
+            self._active -= 1
+            self._lock.notify_all()
+
+
+class SecretSpool(Sequence):
+    """List of secrets keeping at most max_in_memory of them in memory. Further secrets
+    are appended to a temporary JSON lines file and read back when iterated or indexed.
+    The file is deleted with close or when the spool is garbage collected.
+    """
+
+    def __init__(self, max_in_memory: int, directory: str = None):
+        """Creates a new, empty SecretSpool
+
+        :param int max_in_memory:
+            Number of secrets kept in memory before spilling to disk
+
+        :param str directory:
+            Directory of the temporary file (default is None, the system default)
+        """
+        self._max_in_memory: int = max_in_memory
+        self._directory: Optional[str] = directory
+        self._secrets: List[Secret] = []
+        self._path: Optional[str] = None
+        self._file: Optional[IO] = None
+        self._offsets: List[int] = []
+
+    @property
+    def spilled(self) -> int:
+        """
+        :return: number of secrets stored on disk
+        """
+        return len(self._offsets)
+
+    @property
+    def path(self) -> Optional[str]:
+        """
+        :return: the temporary file, None while nothing was spilled
+        """
+        return self._path
+
+    def append(self, secret: Secret):
+        """Adds a secret, spilling it to disk once max_in_memory are held"""
+        if len(self._secrets) < self._max_in_memory and not self._offsets:
+            self._secrets.append(secret)
+            return
+        if self._file is None:
+            import tempfile
+            handle, self._path = tempfile.mkstemp(prefix="trufflehog_api-spool-",
+                                                  suffix=".jsonl", dir=self._directory)
+            self._file = os.fdopen(handle, "w+b")
+        self._file.seek(0, os.SEEK_END)
+        self._offsets.append(self._file.tell())
+        line = json.dumps(secret.to_dict(), default=str) + "\n"
+        self._file.write(line.encode("utf-8"))
+
+    def extend(self, secrets: Iterable[Secret]):
+        """Adds every secret of an iterable, see append"""
+        for secret in secrets:
+            self.append(secret)
+
+    def close(self):
+        """Deletes the temporary file, the spilled secrets are lost"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+        self._path = None
+        self._offsets = []
+
+    def __len__(self):
+        return len(self._secrets) + len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("SecretSpool index out of range")
+        if index < len(self._secrets):
+            return self._secrets[index]
+        return self._read(self._offsets[index - len(self._secrets)])
+
+    def __iter__(self) -> Iterator[Secret]:
+        yield from self._secrets
+        for offset in list(self._offsets):
+            yield self._read(offset)
+
+    def __del__(self):
+        self.close()
+
+    def _read(self, offset: int) -> Secret:
+        if self._file is None:
+            self._file = open(self._path, "r+b")
+        self._file.flush()
+        self._file.seek(offset)
+        return Secret.from_dict(json.loads(self._file.readline().decode("utf-8")))
+
+
+def _statm_rss(pid) -> Optional[int]:
+    try:
+        with open("/proc/{0}/statm".format(pid)) as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _child_pids() -> List[str]:
+    pids = []
+    try:
+        for task in os.listdir("/proc/self/task"):
+            with open("/proc/self/task/{0}/children".format(task)) as children:
+                pids.extend(children.read().split())
+    except OSError:
+        pass
+    return pids
+
+
+def collect_secrets(secrets: Iterable[Secret], max_in_memory: int = None) -> Sequence[Secret]:
+    """Materializes the secrets of a scan
+
+    :param secrets:
+        Iterable of secrets, usually a lazy scan
+
+    :param int max_in_memory:
+        Number of secrets kept in memory before spilling to disk
+        (default is None, a plain list)
+
+    :return: a list, or a SecretSpool when max_in_memory is given
+    """
+    if max_in_memory is None:
+        return list(secrets)
+    spool = SecretSpool(max_in_memory)
+    spool.extend(secrets)
+    return spool
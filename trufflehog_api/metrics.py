@@ -0,0 +1,767 @@
+"""
+Counters, gauges and histograms for long running scanners, rendered in the
+Prometheus text exposition format on demand or served on a local HTTP endpoint.
+
+Updates are lock-light: every thread adds to cells of its own, which are only
+summed when the metrics are read, so the worker threads of a batch never wait on
+each other to count. A lock is only taken the first time a thread updates a
+series, and when the series is read, which also folds in the cells of threads
+that have ended.
+
+The ScanMetrics of the process wide default_registry() are updated by git_log
+(commits, diff bytes, file changes skipped by the path filters), the Scanner
+(findings by reason) and the batch pipeline and scan service (repositories,
+clone and scan durations, jobs in flight, cache sizes).
+"""
+import bisect
+import math
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from trufflehog_api.error import TrufflehogApiError
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# Upper bounds in seconds, from quick local searches to clones of large repositories
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+                   600.0)
+
+# Content type of MetricsRegistry.render
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_METRIC_NAME = re.compile(r"^[a-zA-Z_:][a-zA-Z0-9_:]*$")
+_LABEL_NAME = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+
+_default_registry: Optional["MetricsRegistry"] = None
+_scan_metrics: Optional["ScanMetrics"] = None
+_default_lock = threading.Lock()
+
+
+def default_registry() -> "MetricsRegistry":
+    """
+    :return: the process wide MetricsRegistry the ScanMetrics are registered in
+    """
+    global _default_registry  # pylint: disable=global-statement
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = MetricsRegistry()
+        return _default_registry
+
+
+def scan_metrics() -> "ScanMetrics":
+    """
+    :return: the process wide ScanMetrics, registered in default_registry()
+    """
+    global _scan_metrics  # pylint: disable=global-statement
+    if _scan_metrics is None:
+        registry = default_registry()
+        with _default_lock:
+            if _scan_metrics is None:
+                _scan_metrics = ScanMetrics(registry)
+    return _scan_metrics
+
+
+class _Cells:
+    """size numbers per thread, summed when read"""
+
+    def __init__(self, size: int):
+        self._size: int = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cells: List[Tuple[threading.Thread, List[float]]] = []
+        self._retired: List[float] = [0] * size
+
+    def cell(self) -> List[float]:
+        """
+        :return: the cells of the calling thread, which only it writes to
+        """
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0] * self._size
+            with self._lock:
+                # Fold the threads that exited, so that short lived threads do not pile
+                # up cells between reads
+                self._fold()
+                self._cells.append((threading.current_thread(), cell))
+            return cell
+
+    def totals(self) -> List[float]:
+        """
+        :return: the sums of the cells of every thread
+        """
+        with self._lock:
+            self._fold()
+            totals = list(self._retired)
+            for _, cell in self._cells:
+                totals = [total + value for total, value in zip(totals, cell)]
+        return totals
+
+    def _fold(self):
+        """Adds the cells of the threads that exited to the retired sums, with the lock"""
+        live = []
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                live.append((thread, cell))
+            else:
+                self._retired = [total + value for total, value in zip(self._retired, cell)]
+        self._cells = live
+
+
+class CounterValue:
+    """A series of a Counter"""
+
+    def __init__(self):
+        self._cells = _Cells(1)
+
+    @property
+    def value(self) -> float:
+        """
+        :return: the sum of every increment
+        """
+        return self._cells.totals()[0]
+
+    def inc(self, amount: float = 1):
+        """
+        :param float amount:
+            Non negative amount to add (default is 1)
+
+        :raises TrufflehogApiError:
+            if amount is negative
+        """
+        if amount < 0:
+            raise TrufflehogApiError('Counters can only be increased')
+        self._cells.cell()[0] += amount
+
+
+class GaugeValue:
+    """A series of a Gauge. inc and dec can be called from any thread; set is meant for
+    gauges that are only ever set, see also set_function.
+    """
+
+    def __init__(self):
+        self._cells = _Cells(1)
+        self._base: float = 0
+        self._function: Optional[Callable[[], float]] = None
+
+    @property
+    def value(self) -> float:
+        """
+        :return: the current value
+        """
+        function = self._function
+        if function is not None:
+            return function()
+        return self._base + self._cells.totals()[0]
+
+    def inc(self, amount: float = 1):
+        """
+        :param float amount:
+            Amount to add (default is 1)
+        """
+        self._cells.cell()[0] += amount
+
+    def dec(self, amount: float = 1):
+        """
+        :param float amount:
+            Amount to subtract (default is 1)
+        """
+        self._cells.cell()[0] -= amount
+
+    def set(self, value: float):
+        """
+        :param float value:
+            New value
+        """
+        self._base = value - self._cells.totals()[0]
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        """
+        :param function:
+            Callable computing the value whenever it is read, e.g. the size of a cache
+            (None goes back to the value set or moved by inc and dec)
+        """
+        self._function = function
+
+
+class HistogramValue:
+    """A series of a Histogram"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self._buckets: Tuple[float, ...] = tuple(buckets)
+        # A count per bucket and one for +Inf, then the sum and the count
+        self._cells = _Cells(len(self._buckets) + 3)
+
+    @property
+    def buckets(self) -> Tuple[float, ...]:
+        """
+        :return: upper bounds of the buckets, without +Inf
+        """
+        return self._buckets
+
+    @property
+    def value(self) -> Tuple[List[float], float, float]:
+        """
+        :return: (cumulative count of every bucket and of +Inf, sum, count) of the
+        observations
+        """
+        totals = self._cells.totals()
+        cumulative = []
+        count = 0
+        for bucket_count in totals[:-2]:
+            count += bucket_count
+            cumulative.append(count)
+        return cumulative, totals[-2], totals[-1]
+
+    def observe(self, value: float):
+        """
+        :param float value:
+            Observation, e.g. a duration in seconds
+        """
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self._buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+
+class Metric:
+    """A named family of series told apart by the values of its labels. Metrics without
+    labels have a single series, which the metric's own methods update.
+    """
+
+    kind: str = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """Creates a new metric, see MetricsRegistry
+
+        :raises TrufflehogApiError:
+            if the name or a label name is not valid in the Prometheus format
+        """
+        if not _METRIC_NAME.match(name):
+            raise TrufflehogApiError('Invalid metric name: {0}'.format(name))
+        for labelname in labelnames:
+            if not _LABEL_NAME.match(labelname) or labelname.startswith("__"):
+                raise TrufflehogApiError('Invalid label name: {0}'.format(labelname))
+        self._name: str = name
+        self._documentation: str = documentation
+        self._labelnames: Tuple[str, ...] = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], object] = dict()
+        self._unlabelled = None if self._labelnames else self.labels()
+
+    @property
+    def name(self) -> str:
+        """
+        :return: name of the metric
+        """
+        return self._name
+
+    @property
+    def documentation(self) -> str:
+        """
+        :return: help text of the metric
+        """
+        return self._documentation
+
+    @property
+    def labelnames(self) -> Tuple[str, ...]:
+        """
+        :return: names of the labels of the metric
+        """
+        return self._labelnames
+
+    def labels(self, *values, **labels):
+        """
+        :param values:
+            Values of the labels in the order of labelnames, or given by name
+
+        :raises TrufflehogApiError:
+            if the labels do not match labelnames
+
+        :return: the series with these label values, created if needed
+        """
+        if labels:
+            if values or set(labels) != set(self._labelnames):
+                raise TrufflehogApiError('Labels of {0} are {1}'
+                                         .format(self._name, ", ".join(self._labelnames)))
+            values = tuple(labels[labelname] for labelname in self._labelnames)
+        values = tuple(str(value) for value in values)
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self._labelnames):
+                raise TrufflehogApiError('Labels of {0} are {1}'
+                                         .format(self._name, ", ".join(self._labelnames)))
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def series(self) -> List[Tuple[Dict[str, str], object]]:
+        """
+        :return: (labels, series) of every series, in the order they were created
+        """
+        with self._lock:
+            items = list(self._series.items())
+        return [(dict(zip(self._labelnames, values)), series) for values, series in items]
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """
+        :return: the (sample name, labels, value) lines of the metric in the
+        exposition format
+        """
+        return [(self._name, labels, series.value) for labels, series in self.series()]
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def _only_series(self):
+        if self._unlabelled is None:
+            raise TrufflehogApiError('{0} has labels, select a series with labels()'
+                                     .format(self._name))
+        return self._unlabelled
+
+
+class Counter(Metric):
+    """Monotonically increasing count, e.g. of commits searched"""
+
+    kind = COUNTER
+
+    @property
+    def value(self) -> float:
+        """
+        :return: the value of a counter without labels
+        """
+        return self._only_series().value
+
+    def inc(self, amount: float = 1):
+        """Increases a counter without labels, see CounterValue.inc"""
+        self._only_series().inc(amount)
+
+    def _new_series(self) -> CounterValue:
+        return CounterValue()
+
+
+class Gauge(Metric):
+    """Value that goes up and down, e.g. the number of jobs in flight"""
+
+    kind = GAUGE
+
+    @property
+    def value(self) -> float:
+        """
+        :return: the value of a gauge without labels
+        """
+        return self._only_series().value
+
+    def inc(self, amount: float = 1):
+        """Increases a gauge without labels, see GaugeValue.inc"""
+        self._only_series().inc(amount)
+
+    def dec(self, amount: float = 1):
+        """Decreases a gauge without labels, see GaugeValue.dec"""
+        self._only_series().dec(amount)
+
+    def set(self, value: float):
+        """Sets a gauge without labels, see GaugeValue.set"""
+        self._only_series().set(value)
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        """Computes a gauge without labels when it is read, see GaugeValue.set_function"""
+        self._only_series().set_function(function)
+
+    def _new_series(self) -> GaugeValue:
+        return GaugeValue()
+
+
+class Histogram(Metric):
+    """Distribution of observations in buckets, e.g. of durations"""
+
+    kind = HISTOGRAM
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Creates a new histogram, see MetricsRegistry.histogram"""
+        buckets = [bucket for bucket in buckets if bucket != math.inf]
+        if not buckets or list(buckets) != sorted(set(buckets)):
+            raise TrufflehogApiError('Histogram buckets must be increasing')
+        self._buckets: Tuple[float, ...] = tuple(float(bucket) for bucket in buckets)
+        super().__init__(name, documentation, labelnames)
+
+    @property
+    def buckets(self) -> Tuple[float, ...]:
+        """
+        :return: upper bounds of the buckets, without +Inf
+        """
+        return self._buckets
+
+    @property
+    def value(self) -> Tuple[List[float], float, float]:
+        """
+        :return: the value of a histogram without labels, see HistogramValue.value
+        """
+        return self._only_series().value
+
+    def observe(self, value: float):
+        """Records an observation of a histogram without labels"""
+        self._only_series().observe(value)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        for labels, series in self.series():
+            cumulative, total, count = series.value
+            for bound, bucket_count in zip(self._buckets + (math.inf,), cumulative):
+                samples.append((self._name + "_bucket", dict(labels, le=_format_value(bound)),
+                                bucket_count))
+            samples.append((self._name + "_sum", labels, total))
+            samples.append((self._name + "_count", labels, count))
+        return samples
+
+    def _new_series(self) -> HistogramValue:
+        return HistogramValue(self._buckets)
+
+
+class MetricsRegistry:
+    """Named metrics rendered together. Asking for a metric that is already registered
+    returns it, so modules can look their metrics up instead of passing them around.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = OrderedDict()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """
+        :param str name:
+            Metric name, by convention ending in _total
+
+        :param str documentation:
+            Help text
+
+        :param list labelnames:
+            Names of the labels telling its series apart (default is none)
+
+        :raises TrufflehogApiError:
+            if name is registered with another type or other labels
+
+        :return: the registered Counter
+        """
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """
+        :return: the registered Gauge, see counter
+        """
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        :param list buckets:
+            Increasing upper bounds of the buckets, +Inf is always added
+            (default is DEFAULT_BUCKETS, in seconds)
+
+        :return: the registered Histogram, see counter
+        """
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[Metric]:
+        """
+        :param str name:
+            Metric name
+
+        :return: the registered metric, None if there is none
+        """
+        return self._metrics.get(name)
+
+    def metrics(self) -> List[Metric]:
+        """
+        :return: every registered metric, in the order they were registered
+        """
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self) -> str:
+        """
+        :return: every metric in the Prometheus text exposition format, see CONTENT_TYPE
+        """
+        lines = []
+        for metric in self.metrics():
+            lines.append("# HELP {0} {1}".format(
+                metric.name, metric.documentation.replace("\\", "\\\\").replace("\n", "\\n")))
+            lines.append("# TYPE {0} {1}".format(metric.name, metric.kind))
+            for sample_name, labels, value in metric.samples():
+                if labels:
+                    sample_name += "{" + ",".join(
+                        '{0}="{1}"'.format(labelname, _escape_label_value(label_value))
+                        for labelname, label_value in labels.items()) + "}"
+                lines.append("{0} {1}".format(sample_name, _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 0, host: str = "127.0.0.1") -> "MetricsServer":
+        """Serves render() on GET /metrics in a background thread
+
+        :param int port:
+            TCP port (default is 0, any free port, see MetricsServer.address)
+
+        :param str host:
+            Address to listen on (default is the loopback interface)
+
+        :raises TrufflehogApiError:
+            if the port cannot be bound
+
+        :return: the running MetricsServer, close it once done
+        """
+        return MetricsServer(self, port, host)
+
+    def _register(self, metric_class, name: str, documentation: str,
+                  labelnames: Sequence[str], **options) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, documentation, labelnames,
+                                                            **options)
+            elif not isinstance(metric, metric_class) or metric.labelnames != tuple(labelnames):
+                raise TrufflehogApiError('{0} is already registered as a {1} with labels ({2})'
+                                         .format(name, metric.kind, ", ".join(metric.labelnames)))
+            return metric
+
+
+class MetricsServer:
+    """HTTP server exposing a MetricsRegistry to Prometheus, see MetricsRegistry.serve"""
+
+    def __init__(self, registry: MetricsRegistry, port: int = 0, host: str = "127.0.0.1"):
+        import http.server
+        import socketserver
+
+        class MetricsHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            """Threaded HTTP server, whose request threads do not keep the process alive"""
+
+            daemon_threads = True
+
+        class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+            """Answers GET / and GET /metrics with the registry in the text exposition
+            format"""
+
+            server_version = "trufflehog_api"
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Renders the registry, or answers 404 for any other path"""
+                if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                data = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                """Keeps scrapes out of stderr"""
+
+        try:
+            self._server = MetricsHTTPServer((host, port), MetricsRequestHandler)
+        except OSError as e:
+            raise TrufflehogApiError('Cannot serve metrics on {0}:{1}: {2}'.format(host, port, e))
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server",
+                                        daemon=True)
+        self._thread.start()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """
+        :return: (host, port) the server listens on
+        """
+        return self._server.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        """
+        :return: URL of the metrics
+        """
+        return "http://{0}:{1}/metrics".format(*self.address)
+
+    def close(self):
+        """Stops the server"""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ScanMetrics:
+    """The metrics of a scanning process, registered in a MetricsRegistry"""
+
+    # Counters a search adds to
+    _SEARCH_COUNTERS = ("commits", "diff_bytes", "blobs_skipped", "findings")
+
+    def __init__(self, registry: MetricsRegistry):
+        """Registers the metrics
+
+        :param MetricsRegistry registry:
+            Registry to register them in, usually default_registry()
+        """
+        self._registry: MetricsRegistry = registry
+        self._repositories: Counter = registry.counter(
+            "trufflehog_repositories_total", "Requests finished, by outcome", ("outcome",))
+        self._commits: Counter = registry.counter(
+            "trufflehog_commits_total", "Commits whose diffs were read")
+        self._diff_bytes: Counter = registry.counter(
+            "trufflehog_diff_bytes_total", "Bytes of diff hunks read")
+        self._blobs_skipped: Counter = registry.counter(
+            "trufflehog_blobs_skipped_total",
+            "File changes skipped by the path filters without being read")
+        self._findings: Counter = registry.counter(
+            "trufflehog_findings_total", "Secrets found, by reason", ("reason",))
+        self._clone_seconds: Histogram = registry.histogram(
+            "trufflehog_clone_duration_seconds", "Seconds spent cloning or fetching a repository")
+        self._scan_seconds: Histogram = registry.histogram(
+            "trufflehog_scan_duration_seconds", "Seconds spent searching a repository or shard")
+        self._jobs_in_flight: Gauge = registry.gauge(
+            "trufflehog_jobs_in_flight", "Requests being cloned or searched, by stage",
+            ("stage",))
+        self._result_cache_entries: Gauge = registry.gauge(
+            "trufflehog_result_cache_entries", "Entries in the result cache")
+        self._result_cache_bytes: Gauge = registry.gauge(
+            "trufflehog_result_cache_bytes", "Bytes of the entries in the result cache")
+        self._scratch_bytes: Gauge = registry.gauge(
+            "trufflehog_scratch_bytes", "Bytes of clones in the scratch space")
+
+    @property
+    def registry(self) -> MetricsRegistry:
+        """
+        :return: the registry the metrics are registered in
+        """
+        return self._registry
+
+    @property
+    def repositories(self) -> Counter:
+        """
+        :return: requests finished, labelled with an outcome of "succeeded", "failed"
+        or "cached"
+        """
+        return self._repositories
+
+    @property
+    def commits(self) -> Counter:
+        """
+        :return: commits whose diffs were read from git
+        """
+        return self._commits
+
+    @property
+    def diff_bytes(self) -> Counter:
+        """
+        :return: bytes of the diff hunks read from git
+        """
+        return self._diff_bytes
+
+    @property
+    def blobs_skipped(self) -> Counter:
+        """
+        :return: file changes the path filters skipped without reading them
+        """
+        return self._blobs_skipped
+
+    @property
+    def findings(self) -> Counter:
+        """
+        :return: secrets found, labelled with their reason
+        """
+        return self._findings
+
+    @property
+    def clone_seconds(self) -> Histogram:
+        """
+        :return: durations of the clones and fetches of remote repositories
+        """
+        return self._clone_seconds
+
+    @property
+    def scan_seconds(self) -> Histogram:
+        """
+        :return: durations of the searches of repositories and shards
+        """
+        return self._scan_seconds
+
+    @property
+    def jobs_in_flight(self) -> Gauge:
+        """
+        :return: requests being cloned or searched, labelled with the stage
+        """
+        return self._jobs_in_flight
+
+    def watch_result_cache(self, result_cache):
+        """Reports the size of a ResultCache in the cache gauges whenever they are read,
+        until it is garbage collected
+
+        :param ResultCache result_cache:
+            The cache
+        """
+        cache = weakref.ref(result_cache)
+
+        def entries() -> float:
+            """:return: number of entries of the cache, 0 once it was collected"""
+            watched = cache()
+            return len(watched) if watched is not None else 0
+
+        def size() -> float:
+            """:return: size of the cache in bytes, 0 once it was collected"""
+            watched = cache()
+            return watched.size() if watched is not None else 0
+
+        self._result_cache_entries.set_function(entries)
+        self._result_cache_bytes.set_function(size)
+
+    def watch_scratch_space(self, scratch_space):
+        """Reports the usage of a ScratchSpace in the scratch gauge whenever it is read,
+        until it is garbage collected
+
+        :param ScratchSpace scratch_space:
+            The scratch space
+        """
+        space = weakref.ref(scratch_space)
+
+        def usage() -> float:
+            """:return: bytes used in the scratch space, 0 once it was collected"""
+            watched = space()
+            return watched.usage if watched is not None else 0
+
+        self._scratch_bytes.set_function(usage)
+
+    def search_counts(self) -> Dict[Tuple[str, Tuple[str, ...]], float]:
+        """
+        :return: the value of every series of the counters a search adds to, by
+        (counter, label values)
+        """
+        counts = dict()
+        for counter_name in self._SEARCH_COUNTERS:
+            counter = getattr(self, counter_name)
+            for labels, series in counter.series():
+                counts[(counter_name, tuple(labels.values()))] = series.value
+        return counts
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, int) or (value == int(value) and abs(value) < 2 ** 53):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,99 @@
+"""
+Keeps bare mirror clones of remote repositories in a local directory so
+that long running processes only fetch what changed between scans instead
+of cloning every repository again.
+"""
+import hashlib
+import os
+import subprocess
+import threading
+from typing import Dict
+
+from trufflehog_api.error import TrufflehogApiError
+
+
+class MirrorCache:
+    """Directory of ``git clone --mirror`` copies keyed by repository URL. Each mirror
+    is updated with ``git fetch --prune`` before it is handed out; concurrent users
+    of the same URL are serialized by a per URL lock.
+    """
+
+    def __init__(self, directory: str):
+        """Creates a new MirrorCache, creating directory if needed
+
+        :param str directory:
+            Directory the mirrors are stored in
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory: str = directory
+        self._locks: Dict[str, threading.Lock] = dict()
+        self._locks_lock = threading.Lock()
+
+    @property
+    def directory(self) -> str:
+        """
+        :return: directory the mirrors are stored in
+        """
+        return self._directory
+
+    def path_for(self, url: str) -> str:
+        """
+        :param str url:
+            Repository URL without credentials
+
+        :return: where the mirror of url is (or would be) stored
+        """
+        name = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self._directory, name + '.git')
+
+    def lock_for(self, url: str) -> threading.Lock:
+        """
+        :return: the lock serializing updates of the mirror of url
+        """
+        with self._locks_lock:
+            lock = self._locks.get(url)
+            if lock is None:
+                lock = self._locks[url] = threading.Lock()
+            return lock
+
+    def update(self, url: str, fetch_url: str = None) -> str:
+        """Clones the mirror of url if it does not exist yet, otherwise fetches into it
+
+        :param str url:
+            Repository URL without credentials, stored as the mirror's origin
+
+        :param str fetch_url:
+            URL to actually fetch from, e.g. with an access token appended. It is only
+            passed on the command line and never stored in the mirror
+            (default is None, url is used)
+
+        :raises TrufflehogApiError:
+            if git fails
+
+        :return: path to the up to date bare mirror
+        """
+        fetch_url = fetch_url or url
+        path = self.path_for(url)
+        with self.lock_for(url):
+            if os.path.isdir(path):
+                _git(path, 'fetch', '--prune', '--quiet', fetch_url,
+                     '+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*')
+            else:
+                temp_path = path + '.partial'
+                _git(None, 'clone', '--mirror', '--quiet', fetch_url, temp_path)
+                _git(temp_path, 'remote', 'set-url', 'origin', url)
+                os.replace(temp_path, path)
+        return path
+
+
+def _git(cwd, *args):
+    """Runs a git command without ever prompting for credentials"""
+    env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+    try:
+        subprocess.run(['git'] + list(args), cwd=cwd, env=env, check=True,
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except subprocess.CalledProcessError as e:
+        raise TrufflehogApiError('git {0} failed: {1}'.format(
+            args[0], e.stderr.decode('utf-8', errors='replace').strip()))
+    except OSError as e:
+        raise TrufflehogApiError(e)
@@ -0,0 +1,991 @@
+"""
+Two stage pipeline for batches of requests. Clone workers fetch remote
+repositories, at most max_clones_per_host at a time from the same host, and
+hand the clones to a bounded queue. Scan workers drain the queue at their own
+parallelism level, so that network bound clones and CPU bound scans do not
+compete for the same slots. A full queue holds back the clone stage, which
+keeps the number of clones on disk bounded when the scans fall behind.
+
+Local repositories skip the clone stage's work, and requests answered by the
+ResultCache are finished in the clone stage without cloning.
+
+With a BatchScheduler both stages take the most expensive request first, and
+repositories with long histories are split into shards (see shards) that are put
+back on the scan queue, where whichever scan worker is idle takes the next one.
+
+Requests for the same repository taken in together are cloned once and
+searched with a single shared walk of its history, see shared_walk, and their
+results are handed back to every request separately.
+
+With a ForkStore the requests are grouped by forks instead, see forks: the clone
+stage fetches remote repositories into the store of their group, and the scan
+workers search the members of a group with a GroupSearch shared by the run, so
+that their common commits are diffed once.
+
+With max_rss_bytes a MemoryGuard holds scan workers back before they start a
+search while the process is over the limit, down to a single running search.
+With an AdaptiveConcurrency the scan workers are its max_workers, and it decides
+how many of them may search at the same time.
+
+Besides the PipelineMetrics of a run, the pipeline updates the process wide
+metrics.scan_metrics(): finished requests by outcome, clone and search
+durations, jobs in flight per stage and the sizes of the result cache and
+scratch space.
+"""
+import bisect
+import itertools
+import os
+import queue
+import re
+import threading
+import time
+import warnings
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from trufflehog_api.checkpoint import ScanCheckpoint
+from trufflehog_api.concurrency import AdaptiveConcurrency
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.forks import ForkBatch, ForkStore, groupable
+from trufflehog_api.memory import MemoryGuard, collect_secrets
+from trufflehog_api.metrics import scan_metrics
+from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.repository import (FindSecretsRequest, checkpoint_path, clone_repository,
+                                       is_local_repository, release_clone, result_cache_key,
+                                       search_git_log, search_repository)
+from trufflehog_api.result_cache import ResultCache
+from trufflehog_api.scheduler import BatchScheduler
+from trufflehog_api.scratch import ScratchSpace, default_scratch_space
+from trufflehog_api.search_config import GIT_LOG_BACKEND, SearchConfig
+from trufflehog_api.secret import Secret
+from trufflehog_api.shards import PipelineJob, shard_done, shard_secrets, split_job
+from trufflehog_api.shared_walk import group_jobs, search_shared
+
+CLONE_STAGE = "clone"
+SCAN_STAGE = "scan"
+
+# user@host:path remotes, which urlsplit does not understand
+_SCP_REMOTE = re.compile(r"^(?:[^@/]+@)?([^:/]+):(?!//)")
+
+
+def repository_host(path: str) -> Optional[str]:
+    """
+    :param str path:
+        Repository URL or local path
+
+    :return: lower case host name of a remote repository, '' for a remote without a host
+    (e.g. file:// URLs), None for a local path
+    """
+    if is_local_repository(path):
+        return None
+    if "://" in path:
+        return (urlsplit(path).hostname or "").lower()
+    match = _SCP_REMOTE.match(path)
+    return match.group(1).lower() if match else ""
+
+
+class PipelineMetrics:
+    """Queue depth and stage utilization of a ScanPipeline run. It is safe to read
+    while the pipeline is running. Utilization is the share of the stage's worker
+    time spent working rather than waiting for input or for room in the queue.
+    """
+
+    def __init__(self):
+        """Creates empty metrics, ScanPipeline starts them when it runs"""
+        self._lock = threading.Lock()
+        self._workers: Dict[str, int] = {CLONE_STAGE: 0, SCAN_STAGE: 0}
+        self._busy: Dict[str, float] = {CLONE_STAGE: 0.0, SCAN_STAGE: 0.0}
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+        self._queue_depth: int = 0
+        self._max_queue_depth: int = 0
+        self._depth_area: float = 0.0
+        self._depth_changed: Optional[float] = None
+        self._clones: int = 0
+        self._scans: int = 0
+        self._cache_hits: int = 0
+        self._shards: int = 0
+        self._throttled: int = 0
+        self._throttled_seconds: float = 0.0
+        self._shared: int = 0
+
+    @property
+    def elapsed(self) -> float:
+        """
+        :return: seconds the pipeline has been running, or ran for once finished
+        """
+        with self._lock:
+            return self._elapsed()
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        :return: number of clones currently waiting for a scan worker
+        """
+        return self._queue_depth
+
+    @property
+    def max_queue_depth(self) -> int:
+        """
+        :return: highest number of clones that waited for a scan worker at once
+        """
+        return self._max_queue_depth
+
+    @property
+    def mean_queue_depth(self) -> float:
+        """
+        :return: time weighted mean number of clones waiting for a scan worker
+        """
+        with self._lock:
+            elapsed = self._elapsed()
+            area = self._depth_area
+            if self._depth_changed is not None and self._finished is None:
+                area += self._queue_depth * (time.monotonic() - self._depth_changed)
+            return area / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def clones(self) -> int:
+        """
+        :return: number of remote repositories cloned
+        """
+        return self._clones
+
+    @property
+    def scans(self) -> int:
+        """
+        :return: number of repositories scanned
+        """
+        return self._scans
+
+    @property
+    def shards(self) -> int:
+        """
+        :return: number of shards the histories of large repositories were split into
+        """
+        return self._shards
+
+    @property
+    def cache_hits(self) -> int:
+        """
+        :return: number of requests answered by the ResultCache
+        """
+        return self._cache_hits
+
+    @property
+    def shared(self) -> int:
+        """
+        :return: number of requests searched by a walk shared with other requests
+        """
+        return self._shared
+
+    @property
+    def throttled(self) -> int:
+        """
+        :return: number of searches that waited for memory before starting
+        """
+        return self._throttled
+
+    @property
+    def throttled_seconds(self) -> float:
+        """
+        :return: total seconds searches waited for memory
+        """
+        return self._throttled_seconds
+
+    def utilization(self, stage: str) -> float:
+        """
+        :param str stage:
+            CLONE_STAGE or SCAN_STAGE
+
+        :return: busy seconds of the stage's workers divided by their total seconds
+        """
+        with self._lock:
+            capacity = self._workers[stage] * self._elapsed()
+            return self._busy[stage] / capacity if capacity > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        """
+        :return: the metrics as a dict
+        """
+        metrics_dict = dict()
+        metrics_dict["elapsed"] = self.elapsed
+        metrics_dict["clone_workers"] = self._workers[CLONE_STAGE]
+        metrics_dict["scan_workers"] = self._workers[SCAN_STAGE]
+        metrics_dict["clone_utilization"] = self.utilization(CLONE_STAGE)
+        metrics_dict["scan_utilization"] = self.utilization(SCAN_STAGE)
+        metrics_dict["queue_depth"] = self.queue_depth
+        metrics_dict["max_queue_depth"] = self.max_queue_depth
+        metrics_dict["mean_queue_depth"] = self.mean_queue_depth
+        metrics_dict["clones"] = self.clones
+        metrics_dict["scans"] = self.scans
+        metrics_dict["shards"] = self.shards
+        metrics_dict["cache_hits"] = self.cache_hits
+        metrics_dict["shared"] = self.shared
+        metrics_dict["throttled"] = self.throttled
+        metrics_dict["throttled_seconds"] = self.throttled_seconds
+        return metrics_dict
+
+    def __str__(self):
+        return ("clone stage {0:.0%} busy ({1} workers, {2} clones), "
+                "scan stage {3:.0%} busy ({4} workers, {5} scans, {6} shards), "
+                "queue depth mean {7:.1f} max {8}, {9} cache hits, {10} requests in shared "
+                "walks, {11} searches throttled for {12:.1f}s"
+                .format(self.utilization(CLONE_STAGE), self._workers[CLONE_STAGE], self.clones,
+                        self.utilization(SCAN_STAGE), self._workers[SCAN_STAGE], self.scans,
+                        self.shards, self.mean_queue_depth, self.max_queue_depth,
+                        self.cache_hits, self.shared, self.throttled, self.throttled_seconds))
+
+    def reset(self):
+        """Clears every metric, e.g. to reuse the object for another run"""
+        with self._lock:
+            self._workers = {CLONE_STAGE: 0, SCAN_STAGE: 0}
+            self._busy = {CLONE_STAGE: 0.0, SCAN_STAGE: 0.0}
+            self._started = None
+            self._finished = None
+            self._queue_depth = 0
+            self._max_queue_depth = 0
+            self._depth_area = 0.0
+            self._depth_changed = None
+            self._clones = 0
+            self._scans = 0
+            self._cache_hits = 0
+            self._shards = 0
+            self._throttled = 0
+            self._throttled_seconds = 0.0
+            self._shared = 0
+
+    def start(self, clone_workers: int, scan_workers: int):
+        """Clears the metrics and starts the clock of a run
+
+        :param int clone_workers:
+            Number of workers of the clone stage
+
+        :param int scan_workers:
+            Number of workers of the scan stage
+        """
+        self.reset()
+        with self._lock:
+            self._workers[CLONE_STAGE] = clone_workers
+            self._workers[SCAN_STAGE] = scan_workers
+            self._started = time.monotonic()
+            self._depth_changed = self._started
+
+    def finish(self):
+        """Stops the clock of the run"""
+        with self._lock:
+            self._set_queue_depth(self._queue_depth)
+            self._finished = time.monotonic()
+
+    def add_busy(self, stage: str, seconds: float):
+        """
+        :param str stage:
+            CLONE_STAGE or SCAN_STAGE
+
+        :param float seconds:
+            Time a worker of the stage spent working on a job
+        """
+        with self._lock:
+            self._busy[stage] += seconds
+
+    def count(self, clones: int = 0, scans: int = 0, shards: int = 0, cache_hits: int = 0,
+              shared: int = 0):
+        """Adds to the counts of clones, scans, shards, cache hits and requests searched
+        by shared walks (every count defaults to 0)
+        """
+        with self._lock:
+            self._clones += clones
+            self._scans += scans
+            self._shards += shards
+            self._cache_hits += cache_hits
+            self._shared += shared
+
+    def add_throttle(self, seconds: float):
+        """
+        :param float seconds:
+            Time a search waited for memory before it started
+        """
+        with self._lock:
+            self._throttled += 1
+            self._throttled_seconds += seconds
+
+    def queue_changed(self, change: int):
+        """
+        :param int change:
+            Number of jobs put on (positive) or taken off (negative) the scan queue
+        """
+        with self._lock:
+            self._set_queue_depth(self._queue_depth + change)
+
+    def _set_queue_depth(self, depth: int):
+        now = time.monotonic()
+        if self._depth_changed is not None:
+            self._depth_area += self._queue_depth * (now - self._depth_changed)
+        self._depth_changed = now
+        self._queue_depth = depth
+        self._max_queue_depth = max(self._max_queue_depth, depth)
+
+    def _elapsed(self) -> float:
+        if self._started is None:
+            return 0.0
+        return (self._finished or time.monotonic()) - self._started
+
+
+class ScanPipeline:
+    """Runs batches of requests through a clone stage and a scan stage"""
+
+    def __init__(self,
+                 clone_concurrency_level: int = 4,
+                 scan_concurrency_level: int = None,
+                 max_clones_per_host: int = None,
+                 queue_size: int = None,
+                 result_cache: ResultCache = None,
+                 checkpoint_dir: str = None,
+                 resume: bool = False,
+                 scratch_space: ScratchSpace = None,
+                 metrics: PipelineMetrics = None,
+                 scheduler: BatchScheduler = None,
+                 lookahead: int = None,
+                 max_rss_bytes: int = None,
+                 share_traversal: bool = True,
+                 adaptive_concurrency: AdaptiveConcurrency = None,
+                 fork_store: ForkStore = None,
+                 fork_groups: Dict[str, str] = None):
+        """Creates a new ScanPipeline
+
+        :param int clone_concurrency_level:
+            Number of clone workers (default is 4)
+
+        :param int scan_concurrency_level:
+            Number of scan workers (default is None, the number of CPUs)
+
+        :param int max_clones_per_host:
+            Maximum number of clones from the same host at a time
+            (default is None, no limit besides clone_concurrency_level)
+
+        :param int queue_size:
+            Number of clones that may wait for a scan worker before the clone stage
+            stops (default is None, twice scan_concurrency_level)
+
+        :param ResultCache result_cache:
+            Optional cache shared by the requests, see execute_find_secrets_request
+
+        :param str checkpoint_dir:
+            Optional directory every request writes a checkpoint to, named after the request
+
+        :param bool resume:
+            If True, requests continue from their checkpoints in checkpoint_dir
+
+        :param ScratchSpace scratch_space:
+            Optional place to clone remote repositories in
+
+        :param PipelineMetrics metrics:
+            Optional metrics that are filled in while the pipeline runs
+
+        :param BatchScheduler scheduler:
+            Optional scheduler estimating the cost of requests. The most expensive
+            requests taken in are cloned and searched first, repositories above its
+            shard_commits are split into shards and the durations are recorded in its
+            history (default is None, requests run in the order they are given)
+
+        :param int lookahead:
+            Number of requests taken in ahead of the results, the window the scheduler
+            orders (default is None, a few per worker)
+
+        :param int max_rss_bytes:
+            Soft limit on the resident set size of the process and its git subprocesses.
+            While it is exceeded scan workers wait before starting another search, as
+            long as one search is still running (default is None, no limit)
+
+        :param bool share_traversal:
+            If True, requests for the same repository taken in together are cloned once
+            and searched with one walk of its history. Not used with checkpoint_dir or
+            fork_store (default is True)
+
+        :param AdaptiveConcurrency adaptive_concurrency:
+            Controller moving the number of searches running at the same time between
+            its bounds from samples of the resource usage. Its max_workers replaces
+            scan_concurrency_level (default is None, every scan worker searches)
+
+        :param ForkStore fork_store:
+            Optional stores remote repositories are fetched into instead of being cloned.
+            The requests with the "git_log" scan backend are then grouped by forks, see
+            forks, and their histories are not split into shards
+
+        :param dict fork_groups:
+            Repository path or URL to a declared group name, with fork_store
+            (default is None, repositories are grouped by their root commits)
+
+        :raises TrufflehogApiError:
+            if a stage has no workers, or fork_store is combined with checkpoint_dir
+        """
+        if adaptive_concurrency is not None:
+            scan_concurrency_level = adaptive_concurrency.max_workers
+        if scan_concurrency_level is None:
+            scan_concurrency_level = os.cpu_count() or 1
+        if clone_concurrency_level < 1 or scan_concurrency_level < 1:
+            raise TrufflehogApiError('Pipeline stages need at least one worker')
+        if fork_store is not None and checkpoint_dir:
+            raise TrufflehogApiError('Fork groups cannot be searched with checkpoints')
+        self._clone_workers: int = clone_concurrency_level
+        self._scan_workers: int = scan_concurrency_level
+        self._max_clones_per_host: Optional[int] = max_clones_per_host
+        self._queue_size: int = queue_size or 2 * scan_concurrency_level
+        self._result_cache: Optional[ResultCache] = result_cache
+        self._checkpoint_dir: Optional[str] = checkpoint_dir
+        self._resume: bool = resume
+        self._scratch_space: Optional[ScratchSpace] = scratch_space
+        self._metrics: PipelineMetrics = metrics or PipelineMetrics()
+        self._scheduler: Optional[BatchScheduler] = scheduler
+        self._lookahead: int = (lookahead or
+                                2 * (clone_concurrency_level + scan_concurrency_level) +
+                                self._queue_size)
+        self._max_rss_bytes: Optional[int] = max_rss_bytes
+        self._share_traversal: bool = (share_traversal and not checkpoint_dir
+                                       and fork_store is None)
+        self._adaptive_concurrency: Optional[AdaptiveConcurrency] = adaptive_concurrency
+        self._fork_store: Optional[ForkStore] = fork_store
+        self._fork_groups: Optional[Dict[str, str]] = fork_groups
+
+    @property
+    def metrics(self) -> PipelineMetrics:
+        """
+        :return: metrics of the current or last run
+        """
+        return self._metrics
+
+    @property
+    def clone_concurrency_level(self) -> int:
+        """
+        :return: number of clone workers
+        """
+        return self._clone_workers
+
+    @property
+    def scan_concurrency_level(self) -> int:
+        """
+        :return: number of scan workers
+        """
+        return self._scan_workers
+
+    @property
+    def max_clones_per_host(self) -> Optional[int]:
+        """
+        :return: maximum number of clones from the same host at a time, None for no limit
+        """
+        return self._max_clones_per_host
+
+    @property
+    def queue_size(self) -> int:
+        """
+        :return: number of clones that may wait for a scan worker
+        """
+        return self._queue_size
+
+    @property
+    def result_cache(self) -> Optional[ResultCache]:
+        """
+        :return: cache shared by the requests, if any
+        """
+        return self._result_cache
+
+    @property
+    def checkpoint_dir(self) -> Optional[str]:
+        """
+        :return: directory the requests write their checkpoints to, if any
+        """
+        return self._checkpoint_dir
+
+    @property
+    def resume(self) -> bool:
+        """
+        :return: True if requests continue from their checkpoints
+        """
+        return self._resume
+
+    @property
+    def scratch_space(self) -> Optional[ScratchSpace]:
+        """
+        :return: place remote repositories are cloned in, None until the first run if
+        the process wide default is used
+        """
+        return self._scratch_space
+
+    @property
+    def scheduler(self) -> Optional[BatchScheduler]:
+        """
+        :return: scheduler estimating the cost of requests, if any
+        """
+        return self._scheduler
+
+    @property
+    def max_rss_bytes(self) -> Optional[int]:
+        """
+        :return: soft limit on the resident set size, None for no limit
+        """
+        return self._max_rss_bytes
+
+    @property
+    def adaptive_concurrency(self) -> Optional[AdaptiveConcurrency]:
+        """
+        :return: controller of the number of searches running at the same time, if any
+        """
+        return self._adaptive_concurrency
+
+    @property
+    def fork_store(self) -> Optional[ForkStore]:
+        """
+        :return: stores remote repositories are fetched into, if requests are grouped by
+        forks
+        """
+        return self._fork_store
+
+    @property
+    def fork_groups(self) -> Optional[Dict[str, str]]:
+        """
+        :return: repository path or URL to its declared group name, if any
+        """
+        return self._fork_groups
+
+    def run(self, requests: Iterable[FindSecretsRequest]
+            ) -> Iterator[Tuple[FindSecretsRequest, "concurrent.futures.Future"]]:
+        """Searches the requests. requests is consumed lazily and only lookahead requests
+        are taken in ahead of the results, so it can be a stream of any length.
+        Closing the generator early stops the workers once their current step is done.
+
+        :param requests:
+            Iterable of FindSecretsRequest objects
+
+        :return: generator of (request, finished future) pairs in order of completion. The
+        future's result is the list of secrets, or it raises the search's TrufflehogApiError
+        """
+        for job in self._jobs(requests):
+            yield job.request, job.future
+
+    def run_all(self, requests: Iterable[FindSecretsRequest]
+                ) -> List["concurrent.futures.Future"]:
+        """Searches the requests and waits for all of them
+
+        :param requests:
+            Iterable of FindSecretsRequest objects
+
+        :return: list of finished futures in the order of the requests, see run
+        """
+        futures = dict()
+        for job in self._jobs(requests):
+            futures[job.index] = job.future
+        return [futures[index] for index in sorted(futures)]
+
+    def _jobs(self, requests: Iterable[FindSecretsRequest]) -> Iterator[PipelineJob]:
+        """Runs the requests, see run
+
+        :return: generator of the finished jobs in order of completion
+        """
+        import concurrent.futures
+        if self._scratch_space is None:
+            self._scratch_space = default_scratch_space()
+        run = _PipelineRun(self)
+        pending = dict()
+        requests = iter(requests)
+        counter = itertools.count()
+        exhausted = False
+        try:
+            while True:
+                # Estimate the whole window before handing it over so that it is
+                # ordered as a whole
+                jobs = []
+                while not exhausted and len(pending) + len(jobs) < self._lookahead:
+                    request = next(requests, None)
+                    if request is None:
+                        exhausted = True
+                        break
+                    job = PipelineJob(next(counter), request, concurrent.futures.Future(),
+                                       repository_host(request.path))
+                    if self._scheduler is not None:
+                        cost = self._scheduler.cost(request)
+                        job.cost, job.size = cost.seconds, cost.size
+                    jobs.append(job)
+                for job in jobs:
+                    pending[job.future] = job
+                run.add(group_jobs(jobs) if self._share_traversal else jobs)
+                if not pending:
+                    return
+                done, _ = concurrent.futures.wait(pending,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if not future.cancelled() and future.exception() is not None:
+                        scan_metrics().repositories.labels("failed").inc()
+                    yield pending.pop(future)
+        finally:
+            run.stop()
+
+
+def _search(repo_path: str, origin: str, repo_config: RepoConfig, search_config: SearchConfig,
+            checkpoint: Optional[ScanCheckpoint], resume: bool, walk_slice) -> List[Secret]:
+    """Scan stage work of a job"""
+    if walk_slice is not None:
+        secrets = search_git_log(repo_path, repo_config, search_config, walk_slice=walk_slice)
+    else:
+        secrets = search_repository(repo_path, origin, repo_config, search_config,
+                                    checkpoint=checkpoint, resume=resume)
+    return collect_secrets(secrets, search_config.max_findings_in_memory)
+
+
+class _PipelineRun:
+    """The worker threads and queues of one ScanPipeline run, and the steps of its
+    stages"""
+
+    def __init__(self, pipeline: ScanPipeline):
+        self._pipeline: ScanPipeline = pipeline
+        self._metrics: PipelineMetrics = pipeline.metrics
+        self._result_cache: Optional[ResultCache] = pipeline.result_cache
+        self._scratch_space: ScratchSpace = pipeline.scratch_space
+        self._scheduler: Optional[BatchScheduler] = pipeline.scheduler
+        # (-cost, index, job) of the jobs waiting for a clone worker, most expensive first
+        self._backlog: List[Tuple[float, int, PipelineJob]] = []
+        self._active_hosts: Dict[str, int] = defaultdict(int)
+        self._changed = threading.Condition()
+        self._stopped: bool = False
+        # Shards are put back by scan workers, so the queue itself is unbounded and the
+        # clone stage waits for one of queue_size slots instead
+        self._scan_queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._queue_slots = threading.Semaphore(pipeline.queue_size)
+        self._sentinels = itertools.count()
+        self._memory_guard: Optional[MemoryGuard] = None
+        if pipeline.max_rss_bytes is not None:
+            self._memory_guard = MemoryGuard(pipeline.max_rss_bytes)
+        self._metrics.start(pipeline.clone_concurrency_level, pipeline.scan_concurrency_level)
+        metrics = scan_metrics()
+        self._clones_in_flight = metrics.jobs_in_flight.labels(CLONE_STAGE)
+        self._scans_in_flight = metrics.jobs_in_flight.labels(SCAN_STAGE)
+        metrics.watch_scratch_space(self._scratch_space)
+        if self._result_cache is not None:
+            metrics.watch_result_cache(self._result_cache)
+        self._concurrency: Optional[AdaptiveConcurrency] = pipeline.adaptive_concurrency
+        if self._concurrency is not None:
+            self._concurrency.attach(self._metrics, self._scratch_space)
+        self._forks: Optional[ForkBatch] = None
+        if pipeline.fork_store is not None:
+            self._forks = ForkBatch(pipeline.fork_store, pipeline.fork_groups)
+        self._clone_threads = [self._start_thread(self._clone_worker, "clone", number)
+                               for number in range(pipeline.clone_concurrency_level)]
+        self._scan_threads = [self._start_thread(self._scan_worker, "scan", number)
+                              for number in range(pipeline.scan_concurrency_level)]
+
+    def add(self, jobs: List[PipelineJob]):
+        """Hands jobs to the clone workers, which take the most expensive first
+
+        :param list jobs:
+            PipelineJob objects of requests taken in
+        """
+        with self._changed:
+            for job in jobs:
+                bisect.insort(self._backlog, (-job.cost, job.index, job))
+            self._changed.notify_all()
+
+    def stop(self):
+        """Stops the workers, cancelling the jobs that have not been started"""
+        with self._changed:
+            self._stopped = True
+            for _, _, job in self._backlog:
+                job.future.cancel()
+            self._backlog = []
+            self._changed.notify_all()
+        for thread in self._clone_threads:
+            thread.join()
+        for _ in self._scan_threads:
+            self._scan_queue.put((float("inf"), next(self._sentinels), 0, None))
+        for thread in self._scan_threads:
+            thread.join()
+        if self._forks is not None:
+            self._forks.close()
+        self._metrics.finish()
+
+    def _start_thread(self, target, stage: str, number: int) -> threading.Thread:
+        thread = threading.Thread(target=target, name="pipeline-{0}-{1}".format(stage, number),
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def _put(self, job: PipelineJob):
+        self._scan_queue.put((-job.cost, job.index, job.shard_number, job))
+        self._metrics.queue_changed(1)
+
+    def _next_clone(self) -> Optional[PipelineJob]:
+        """Takes the first job whose host is below its clone limit, None once stopped"""
+        limit = self._pipeline.max_clones_per_host
+        with self._changed:
+            while not self._stopped:
+                for position, (_, _, job) in enumerate(self._backlog):
+                    if job.host is None or limit is None or self._active_hosts[job.host] < limit:
+                        del self._backlog[position]
+                        if job.host is not None:
+                            self._active_hosts[job.host] += 1
+                        return job
+                self._changed.wait()
+            return None
+
+    def _host_done(self, job: PipelineJob):
+        if job.host is not None:
+            with self._changed:
+                self._active_hosts[job.host] -= 1
+                self._changed.notify_all()
+
+    def _clone_worker(self):
+        while True:
+            job = self._next_clone()
+            if job is None:
+                return
+            start = time.monotonic()
+            self._clones_in_flight.inc()
+            try:
+                queued = self._clone(job)
+            except TrufflehogApiError as e:
+                job.future.set_exception(e)
+                queued = False
+            except Exception as e:  # pylint: disable=broad-except
+                job.future.set_exception(TrufflehogApiError(e))
+                queued = False
+            finally:
+                self._clones_in_flight.dec()
+                self._host_done(job)
+                job.busy += time.monotonic() - start
+                self._metrics.add_busy(CLONE_STAGE, time.monotonic() - start)
+            if queued:
+                self._queue_slots.acquire()
+                self._put(job)
+
+    def _scan_worker(self):
+        while True:
+            job = self._scan_queue.get()[-1]
+            if job is None:
+                return
+            self._metrics.queue_changed(-1)
+            if job.parent is None:
+                self._queue_slots.release()
+            guard = self._memory_guard if not self._stopped else None
+            if guard is not None:
+                waited = guard.acquire()
+                if waited:
+                    self._metrics.add_throttle(waited)
+            concurrency = self._concurrency if not self._stopped else None
+            if concurrency is not None:
+                concurrency.acquire()
+            start = time.monotonic()
+            self._scans_in_flight.inc()
+            try:
+                if self._stopped:
+                    self._cancel(job)
+                elif job.parent is None:
+                    self._scan_whole(job)
+                else:
+                    self._scan_shard(job)
+            finally:
+                self._scans_in_flight.dec()
+                self._metrics.add_busy(SCAN_STAGE, time.monotonic() - start)
+                if concurrency is not None:
+                    concurrency.release()
+                if guard is not None:
+                    guard.release()
+
+    def _scan_whole(self, job: PipelineJob):
+        start = time.monotonic()
+        try:
+            secrets = self._prepare(job)
+            if secrets is None:
+                shards = self._split(job)
+                if shards:
+                    # Idle scan workers pick the shards up, the last one finishes the job
+                    self._metrics.count(shards=len(shards))
+                    job.busy += time.monotonic() - start
+                    for shard in shards:
+                        self._put(shard)
+                    return
+                secrets = self._scan(job)
+                job.busy += time.monotonic() - start
+            else:
+                self._release(job)
+                job.future.set_result(secrets)
+                return
+        except Exception as e:  # pylint: disable=broad-except
+            self._release(job)
+            job.future.set_exception(e if isinstance(e, TrufflehogApiError)
+                                     else TrufflehogApiError(e))
+            return
+        self._finish(job, secrets)
+
+    def _scan_shard(self, shard: PipelineJob):
+        parent = shard.parent
+        start = time.monotonic()
+        secrets = None
+        error = None
+        if not parent.future.done():
+            try:
+                secrets = self._scan(shard)
+            except TrufflehogApiError as e:
+                error = e
+            except Exception as e:  # pylint: disable=broad-except
+                error = TrufflehogApiError(e)
+        if not shard_done(shard, secrets, error, time.monotonic() - start):
+            return
+        if parent.future.done():
+            self._release(parent)
+        else:
+            self._finish(parent, shard_secrets(parent))
+
+    def _cancel(self, job: PipelineJob):
+        """Drops a job, or a shard of one, taken from the queue after stop"""
+        parent = job.parent or job
+        last = shard_done(job) if job.parent is not None else True
+        parent.future.cancel()
+        if last:
+            self._release(parent)
+
+    def _from_cache(self, job: PipelineJob) -> bool:
+        """Completes the job with its secrets stored in the ResultCache, if any
+
+        :return: True if the job was finished
+        """
+        job.cache_key = result_cache_key(job.request)
+        if job.cache_key is None:
+            return False
+        cached = self._result_cache.get(job.cache_key)
+        if cached is None:
+            return False
+        self._metrics.count(cache_hits=1)
+        scan_metrics().repositories.labels("cached").inc()
+        job.future.set_result(cached)
+        return True
+
+    def _clone(self, job: PipelineJob) -> bool:
+        """Clone stage of a job
+
+        :return: False if the job was finished from the ResultCache
+        """
+        request = job.request
+        repo_config = request.repo_config or RepoConfig()
+        if job.host is not None and self._result_cache is not None:
+            if job.members:
+                job.members = [member for member in job.members
+                               if not self._from_cache(member)]
+                if not job.members:
+                    job.future.set_result([])
+                    return False
+            elif self._from_cache(job):
+                return False
+        if job.host is not None:
+            start = time.monotonic()
+            if self._forked(job):
+                job.fork_group, job.repo_path = self._forks.fetch(request)
+            else:
+                job.repo, job.repo_path = clone_repository(request.path, repo_config,
+                                                           self._scratch_space, job.size)
+            scan_metrics().clone_seconds.observe(time.monotonic() - start)
+            self._metrics.count(clones=1)
+        return True
+
+    def _prepare(self, job: PipelineJob) -> Optional[List[Secret]]:
+        """First step of the scan stage of a local repository
+
+        :return: the secrets stored in the ResultCache, None if they have to be searched
+        """
+        request = job.request
+        if job.host is not None:
+            return None
+        for member in job.members or [job]:
+            repo_config = member.request.repo_config or RepoConfig()
+            token_key = repo_config.access_token_env_key
+            if token_key and token_key in os.environ:
+                warnings.warn("Warning: local repository path provided with an access token - "
+                              "Token will be ignored")
+        if self._result_cache is None:
+            return None
+        if job.members:
+            job.members = [member for member in job.members if not self._from_cache(member)]
+            return None if job.members else []
+        job.cache_key = result_cache_key(request)
+        if job.cache_key is None:
+            return None
+        cached = self._result_cache.get(job.cache_key)
+        if cached is not None:
+            self._metrics.count(cache_hits=1)
+            scan_metrics().repositories.labels("cached").inc()
+        return cached
+
+    def _split(self, job: PipelineJob) -> List[PipelineJob]:
+        """Splits the walk of a repository with more commits than the scheduler's
+        shard_commits into shards
+
+        :return: the shards, empty if the repository is searched as a whole
+        """
+        if not self._shardable(job):
+            return []
+        return split_job(job, self._scheduler.shard_commits)
+
+    def _shardable(self, job: PipelineJob) -> bool:
+        """:return: True if the walk of the job may be split into shards"""
+        scheduler = self._scheduler
+        sharding = scheduler is not None and scheduler.shard_commits is not None
+        # Checkpoints, shared walks and fork groups follow the walk of a request as a
+        # whole
+        searched_alone = not job.members and not self._forked(job)
+        checkpointed = bool(self._pipeline.checkpoint_dir)
+        search_config = job.request.search_config or SearchConfig()
+        git_log_backend = search_config.scan_backend == GIT_LOG_BACKEND
+        return sharding and searched_alone and git_log_backend and not checkpointed
+
+    def _scan(self, job: PipelineJob) -> List[Secret]:
+        """Searches a whole repository or the slice of its walk of a shard
+
+        :return: list of secret objects found, or the list of every member's secrets for
+        a shared walk
+        """
+        start = time.monotonic()
+        try:
+            return self._search_job(job)
+        finally:
+            scan_metrics().scan_seconds.observe(time.monotonic() - start)
+
+    def _search_job(self, job: PipelineJob) -> List[Secret]:
+        """Runs _scan's search"""
+        request = job.request
+        if job.members:
+            return search_shared(job.repo_path,
+                                 [member.request.repo_config or RepoConfig()
+                                  for member in job.members],
+                                 [member.request.search_config or SearchConfig()
+                                  for member in job.members])
+        if self._forked(job):
+            return self._forks.search_member(request, job.repo_path, job.fork_group)
+        checkpoint = None
+        checkpoint_dir = self._pipeline.checkpoint_dir
+        if checkpoint_dir and job.walk_slice is None:
+            checkpoint = ScanCheckpoint(checkpoint_path(checkpoint_dir, request))
+        origin = os.path.abspath(request.path) if job.host is None else request.path
+        return _search(job.repo_path, origin, request.repo_config or RepoConfig(),
+                       request.search_config or SearchConfig(), checkpoint,
+                       self._pipeline.resume, job.walk_slice)
+
+    def _finish(self, job: PipelineJob, secrets: List[Secret]):
+        """Stores the secrets of a searched repository and completes its future"""
+        self._release(job)
+        self._metrics.count(scans=1)
+        scan_metrics().repositories.labels("succeeded").inc(len(job.members) or 1)
+        if len(job.members) > 1:
+            self._metrics.count(shared=len(job.members))
+        for member, member_secrets in (zip(job.members, secrets) if job.members
+                                       else [(job, secrets)]):
+            if member.cache_key is not None:
+                self._result_cache.put(member.cache_key, member_secrets)
+            if self._scheduler is not None:
+                self._scheduler.record(member.request, job.busy)
+        job.future.set_result(secrets)
+
+    def _forked(self, job: PipelineJob) -> bool:
+        """:return: True if the job is searched as a member of a fork group"""
+        return self._forks is not None and groupable(job.request)
+
+    def _release(self, job: PipelineJob):
+        if job.repo is not None:
+            release_clone(job.repo, job.repo_path, self._scratch_space)
+            job.repo = None
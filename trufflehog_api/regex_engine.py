@@ -0,0 +1,212 @@
+"""
+Regex engines that SearchConfig.regexes and the search path filters can be
+compiled with: Python's re module, the third party regex module and RE2.
+The regex and RE2 engines are optional dependencies, patterns fall back to
+re when the selected engine is not installed or cannot compile them.
+"""
+import importlib
+import re
+import warnings
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from trufflehog_api.error import TrufflehogApiError
+
+RE_BACKEND = "re"
+REGEX_BACKEND = "regex"
+RE2_BACKEND = "re2"
+
+# Inline flags RE2 understands, keyed by the matching re flag
+_RE2_INLINE_FLAGS = ((re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"))
+
+# Patterns compiled so far, keyed by (backend, pattern, flags), so that tables such as
+# the default regexes are compiled once per process however many Scanners use them.
+# Like re's own cache it is simply emptied when full.
+_COMPILE_CACHE_SIZE = 1024
+_compile_cache: Dict[Tuple[str, Any, int], "CompiledRegex"] = dict()
+
+
+class RegexEngine:
+    """A regex implementation whose compiled patterns provide ``search`` and ``match``
+    with the same semantics as compiled re patterns.
+    """
+
+    #: name used to select the engine in SearchConfig(regex_backend=...)
+    name: str = RE_BACKEND
+    #: module implementing the engine
+    module_name: str = "re"
+    #: True if matching is guaranteed to run in linear time
+    linear_time: bool = False
+    #: True if compiled patterns accept a ``timeout`` keyword argument
+    supports_timeout: bool = False
+
+    def __init__(self):
+        self._module = None
+
+    def available(self) -> bool:
+        """
+        :return: True if the module implementing the engine can be imported
+        """
+        try:
+            self._load()
+        except ImportError:
+            return False
+        return True
+
+    def compile(self, pattern: str, flags: int = 0) -> Any:
+        """Compiles a pattern with the engine
+
+        :param str pattern:
+            Regular expression in Python re syntax
+
+        :param int flags:
+            re module flags
+
+        :raises Exception:
+            whatever the engine raises for a pattern it does not support
+
+        :return: the engine's compiled pattern
+        """
+        return self._load().compile(pattern, flags)
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self.module_name)
+        return self._module
+
+
+class RegexModuleEngine(RegexEngine):
+    """The ``regex`` module, a drop in re replacement supporting match timeouts"""
+    name = REGEX_BACKEND
+    module_name = "regex"
+    supports_timeout = True
+
+
+class Re2Engine(RegexEngine):
+    """Google's RE2 through the ``google-re2`` bindings, linear time but without
+    backreferences and lookarounds
+    """
+    name = RE2_BACKEND
+    module_name = "re2"
+    linear_time = True
+
+    def compile(self, pattern: str, flags: int = 0) -> Any:
+        inline = "".join(letter for flag, letter in _RE2_INLINE_FLAGS if flags & flag)
+        if inline:
+            pattern = "(?{0}){1}".format(inline, pattern)
+        return self._load().compile(pattern)
+
+
+ENGINES: Dict[str, RegexEngine] = {engine.name: engine for engine in
+                                   (RegexEngine(), RegexModuleEngine(), Re2Engine())}
+
+
+class CompiledRegex(NamedTuple):
+    """A compiled pattern together with the engine that compiled it"""
+    pattern: Any
+    engine: RegexEngine
+
+
+def get_engine(backend: str) -> RegexEngine:
+    """
+    :param str backend:
+        Name of the engine, one of "re", "regex" or "re2"
+
+    :raises TrufflehogApiError:
+        if the name is unknown
+
+    :return: the engine registered under backend
+    """
+    engine = ENGINES.get(backend or RE_BACKEND)
+    if engine is None:
+        raise TrufflehogApiError('Unknown regex backend: {0}'.format(backend))
+    return engine
+
+
+def compile_regex(regex, backend: str = RE_BACKEND, description: str = None) -> CompiledRegex:
+    """Compiles a pattern given as a string or a compiled re pattern with the selected
+    engine, falling back to re with a warning if the engine is not installed or cannot
+    compile the pattern
+
+    :param regex:
+        Pattern string or compiled re pattern
+
+    :param str backend:
+        Name of the engine to use (default is "re")
+
+    :param str description:
+        Name of the pattern used in warnings and errors (default is the pattern itself)
+
+    :raises TrufflehogApiError:
+        if re cannot compile the pattern either
+
+    :return: the compiled pattern and the engine that compiled it
+    """
+    if isinstance(regex, str):
+        pattern, flags = regex, 0
+    else:
+        pattern, flags = regex.pattern, regex.flags & ~re.UNICODE
+    description = description or pattern
+    engine = get_engine(backend)
+    cache_key = (engine.name, pattern, flags)
+    cached = _compile_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if engine.name != RE_BACKEND:
+        if not engine.available():
+            warnings.warn('Warning: regex backend "{0}" is not installed, falling back to re'
+                          .format(engine.name))
+        else:
+            try:
+                return _cache(cache_key, CompiledRegex(engine.compile(pattern, flags), engine))
+            except Exception as e:
+                warnings.warn('Warning: regex backend "{0}" cannot compile "{1}" ({2}), '
+                              'falling back to re'.format(engine.name, description, e))
+
+    if not isinstance(regex, str):
+        compiled = CompiledRegex(regex, ENGINES[RE_BACKEND])
+    else:
+        try:
+            compiled = CompiledRegex(re.compile(pattern, flags), ENGINES[RE_BACKEND])
+        except re.error as e:
+            raise TrufflehogApiError('Invalid regex "{0}": {1}'.format(description, e))
+    # Fallbacks are not cached so that every use of them is warned about
+    if engine.name == RE_BACKEND:
+        _cache(cache_key, compiled)
+    return compiled
+
+
+def compile_bytes_regex(compiled: CompiledRegex) -> Optional[CompiledRegex]:
+    """Compiles a pattern compiled by compile_regex again, with the same engine, for
+    matching bytes. Non ASCII characters of the pattern match their UTF-8 encoding.
+
+    :param CompiledRegex compiled:
+        Pattern compiled for matching strings
+
+    :return: the pattern compiled for bytes, None if it cannot match bytes (e.g. it
+    uses \\u escapes or the engine does not support bytes patterns)
+    """
+    pattern = compiled.pattern.pattern
+    if isinstance(pattern, bytes):
+        return compiled
+    engine = compiled.engine
+    flags = getattr(compiled.pattern, "flags", 0) & ~re.UNICODE
+    if engine.name == RE2_BACKEND:
+        # The inline flags are already part of the pattern
+        flags = 0
+    encoded = pattern.encode("utf-8")
+    cache_key = (engine.name, encoded, flags)
+    cached = _compile_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    try:
+        return _cache(cache_key, CompiledRegex(engine.compile(encoded, flags), engine))
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
+def _cache(cache_key: Tuple[str, Any, int], compiled: CompiledRegex) -> CompiledRegex:
+    if len(_compile_cache) >= _COMPILE_CACHE_SIZE:
+        _compile_cache.clear()
+    _compile_cache[cache_key] = compiled
+    return compiled
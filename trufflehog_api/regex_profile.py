@@ -0,0 +1,256 @@
+"""
+Validates and profiles the custom regexes of a SearchConfig and keeps track
+of the time each of them costs during a scan, so that expensive or
+catastrophically backtracking patterns can be found and rewritten.
+"""
+import time
+from typing import Any, Dict, List
+
+from trufflehog_api.regex_engine import RE_BACKEND, CompiledRegex, compile_regex
+
+# Inputs that commonly trigger catastrophic backtracking. Each one is followed by a
+# character that is unlikely to let the pattern match, forcing a full search.
+_PROBE_ALPHABETS = ("a", "A", "0", " ", "aA0+/=-_", "\t ")
+# Small steps first so exponential patterns are caught long before they hang
+_PROBE_LENGTHS = tuple(range(4, 34, 2)) + (64, 128, 256, 512, 1024, 2048, 4096)
+
+
+class PatternStats:
+    """Cumulative cost of a single regex over a scan
+    """
+
+    def __init__(self, description: str):
+        """Creates empty statistics
+
+        :param str description:
+            Description (key in SearchConfig.regexes) of the regex
+        """
+        self._description: str = description
+        self._calls: int = 0
+        self._hits: int = 0
+        self._seconds: float = 0.0
+        self._max_seconds: float = 0.0
+        self._budget_exceeded: int = 0
+        self._disabled: bool = False
+
+    @property
+    def description(self) -> str:
+        """
+        :return: description of the regex
+        """
+        return self._description
+
+    @property
+    def calls(self) -> int:
+        """
+        :return: number of hunks the regex was evaluated on
+        """
+        return self._calls
+
+    @property
+    def hits(self) -> int:
+        """
+        :return: number of hunks the regex matched
+        """
+        return self._hits
+
+    @property
+    def seconds(self) -> float:
+        """
+        :return: total time spent evaluating the regex
+        """
+        return self._seconds
+
+    @property
+    def max_seconds(self) -> float:
+        """
+        :return: longest time spent evaluating the regex on a single hunk
+        """
+        return self._max_seconds
+
+    @property
+    def budget_exceeded(self) -> int:
+        """
+        :return: number of hunks on which the regex ran out of its time budget
+        """
+        return self._budget_exceeded
+
+    @property
+    def disabled(self) -> bool:
+        """
+        :return: True if the regex was rejected when profiled and never ran
+        """
+        return self._disabled
+
+    def record(self, seconds: float, hit: bool, budget_exceeded: bool = False):
+        """Adds the cost of evaluating the regex on one hunk"""
+        self._calls += 1
+        self._seconds += seconds
+        self._max_seconds = max(self._max_seconds, seconds)
+        if hit:
+            self._hits += 1
+        if budget_exceeded:
+            self._budget_exceeded += 1
+
+    def disable(self):
+        """Marks the regex as rejected by profiling"""
+        self._disabled = True
+
+    def merge(self, other):
+        """Adds the statistics of other, e.g. from another request of a batch"""
+        self._calls += other.calls
+        self._hits += other.hits
+        self._seconds += other.seconds
+        self._max_seconds = max(self._max_seconds, other.max_seconds)
+        self._budget_exceeded += other.budget_exceeded
+        self._disabled = self._disabled or other.disabled
+
+    def to_dict(self):
+        """
+        :return: A dict with the PatternStats object's attributes
+        """
+        stats_dict = dict()
+        stats_dict["description"] = self._description
+        stats_dict["calls"] = self._calls
+        stats_dict["hits"] = self._hits
+        stats_dict["seconds"] = self._seconds
+        stats_dict["max_seconds"] = self._max_seconds
+        stats_dict["budget_exceeded"] = self._budget_exceeded
+        stats_dict["disabled"] = self._disabled
+        return stats_dict
+
+    def __repr__(self):
+        return ("PatternStats(description={0}, calls={1}, hits={2}, seconds={3:.6f}, "
+                "max_seconds={4:.6f}, budget_exceeded={5}, disabled={6})"
+                .format(self._description, self._calls, self._hits, self._seconds,
+                        self._max_seconds, self._budget_exceeded, self._disabled))
+
+
+class RegexProfile:
+    """Report of the cost of every regex of a scan, keyed by regex description.
+    Pass an instance to find_secrets to have it filled in.
+    """
+
+    def __init__(self):
+        """Creates an empty report"""
+        self._stats: Dict[str, PatternStats] = dict()
+
+    def stats(self, description: str) -> PatternStats:
+        """
+        :param str description:
+            Description of the regex
+
+        :return: the statistics of the regex, created on first use
+        """
+        stats = self._stats.get(description)
+        if stats is None:
+            stats = self._stats[description] = PatternStats(description)
+        return stats
+
+    def merge(self, other):
+        """Adds every regex statistic of other into this report"""
+        for description, stats in other.to_stats().items():
+            self.stats(description).merge(stats)
+
+    def to_stats(self) -> Dict[str, PatternStats]:
+        """
+        :return: a copy of the mapping of regex description to PatternStats
+        """
+        return dict(self._stats)
+
+    def most_expensive(self, count: int = None) -> List[PatternStats]:
+        """
+        :param int count:
+            Number of regexes to return (default is None, all of them)
+
+        :return: regex statistics ordered by total time spent, most expensive first
+        """
+        ordered = sorted(self._stats.values(), key=lambda stats: stats.seconds, reverse=True)
+        return ordered[:count] if count is not None else ordered
+
+    def to_dict(self):
+        """
+        :return: A dict mapping regex description to its statistics as a dict
+        """
+        return {description: stats.to_dict() for description, stats in self._stats.items()}
+
+    def __str__(self):
+        """
+        :return: A table of the regexes ordered by total time spent
+        """
+        lines = ["{0:>10} {1:>10} {2:>8} {3:>8} {4:>8}  {5}".format(
+            "seconds", "max", "calls", "hits", "budget", "description")]
+        for stats in self.most_expensive():
+            lines.append("{0:10.4f} {1:10.4f} {2:8d} {3:8d} {4:8d}  {5}{6}".format(
+                stats.seconds, stats.max_seconds, stats.calls, stats.hits,
+                stats.budget_exceeded, stats.description,
+                " (disabled)" if stats.disabled else ""))
+        return "\n".join(lines)
+
+
+def validate_regexes(regexes: Dict, backend: str = RE_BACKEND) -> Dict[str, CompiledRegex]:
+    """Compiles a regex dictionary whose values are strings or compiled patterns
+
+    :param dict regexes:
+        Mapping of regex description to regex, may be None
+
+    :param str backend:
+        Name of the regex engine to compile with, see regex_engine.compile_regex
+        (default is "re")
+
+    :raises TrufflehogApiError:
+        naming the first regex that does not compile
+
+    :return: mapping of regex description to compiled regex
+    """
+    return {description: compile_regex(regex, backend, description)
+            for description, regex in (regexes or {}).items()}
+
+
+def probe_cost(pattern: Any, budget: float) -> float:
+    """Searches inputs of increasing length known to trigger catastrophic backtracking
+    and reports the slowest single search. Stops as soon as a search exceeds budget,
+    which keeps the probing of exponential patterns short.
+
+    :param pattern:
+        Compiled pattern to probe
+
+    :param float budget:
+        Time in seconds a single search may take
+
+    :return: the slowest search time observed in seconds
+    """
+    worst = 0.0
+    for alphabet in _PROBE_ALPHABETS:
+        for length in _PROBE_LENGTHS:
+            probe = (alphabet * (length // len(alphabet) + 1))[:length] + "\x00!"
+            start = time.perf_counter()
+            pattern.search(probe)
+            elapsed = time.perf_counter() - start
+            worst = max(worst, elapsed)
+            if elapsed > budget:
+                return worst
+    return worst
+
+
+def find_unsafe_regexes(regexes: Dict[str, CompiledRegex], budget: float) -> Dict[str, float]:
+    """Profiles compiled regexes with probe_cost. Regexes compiled by a linear time
+    engine cannot backtrack catastrophically and are not probed.
+
+    :param dict regexes:
+        Mapping of regex description to compiled regex
+
+    :param float budget:
+        Time in seconds a single search may take
+
+    :return: mapping of the description of every regex exceeding budget to its
+    probed cost in seconds
+    """
+    unsafe = dict()
+    for description, compiled in regexes.items():
+        if compiled.engine.linear_time:
+            continue
+        cost = probe_cost(compiled.pattern, budget)
+        if cost > budget:
+            unsafe[description] = cost
+    return unsafe
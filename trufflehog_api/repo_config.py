@@ -2,7 +2,31 @@
 Contains the RepoConfig class that specifies attributes for a repository
 when searching for secrets.
 """
+import hashlib
 import json
+import re
+from datetime import datetime
+from typing import List, Tuple, Union
+
+# History traversal options and their defaults. They are only listed by to_dict and
+# __str__ when they differ from these, so fingerprints of configs not using them stay
+# the same.
+_TRAVERSAL_DEFAULTS = (("first_parent", False),
+                       ("skip_merges", False),
+                       ("merges_against_first_parent", False),
+                       ("detect_renames", None),
+                       ("detect_copies", False),
+                       ("since", None),
+                       ("until", None),
+                       ("author", None),
+                       ("committer", None),
+                       ("paths", None))
+
+# Dates that do not depend on when the search runs: a unix timestamp or a date with a
+# time, as written by datetime.isoformat. git completes a date without a time with the
+# current time of day.
+_ABSOLUTE_DATE = re.compile(r"^(@\d+|\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?"
+                            r" ?(Z|[+-]\d{2}:?\d{2})?)$")
 
 class RepoConfig:
     """Class to encapsulate details of a Git repository to search secrets in.
@@ -11,7 +35,17 @@ class RepoConfig:
     def __init__(self, *,
                  branch: str = None,
                  since_commit: str = None,
-                 access_token_env_key: str = None):
+                 access_token_env_key: str = None,
+                 first_parent: bool = False,
+                 skip_merges: bool = False,
+                 merges_against_first_parent: bool = False,
+                 detect_renames: bool = None,
+                 detect_copies: bool = False,
+                 since: Union[str, datetime] = None,
+                 until: Union[str, datetime] = None,
+                 author: str = None,
+                 committer: str = None,
+                 paths: List[str] = None):
         """Creates a new RepoConfig object
 
         :param str branch:
@@ -26,10 +60,76 @@ class RepoConfig:
             Optional access token key to be extracted from the env vars for remote,
             private repo access
             (default is None, no access key needed to access repo)
+
+        :param bool first_parent:
+            Only follow the first parent of merge commits, i.e. walk the history of the
+            branch itself and not the commits of the branches merged into it. As with
+            ``git log --first-parent``, merge commits are then searched against their first
+            parent, so every merged branch is searched once, as a single change
+            (default is False, every commit is walked)
+
+        :param bool skip_merges:
+            Leave merge commits out of the walk, they do not count towards max_depth
+            (default is False)
+
+        :param bool merges_against_first_parent:
+            Search the changes of merge commits against their first parent. Without it
+            (or first_parent) merge commits have no diff, as in ``git log -p``, and their
+            changes are searched in the commits that made them. Requires git 2.31 or later
+            (default is False)
+
+        :param bool detect_renames:
+            Detect renamed files, so that moving a file does not search its contents
+            again. Detection is expensive on large refactors
+            (default is None, git's diff.renames setting, which is on unless configured)
+
+        :param bool detect_copies:
+            Also detect copied files, even more expensive than rename detection
+            (default is False)
+
+        :param since:
+            Only search commits committed after this date, a datetime or any date git
+            understands, e.g. "2024-01-31 00:00" or "90 days ago". Relative dates, including
+            dates without a time, are resolved when the search runs, so their results are
+            not cached and they do not write checkpoints, see has_relative_dates
+            (default is None, no lower bound)
+
+        :param until:
+            Only search commits committed before this date, see since
+            (default is None, no upper bound)
+
+        :param str author:
+            Only search commits whose author name or email matches this regular
+            expression, as ``git log --author``
+            (default is None, every author)
+
+        :param str committer:
+            Only search commits whose committer name or email matches this regular
+            expression, as ``git log --committer``
+            (default is None, every committer)
+
+        :param list paths:
+            Only search the changes of commits to these git pathspecs, e.g. ["src/",
+            "*.env"]. Commits not touching them are not diffed at all, unlike with the
+            include_search_paths of SearchConfig
+            (default is None, every path)
+
+        Traversal options are only used by the "git_log" scan backend, the filters are
+        applied by git while it walks the history, so excluded commits are never diffed
         """
         self._branch: str = branch
         self._since_commit: str = since_commit
         self._access_token_env_key: str = access_token_env_key
+        self._first_parent: bool = first_parent
+        self._skip_merges: bool = skip_merges
+        self._merges_against_first_parent: bool = merges_against_first_parent
+        self._detect_renames: bool = detect_renames
+        self._detect_copies: bool = detect_copies
+        self._since: str = since.isoformat() if isinstance(since, datetime) else since
+        self._until: str = until.isoformat() if isinstance(until, datetime) else until
+        self._author: str = author
+        self._committer: str = committer
+        self._paths: Tuple[str, ...] = tuple(paths) if paths else None
 
     @classmethod
     def from_repo_config(cls, repo_config,
@@ -71,7 +171,8 @@ class RepoConfig:
 
         return cls(branch=branch_to_set,
                    since_commit=since_commit_to_set,
-                   access_token_env_key=access_token_env_key_to_set)
+                   access_token_env_key=access_token_env_key_to_set,
+                   **repo_config.traversal_options())
 
     @property
     def branch(self) -> str:
@@ -94,6 +195,86 @@ class RepoConfig:
         """
         return self._access_token_env_key
 
+    @property
+    def first_parent(self) -> bool:
+        """
+        :return: True if only the first parent of merge commits is followed
+        """
+        return self._first_parent
+
+    @property
+    def skip_merges(self) -> bool:
+        """
+        :return: True if merge commits are left out of the walk
+        """
+        return self._skip_merges
+
+    @property
+    def merges_against_first_parent(self) -> bool:
+        """
+        :return: True if the changes of merge commits against their first parent are searched
+        """
+        return self._merges_against_first_parent
+
+    @property
+    def detect_renames(self) -> bool:
+        """
+        :return: True or False to turn rename detection on or off, None for git's default
+        """
+        return self._detect_renames
+
+    @property
+    def detect_copies(self) -> bool:
+        """
+        :return: True if copied files are detected
+        """
+        return self._detect_copies
+
+    @property
+    def since(self) -> str:
+        """
+        :return: Date after which commits are searched, datetimes given as ISO 8601 strings
+        """
+        return self._since
+
+    @property
+    def until(self) -> str:
+        """
+        :return: Date before which commits are searched, datetimes given as ISO 8601 strings
+        """
+        return self._until
+
+    @property
+    def author(self) -> str:
+        """
+        :return: Regular expression the author of searched commits matches
+        """
+        return self._author
+
+    @property
+    def committer(self) -> str:
+        """
+        :return: Regular expression the committer of searched commits matches
+        """
+        return self._committer
+
+    @property
+    def paths(self) -> Tuple[str, ...]:
+        """
+        :return: Git pathspecs the search is restricted to
+        """
+        return self._paths
+
+    @property
+    def has_relative_dates(self) -> bool:
+        """
+        :return: True if since or until depend on when the search runs, e.g. "90 days ago"
+        or a date without a time. The fingerprint of the config then stands for a
+        different search every time
+        """
+        return any(date is not None and not _ABSOLUTE_DATE.match(date.strip())
+                   for date in (self._since, self._until))
+
     @staticmethod
     def from_dict(config_dict: dict()):
 
@@ -104,7 +285,17 @@ class RepoConfig:
         {\t
             "branch": string, \t
             "since_commit": string, \t
-            "access_token_env": string \t
+            "access_token_env": string, \t
+            "first_parent": bool, \t
+            "skip_merges": bool, \t
+            "merges_against_first_parent": bool, \t
+            "detect_renames": bool, \t
+            "detect_copies": bool, \t
+            "since": string, \t
+            "until": string, \t
+            "author": string, \t
+            "committer": string, \t
+            "paths": [string] \t
         }\t
 
         :param str input_config:
@@ -123,8 +314,11 @@ class RepoConfig:
         if  "access_token_env_key" in config_dict:
             access_token_env_key = config_dict["access_token_env_key"]
 
+        traversal_options = {option: config_dict[option]
+                             for option, _ in _TRAVERSAL_DEFAULTS if option in config_dict}
+
         return RepoConfig(branch=branch, since_commit=since_commit,
-                          access_token_env_key=access_token_env_key)
+                          access_token_env_key=access_token_env_key, **traversal_options)
 
     def __str__(self):
         """
@@ -133,6 +327,7 @@ class RepoConfig:
         config_dict = dict()
         config_dict["branch"] = self._branch
         config_dict["since_commit"] = self._since_commit
+        config_dict.update(self.traversal_options(changed_only=True))
         return json.dumps(config_dict, indent=2)
 
     def to_dict(self):
@@ -142,12 +337,34 @@ class RepoConfig:
         config_dict = dict()
         config_dict["branch"] = self._branch
         config_dict["since_commit"] = self._since_commit
+        config_dict.update(self.traversal_options(changed_only=True))
         return config_dict
 
+    def fingerprint(self):
+        """
+        :return: A sha256 hex digest of the RepoConfig object's attributes that affect
+        search results (the access token key is left out)
+        """
+        config_string = json.dumps(self.to_dict(), sort_keys=True)
+        return hashlib.sha256(config_string.encode('utf-8')).hexdigest()
+
     def __repr__(self):
         """
         :return: A string listing out the RepoConfig object's attributes
         attributes
         """
-        return ('RepoConfig(branch={0}, since_commit={1}, access_token_env_key={2})'
-                .format(str(self.branch), str(self.since_commit), str(self.access_token_env_key)))
+        options = "".join(", {0}={1}".format(option, value) for option, value
+                          in self.traversal_options(changed_only=True).items())
+        return ('RepoConfig(branch={0}, since_commit={1}, access_token_env_key={2}{3})'
+                .format(str(self.branch), str(self.since_commit), str(self.access_token_env_key),
+                        options))
+
+    def traversal_options(self, changed_only: bool = False) -> dict:
+        """
+        :param bool changed_only:
+            If True, only list the options differing from their default (default is False)
+
+        :return: the history traversal options by name, as keyword arguments of RepoConfig
+        """
+        return {option: getattr(self, "_" + option) for option, default in _TRAVERSAL_DEFAULTS
+                if not changed_only or getattr(self, "_" + option) != default}
@@ -0,0 +1,574 @@
+"""
+The request type and the steps shared by every way of executing requests:
+telling local repositories from remote ones, cloning remote repositories into
+a ScratchSpace and releasing the clones, the ResultCache and checkpoint keys of
+a request and the search of a local repository with the selected scan backend.
+find_secrets, the batch pipeline, the scan service, triage and fork groups are
+built on these, so none of them has to import another to reuse them.
+"""
+
+import json
+import os
+import shutil
+import warnings
+from typing import Iterator, List, Optional, Tuple
+
+# GitPython and truffleHog are imported where they are used, so that importing the
+# package stays cheap for short lived processes
+from trufflehog_api import git_log
+from trufflehog_api.baseline import Baseline
+from trufflehog_api.checkpoint import ScanCheckpoint, checkpoint_key
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.regex_profile import RegexProfile, validate_regexes
+from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.result_cache import ResultCache
+from trufflehog_api.scanner import Scanner, compile_patterns
+from trufflehog_api.scratch import ScratchSpace, default_scratch_space
+from trufflehog_api.search_config import (DEFAULT_BASE64_ENTROPY_THRESHOLD,
+                                          DEFAULT_ENTROPY_MIN_LENGTH,
+                                          DEFAULT_HEX_ENTROPY_THRESHOLD, GIT_LOG_BACKEND,
+                                          TRUFFLEHOG_BACKEND, SearchConfig)
+from trufflehog_api.secret import Secret
+
+
+class FindSecretsRequest:
+    """
+    Represents a request to search for secrets in a specific repository
+    with RepoConfig and SearchConfig
+    """
+
+    def __init__(self,
+                 path: str,
+                 repo_config: RepoConfig = None,
+                 search_config: SearchConfig = None):
+        """Creates a new FindSecretsRequest object
+
+        :param str path:
+        Path to the git repository
+
+        :param repo_config:
+        Configuration object to specify repository specific attributes for the search
+        Default is None which gives the default RepoConfig object
+
+        :param search_config:
+        Configuration object to specify other attributes for the search that can be
+        generalized to many searches
+        Default is None which gives the default SearchConfig object
+        """
+        self._path = path
+        self._repo_config = repo_config
+        self._search_config = search_config
+
+    @property
+    def path(self) -> str:
+        """
+        :return: request's path to git repository
+        """
+        return self._path
+
+    @property
+    def repo_config(self) -> RepoConfig:
+        """
+        :return: request's repository specific attributes for the search
+        """
+        return self._repo_config
+
+    @property
+    def search_config(self) -> SearchConfig:
+        """
+        :return: request's other attributes for the search
+        """
+        return self._search_config
+
+    def __str__(self):
+        """
+        :return: Returns a json string containing all the attributes of the FindSecretsRequest
+        """
+        n_config = dict()
+        s_config = self._search_config
+        n_config["max_depth"] = s_config.max_depth
+        n_config["entropy_checks_enabled"] = s_config.entropy_checks_enabled
+        n_config["include_search_paths"] = s_config.include_search_paths
+        n_config["exclude_search_paths"] = s_config.exclude_search_paths
+
+        request = dict()
+        request["path"] = self._path
+        request["repo_config"] = self._repo_config.to_dict()
+        request["search_config"] = n_config
+        request_string = json.dumps(request, indent=2)
+        return request_string
+
+    @staticmethod
+    def from_dict(request_dict: dict):
+        """
+        Takes a dictionary describing a request and generates a FindSecretsRequest object
+
+        Dict Format \t
+        {\t
+            "path": string, \t
+            "repo_config": dict, see RepoConfig.from_dict \t
+            "search_config": dict, see SearchConfig.from_dict \t
+        }\t
+
+        :raises TrufflehogApiError:
+            if the path is missing
+
+        :return: Returns a FindSecretsRequest from the dict
+        """
+        if not request_dict.get("path"):
+            raise TrufflehogApiError('A request needs a "path"')
+        repo_config = None
+        search_config = None
+        if request_dict.get("repo_config") is not None:
+            repo_config = RepoConfig.from_dict(request_dict["repo_config"])
+        if request_dict.get("search_config") is not None:
+            search_config = SearchConfig.from_dict(request_dict["search_config"])
+        return FindSecretsRequest(request_dict["path"], repo_config=repo_config,
+                                  search_config=search_config)
+
+    def __repr__(self):
+        """
+        :return: Returns a string containing all the attributes of the FindSecretsRequest
+        """
+        repr_repo = repr(self._repo_config)
+        repr_search = repr(self._search_config)
+        return ("FindSecretsRequest(path={path}, "
+                "repo_config={repo_config}, "
+                "search_config={search_config})").format(path=self._path,
+                                                         repo_config=repr_repo,
+                                                         search_config=repr_search)
+
+
+def is_local_repository(path: str) -> bool:
+    """
+    :param str path:
+        Path or URL of a git repository
+
+    :return: True if path is a local working copy or bare repository
+    """
+    return git_log.is_git_dir(os.path.join(path, ".git")) or git_log.is_git_dir(path)
+
+
+def authenticated_url(path: str, repo_config: RepoConfig) -> str:
+    """
+    :param str path:
+        URL of a remote repository
+
+    :param RepoConfig repo_config:
+        Repository options, the access token is read from the environment variable
+        named by its access_token_env_key
+
+    :return: the URL to clone or list the repository with, including the access token
+    if the variable is set
+    """
+    token_key = repo_config.access_token_env_key
+    if token_key and token_key in os.environ:
+        return _append_env_access_token_to_path(path, token_key)
+    return path
+
+
+def clone_repository(path: str, repo_config: RepoConfig, scratch_space: ScratchSpace,
+                     expected_bytes: int = None):
+    """Clones a remote repository into the scratch space
+
+    :param str path:
+        URL of the remote repository
+
+    :param RepoConfig repo_config:
+        Repository options, see authenticated_url
+
+    :param ScratchSpace scratch_space:
+        Where the repository is cloned
+
+    :param int expected_bytes:
+        Estimated size of the clone, reserved in the scratch space until it is measured
+        (default is None, see ScratchSpace.acquire)
+
+    :raises TrufflehogApiError:
+        wraps the exception raised by the clone
+
+    :return: (GitPython Repo, path of the clone), to pass to release_clone
+    """
+    git_url = authenticated_url(path, repo_config)
+
+    # We pre-clone the repo to fix a bug that causes truffleHog to crash
+    # on Windows machines when run on remote repositories.
+    from git import Repo
+    repo_path = scratch_space.acquire(expected_bytes)
+    try:
+        repo = Repo.clone_from(git_url, repo_path)
+    except Exception as e:
+        scratch_space.release(repo_path)
+        raise TrufflehogApiError(e)
+    scratch_space.measure(repo_path)
+    return repo, repo_path
+
+
+def release_clone(repo, repo_path: str, scratch_space: ScratchSpace):
+    """Deletes a clone made by clone_repository in the background
+
+    :param repo:
+        GitPython Repo returned by clone_repository
+
+    :param str repo_path:
+        Path of the clone
+
+    :param ScratchSpace scratch_space:
+        The scratch space the repository was cloned into
+    """
+    repo.close()  # truffleHog doesn't do this, which causes a bug on Windows
+    scratch_space.release(repo_path)
+
+
+class RepositoryCheckout:
+    """The local repository a request is searched in, for the length of a with block:
+    a local repository is used in place, a remote one is cloned into a ScratchSpace
+    and the clone is released in the background when the block is left
+    """
+
+    def __init__(self, request: FindSecretsRequest, scratch_space: ScratchSpace = None):
+        """Creates a new RepositoryCheckout, the clone is only made on entering it
+
+        :param FindSecretsRequest request:
+            The request
+
+        :param ScratchSpace scratch_space:
+            Where a remote repository is cloned
+            (default is None, the process wide default_scratch_space)
+        """
+        self._request: FindSecretsRequest = request
+        self._scratch_space: Optional[ScratchSpace] = scratch_space
+        self._repo = None
+        self._repo_path: Optional[str] = None
+
+    @property
+    def origin(self) -> str:
+        """
+        :return: the absolute path of a local repository or the URL of a remote one, which
+        identifies the search in checkpoints
+        """
+        path = self._request.path
+        return os.path.abspath(path) if is_local_repository(path) else path
+
+    def __enter__(self) -> str:
+        """
+        :raises TrufflehogApiError:
+            wraps the exception raised by the clone
+
+        :return: path of the local repository or clone
+        """
+        path = self._request.path
+        repo_config = self._request.repo_config or RepoConfig()
+        if is_local_repository(path):
+            # If repo is local and env key for access token is present, display warning
+            token_key = repo_config.access_token_env_key
+            if token_key and token_key in os.environ:
+                warnings.warn("Warning: local repository path provided with an access token - "
+                              "Token will be ignored")
+            return path
+        if self._scratch_space is None:
+            self._scratch_space = default_scratch_space()
+        self._repo, self._repo_path = clone_repository(path, repo_config, self._scratch_space)
+        return self._repo_path
+
+    def __exit__(self, *exc_info):
+        if self._repo is not None:
+            release_clone(self._repo, self._repo_path, self._scratch_space)
+            self._repo = None
+
+
+def result_cache_key(request: FindSecretsRequest) -> Optional[str]:
+    """Resolves the branches a request searches and computes its ResultCache key
+
+    :param FindSecretsRequest request:
+        The request
+
+    :raises TrufflehogApiError:
+        if the branches cannot be resolved
+
+    :return: key of the request's results, see ResultCache.make_key, None if its results
+    must not be cached because its RepoConfig has relative dates
+    """
+    repo_config = request.repo_config or RepoConfig()
+    search_config = request.search_config or SearchConfig()
+    if repo_config.has_relative_dates:
+        warnings.warn("Warning: since or until is relative to the current time - "
+                      "the results will not be cached")
+        return None
+    path = request.path
+    try:
+        if is_local_repository(path):
+            path = os.path.abspath(path)
+            resolved_refs = git_log.resolve_refs(path, repo_config.branch)
+        else:
+            resolved_refs = git_log.resolve_remote_refs(authenticated_url(path, repo_config),
+                                                        repo_config.branch)
+        return ResultCache.make_key(path, resolved_refs, search_config, repo_config)
+    except TrufflehogApiError:
+        raise
+    except Exception as e:
+        raise TrufflehogApiError(e)
+
+
+def checkpoint_path(checkpoint_dir: str, request: FindSecretsRequest) -> str:
+    """Names the checkpoint file of a request in a batch, creating checkpoint_dir if needed
+
+    :param str checkpoint_dir:
+        Directory of the checkpoints of a batch
+
+    :param FindSecretsRequest request:
+        The request
+
+    :return: path of the request's checkpoint in checkpoint_dir
+    """
+    path = request.path
+    if is_local_repository(path):
+        path = os.path.abspath(path)
+    key = checkpoint_key(path, request.search_config or SearchConfig(),
+                         request.repo_config or RepoConfig())
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    return os.path.join(checkpoint_dir, key + ".checkpoint")
+
+
+def search_repository(repo_path: str,
+                      origin: str,
+                      repo_config: RepoConfig,
+                      search_config: SearchConfig,
+                      regex_profile: RegexProfile = None,
+                      scanner: Scanner = None,
+                      checkpoint: ScanCheckpoint = None,
+                      resume: bool = False) -> Iterator[Secret]:
+    """Searches a local repository with the selected scan backend
+
+    :param str repo_path:
+        Path of the local repository or clone to search
+
+    :param str origin:
+        Absolute path or URL the request named, identifying the search in checkpoints
+
+    :param RepoConfig repo_config:
+        Repository options of the search
+
+    :param SearchConfig search_config:
+        Search options of the search
+
+    :param RegexProfile regex_profile:
+        Optional report filled in with the time spent and hits of every regex
+
+    :param Scanner scanner:
+        Optional Scanner already built for search_config
+
+    :param ScanCheckpoint checkpoint:
+        Optional checkpoint the progress of the search is written to. Not used when
+        repo_config has relative dates
+
+    :param bool resume:
+        If True, continue the search recorded in checkpoint
+
+    :raises TrufflehogApiError:
+        wraps an exception that occurred while searching the repository
+
+    :return: generator of secret objects, see find_secrets.iter_find_secrets_request
+    """
+    try:
+        if checkpoint is not None and repo_config.has_relative_dates:
+            # The walk of the checkpointed run covered other commits
+            warnings.warn("Warning: since or until is relative to the current time - "
+                          "the search will not be checkpointed")
+            checkpoint = None
+        if search_config.scan_backend == GIT_LOG_BACKEND and checkpoint is not None:
+            key = checkpoint_key(origin, search_config, repo_config)
+            yield from _search_with_checkpoint(repo_path, repo_config, search_config,
+                                               regex_profile, scanner, checkpoint, key, resume)
+        elif search_config.scan_backend == GIT_LOG_BACKEND:
+            yield from search_git_log(repo_path, repo_config, search_config, regex_profile,
+                                      scanner)
+        elif search_config.scan_backend == TRUFFLEHOG_BACKEND:
+            if checkpoint is not None:
+                warnings.warn("Warning: checkpoints are not supported by the truffleHog scan "
+                              "backend - the search will not be checkpointed")
+            if repo_config.traversal_options(changed_only=True):
+                warnings.warn("Warning: the traversal options of RepoConfig are not supported "
+                              "by the truffleHog scan backend - they will be ignored")
+            if search_config.added_lines_only:
+                warnings.warn("Warning: added_lines_only is not supported by the truffleHog "
+                              "scan backend - every line of the diffs will be searched")
+            if (search_config.entropy_min_length, search_config.base64_entropy_threshold,
+                    search_config.hex_entropy_threshold) != (DEFAULT_ENTROPY_MIN_LENGTH,
+                                                             DEFAULT_BASE64_ENTROPY_THRESHOLD,
+                                                             DEFAULT_HEX_ENTROPY_THRESHOLD):
+                warnings.warn("Warning: the entropy settings of SearchConfig are not supported "
+                              "by the truffleHog scan backend - its defaults will be used")
+            yield from _search_with_trufflehog(repo_path, repo_config, search_config)
+        else:
+            raise TrufflehogApiError('Unknown scan backend: {0}'
+                                     .format(search_config.scan_backend))
+    except TrufflehogApiError:
+        raise
+    except Exception as e:
+        raise TrufflehogApiError(e)
+
+
+def search_git_log(repo_path: str,
+                   repo_config: RepoConfig,
+                   search_config: SearchConfig,
+                   regex_profile: RegexProfile = None,
+                   scanner: Scanner = None,
+                   walk_slice: Tuple[List[Tuple[str, str]], Tuple[int, int],
+                                     Tuple[int, int]] = None) -> Iterator[Secret]:
+    """Searches the repository by streaming ``git log -p`` through a Scanner
+
+    :param walk_slice:
+        Optional (refs, position, end_position) slice of the walk to search instead of
+        the whole history, see git_log.split_walk
+
+    :return: generator of secret objects, see search_repository for the other parameters
+    """
+    if scanner is None:
+        scanner = Scanner(search_config, regex_profile)
+    if walk_slice is None:
+        hunks = git_log.iter_diff_hunks(repo_path, repo_config,
+                                        max_depth=search_config.max_depth,
+                                        path_filter=scanner.path_included,
+                                        max_hunk_bytes=search_config.max_hunk_bytes)
+    else:
+        refs, position, end_position = walk_slice
+        hunks = git_log.iter_diff_hunks(repo_path, repo_config,
+                                        max_depth=search_config.max_depth,
+                                        path_filter=scanner.path_included,
+                                        refs=refs, position=position,
+                                        end_position=end_position,
+                                        max_hunk_bytes=search_config.max_hunk_bytes)
+    return scanner.scan(hunks)
+
+
+def _search_with_checkpoint(repo_path: str,
+                            repo_config: RepoConfig,
+                            search_config: SearchConfig,
+                            regex_profile: RegexProfile,
+                            scanner: Scanner,
+                            checkpoint: ScanCheckpoint,
+                            key: str,
+                            resume: bool) -> Iterator[Secret]:
+    """Searches the repository like search_git_log while writing checkpoints,
+    continuing from the state recorded in checkpoint when resuming
+    """
+    state = checkpoint.load(key) if resume else None
+    if state is not None:
+        yield from state.secrets
+        if state.complete:
+            return
+        refs = state.refs
+        position = state.position
+        checkpoint.resume(state)
+    else:
+        refs = list(git_log.resolve_refs(repo_path, repo_config.branch).items())
+        position = (0, 0)
+        checkpoint.start(key, refs)
+
+    if scanner is None:
+        scanner = Scanner(search_config, regex_profile)
+    hunks = git_log.iter_diff_hunks(repo_path, repo_config,
+                                    max_depth=search_config.max_depth,
+                                    path_filter=scanner.path_included,
+                                    refs=refs, position=position,
+                                    on_progress=checkpoint.progress,
+                                    max_hunk_bytes=search_config.max_hunk_bytes)
+    try:
+        for secret in scanner.scan(hunks):
+            checkpoint.add_secret(secret)
+            yield secret
+        checkpoint.complete()
+    finally:
+        checkpoint.close()
+
+
+def _search_with_trufflehog(repo_path: str,
+                            repo_config: RepoConfig,
+                            search_config: SearchConfig) -> List[Secret]:
+    """Searches the repository with truffleHog.find_strings()
+    """
+    from truffleHog import truffleHog
+    backend = search_config.regex_backend
+    regexes = {description: compiled.pattern for description, compiled
+               in validate_regexes(search_config.regexes, backend).items()}
+    output = truffleHog.find_strings(git_url=None,
+                                     since_commit=repo_config.since_commit,
+                                     max_depth=search_config.max_depth,
+                                     do_regex=bool(regexes),
+                                     do_entropy=search_config.entropy_checks_enabled,
+                                     custom_regexes=regexes,
+                                     branch=repo_config.branch,
+                                     repo_path=repo_path,
+                                     path_inclusions=compile_patterns(
+                                         search_config.include_search_paths, backend),
+                                     path_exclusions=compile_patterns(
+                                         search_config.exclude_search_paths, backend))
+    baseline = Baseline.load(search_config.baseline_path) if search_config.baseline_path else None
+    secrets = _convert_default_output_to_secrets(output, baseline)
+    _clean_up(output)
+    return secrets
+
+
+def _convert_default_output_to_secrets(output: dict, baseline: Baseline = None) -> List[Secret]:
+    """
+    Takes the output from truffleHog.find_strings() and converts
+    to a list of Secret objects that are easier to programmatically
+    parse and output.
+
+    :param dict output:
+        Output from truffleHog.find_strings()
+
+    :param Baseline baseline:
+        Optional baseline of known findings, suppressed before Secrets are built
+
+    :return: List of Secret Objects
+    """
+    secrets = []
+    issues = output["foundIssues"]
+    for issue_file in issues:
+        with open(issue_file) as result_file:
+            issue = json.loads(result_file.read())
+            strings_found = issue['stringsFound']
+            if baseline is not None:
+                strings_found = baseline.filter_strings(issue['reason'], strings_found,
+                                                        issue['path'])
+                if not strings_found:
+                    continue
+            secret = Secret(commit_time=issue['date'],
+                            branch_name=issue['branch'],
+                            commit=issue['commit'],
+                            diff=issue['printDiff'],
+                            commit_hash=issue['commitHash'],
+                            reason=issue['reason'],
+                            path=issue['path'],
+                            strings_found=strings_found)
+            secrets.append(secret)
+    return secrets
+
+
+def _clean_up(output: dict):
+    """Removes files containing the output from truffleHog.find_strings()
+    from the file system.
+
+    :param dict output:
+        Output from truffleHog.find_strings()
+    """
+    issues_path = output.get("issues_path", None)
+    if issues_path and os.path.isdir(issues_path):
+        shutil.rmtree(output["issues_path"])
+
+
+def _append_env_access_token_to_path(path, token_key):
+    """Appends the secret token to a valid git url
+
+    :param str path:
+        Repository path
+    :param str token_key:
+        Env variable key which stores the secret token
+    """
+    # FIXME - This only supports github!
+    idx = path.find("github.com/")
+    if idx > -1:
+        path = path[:idx] + os.environ.get(token_key) + ":x-oauth-basic@" + path[idx:]
+    return path
@@ -0,0 +1,232 @@
+"""
+Disk backed cache of whole-scan results. Entries are keyed by the repository,
+the commits its branches resolve to and the fingerprints of the RepoConfig
+and SearchConfig, so a repeated request for a branch that has not moved is
+answered without cloning or walking the history again.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.search_config import SearchConfig
+from trufflehog_api.secret import Secret
+
+# Bump when the stored format or the meaning of results changes
+CACHE_VERSION = 1
+
+_ENTRY_SUFFIX = ".json"
+
+
+class ResultCache:
+    """Stores the secrets of completed scans as one JSON file per key, with an optional
+    time to live and a total size limit enforced by evicting the least recently used
+    entries. The modification time of an entry's file is its creation time, which the
+    time to live counts from, and its access time is its last use.
+    """
+
+    def __init__(self, directory: str, ttl: float = None, max_bytes: int = None):
+        """Creates a new ResultCache, creating directory if needed
+
+        :param str directory:
+            Directory the entries are stored in
+
+        :param float ttl:
+            Seconds after its creation an entry stays valid, however often it is read
+            (default is None, entries never expire)
+
+        :param int max_bytes:
+            Total size of the entries above which the least recently used ones are evicted
+            (default is None, no size limit)
+
+        :raises TrufflehogApiError:
+            if the directory cannot be created
+        """
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            raise TrufflehogApiError(e)
+        self._directory: str = directory
+        self._ttl: float = ttl
+        self._max_bytes: int = max_bytes
+        self._lock = threading.Lock()
+        self._hits: int = 0
+        self._misses: int = 0
+
+    @property
+    def directory(self) -> str:
+        """
+        :return: directory the entries are stored in
+        """
+        return self._directory
+
+    @property
+    def hits(self) -> int:
+        """
+        :return: number of get calls answered from the cache
+        """
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """
+        :return: number of get calls that found no valid entry
+        """
+        return self._misses
+
+    @staticmethod
+    def make_key(path: str,
+                 resolved_refs: Dict[str, str],
+                 search_config: SearchConfig,
+                 repo_config: RepoConfig) -> str:
+        """Computes the key of a scan
+
+        :param str path:
+            Repository URL or absolute local path, without credentials
+
+        :param dict resolved_refs:
+            Ref name to commit hash of every branch the scan walks
+
+        :param SearchConfig search_config:
+            Search configuration of the scan
+
+        :param RepoConfig repo_config:
+            Repository configuration of the scan
+
+        :return: hex digest identifying the scan
+        """
+        key = dict()
+        key["version"] = CACHE_VERSION
+        key["path"] = path
+        key["refs"] = resolved_refs
+        key["search_config"] = search_config.fingerprint()
+        key["repo_config"] = repo_config.fingerprint()
+        if search_config.baseline_path:
+            # The results depend on the baseline content, not on its path
+            with open(search_config.baseline_path, "rb") as baseline_file:
+                key["baseline"] = hashlib.sha256(baseline_file.read()).hexdigest()
+        key_string = json.dumps(key, sort_keys=True)
+        return hashlib.sha256(key_string.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[Secret]]:
+        """
+        :param str key:
+            Key computed by make_key
+
+        :return: the stored secrets, or None if there is no entry or it expired
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path) as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+
+        if self._ttl is not None and time.time() - entry["created"] > self._ttl:
+            self._remove(entry_path)
+            self._count(hit=False)
+            return None
+
+        # Reading marks the entry as recently used for size based eviction, and keeps the
+        # creation time the time to live counts from
+        try:
+            os.utime(entry_path, (time.time(), entry["created"]))
+        except OSError:
+            pass
+        self._count(hit=True)
+        return [Secret.from_dict(secret) for secret in entry["secrets"]]
+
+    def put(self, key: str, secrets: List[Secret]):
+        """Stores the secrets of a scan, then evicts entries if over the size limit
+
+        :param str key:
+            Key computed by make_key
+
+        :param list secrets:
+            Secrets found by the scan
+        """
+        entry = dict()
+        entry["key"] = key
+        entry["created"] = time.time()
+        entry["secrets"] = [secret.to_dict() for secret in secrets]
+        # Write to a temporary file first so readers never see partial entries
+        handle, temp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as entry_file:
+            json.dump(entry, entry_file, default=str)
+        os.utime(temp_path, (entry["created"], entry["created"]))
+        os.replace(temp_path, self._entry_path(key))
+        self._evict()
+
+    def clear(self):
+        """Removes every entry"""
+        with self._lock:
+            for name in os.listdir(self._directory):
+                if name.endswith(_ENTRY_SUFFIX):
+                    self._remove(os.path.join(self._directory, name))
+
+    def size(self) -> int:
+        """
+        :return: total size in bytes of the stored entries
+        """
+        return sum(size for _, _, _, size in self._entries())
+
+    def __len__(self):
+        return len(self._entries())
+
+    def _count(self, hit: bool):
+        """Counts a get call, which may run on any thread of a batch"""
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    def _evict(self):
+        """Drops the entries created more than ttl ago, then the least recently used ones
+        over max_bytes"""
+        with self._lock:
+            entries = self._entries()
+            if self._ttl is not None:
+                expired_before = time.time() - self._ttl
+                for path, created, _, _ in entries:
+                    if created < expired_before:
+                        self._remove(path)
+                entries = [entry for entry in entries if entry[1] >= expired_before]
+            if self._max_bytes is None:
+                return
+            total = sum(size for _, _, _, size in entries)
+            for path, _, _, size in sorted(entries, key=lambda entry: entry[2]):
+                if total <= self._max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    def _entries(self):
+        """Lists (path, creation time, last use time, size) of the stored entries"""
+        entries = []
+        for name in os.listdir(self._directory):
+            if not name.endswith(_ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self._directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_mtime, stat.st_atime, stat.st_size))
+        return entries
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self._directory, key + _ENTRY_SUFFIX)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,371 @@
+"""
+Runs the entropy and regex checks of a SearchConfig over the hunks produced
+by trufflehog_api.git_log and turns the matches into Secret objects.
+"""
+import datetime
+import math
+import re
+import time
+import warnings
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from trufflehog_api.baseline import Baseline
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.git_log import DiffHunk
+from trufflehog_api.metrics import scan_metrics
+from trufflehog_api.regex_engine import (RE_BACKEND, CompiledRegex, compile_bytes_regex,
+                                         compile_regex)
+from trufflehog_api.regex_profile import RegexProfile, find_unsafe_regexes, validate_regexes
+from trufflehog_api.search_config import (DEFAULT_BASE64_ENTROPY_THRESHOLD,
+                                          DEFAULT_ENTROPY_MIN_LENGTH,
+                                          DEFAULT_HEX_ENTROPY_THRESHOLD, SearchConfig)
+from trufflehog_api.secret import Secret
+
+HIGH_ENTROPY_REASON = "High Entropy"
+
+# With a regex time budget, long hunks are searched line by line and long lines
+# in overlapping windows, so that the budget can be checked between searches.
+# Matches longer than the overlap may be missed at window boundaries.
+_CHUNK_SIZE = 4096
+_CHUNK_OVERLAP = 256
+
+# truffleHog's entropy helpers, imported on first use since truffleHog imports GitPython
+_entropy_helpers = None
+
+# truffleHog's entropy alphabets for the bytes tokenizer. Like truffleHog.get_strings_of_set,
+# runs of at least entropy_min_length characters of an alphabet are candidates, and none
+# of the alphabets contains whitespace.
+_BASE64_BYTES = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+_HEX_BYTES = b"1234567890abcdefABCDEF"
+
+# Character classes of the entropy prefilter: the bytes of the base64 alphabet, which
+# contains the hex one, become b"a" and every other byte b" ", so that a candidate run is
+# a run of b"a" found by bytes.find
+_RUN_CLASSES = bytes(0x61 if byte in _BASE64_BYTES else 0x20 for byte in range(256))
+
+
+def compile_patterns(patterns, backend: str = RE_BACKEND) -> List[Any]:
+    """Compiles path filter patterns given either as strings or compiled patterns
+
+    :param list patterns:
+        Regular expressions as strings or compiled re patterns, may be None
+
+    :param str backend:
+        Name of the regex engine to compile with (default is "re")
+
+    :return: list of compiled patterns
+    """
+    return [compile_regex(pattern, backend).pattern for pattern in patterns or []]
+
+
+class Scanner:
+    """Applies the checks described by a SearchConfig to diff hunks. Patterns are
+    compiled once per Scanner so one instance should be reused for a whole scan.
+    """
+
+    def __init__(self, search_config: SearchConfig, regex_profile: RegexProfile = None):
+        """Creates a new Scanner
+
+        :param SearchConfig search_config:
+            Configuration describing which checks to run and which paths to search
+
+        :param RegexProfile regex_profile:
+            Report to record the cost of every regex in
+            (default is None, a new report available as Scanner.regex_profile)
+
+        :raises TrufflehogApiError:
+            if one of the regexes does not compile, the baseline cannot be loaded or
+            entropy_min_length is not positive
+        """
+        if search_config.entropy_min_length < 1:
+            raise TrufflehogApiError('entropy_min_length must be positive')
+        self._entropy_checks_enabled: bool = search_config.entropy_checks_enabled
+        self._entropy_min_length: int = search_config.entropy_min_length
+        self._base64_entropy_threshold: float = search_config.base64_entropy_threshold
+        self._hex_entropy_threshold: float = search_config.hex_entropy_threshold
+        self._added_lines_only: bool = search_config.added_lines_only
+        self._regex_time_budget: float = search_config.regex_time_budget
+        self._regex_profile: RegexProfile = (regex_profile if regex_profile is not None
+                                             else RegexProfile())
+        backend = search_config.regex_backend
+        self._regexes: Dict[str, CompiledRegex] = validate_regexes(search_config.regexes,
+                                                                    backend)
+        if self._regex_time_budget is not None:
+            self._disable_unsafe_regexes()
+        self._include_patterns: List[Any] = compile_patterns(
+            search_config.include_search_paths, backend)
+        self._exclude_patterns: List[Any] = compile_patterns(
+            search_config.exclude_search_paths, backend)
+        self._baseline: Baseline = (Baseline.load(search_config.baseline_path)
+                                    if search_config.baseline_path else None)
+        # Added lines mode: the regexes compiled for bytes, None for the few that can
+        # only match strings and are searched in the decoded added lines
+        self._bytes_regexes: Dict[str, Optional[CompiledRegex]] = dict()
+        if self._added_lines_only:
+            self._bytes_regexes = {description: compile_bytes_regex(compiled)
+                                   for description, compiled in self._regexes.items()}
+
+    @property
+    def regex_profile(self) -> RegexProfile:
+        """
+        :return: the report of the time spent in every regex so far
+        """
+        return self._regex_profile
+
+    def path_included(self, path: str) -> bool:
+        """Same semantics as truffleHog.path_included, on a plain path
+
+        :param str path:
+            Path of the file in the repository
+
+        :return: False if the path does not match an include pattern (when any are
+        given) or matches an exclude pattern, otherwise True
+        """
+        if self._include_patterns and not any(p.match(path) for p in self._include_patterns):
+            return False
+        if self._exclude_patterns and any(p.match(path) for p in self._exclude_patterns):
+            return False
+        return True
+
+    def scan_hunk(self, hunk: DiffHunk) -> List[Secret]:
+        """Runs the enabled checks over a single hunk
+
+        :param DiffHunk hunk:
+            Hunk to scan
+
+        :return: list of secrets found in the hunk
+        """
+        if self._added_lines_only:
+            secrets = self._scan_added_lines(hunk)
+        else:
+            secrets = self._scan_text(hunk)
+        if secrets:
+            findings = scan_metrics().findings
+            for secret in secrets:
+                findings.labels(secret.reason).inc()
+        return secrets
+
+    def scan(self, hunks: Iterable[DiffHunk]) -> Iterator[Secret]:
+        """Scans a stream of hunks lazily
+
+        :param hunks:
+            Iterable of DiffHunk records, usually from git_log.iter_diff_hunks
+
+        :return: generator of secrets in the order they are found
+        """
+        for hunk in hunks:
+            yield from self.scan_hunk(hunk)
+
+    def _scan_text(self, hunk: DiffHunk) -> List[Secret]:
+        """scan_hunk for the default mode: searches the whole decoded hunk"""
+        text = hunk.hunk.decode('utf-8', errors='replace')
+        secrets = []
+        if self._entropy_checks_enabled:
+            strings_found = self._unknown(HIGH_ENTROPY_REASON, _find_high_entropy_strings(
+                hunk.hunk, self._entropy_min_length, self._base64_entropy_threshold,
+                self._hex_entropy_threshold), hunk.path)
+            if strings_found:
+                secrets.append(_make_secret(hunk, text, HIGH_ENTROPY_REASON, strings_found))
+        for reason, compiled in self._regexes.items():
+            strings_found = self._unknown(reason, self._search(reason, compiled, text),
+                                          hunk.path)
+            if strings_found:
+                secrets.append(_make_secret(hunk, text, reason, strings_found))
+        return secrets
+
+    def _scan_added_lines(self, hunk: DiffHunk) -> List[Secret]:
+        """scan_hunk for the added_lines_only mode: matches the added lines as bytes and
+        decodes the hunk only when a Secret is built from it"""
+        added = _added_lines(hunk.hunk)
+        if not added:
+            return []
+        found = []
+        if self._entropy_checks_enabled:
+            strings_found = self._unknown(HIGH_ENTROPY_REASON, _find_high_entropy_bytes(
+                added, self._entropy_min_length, self._base64_entropy_threshold,
+                self._hex_entropy_threshold), hunk.path)
+            if strings_found:
+                found.append((HIGH_ENTROPY_REASON, strings_found))
+        added_text = None
+        for reason, compiled in self._regexes.items():
+            bytes_compiled = self._bytes_regexes.get(reason)
+            if bytes_compiled is not None:
+                matches = [match.decode('utf-8', errors='replace')
+                           for match in self._search(reason, bytes_compiled, added)]
+            else:
+                if added_text is None:
+                    added_text = added.decode('utf-8', errors='replace')
+                matches = self._search(reason, compiled, added_text)
+            strings_found = self._unknown(reason, list(dict.fromkeys(matches)), hunk.path)
+            if strings_found:
+                found.append((reason, strings_found))
+        if not found:
+            return []
+        text = hunk.hunk.decode('utf-8', errors='replace')
+        return [_make_secret(hunk, text, reason, strings_found)
+                for reason, strings_found in found]
+
+    def _unknown(self, reason: str, strings_found: List[str], path: str) -> List[str]:
+        """Drops the strings suppressed by the baseline, if any"""
+        if not strings_found or self._baseline is None:
+            return strings_found
+        return self._baseline.filter_strings(reason, strings_found, path)
+
+    def _disable_unsafe_regexes(self):
+        """Drops the regexes whose probed cost exceeds the time budget"""
+        unsafe = find_unsafe_regexes(self._regexes, self._regex_time_budget)
+        for description, cost in unsafe.items():
+            warnings.warn('Warning: regex "{0}" took {1:.3f}s on a {2:.3f}s budget when '
+                          'profiled and will not be searched'
+                          .format(description, cost, self._regex_time_budget))
+            del self._regexes[description]
+            self._regex_profile.stats(description).disable()
+
+    def _search(self, reason: str, compiled: CompiledRegex, text) -> list:
+        """Searches text with a regex while recording its cost, giving up once the
+        regex time budget (if any) is exhausted for this text. Engines supporting
+        timeouts enforce the budget themselves, otherwise long texts are chunked.
+
+        :param text:
+            str, or bytes for patterns compiled for bytes
+
+        :return: the distinct strings (or bytes) matched, in order of appearance
+        """
+        pattern = compiled.pattern
+        start = time.perf_counter()
+        budget_exceeded = False
+        if self._regex_time_budget is None or len(text) <= _CHUNK_SIZE:
+            found = [match.group(0) for match in pattern.finditer(text)]
+        elif compiled.engine.supports_timeout:
+            try:
+                found = [match.group(0) for match in
+                         pattern.finditer(text, timeout=self._regex_time_budget)]
+            except TimeoutError:
+                found = []
+                budget_exceeded = True
+        else:
+            found = []
+            for chunk in _iter_chunks(text):
+                found.extend(match.group(0) for match in pattern.finditer(chunk))
+                if time.perf_counter() - start > self._regex_time_budget:
+                    budget_exceeded = True
+                    break
+        found = list(dict.fromkeys(found))
+        self._regex_profile.stats(reason).record(time.perf_counter() - start, bool(found),
+                                                 budget_exceeded)
+        return found
+
+
+def _iter_chunks(text):
+    """Splits text into lines, and lines longer than _CHUNK_SIZE into overlapping windows"""
+    for line in text.splitlines():
+        if len(line) <= _CHUNK_SIZE:
+            yield line
+            continue
+        step = _CHUNK_SIZE - _CHUNK_OVERLAP
+        for start in range(0, len(line) - _CHUNK_OVERLAP, step):
+            yield line[start:start + _CHUNK_SIZE]
+
+
+def _candidate_lines(data: bytes, min_length: int) -> Iterator[bytes]:
+    """Prefilter of the entropy check: a single pass over the character classes of data
+    finds the runs of at least min_length base64 characters, so lines without any are
+    never split into words or measured
+
+    :return: generator of the lines of data holding such a run, without their newlines
+    """
+    classes = data.translate(_RUN_CLASSES)
+    run = b"a" * min_length
+    position = classes.find(run)
+    while position != -1:
+        start = data.rfind(b"\n", 0, position) + 1
+        end = data.find(b"\n", position)
+        if end == -1:
+            end = len(data)
+        yield data[start:end]
+        position = classes.find(run, end + 1)
+
+
+def _find_high_entropy_strings(data: bytes,
+                               min_length: int = DEFAULT_ENTROPY_MIN_LENGTH,
+                               base64_threshold: float = DEFAULT_BASE64_ENTROPY_THRESHOLD,
+                               hex_threshold: float = DEFAULT_HEX_ENTROPY_THRESHOLD) -> List[str]:
+    """Entropy check of truffleHog.find_entropy on the lines of a hunk passing the
+    _candidate_lines prefilter
+
+    :return: the distinct high entropy strings, in order of appearance
+    """
+    global _entropy_helpers  # pylint: disable=global-statement
+    if _entropy_helpers is None:
+        from truffleHog import truffleHog
+        _entropy_helpers = (truffleHog.BASE64_CHARS, truffleHog.HEX_CHARS,
+                            truffleHog.get_strings_of_set, truffleHog.shannon_entropy)
+    base64_chars, hex_chars, get_strings_of_set, shannon_entropy = _entropy_helpers
+
+    strings_found = []
+    for line in _candidate_lines(data, min_length):
+        for word in line.decode('utf-8', errors='replace').split():
+            if len(word) < min_length:
+                continue
+            for string in get_strings_of_set(word, base64_chars, min_length - 1):
+                if shannon_entropy(string, base64_chars) > base64_threshold:
+                    strings_found.append(string)
+            for string in get_strings_of_set(word, hex_chars, min_length - 1):
+                if shannon_entropy(string, hex_chars) > hex_threshold:
+                    strings_found.append(string)
+    return list(dict.fromkeys(strings_found))
+
+
+def _added_lines(hunk: bytes) -> bytes:
+    """
+    :return: the lines a hunk adds, without their "+" markers, joined by newlines.
+    Pieces of lines longer than max_hunk_bytes carried over to the next chunk of the
+    hunk are not recognized as added.
+    """
+    return b"\n".join(line[1:] for line in hunk.split(b"\n") if line.startswith(b"+"))
+
+
+def _shannon_entropy_bytes(data: bytes, alphabet: bytes) -> float:
+    """truffleHog.shannon_entropy on bytes, summed in the same order"""
+    entropy = 0.0
+    for byte in alphabet:
+        p_x = float(data.count(byte)) / len(data)
+        if p_x > 0:
+            entropy += - p_x * math.log(p_x, 2)
+    return entropy
+
+
+def _find_high_entropy_bytes(data: bytes,
+                             min_length: int = DEFAULT_ENTROPY_MIN_LENGTH,
+                             base64_threshold: float = DEFAULT_BASE64_ENTROPY_THRESHOLD,
+                             hex_threshold: float = DEFAULT_HEX_ENTROPY_THRESHOLD) -> List[str]:
+    """Entropy check of _find_high_entropy_strings on bytes
+
+    :return: the distinct high entropy strings, in order of appearance
+    """
+    candidates = b"\n".join(_candidate_lines(data, min_length))
+    if not candidates:
+        return []
+    strings_found = []
+    for run in re.findall(rb"[A-Za-z0-9+/=]{%d,}" % min_length, candidates):
+        if _shannon_entropy_bytes(run, _BASE64_BYTES) > base64_threshold:
+            strings_found.append(run.decode('ascii'))
+    for run in re.findall(rb"[0-9a-fA-F]{%d,}" % min_length, candidates):
+        if _shannon_entropy_bytes(run, _HEX_BYTES) > hex_threshold:
+            strings_found.append(run.decode('ascii'))
+    return list(dict.fromkeys(strings_found))
+
+
+def _make_secret(hunk: DiffHunk, text: str, reason: str, strings_found: List[str]) -> Secret:
+    """Builds a Secret for a hunk, formatting the commit time like truffleHog"""
+    commit = hunk.commit
+    commit_time = datetime.datetime.fromtimestamp(commit.committed_date).strftime(
+        '%Y-%m-%d %H:%M:%S')
+    return Secret(commit_time=commit_time,
+                  branch_name=commit.branch_name,
+                  commit=commit.message,
+                  diff=text,
+                  commit_hash=commit.hexsha,
+                  reason=reason,
+                  path=hunk.path,
+                  strings_found=strings_found)
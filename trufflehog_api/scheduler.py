@@ -0,0 +1,254 @@
+"""
+Size aware ordering of batch requests. A BatchScheduler estimates how long
+each request will take, from the durations of its previous scans, a
+CostEstimator's measurement, the size and commit count of local repositories
+or a size hint given for remote ones, so
+that a ScanPipeline can start the longest requests first and a giant
+repository submitted last no longer stretches the whole batch. Requests over a
+commit threshold can also be split into shards, slices of their history walk
+that idle scan workers pick up independently.
+"""
+import json
+import os
+import threading
+from typing import Dict, NamedTuple, Optional
+
+from trufflehog_api import git_log
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.repository import FindSecretsRequest, is_local_repository
+from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.search_config import SearchConfig
+
+# Sources of a cost estimate
+HISTORY = "history"
+ESTIMATE = "estimate"
+LOCAL = "local"
+HINT = "hint"
+DEFAULT = "default"
+
+
+class RequestCost(NamedTuple):
+    """Estimated cost of a request"""
+    seconds: float
+    source: str
+    commits: Optional[int] = None
+    size: Optional[int] = None
+
+
+class DurationHistory:
+    """Durations of previous scans by repository, optionally kept in a JSON file so
+    that the next batch can be ordered by them. Durations are smoothed with an
+    exponential moving average.
+    """
+
+    def __init__(self, path: str = None, smoothing: float = 0.5):
+        """Creates a new DurationHistory, loading path if it exists
+
+        :param str path:
+            JSON file the durations are loaded from and saved to
+            (default is None, durations are only kept in memory)
+
+        :param float smoothing:
+            Weight of a new duration against the previous average (default is 0.5)
+
+        :raises TrufflehogApiError:
+            if the file exists but cannot be read
+        """
+        self._path: Optional[str] = path
+        self._smoothing: float = smoothing
+        self._lock = threading.Lock()
+        self._durations: Dict[str, float] = dict()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as history_file:
+                    self._durations = {key: float(value) for key, value
+                                       in json.load(history_file).items()}
+            except (OSError, ValueError, AttributeError) as e:
+                raise TrufflehogApiError('Cannot read duration history {0}: {1}'
+                                         .format(path, e))
+
+    @property
+    def path(self) -> Optional[str]:
+        """
+        :return: JSON file the durations are saved to
+        """
+        return self._path
+
+    def get(self, repository: str) -> Optional[float]:
+        """
+        :param str repository:
+            Repository URL or absolute local path
+
+        :return: average seconds of its previous scans, None if it was never scanned
+        """
+        return self._durations.get(repository)
+
+    def record(self, repository: str, seconds: float):
+        """Adds the duration of a scan
+
+        :param str repository:
+            Repository URL or absolute local path
+
+        :param float seconds:
+            Time the clone and search of the repository took
+        """
+        with self._lock:
+            previous = self._durations.get(repository)
+            if previous is not None:
+                seconds = self._smoothing * seconds + (1 - self._smoothing) * previous
+            self._durations[repository] = seconds
+
+    def save(self):
+        """Writes the durations to the JSON file, if there is one"""
+        if not self._path:
+            return
+        with self._lock:
+            durations = dict(self._durations)
+        temp_path = self._path + ".tmp"
+        with open(temp_path, "w") as history_file:
+            json.dump(durations, history_file, indent=1, sort_keys=True)
+        os.replace(temp_path, self._path)
+
+    def __len__(self):
+        return len(self._durations)
+
+
+class BatchScheduler:
+    """Estimates the cost of requests so a ScanPipeline can run the longest first,
+    and decides which requests are split into shards
+    """
+
+    def __init__(self,
+                 history: DurationHistory = None,
+                 size_hints: Dict[str, int] = None,
+                 shard_commits: int = None,
+                 seconds_per_commit: float = 0.002,
+                 seconds_per_byte: float = 2e-8,
+                 default_seconds: float = 1.0,
+                 estimator: "CostEstimator" = None):
+        """Creates a new BatchScheduler
+
+        :param DurationHistory history:
+            Durations of previous scans, preferred over any other estimate and updated
+            with the durations of this batch (default is None, a new in memory history)
+
+        :param dict size_hints:
+            Repository URL or path to its size in bytes, e.g. as reported by the hosting
+            service, used for remote repositories without history
+
+        :param int shard_commits:
+            Number of commits above which a repository's history is split into shards
+            of about that many commits (default is None, never shard)
+
+        :param float seconds_per_commit:
+            Estimated search time per commit of a local repository
+
+        :param float seconds_per_byte:
+            Estimated clone and search time per byte of repository size
+
+        :param float default_seconds:
+            Estimate for remote repositories without history or size hint
+
+        :param CostEstimator estimator:
+            Measures the requests without history that it has a local copy of, and
+            is given the durations of this batch to calibrate on
+            (default is None, the commit count and object size are used)
+        """
+        if shard_commits is not None and shard_commits < 1:
+            raise TrufflehogApiError('shard_commits must be at least 1')
+        self._history: DurationHistory = history if history is not None else DurationHistory()
+        self._size_hints: Dict[str, int] = size_hints or dict()
+        self._shard_commits: Optional[int] = shard_commits
+        self._seconds_per_commit: float = seconds_per_commit
+        self._seconds_per_byte: float = seconds_per_byte
+        self._default_seconds: float = default_seconds
+        self._estimator = estimator
+
+    @property
+    def history(self) -> DurationHistory:
+        """
+        :return: durations of previous scans
+        """
+        return self._history
+
+    @property
+    def shard_commits(self) -> Optional[int]:
+        """
+        :return: number of commits above which a history is split into shards
+        """
+        return self._shard_commits
+
+    def cost(self, request: FindSecretsRequest) -> RequestCost:
+        """Estimates how long a request will take
+
+        :param FindSecretsRequest request:
+            Request to estimate
+
+        :return: the estimate and what it is based on
+        """
+        repository = repository_key(request.path)
+        seconds = self._history.get(repository)
+        if seconds is not None:
+            return RequestCost(seconds, HISTORY)
+        if self._estimator is not None:
+            try:
+                estimate = self._estimator.estimate(request)
+                return RequestCost(estimate.seconds, ESTIMATE, commits=estimate.commits,
+                                   size=estimate.diff_bytes)
+            except TrufflehogApiError:
+                pass
+        if is_local_repository(request.path):
+            try:
+                commits, size = _local_size(request)
+            except TrufflehogApiError:
+                return RequestCost(self._default_seconds, DEFAULT)
+            return RequestCost(commits * self._seconds_per_commit + size * self._seconds_per_byte,
+                               LOCAL, commits=commits, size=size)
+        size = self._size_hints.get(request.path)
+        if size is not None:
+            return RequestCost(size * self._seconds_per_byte, HINT, size=size)
+        return RequestCost(self._default_seconds, DEFAULT)
+
+    def record(self, request: FindSecretsRequest, seconds: float):
+        """Adds the duration of a finished request to the history
+
+        :param FindSecretsRequest request:
+            Request that finished
+
+        :param float seconds:
+            Time its clone and search took
+        """
+        self._history.record(repository_key(request.path), seconds)
+        if self._estimator is not None:
+            self._estimator.record(request, seconds)
+
+
+def repository_key(path: str) -> str:
+    """
+    :param str path:
+        Repository URL or local path
+
+    :return: the absolute path of a local repository, the URL of a remote one
+    """
+    return os.path.abspath(path) if is_local_repository(path) else path
+
+
+def _local_size(request: FindSecretsRequest):
+    """Counts the commits a search of a local repository walks and measures its
+    object database
+
+    :return: (commit count, size in bytes)
+    """
+    repo_config = request.repo_config or RepoConfig()
+    search_config = request.search_config or SearchConfig()
+    commits = 0
+    walked = []
+    for ref in git_log.list_branches(request.path, repo_config.branch):
+        commits += git_log.count_commits(request.path, ref,
+                                         since_commit=repo_config.since_commit,
+                                         exclude_refs=walked,
+                                         max_depth=search_config.max_depth,
+                                         options=git_log.traversal_arguments(repo_config),
+                                         paths=repo_config.paths)
+        walked.append(ref)
+    return commits, git_log.object_size(request.path)
@@ -0,0 +1,256 @@
+"""
+Scratch storage for the clones of remote repositories. Clones are made in
+per-worker directories under a configurable root (for example a tmpfs or a
+fast local disk), a quota guard holds back new clones while the space in use
+is over budget, and finished clones are renamed out of the way and deleted
+by a background thread so that requests do not wait for the deletion.
+"""
+import atexit
+import itertools
+import os
+import queue
+import shutil
+import stat
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from trufflehog_api.error import TrufflehogApiError
+
+_default_scratch_space: Optional["ScratchSpace"] = None
+_default_lock = threading.Lock()
+
+
+def default_scratch_space() -> "ScratchSpace":
+    """
+    :return: the process wide ScratchSpace in the system temporary directory, used when
+    no ScratchSpace is given to a request. It is drained when the interpreter exits.
+    """
+    global _default_scratch_space  # pylint: disable=global-statement
+    with _default_lock:
+        if _default_scratch_space is None:
+            _default_scratch_space = ScratchSpace()
+            atexit.register(_default_scratch_space.close)
+        return _default_scratch_space
+
+
+class ScratchSpace:
+    """Hands out directories to clone into and deletes them in the background once
+    released. Usage is the size of the directories handed out plus the size of those
+    still waiting to be deleted. A directory counts with the size reserved for it when
+    it is handed out until measure replaces that estimate with its actual size, so that
+    clones running at the same time are bounded by the quota before any of them is
+    measured.
+    """
+
+    def __init__(self,
+                 root: str = None,
+                 max_bytes: int = None,
+                 min_free_bytes: int = None,
+                 wait_timeout: float = None):
+        """Creates a new ScratchSpace in a fresh directory under root
+
+        :param str root:
+            Directory to create the scratch space in, e.g. a tmpfs mount
+            (default is None, the system temporary directory)
+
+        :param int max_bytes:
+            Usage above which acquire holds back new directories
+            (default is None, no limit)
+
+        :param int min_free_bytes:
+            Free space of the file system of root below which acquire holds back new
+            directories (default is None, no limit)
+
+        :param float wait_timeout:
+            Seconds acquire waits for space before raising, 0 to raise immediately
+            (default is None, wait as long as needed)
+
+        :raises TrufflehogApiError:
+            if the directory cannot be created
+        """
+        import tempfile
+        try:
+            if root:
+                os.makedirs(root, exist_ok=True)
+            self._directory: str = tempfile.mkdtemp(prefix="trufflehog_api-", dir=root)
+        except OSError as e:
+            raise TrufflehogApiError('Cannot create scratch space in {0}: {1}'.format(root, e))
+        self._max_bytes: Optional[int] = max_bytes
+        self._min_free_bytes: Optional[int] = min_free_bytes
+        self._wait_timeout: Optional[float] = wait_timeout
+        self._leases: Dict[str, int] = dict()
+        self._pending_bytes: int = 0
+        self._last_measured: int = 0
+        self._worker_directories: Dict[int, str] = dict()
+        self._counter = itertools.count()
+        self._changed = threading.Condition()
+        self._deletions: queue.Queue = queue.Queue()
+        self._cleaner: Optional[threading.Thread] = None
+
+    @property
+    def directory(self) -> str:
+        """
+        :return: the directory all scratch directories are created in
+        """
+        return self._directory
+
+    @property
+    def usage(self) -> int:
+        """
+        :return: bytes used by directories in use or waiting to be deleted
+        """
+        with self._changed:
+            return self._usage()
+
+    @property
+    def pending_deletions(self) -> int:
+        """
+        :return: number of released directories not deleted yet
+        """
+        return self._deletions.unfinished_tasks
+
+    def acquire(self, expected_bytes: int = None) -> str:
+        """Creates an empty directory in the calling thread's worker directory, waiting
+        while the scratch space has no room for it
+
+        :param int expected_bytes:
+            Estimated size of what will be put in the directory, reserved until it is
+            measured (default is None, the size of the directory measured last)
+
+        :raises TrufflehogApiError:
+            if there is no room after wait_timeout seconds
+
+        :return: path of the new directory, hand it back with release
+        """
+        deadline = None if self._wait_timeout is None else time.monotonic() + self._wait_timeout
+        with self._changed:
+            reserved = self._last_measured if expected_bytes is None else expected_bytes
+            while not self._has_room(reserved):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TrufflehogApiError('Scratch space quota exceeded in {0}: {1} bytes in use'
+                                             .format(self._directory, self._usage()))
+                # Free space is also released by other processes, so poll as well
+                self._changed.wait(1.0 if remaining is None else min(remaining, 1.0))
+            path = os.path.join(self._worker_directory(),
+                                "clone-{0}".format(next(self._counter)))
+            self._leases[path] = reserved
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            self.release(path)
+            raise TrufflehogApiError('Cannot create scratch directory {0}: {1}'.format(path, e))
+        return path
+
+    def measure(self, path: str) -> int:
+        """Records the size of an acquired directory, e.g. once a clone into it finished,
+        in place of the size reserved for it
+
+        :param str path:
+            Directory returned by acquire
+
+        :return: its size in bytes
+        """
+        size = _directory_size(path)
+        with self._changed:
+            if path in self._leases:
+                self._leases[path] = size
+            self._last_measured = size
+            # The reservation may have been larger than the directory
+            self._changed.notify_all()
+        return size
+
+    def release(self, path: str):
+        """Hands a directory back. It is renamed out of the worker directory right away
+        and deleted by a background thread.
+
+        :param str path:
+            Directory returned by acquire
+        """
+        trash_path = os.path.join(self._directory, "trash-{0}".format(uuid.uuid4().hex))
+        try:
+            os.rename(path, trash_path)
+        except OSError:
+            trash_path = path
+        with self._changed:
+            size = self._leases.pop(path, 0)
+            self._pending_bytes += size
+            if self._cleaner is None:
+                self._cleaner = threading.Thread(target=self._clean, name="scratch-cleaner",
+                                                 daemon=True)
+                self._cleaner.start()
+        self._deletions.put((trash_path, size))
+
+    def drain(self):
+        """Blocks until every released directory has been deleted"""
+        self._deletions.join()
+
+    def close(self):
+        """Waits for the pending deletions and removes the scratch space directory"""
+        if self._cleaner is not None:
+            self._deletions.put(None)
+            self._cleaner.join()
+            self._cleaner = None
+        _remove_tree(self._directory)
+
+    def _usage(self) -> int:
+        return sum(self._leases.values()) + self._pending_bytes
+
+    def _has_room(self, reserved: int) -> bool:
+        """:return: True if a directory of reserved bytes fits in the quota, or nothing
+        else is in use"""
+        if self._max_bytes is not None:
+            usage = self._usage()
+            if usage >= self._max_bytes or (usage > 0 and usage + reserved > self._max_bytes):
+                return False
+        if self._min_free_bytes is not None:
+            return shutil.disk_usage(self._directory).free >= self._min_free_bytes
+        return True
+
+    def _worker_directory(self) -> str:
+        """Directory reused by every clone of the calling thread"""
+        ident = threading.get_ident()
+        directory = self._worker_directories.get(ident)
+        if directory is None:
+            directory = os.path.join(self._directory,
+                                     "worker-{0}".format(len(self._worker_directories)))
+            self._worker_directories[ident] = directory
+        return directory
+
+    def _clean(self):
+        while True:
+            item = self._deletions.get()
+            try:
+                if item is None:
+                    return
+                path, size = item
+                _remove_tree(path)
+                with self._changed:
+                    self._pending_bytes -= size
+                    self._changed.notify_all()
+            finally:
+                self._deletions.task_done()
+
+
+def _remove_tree(path: str):
+    """Deletes a directory tree, including the read only files git creates"""
+    def del_rw(func, path, _exc):
+        try:
+            os.chmod(path, stat.S_IWRITE)
+            func(path)
+        except OSError:
+            pass
+    shutil.rmtree(path, onerror=del_rw)
+
+
+def _directory_size(path: str) -> int:
+    size = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:
+                pass
+    return size
@@ -2,12 +2,25 @@
 Contains the SearchConfig class that specifies the configurations for
 finding secrets
 """
+import hashlib
 import json
 from copy import copy
 from typing import List, Dict
 
-from truffleHogRegexes.regexChecks import regexes as default_regexes
 
+# History walking backends understood by find_secrets
+GIT_LOG_BACKEND = "git_log"
+TRUFFLEHOG_BACKEND = "truffleHog"
+SCAN_BACKENDS = (GIT_LOG_BACKEND, TRUFFLEHOG_BACKEND)
+
+# truffleHog's entropy check: runs of more than 20 base64 or hex characters are
+# reported above these Shannon entropies
+DEFAULT_ENTROPY_MIN_LENGTH = 21
+DEFAULT_BASE64_ENTROPY_THRESHOLD = 4.5
+DEFAULT_HEX_ENTROPY_THRESHOLD = 3.0
+
+# truffleHogRegexes' table, imported on first use
+_default_regexes: Dict[str, str] = None
 
 class SearchConfig:
     """Class to hold trufflehog_api's search configurations
@@ -18,7 +31,17 @@ class SearchConfig:
                  include_search_paths: List[str] = None,
                  exclude_search_paths: List[str] = None,
                  entropy_checks_enabled: bool = True,
-                 regexes: Dict[str, str] = None):
+                 regexes: Dict[str, str] = None,
+                 scan_backend: str = GIT_LOG_BACKEND,
+                 regex_time_budget: float = None,
+                 regex_backend: str = "re",
+                 baseline_path: str = None,
+                 max_hunk_bytes: int = None,
+                 max_findings_in_memory: int = None,
+                 added_lines_only: bool = False,
+                 entropy_min_length: int = DEFAULT_ENTROPY_MIN_LENGTH,
+                 base64_entropy_threshold: float = DEFAULT_BASE64_ENTROPY_THRESHOLD,
+                 hex_entropy_threshold: float = DEFAULT_HEX_ENTROPY_THRESHOLD):
         """Creates a new default search configuration object with entropy and regex checks off
 
         :param str max_depth:
@@ -50,6 +73,71 @@ class SearchConfig:
             services. This dict is accessible as a static method SearchConfig.default_regexes().
             Search may be slower than than usual
             (default is None, no regexes to search)
+
+        :param str scan_backend:
+            How the repository history is walked. "git_log" streams the patches of a single
+            ``git log -p`` subprocess per branch through trufflehog_api's own scanner,
+            "truffleHog" delegates to truffleHog.find_strings which builds GitPython diff
+            objects for every commit and fetches from origin first
+            (default is "git_log")
+
+        :param float regex_time_budget:
+            Time in seconds each regex may spend on a single hunk. When set, regexes are
+            profiled against inputs known to cause catastrophic backtracking when the scan
+            starts and dropped with a warning if they exceed the budget, and long hunks are
+            searched in line sized chunks so the budget can be enforced while scanning.
+            Only used by the "git_log" backend
+            (default is None, no time limit)
+
+        :param str regex_backend:
+            Regex engine the regexes and search paths are compiled with: "re", "regex" (the
+            regex module, which also enforces regex_time_budget with match timeouts) or "re2"
+            (linear time matching). Patterns fall back to "re" with a warning when the engine
+            is not installed or cannot compile them
+            (default is "re")
+
+        :param str baseline_path:
+            Path to a baseline file (see trufflehog_api.baseline) listing known findings.
+            Matched strings found in the baseline are dropped before any Secret is built,
+            and a finding left without strings is not reported at all
+            (default is None, every finding is reported)
+
+        :param int max_hunk_bytes:
+            Largest part of a diff held in memory at once. Longer hunks, and single lines
+            longer than this, are read from git and searched in chunks of at most this many
+            bytes, so a huge generated file cannot exhaust memory. Only used by the "git_log"
+            backend
+            (default is None, hunks are read whole)
+
+        :param int max_findings_in_memory:
+            Number of findings kept in memory before further ones spill to a temporary file,
+            see trufflehog_api.memory.SecretSpool. Results are then returned as a SecretSpool
+            instead of a list
+            (default is None, findings are returned as a list)
+
+        :param bool added_lines_only:
+            Only search the lines a commit adds, so secrets are not reported again by the
+            commits removing them and context lines are not searched once per hunk. The
+            added lines are matched as bytes, with the regexes compiled for bytes and a
+            bytes entropy tokenizer, and only hunks with findings are decoded. Only used by
+            the "git_log" backend
+            (default is False, every line of the diff is searched)
+
+        :param int entropy_min_length:
+            Shortest run of base64 or hex characters whose entropy is checked. Lines without
+            such a run are skipped before they are split into words, so longer runs trade
+            recall for speed. Only used by the "git_log" backend
+            (default is 21, truffleHog checks runs of more than 20 characters)
+
+        :param float base64_entropy_threshold:
+            Shannon entropy above which a base64 run is reported. Only used by the "git_log"
+            backend
+            (default is 4.5, as truffleHog)
+
+        :param float hex_entropy_threshold:
+            Shannon entropy above which a hex run is reported. Only used by the "git_log"
+            backend
+            (default is 3.0, as truffleHog)
         """
 
         self._max_depth: int = max_depth
@@ -59,6 +147,16 @@ class SearchConfig:
         self._include_search_paths: List[str] = copy(include_search_paths)
         self._exclude_search_paths: List[str] = copy(exclude_search_paths)
         self._regexes: Dict[str, str] = copy(regexes)
+        self._scan_backend: str = scan_backend
+        self._regex_time_budget: float = regex_time_budget
+        self._regex_backend: str = regex_backend
+        self._baseline_path: str = baseline_path
+        self._max_hunk_bytes: int = max_hunk_bytes
+        self._max_findings_in_memory: int = max_findings_in_memory
+        self._added_lines_only: bool = added_lines_only
+        self._entropy_min_length: int = entropy_min_length
+        self._base64_entropy_threshold: float = base64_entropy_threshold
+        self._hex_entropy_threshold: float = hex_entropy_threshold
 
     @property
     def max_depth(self) -> int:
@@ -99,13 +197,87 @@ class SearchConfig:
         """
         return copy(self._regexes)
 
+    @property
+    def scan_backend(self) -> str:
+        """
+        :return: Returns the name of the backend used to walk the repository history
+        """
+        return self._scan_backend
+
+    @property
+    def regex_time_budget(self) -> float:
+        """
+        :return: Returns the time in seconds each regex may spend on a single hunk
+        """
+        return self._regex_time_budget
+
+    @property
+    def regex_backend(self) -> str:
+        """
+        :return: Returns the name of the regex engine the regexes are compiled with
+        """
+        return self._regex_backend
+
+    @property
+    def baseline_path(self) -> str:
+        """
+        :return: Returns the path to the baseline of known findings to suppress
+        """
+        return self._baseline_path
+
+    @property
+    def max_hunk_bytes(self) -> int:
+        """
+        :return: Returns the largest part of a diff held in memory at once
+        """
+        return self._max_hunk_bytes
+
+    @property
+    def max_findings_in_memory(self) -> int:
+        """
+        :return: Returns the number of findings kept in memory before spilling to disk
+        """
+        return self._max_findings_in_memory
+
+    @property
+    def added_lines_only(self) -> bool:
+        """
+        :return: Returns a boolean value indicating whether only added lines are searched
+        """
+        return self._added_lines_only
+
+    @property
+    def entropy_min_length(self) -> int:
+        """
+        :return: Returns the shortest base64 or hex run whose entropy is checked
+        """
+        return self._entropy_min_length
+
+    @property
+    def base64_entropy_threshold(self) -> float:
+        """
+        :return: Returns the entropy above which a base64 run is reported
+        """
+        return self._base64_entropy_threshold
+
+    @property
+    def hex_entropy_threshold(self) -> float:
+        """
+        :return: Returns the entropy above which a hex run is reported
+        """
+        return self._hex_entropy_threshold
+
     @staticmethod
     def default_regexes() -> Dict[str, str]:
         """
         :return: Returns a copy of the prebuilt regex dict provided by truffleHogRegexes
         library
         """
-        return copy(default_regexes)
+        global _default_regexes  # pylint: disable=global-statement
+        if _default_regexes is None:
+            from truffleHogRegexes.regexChecks import regexes
+            _default_regexes = regexes
+        return copy(_default_regexes)
 
     def __str__(self):
         """
@@ -117,6 +289,16 @@ class SearchConfig:
         config["include_search_paths"] = self._include_search_paths
         config["exclude_search_paths"] = self._exclude_search_paths
         #config["regexes"] = self._regexes
+        config["scan_backend"] = self._scan_backend
+        config["regex_time_budget"] = self._regex_time_budget
+        config["regex_backend"] = self._regex_backend
+        config["baseline_path"] = self._baseline_path
+        config["max_hunk_bytes"] = self._max_hunk_bytes
+        config["max_findings_in_memory"] = self._max_findings_in_memory
+        config["added_lines_only"] = self._added_lines_only
+        config["entropy_min_length"] = self._entropy_min_length
+        config["base64_entropy_threshold"] = self._base64_entropy_threshold
+        config["hex_entropy_threshold"] = self._hex_entropy_threshold
         config_string = json.dumps(config, indent=2)
         return config_string
 
@@ -145,8 +327,34 @@ class SearchConfig:
         config_dict["include_search_paths"] = self._include_search_paths
         config_dict["exclude_search_paths"] = self._exclude_search_paths
         config_dict["regexes"] = self._regexes
+        config_dict["scan_backend"] = self._scan_backend
+        config_dict["regex_time_budget"] = self._regex_time_budget
+        config_dict["regex_backend"] = self._regex_backend
+        config_dict["baseline_path"] = self._baseline_path
+        config_dict["max_hunk_bytes"] = self._max_hunk_bytes
+        config_dict["max_findings_in_memory"] = self._max_findings_in_memory
+        config_dict["added_lines_only"] = self._added_lines_only
+        config_dict["entropy_min_length"] = self._entropy_min_length
+        config_dict["base64_entropy_threshold"] = self._base64_entropy_threshold
+        config_dict["hex_entropy_threshold"] = self._hex_entropy_threshold
         return config_dict
 
+    def fingerprint(self) -> str:
+        """
+        :return: Returns a sha256 hex digest of all the attributes of the SearchConfig,
+        equal for equal configurations across processes. Compiled regexes are
+        represented by their pattern and flags, and max_findings_in_memory, which does
+        not change the findings, is left out.
+        """
+        config_dict = self.to_dict()
+        del config_dict["max_findings_in_memory"]
+        if self._regexes:
+            config_dict["regexes"] = {
+                description: regex if isinstance(regex, str) else [regex.pattern, regex.flags]
+                for description, regex in self._regexes.items()}
+        config_string = json.dumps(config_dict, sort_keys=True, default=str)
+        return hashlib.sha256(config_string.encode('utf-8')).hexdigest()
+
     @staticmethod
     def from_dict(config_dict: dict):
         """
@@ -159,7 +367,17 @@ class SearchConfig:
             "include_search_paths": list, \t
             "exclude_search_paths": list, \t
             "entropy_checks_enabled": bool,\t
-            "regexes": string \t
+            "regexes": string, \t
+            "scan_backend": string, \t
+            "regex_time_budget": float, \t
+            "regex_backend": string, \t
+            "baseline_path": string, \t
+            "max_hunk_bytes": int, \t
+            "max_findings_in_memory": int, \t
+            "added_lines_only": bool, \t
+            "entropy_min_length": int, \t
+            "base64_entropy_threshold": float, \t
+            "hex_entropy_threshold": float \t
         } \t
 
         :param dict input_config:
@@ -172,6 +390,16 @@ class SearchConfig:
         exclude_search_paths = None
         entropy_checks_enabled = True
         regexes = None
+        scan_backend = GIT_LOG_BACKEND
+        regex_time_budget = None
+        regex_backend = "re"
+        baseline_path = None
+        max_hunk_bytes = None
+        max_findings_in_memory = None
+        added_lines_only = False
+        entropy_min_length = DEFAULT_ENTROPY_MIN_LENGTH
+        base64_entropy_threshold = DEFAULT_BASE64_ENTROPY_THRESHOLD
+        hex_entropy_threshold = DEFAULT_HEX_ENTROPY_THRESHOLD
 
         if "max_depth" in config_dict:
             max_depth = config_dict["max_depth"]
@@ -186,6 +414,26 @@ class SearchConfig:
                 regexes = SearchConfig.default_regexes()
             else:
                 regexes = config_dict["regexes"]
+        if "scan_backend" in config_dict:
+            scan_backend = config_dict["scan_backend"]
+        if "regex_time_budget" in config_dict:
+            regex_time_budget = config_dict["regex_time_budget"]
+        if "regex_backend" in config_dict:
+            regex_backend = config_dict["regex_backend"]
+        if "baseline_path" in config_dict:
+            baseline_path = config_dict["baseline_path"]
+        if "max_hunk_bytes" in config_dict:
+            max_hunk_bytes = config_dict["max_hunk_bytes"]
+        if "max_findings_in_memory" in config_dict:
+            max_findings_in_memory = config_dict["max_findings_in_memory"]
+        if "added_lines_only" in config_dict:
+            added_lines_only = config_dict["added_lines_only"]
+        if "entropy_min_length" in config_dict:
+            entropy_min_length = config_dict["entropy_min_length"]
+        if "base64_entropy_threshold" in config_dict:
+            base64_entropy_threshold = config_dict["base64_entropy_threshold"]
+        if "hex_entropy_threshold" in config_dict:
+            hex_entropy_threshold = config_dict["hex_entropy_threshold"]
 
         config = SearchConfig(
             max_depth=max_depth,
@@ -193,6 +441,16 @@ class SearchConfig:
             exclude_search_paths=exclude_search_paths,
             entropy_checks_enabled=entropy_checks_enabled,
             regexes=regexes,
+            scan_backend=scan_backend,
+            regex_time_budget=regex_time_budget,
+            regex_backend=regex_backend,
+            baseline_path=baseline_path,
+            max_hunk_bytes=max_hunk_bytes,
+            max_findings_in_memory=max_findings_in_memory,
+            added_lines_only=added_lines_only,
+            entropy_min_length=entropy_min_length,
+            base64_entropy_threshold=base64_entropy_threshold,
+            hex_entropy_threshold=hex_entropy_threshold,
         )
 
         return config
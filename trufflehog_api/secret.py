@@ -0,0 +1,240 @@
+"""
+Contains the Secret class which describes a single finding produced by a
+search, independent of the backend that walked the repository history.
+"""
+import datetime
+import hashlib
+from typing import List
+
+# Characters stripped from matched strings before they are fingerprinted, so that the
+# same secret quoted differently or with a trailing separator gets one fingerprint
+_NORMALIZE_STRIP = " \t\r\n'\"`,;"
+
+
+def normalize_string(string: str) -> str:
+    """Normalizes a matched string for fingerprinting
+
+    :param str string:
+        String matched by a regex or entropy check
+
+    :return: the string without surrounding whitespace, quotes and separators
+    """
+    return string.strip(_NORMALIZE_STRIP)
+
+
+def fingerprint(reason: str, string_found: str, path: str) -> str:
+    """Computes the stable fingerprint of a matched string. The commit, branch and diff
+    are deliberately left out so the same secret seen in many commits shares a
+    fingerprint, and so are the other strings matched in the same hunk. This is the one
+    definition used by Secret, SecretIndex, Baseline and the FindingsStore.
+
+    :param str reason:
+        Reason why the secret was flagged
+
+    :param str string_found:
+        String matched by the check, empty for findings without matched strings
+
+    :param str path:
+        Path to file in which the secret was found
+
+    :return: hex encoded sha256 of the reason, the path and the normalized string
+    """
+    digest = hashlib.sha256()
+    for part in (reason, path, normalize_string(string_found)):
+        digest.update(part.encode('utf-8', errors='replace'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class Secret:
+    """
+    A secret found in a repository. Contains information about where the secret
+    is found and why it was flagged.
+    """
+
+    def __init__(self, *,
+                 commit_time: datetime.datetime,
+                 branch_name: str,
+                 commit: str,
+                 diff: str,
+                 commit_hash: str,
+                 reason: str,
+                 path: str,
+                 strings_found: List[str] = None):
+        """Creates a new Secret
+
+        :param str commit_time:
+            Time when the secret was committed
+
+        :param str branch_name:
+            Branch where the secret was committed
+
+        :param str commit:
+            Commit where the secret was found
+
+        :param str diff:
+            Git diff where secret can be found
+
+        :param str commit_hash:
+            Commit hash for the commit where the secret was found
+
+        :param str reason:
+            Reason why the secret was flagged (Eg. regex description or High Entropy)
+
+        :param str path:
+            Path to file in which secret can be found
+
+        :param list strings_found:
+            Strings matched by the check that flagged the secret
+            (default is None, no strings recorded)
+        """
+        self._commit_time: datetime.datetime = commit_time
+        self._branch_name: str = branch_name
+        self._commit: str = commit
+        self._diff: str = diff
+        self._commit_hash: str = commit_hash
+        self._reason: str = reason
+        self._path: str = path
+        self._strings_found: List[str] = list(strings_found or [])
+        self._fingerprints: List[str] = None
+
+    @property
+    def commit_time(self) -> datetime.datetime:
+        """
+        :return: time when the secret was committed
+        """
+        return self._commit_time
+
+    @property
+    def branch_name(self) -> str:
+        """
+        :return: branch where the secret was committed
+        """
+        return self._branch_name
+
+    @property
+    def commit(self) -> str:
+        """
+        :return: commit where the secret was found
+        """
+        return self._commit
+
+    @property
+    def diff(self) -> str:
+        """
+        :return: git diff where secret can be found
+        """
+        return self._diff
+
+    @property
+    def commit_hash(self) -> str:
+        """
+        :return: commit hash for the commit where the secret was found
+        """
+        return self._commit_hash
+
+    @property
+    def reason(self) -> str:
+        """
+        :return: reason why the secret was flagged
+        (Eg. regex description or High Entropy)
+        """
+        return self._reason
+
+    @property
+    def path(self) -> str:
+        """
+        :return: path to file in which secret can be found
+        """
+        return self._path
+
+    @property
+    def strings_found(self) -> List[str]:
+        """
+        :return: copy of the strings matched by the check that flagged the secret
+        """
+        return list(self._strings_found)
+
+    @property
+    def fingerprints(self) -> List[str]:
+        """
+        :return: the fingerprint of every distinct matched string, in the order the
+        strings were found (a single fingerprint of the reason and path for secrets
+        without matched strings), see fingerprint
+        """
+        if self._fingerprints is None:
+            fingerprints = dict()
+            for string_found in self._strings_found or [""]:
+                fingerprints[fingerprint(self._reason, string_found, self._path)] = None
+            self._fingerprints = list(fingerprints)
+        return list(self._fingerprints)
+
+    def to_dict(self):
+        """
+        :return: Returns a dict containing all the attributes of a Secret
+        """
+        secret_dict = dict()
+        secret_dict["commit_time"] = self._commit_time
+        secret_dict["branch_name"] = self._branch_name
+        secret_dict["commit"] = self._commit
+        secret_dict["diff"] = self._diff
+        secret_dict["commit_hash"] = self._commit_hash
+        secret_dict["reason"] = self._reason
+        secret_dict["path"] = self._path
+        secret_dict["strings_found"] = list(self._strings_found)
+        secret_dict["fingerprints"] = self.fingerprints
+        return secret_dict
+
+    @staticmethod
+    def from_dict(secret_dict: dict):
+        """
+        Takes a dictionary as produced by to_dict and generates a Secret object
+
+        :param dict secret_dict:
+            The attributes of the Secret, the fingerprints are recomputed
+
+        :return: Returns a Secret with the attributes of the dict
+        """
+        return Secret(commit_time=secret_dict["commit_time"],
+                      branch_name=secret_dict["branch_name"],
+                      commit=secret_dict["commit"],
+                      diff=secret_dict["diff"],
+                      commit_hash=secret_dict["commit_hash"],
+                      reason=secret_dict["reason"],
+                      path=secret_dict["path"],
+                      strings_found=secret_dict.get("strings_found"))
+
+    def __str__(self):
+        """
+        :return: Returns a string containing all the attributes of a Secret
+        besides the diff.
+        """
+        return ("commit_time: {commit_time}\n"
+                "branch_name: {branch_name}\n"
+                "commit: {commit}\n"
+                "commit_hash: {commit_hash}\n"
+                "reason: {reason}\n"
+                "path: {path}\n".format(commit_time=self._commit_time,
+                                        branch_name=self._branch_name,
+                                        commit=self._commit.strip('\n'),
+                                        commit_hash=self._commit_hash,
+                                        reason=self._reason,
+                                        path=self._path))
+
+    def __repr__(self):
+        """
+        :return: Returns a string containing all the attributes of a Secret
+        """
+        return ("Secret(commit_time={commit_time}, "
+                "branch_name={branch_name}, "
+                "commit={commit}, "
+                "commit_hash={commit_hash}, "
+                "diff={diff}, "
+                "reason={reason},"
+                "path={path})".format(commit_time=self._commit_time,
+                                      branch_name=self._branch_name,
+                                      commit=self._commit,
+                                      commit_hash=self._commit_hash,
+                                      diff=self._diff,
+                                      reason=self._reason,
+                                      path=self._path))
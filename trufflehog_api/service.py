@@ -0,0 +1,652 @@
+"""
+Long running scan service. Jobs are FindSecretsRequest dicts submitted over a
+local HTTP API (on a TCP port or a Unix socket), queued by priority and run
+by a pool of worker threads that share compiled Scanners and mirror clones
+between jobs. Results are streamed back as JSON lines while a job runs.
+
+    python -m trufflehog_api.service --port 8765 --workers 4 --mirror-dir mirrors
+
+Endpoints
+
+    POST   /jobs                 submit {"path", "repo_config", "search_config",
+                                 "priority"}, returns the job status
+    GET    /jobs                 status of every known job
+    GET    /jobs/<id>            status of a job
+    GET    /jobs/<id>/results    Secret.to_dict() JSON lines, streamed until the job ends
+    DELETE /jobs/<id>            cancel a queued or running job
+    POST   /scan                 submit a job and stream its results in the same response
+    GET    /health               queue length and worker count
+    GET    /metrics              metrics.default_registry() in the Prometheus text format
+"""
+import argparse
+import http.server
+import itertools
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.metrics import CONTENT_TYPE, default_registry, scan_metrics
+from trufflehog_api.find_secrets import iter_find_secrets_request
+from trufflehog_api.mirror import MirrorCache
+from trufflehog_api.regex_profile import RegexProfile
+from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.repository import (FindSecretsRequest, authenticated_url,
+                                       is_local_repository, result_cache_key)
+from trufflehog_api.result_cache import ResultCache
+from trufflehog_api.scanner import Scanner
+from trufflehog_api.search_config import GIT_LOG_BACKEND, SearchConfig
+from trufflehog_api.secret import Secret
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_FINISHED = (DONE, FAILED, CANCELLED)
+_STOP = object()
+
+
+class ScanJob:
+    """A submitted request together with its state and the secrets found so far.
+    Readers can follow the results while the job is running with iter_results.
+    """
+
+    def __init__(self, request: FindSecretsRequest, priority: int = 0):
+        """Creates a new queued ScanJob
+
+        :param FindSecretsRequest request:
+            Request to execute
+
+        :param int priority:
+            Jobs with a higher priority are started first (default is 0)
+        """
+        self._id: str = uuid.uuid4().hex
+        self._request: FindSecretsRequest = request
+        self._priority: int = priority
+        self._status: str = QUEUED
+        self._error: Optional[str] = None
+        self._secrets: List[Secret] = []
+        self._submitted: float = time.time()
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+        self._cache_hit: bool = False
+        self._changed = threading.Condition()
+
+    @property
+    def id(self) -> str:
+        """
+        :return: unique identifier of the job
+        """
+        return self._id
+
+    @property
+    def request(self) -> FindSecretsRequest:
+        """
+        :return: the request the job executes
+        """
+        return self._request
+
+    @property
+    def priority(self) -> int:
+        """
+        :return: priority of the job, higher runs first
+        """
+        return self._priority
+
+    @property
+    def status(self) -> str:
+        """
+        :return: one of "queued", "running", "done", "failed" or "cancelled"
+        """
+        return self._status
+
+    @property
+    def error(self) -> Optional[str]:
+        """
+        :return: message of the error that failed the job, if any
+        """
+        return self._error
+
+    @property
+    def finished(self) -> bool:
+        """
+        :return: True once the job is done, failed or cancelled
+        """
+        return self._status in _FINISHED
+
+    @property
+    def cache_hit(self) -> bool:
+        """
+        :return: True if the secrets of the job were read from the ResultCache
+        """
+        return self._cache_hit
+
+    def secrets(self) -> List[Secret]:
+        """
+        :return: copy of the list of secrets found so far
+        """
+        with self._changed:
+            return list(self._secrets)
+
+    def wait(self, timeout: float = None) -> bool:
+        """Blocks until the job is finished
+
+        :param float timeout:
+            Seconds to wait at most (default is None, no limit)
+
+        :return: True if the job is finished
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: self.finished, timeout)
+
+    def iter_results(self) -> Iterator[Secret]:
+        """
+        :return: generator of every secret of the job, waiting for new secrets until
+        the job is finished
+        """
+        position = 0
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: len(self._secrets) > position or self.finished)
+                secrets = self._secrets[position:]
+                finished = self.finished
+            yield from secrets
+            position += len(secrets)
+            if finished and not secrets:
+                return
+
+    def cancel(self):
+        """Cancels the job. A running job stops at its next secret."""
+        with self._changed:
+            if not self.finished:
+                self._set_status(CANCELLED)
+
+    def to_dict(self):
+        """
+        :return: A dict with the state of the job
+        """
+        job_dict = dict()
+        job_dict["job_id"] = self._id
+        job_dict["path"] = self._request.path
+        job_dict["priority"] = self._priority
+        job_dict["status"] = self._status
+        job_dict["error"] = self._error
+        job_dict["secrets_found"] = len(self._secrets)
+        job_dict["cache_hit"] = self._cache_hit
+        job_dict["submitted"] = self._submitted
+        job_dict["started"] = self._started
+        job_dict["finished"] = self._finished
+        return job_dict
+
+    def start(self) -> bool:
+        """Marks a queued job as running, called by the worker that picked it up
+
+        :return: False if the job is no longer queued, e.g. because it was cancelled
+        """
+        with self._changed:
+            if self._status != QUEUED:
+                return False
+            self._started = time.time()
+            self._set_status(RUNNING)
+            return True
+
+    def add(self, secret: Secret) -> bool:
+        """Appends a secret found by the running job and wakes up its readers
+
+        :param Secret secret:
+            The secret found
+
+        :return: False if the job is no longer running, e.g. because it was cancelled
+        """
+        with self._changed:
+            if self._status != RUNNING:
+                return False
+            self._secrets.append(secret)
+            self._changed.notify_all()
+            return True
+
+    def finish(self, error: str = None):
+        """Ends the running job, nothing happens if it is no longer running
+
+        :param str error:
+            Message of the error that failed the job (default is None, the job is done)
+        """
+        with self._changed:
+            if self._status != RUNNING:
+                return
+            self._error = error
+            self._set_status(FAILED if error else DONE)
+
+    def finish_from_cache(self, secrets: List[Secret]):
+        """Ends the running job with the secrets a ResultCache stored for its request
+
+        :param list secrets:
+            The cached secrets
+        """
+        with self._changed:
+            if self._status != RUNNING:
+                return
+            self._cache_hit = True
+            self._secrets.extend(secrets)
+            self._set_status(DONE)
+
+    def _set_status(self, status: str):
+        self._status = status
+        if status in _FINISHED:
+            self._finished = time.time()
+        self._changed.notify_all()
+
+    def __repr__(self):
+        return "ScanJob(id={0}, path={1}, priority={2}, status={3})".format(
+            self._id, self._request.path, self._priority, self._status)
+
+
+class ScanService:
+    """Runs ScanJobs on a pool of worker threads. Scanners are cached by SearchConfig
+    fingerprint and, with a mirror directory, remote repositories are kept as mirror
+    clones that are only fetched into for later jobs.
+    """
+
+    def __init__(self,
+                 workers: int = 2,
+                 mirror_dir: str = None,
+                 result_cache: ResultCache = None,
+                 max_finished_jobs: int = 1000,
+                 max_scanners: int = 32):
+        """Creates a new ScanService, call start to run the workers
+
+        :param int workers:
+            Number of jobs run concurrently (default is 2)
+
+        :param str mirror_dir:
+            Directory to keep mirror clones of remote repositories in
+            (default is None, remote repositories are cloned for every job)
+
+        :param ResultCache result_cache:
+            Optional cache of whole-scan results shared by the jobs
+
+        :param int max_finished_jobs:
+            Number of finished jobs kept for status and result queries (default is 1000)
+
+        :param int max_scanners:
+            Number of compiled Scanners kept warm (default is 32)
+        """
+        self._workers: int = workers
+        self._mirrors: Optional[MirrorCache] = MirrorCache(mirror_dir) if mirror_dir else None
+        self._result_cache: Optional[ResultCache] = result_cache
+        self._max_finished_jobs: int = max_finished_jobs
+        self._max_scanners: int = max_scanners
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._jobs: Dict[str, ScanJob] = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._scanners: Dict[Tuple, Scanner] = OrderedDict()
+        self._scanners_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        if result_cache is not None:
+            scan_metrics().watch_result_cache(result_cache)
+
+    @property
+    def workers(self) -> int:
+        """
+        :return: number of jobs run concurrently
+        """
+        return self._workers
+
+    @property
+    def mirrors(self) -> Optional[MirrorCache]:
+        """
+        :return: the mirror clones of remote repositories, None if disabled
+        """
+        return self._mirrors
+
+    def start(self):
+        """Starts the worker threads"""
+        if self._threads:
+            return
+        for number in range(self._workers):
+            thread = threading.Thread(target=self._work, name="scan-worker-{0}".format(number),
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        """Cancels the queued jobs and stops the workers once their jobs are finished
+
+        :param float timeout:
+            Seconds to wait for every worker (default is None, no limit)
+        """
+        with self._jobs_lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if job.status == QUEUED:
+                job.cancel()
+        for _ in self._threads:
+            self._queue.put((float("inf"), next(self._sequence), _STOP))
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, request: FindSecretsRequest, priority: int = 0) -> ScanJob:
+        """Queues a request
+
+        :param FindSecretsRequest request:
+            Request to execute
+
+        :param int priority:
+            Jobs with a higher priority are started first, equal priorities in order
+            of submission (default is 0)
+
+        :return: the queued job
+        """
+        job = ScanJob(request, priority)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            self._forget_finished_jobs()
+        self._queue.put((-priority, next(self._sequence), job))
+        return job
+
+    def job(self, job_id: str) -> Optional[ScanJob]:
+        """
+        :return: the job with the given id, None if unknown or forgotten
+        """
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[ScanJob]:
+        """
+        :return: every known job in order of submission
+        """
+        with self._jobs_lock:
+            return list(self._jobs.values())
+
+    def queue_length(self) -> int:
+        """
+        :return: number of jobs waiting for a worker
+        """
+        with self._jobs_lock:
+            return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def scanner_for(self, search_config: SearchConfig) -> Scanner:
+        """Returns the cached Scanner of a SearchConfig, building it on first use. A
+        changed baseline file gives a new Scanner.
+
+        :param SearchConfig search_config:
+            Configuration of the checks
+
+        :return: a Scanner shared by every job with an equal configuration
+        """
+        key = (search_config.fingerprint(), _modification_time(search_config.baseline_path))
+        with self._scanners_lock:
+            scanner = self._scanners.get(key)
+            if scanner is not None:
+                self._scanners.move_to_end(key)
+                return scanner
+        scanner = Scanner(search_config, RegexProfile())
+        with self._scanners_lock:
+            scanner = self._scanners.setdefault(key, scanner)
+            while len(self._scanners) > self._max_scanners:
+                self._scanners.popitem(last=False)
+        return scanner
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is _STOP:
+                return
+            if job.start():
+                self._run(job)
+
+    def _run(self, job: ScanJob):
+        """Executes a job, appending its secrets as they are found, and records it in the
+        ScanMetrics
+        """
+        metrics = scan_metrics()
+        in_flight = metrics.jobs_in_flight.labels("scan")
+        in_flight.inc()
+        start = time.monotonic()
+        try:
+            self._execute(job)
+        finally:
+            in_flight.dec()
+            if job.status == DONE and job.cache_hit:
+                metrics.repositories.labels("cached").inc()
+            elif job.status in (DONE, FAILED):
+                metrics.scan_seconds.observe(time.monotonic() - start)
+                metrics.repositories.labels("succeeded" if job.status == DONE
+                                            else "failed").inc()
+
+    def _execute(self, job: ScanJob):
+        request = job.request
+        search_config = request.search_config or SearchConfig()
+        try:
+            key = result_cache_key(request) if self._result_cache is not None else None
+            if key is not None:
+                cached = self._result_cache.get(key)
+                if cached is not None:
+                    job.finish_from_cache(cached)
+                    return
+
+            scanner = None
+            if search_config.scan_backend == GIT_LOG_BACKEND:
+                scanner = self.scanner_for(search_config)
+            secrets = iter_find_secrets_request(self._local_request(request), scanner=scanner)
+            try:
+                for secret in secrets:
+                    if not job.add(secret):
+                        return
+            finally:
+                secrets.close()
+            if key is not None and job.status == RUNNING:
+                self._result_cache.put(key, job.secrets())
+            job.finish()
+        except TrufflehogApiError as e:
+            job.finish(str(e) or repr(e))
+        except Exception as e:  # pylint: disable=broad-except
+            job.finish(repr(e))
+
+    def _local_request(self, request: FindSecretsRequest) -> FindSecretsRequest:
+        """Points a request for a remote repository at its updated mirror clone"""
+        if self._mirrors is None or is_local_repository(request.path):
+            return request
+        repo_config = request.repo_config or RepoConfig()
+        start = time.monotonic()
+        mirror_path = self._mirrors.update(request.path,
+                                           authenticated_url(request.path, repo_config))
+        scan_metrics().clone_seconds.observe(time.monotonic() - start)
+        return FindSecretsRequest(mirror_path, repo_config=repo_config,
+                                  search_config=request.search_config)
+
+    def _forget_finished_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self._max_finished_jobs)]:
+            del self._jobs[job_id]
+
+
+class ScanRequestHandler(http.server.BaseHTTPRequestHandler):
+    """HTTP front end of the ScanService stored on the server"""
+
+    server_version = "trufflehog_api"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serves the health, metrics and job status endpoints and streams job results"""
+        service = self.server.service
+        parts = self._path_parts()
+        if parts == ["health"]:
+            self._send_json(200, {"status": "ok", "queued": service.queue_length(),
+                                  "workers": service.workers})
+        elif parts == ["metrics"]:
+            data = default_registry().render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif parts == ["jobs"]:
+            self._send_json(200, [job.to_dict() for job in service.jobs()])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self._find_job(parts[1])
+            if job:
+                self._send_json(200, job.to_dict())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "results":
+            job = self._find_job(parts[1])
+            if job:
+                self._stream_results(job)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Submits a job, answering with its status (/jobs) or streaming its results
+        (/scan); answers 400 if the body is not a valid FindSecretsRequest dict
+        """
+        parts = self._path_parts()
+        if parts not in (["jobs"], ["scan"]):
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+            priority = int(body.get("priority", 0))
+            request = FindSecretsRequest.from_dict(body)
+        except (ValueError, TypeError, AttributeError, TrufflehogApiError) as e:
+            self._send_json(400, {"error": "Invalid request: {0}".format(e)})
+            return
+        job = self.server.service.submit(request, priority)
+        if parts == ["scan"]:
+            self._stream_results(job)
+        else:
+            self._send_json(202, job.to_dict())
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        """Cancels a job and answers with its status"""
+        parts = self._path_parts()
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = self._find_job(parts[1])
+            if job:
+                job.cancel()
+                self._send_json(200, job.to_dict())
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Logs requests to stderr only if the server is verbose"""
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def address_string(self):
+        """
+        :return: the client address for the log, "unix" for Unix socket clients, which
+        have no address
+        """
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _path_parts(self) -> List[str]:
+        return [part for part in self.path.split("?", 1)[0].split("/") if part]
+
+    def _find_job(self, job_id: str) -> Optional[ScanJob]:
+        job = self.server.service.job(job_id)
+        if job is None:
+            self._send_json(404, {"error": "Unknown job {0}".format(job_id)})
+        return job
+
+    def _send_json(self, code: int, body):
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream_results(self, job: ScanJob):
+        """Writes one JSON line per secret as they are found, then a final status line.
+        The response has no length, the end of the body is marked by closing the
+        connection.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("X-Job-Id", job.id)
+        self.end_headers()
+        try:
+            for secret in job.iter_results():
+                self.wfile.write(json.dumps(secret.to_dict(), default=str).encode("utf-8")
+                                 + b"\n")
+                self.wfile.flush()
+            self.wfile.write(json.dumps({"job": job.to_dict()}).encode("utf-8") + b"\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+
+class ScanHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """Threaded HTTP server on a TCP port in front of a ScanService"""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: ScanService, verbose: bool = False):
+        self.service = service
+        self.verbose = verbose
+        super().__init__(address, ScanRequestHandler)
+
+
+class UnixScanHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded HTTP server on a Unix socket in front of a ScanService"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: ScanService, verbose: bool = False):
+        self.service = service
+        self.verbose = verbose
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, ScanRequestHandler)
+
+
+def _modification_time(path: Optional[str]) -> Optional[float]:
+    try:
+        return os.path.getmtime(path) if path else None
+    except OSError:
+        return None
+
+
+def main(argv: List[str] = None):
+    """Runs the scan service until interrupted"""
+    parser = argparse.ArgumentParser(description="Run the trufflehog_api scan service")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port to listen on")
+    parser.add_argument("--unix-socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=2, help="jobs run concurrently")
+    parser.add_argument("--mirror-dir", help="keep mirror clones of remote repositories here")
+    parser.add_argument("--cache-dir", help="cache whole-scan results here")
+    parser.add_argument("--cache-ttl", type=float, help="seconds cached results stay valid")
+    parser.add_argument("--verbose", action="store_true", help="log every HTTP request")
+    args = parser.parse_args(argv)
+
+    result_cache = ResultCache(args.cache_dir, ttl=args.cache_ttl) if args.cache_dir else None
+    service = ScanService(workers=args.workers, mirror_dir=args.mirror_dir,
+                          result_cache=result_cache)
+    if args.unix_socket:
+        server = UnixScanHTTPServer(args.unix_socket, service, args.verbose)
+        print("Listening on {0}".format(args.unix_socket))
+    else:
+        server = ScanHTTPServer((args.host, args.port), service, args.verbose)
+        print("Listening on http://{0}:{1}".format(*server.server_address[:2]))
+    service.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Jobs of a ScanPipeline run, and the shards long histories are split into. A
+repository with more commits than the scheduler's shard_commits is searched as
+several slices of one walk of its history, each a job of its own on the scan
+queue; the last shard to finish hands the secrets of all of them, in walk
+order, to the job they belong to.
+"""
+import itertools
+import threading
+from typing import List, Optional, Sequence
+
+from trufflehog_api import git_log
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.memory import collect_secrets
+from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.repository import FindSecretsRequest
+from trufflehog_api.search_config import SearchConfig
+from trufflehog_api.secret import Secret
+
+
+class PipelineJob:
+    """A request, or a shard of one, on its way through the pipeline"""
+
+    def __init__(self, index: int, request: FindSecretsRequest, future, host: Optional[str]):
+        """Creates a new PipelineJob
+
+        :param int index:
+            Position of the request in the batch
+
+        :param FindSecretsRequest request:
+            The request
+
+        :param future:
+            Future completed with the request's secrets, None for a shard
+
+        :param str host:
+            Host of a remote repository, see repository_host (None for a local path)
+        """
+        self.index: int = index
+        self.request: FindSecretsRequest = request
+        self.future = future
+        self.host: Optional[str] = host
+        self.repo = None
+        self.repo_path: str = request.path
+        self.cache_key: Optional[str] = None
+        self.cost: float = 0.0
+        # Estimated size of the repository, reserved in the scratch space while cloning
+        self.size: Optional[int] = None
+        self.busy: float = 0.0
+        # Shards: the job they belong to, their number and their slice of its walk
+        self.parent: Optional[PipelineJob] = None
+        self.shard_number: int = 0
+        self.walk_slice = None
+        # Sharded jobs: the secrets of every shard and the number still running
+        self.shard_results: List[Optional[List[Secret]]] = []
+        self.remaining: int = 0
+        # Shared walks: the jobs of the requests searched together, whose futures are
+        # completed from this job's list of their results
+        self.members: List[PipelineJob] = []
+        # Fork groups: the group of a fetched remote member, local ones are grouped when
+        # they are searched
+        self.fork_group: Optional[str] = None
+        self.lock = threading.Lock()
+
+
+def split_job(job: PipelineJob, shard_commits: int) -> List[PipelineJob]:
+    """Splits the walk of a cloned or local repository into shards of about
+    shard_commits commits
+
+    :param PipelineJob job:
+        Job of a request with the "git_log" scan backend
+
+    :param int shard_commits:
+        Number of commits per shard
+
+    :raises TrufflehogApiError:
+        if git fails
+
+    :return: the shards, empty if the repository is searched as a whole
+    """
+    request = job.request
+    repo_config = request.repo_config or RepoConfig()
+    search_config = request.search_config or SearchConfig()
+    refs = list(git_log.resolve_refs(job.repo_path, repo_config.branch).items())
+    slices = git_log.split_walk(job.repo_path, refs, shard_commits,
+                                repo_config=repo_config, max_depth=search_config.max_depth)
+    if len(slices) < 2:
+        return []
+    shards = []
+    for number, (position, end_position) in enumerate(slices):
+        shard = PipelineJob(job.index, request, None, job.host)
+        shard.repo_path = job.repo_path
+        shard.cost = job.cost
+        shard.parent = job
+        shard.shard_number = number
+        shard.walk_slice = (refs, position, end_position)
+        shards.append(shard)
+    job.shard_results = [None] * len(shards)
+    job.remaining = len(shards)
+    return shards
+
+
+def shard_done(shard: PipelineJob, secrets: Optional[List[Secret]] = None,
+               error: TrufflehogApiError = None, busy: float = 0.0) -> bool:
+    """Records the outcome of a shard in the job it belongs to. The first error fails
+    the job
+
+    :param PipelineJob shard:
+        The shard
+
+    :param list secrets:
+        Secrets found in the shard's slice (default is None, it was not searched)
+
+    :param TrufflehogApiError error:
+        Error of the shard's search, if any
+
+    :param float busy:
+        Seconds spent searching the shard
+
+    :return: True if it was the last shard of the job to finish
+    """
+    parent = shard.parent
+    with parent.lock:
+        parent.busy += busy
+        parent.shard_results[shard.shard_number] = secrets
+        parent.remaining -= 1
+        if error is not None and not parent.future.done():
+            parent.future.set_exception(error)
+        return parent.remaining == 0
+
+
+def shard_secrets(job: PipelineJob) -> Sequence[Secret]:
+    """
+    :param PipelineJob job:
+        A job whose shards all finished
+
+    :return: the secrets of every shard in walk order, spilled to disk after the
+    request's max_findings_in_memory
+    """
+    search_config = job.request.search_config or SearchConfig()
+    return collect_secrets(itertools.chain.from_iterable(job.shard_results),
+                           search_config.max_findings_in_memory)
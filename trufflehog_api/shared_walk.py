@@ -0,0 +1,183 @@
+"""
+Searches one repository for several requests with a single walk of its
+history. Batches often hold requests for the same repository that only differ
+in their SearchConfig or branch; instead of cloning and diffing the history
+once per request, the diffs of the union of the commits they need are produced
+once and every request's Scanner runs over them. Each request only sees the
+hunks of the commits its own walk would have visited, named after the same
+branch, so the findings are the same as those of separate searches.
+
+In a ScanPipeline the jobs of such requests taken in together are replaced by
+one job searching for all of them, see group_jobs.
+"""
+import os
+from collections import defaultdict
+from typing import List, Optional, Sequence, Tuple
+
+from trufflehog_api import git_log
+from trufflehog_api.repository import FindSecretsRequest, is_local_repository
+from trufflehog_api.memory import SecretSpool
+from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.scanner import Scanner
+from trufflehog_api.search_config import GIT_LOG_BACKEND, SearchConfig
+from trufflehog_api.secret import Secret
+from trufflehog_api.shards import PipelineJob
+
+
+def shared_walk_key(request: FindSecretsRequest) -> Optional[Tuple]:
+    """Requests with the same key can be searched together by search_shared
+
+    :param FindSecretsRequest request:
+        Request to group
+
+    :return: the key, None if the request cannot share a walk (e.g. because it uses
+    the "truffleHog" scan backend)
+    """
+    repo_config = request.repo_config or RepoConfig()
+    search_config = request.search_config or SearchConfig()
+    if search_config.scan_backend != GIT_LOG_BACKEND:
+        return None
+    path = request.path
+    if is_local_repository(path):
+        path = os.path.abspath(path)
+    return (path, repo_config.access_token_env_key, search_config.max_hunk_bytes,
+            tuple(sorted(repo_config.traversal_options().items())))
+
+
+def search_shared(repo_path: str,
+                  repo_configs: List[RepoConfig],
+                  search_configs: List[SearchConfig]) -> List[Sequence[Secret]]:
+    """Searches a local repository for several requests with one walk of its history
+
+    :param str repo_path:
+        Path to the local git repository or clone
+
+    :param list repo_configs:
+        RepoConfig of every request, all with the same traversal options
+
+    :param list search_configs:
+        SearchConfig of every request, all with the same max_hunk_bytes and the
+        "git_log" scan backend
+
+    :raises TrufflehogApiError:
+        if git exits with an error or a SearchConfig cannot be compiled
+
+    :return: the secrets of every request, in the order of the configs
+    """
+    scanners = [Scanner(search_config) for search_config in search_configs]
+    results = [SecretSpool(search_config.max_findings_in_memory)
+               if search_config.max_findings_in_memory is not None else []
+               for search_config in search_configs]
+    walks = [(repo_config.branch, repo_config.since_commit, search_config.max_depth)
+             for repo_config, search_config in zip(repo_configs, search_configs)]
+
+    def path_filter(path):
+        return any(scanner.path_included(path) for scanner in scanners)
+
+    if len(set(walks)) == 1:
+        # Every request walks the same commits
+        hunks = git_log.iter_diff_hunks(repo_path, repo_configs[0],
+                                        max_depth=search_configs[0].max_depth,
+                                        path_filter=path_filter,
+                                        max_hunk_bytes=search_configs[0].max_hunk_bytes)
+        for hunk in hunks:
+            for scanner, secrets in zip(scanners, results):
+                if scanner.path_included(hunk.path):
+                    secrets.extend(scanner.scan_hunk(hunk))
+        return results
+
+    # Walk the union of the requests' refs and hand every hunk to the requests whose
+    # own walk visits its commit, under the branch that walk reaches it from
+    ref_lists = [git_log.list_branches(repo_path, repo_config.branch)
+                 for repo_config in repo_configs]
+    union_refs = []
+    for refs in ref_lists:
+        union_refs.extend(ref for ref in refs if ref not in union_refs)
+    since_commits = {since_commit for _, since_commit, _ in walks}
+    since_commit = since_commits.pop() if len(since_commits) == 1 else None
+    max_depth = None
+    if all(refs == ref_lists[0] for refs in ref_lists):
+        # Depth limited walks of the same refs are prefixes of the deepest one
+        depths = [depth for _, _, depth in walks]
+        max_depth = max(depths) if all(depths) else None
+    options = git_log.traversal_arguments(repo_configs[0])
+    commit_branches = [git_log.walk_commits(repo_path, refs, repo_config.since_commit,
+                                            search_config.max_depth, options,
+                                            repo_configs[0].paths)
+                       for refs, repo_config, search_config
+                       in zip(ref_lists, repo_configs, search_configs)]
+
+    union_config = RepoConfig(since_commit=since_commit,
+                              **repo_configs[0].traversal_options())
+    hunks = git_log.iter_diff_hunks(repo_path, union_config,
+                                    max_depth=max_depth, path_filter=path_filter,
+                                    refs=[(ref, ref) for ref in union_refs],
+                                    max_hunk_bytes=search_configs[0].max_hunk_bytes)
+    for hunk in hunks:
+        for scanner, secrets, branches in zip(scanners, results, commit_branches):
+            branch_name = branches.get(hunk.commit.hexsha)
+            if branch_name is None or not scanner.path_included(hunk.path):
+                continue
+            if branch_name == hunk.commit.branch_name:
+                secrets.extend(scanner.scan_hunk(hunk))
+            else:
+                secrets.extend(scanner.scan_hunk(
+                    hunk._replace(commit=hunk.commit._replace(branch_name=branch_name))))
+    return results
+
+
+def group_jobs(jobs: List[PipelineJob]) -> List[PipelineJob]:
+    """Replaces the jobs that can share a walk of the same repository with one job
+    searching for all of them, whose result is the list of every member's secrets
+
+    :param list jobs:
+        PipelineJob objects of a batch
+
+    :return: the jobs to run, in the order of the requests
+    """
+    import concurrent.futures
+    groups = defaultdict(list)
+    grouped = []
+    for job in jobs:
+        key = shared_walk_key(job.request)
+        if key is None:
+            grouped.append(job)
+        else:
+            groups[key].append(job)
+    for members in groups.values():
+        if len(members) == 1:
+            grouped.extend(members)
+            continue
+        first = members[0]
+        group = PipelineJob(first.index, first.request, concurrent.futures.Future(),
+                            first.host)
+        group.members = members
+        group.cost = max(member.cost for member in members)
+        group.size = first.size
+        group.future.add_done_callback(
+            lambda future, group=group: demultiplex(group, future))
+        grouped.append(group)
+    grouped.sort(key=lambda job: job.index)
+    return grouped
+
+
+def demultiplex(group: PipelineJob, future):
+    """Completes the futures of the members of a shared walk from the future of the job
+    searching for them
+
+    :param PipelineJob group:
+        Job made by group_jobs
+
+    :param future:
+        The job's finished future
+    """
+    if future.cancelled():
+        for member in group.members:
+            member.future.cancel()
+    elif future.exception() is not None:
+        for member in group.members:
+            if not member.future.done():
+                member.future.set_exception(future.exception())
+    else:
+        for member, secrets in zip(group.members, future.result()):
+            member.future.set_result(secrets)
@@ -0,0 +1,401 @@
+"""
+Quick risk triage of repositories before a full scan. Instead of walking the
+whole history, a triage searches the tree at the head of the repository, its
+most recent commits (the first max_depth commits of every branch walk) and a
+seeded random sample of the older ones, within an optional time budget. The
+findings of the sample are extrapolated to an estimated finding count and cost
+of a full scan, so a fleet of repositories can be ranked and the riskiest
+scanned first.
+"""
+import random
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from trufflehog_api import git_log
+from trufflehog_api.error import TrufflehogApiError
+from trufflehog_api.repo_config import RepoConfig
+from trufflehog_api.repository import FindSecretsRequest, RepositoryCheckout
+from trufflehog_api.scanner import Scanner
+from trufflehog_api.scratch import ScratchSpace
+from trufflehog_api.search_config import GIT_LOG_BACKEND, SearchConfig
+from trufflehog_api.secret import Secret
+
+
+class TriageResult:
+    """Findings of a sampled search and the full scan they extrapolate to
+    """
+
+    def __init__(self, *,
+                 path: str,
+                 secrets: List[Secret],
+                 snapshot_secrets: List[Secret],
+                 commits_total: int,
+                 recent_commits: int,
+                 sampled_commits: int,
+                 history_findings: int,
+                 history_seconds: float,
+                 elapsed_seconds: float,
+                 budget_exhausted: bool):
+        """Creates a new TriageResult, see triage_find_secrets
+
+        :param str path:
+            Path or URL of the repository
+
+        :param list secrets:
+            Secrets found in the recent and sampled commits
+
+        :param list snapshot_secrets:
+            Secrets found in the files at the head of the repository
+
+        :param int commits_total:
+            Number of commits a full scan would walk
+
+        :param int recent_commits:
+            Number of recent commits searched
+
+        :param int sampled_commits:
+            Number of older commits searched, out of commits_total - recent_commits
+
+        :param int history_findings:
+            Number of secrets found in the sampled older commits
+
+        :param float history_seconds:
+            Time spent searching the recent and sampled commits
+
+        :param float elapsed_seconds:
+            Time the whole triage took
+
+        :param bool budget_exhausted:
+            True if the time budget ran out before every phase finished
+        """
+        self._path: str = path
+        self._secrets: List[Secret] = secrets
+        self._snapshot_secrets: List[Secret] = snapshot_secrets
+        self._commits_total: int = commits_total
+        self._recent_commits: int = recent_commits
+        self._sampled_commits: int = sampled_commits
+        self._history_findings: int = history_findings
+        self._history_seconds: float = history_seconds
+        self._elapsed_seconds: float = elapsed_seconds
+        self._budget_exhausted: bool = budget_exhausted
+
+    @property
+    def path(self) -> str:
+        """
+        :return: Path or URL of the repository
+        """
+        return self._path
+
+    @property
+    def secrets(self) -> List[Secret]:
+        """
+        :return: Secrets found in the recent and sampled commits
+        """
+        return self._secrets
+
+    @property
+    def snapshot_secrets(self) -> List[Secret]:
+        """
+        :return: Secrets found in the files at the head of the repository
+        """
+        return self._snapshot_secrets
+
+    @property
+    def commits_total(self) -> int:
+        """
+        :return: Number of commits a full scan would walk
+        """
+        return self._commits_total
+
+    @property
+    def commits_scanned(self) -> int:
+        """
+        :return: Number of recent and sampled commits searched
+        """
+        return self._recent_commits + self._sampled_commits
+
+    @property
+    def budget_exhausted(self) -> bool:
+        """
+        :return: True if the time budget ran out before the triage finished
+        """
+        return self._budget_exhausted
+
+    @property
+    def elapsed_seconds(self) -> float:
+        """
+        :return: Time the triage took
+        """
+        return self._elapsed_seconds
+
+    @property
+    def estimated_findings(self) -> float:
+        """
+        :return: Estimated number of secrets a full scan would report: those of the
+        recent commits plus those of the sample, scaled to all older commits
+        """
+        recent_findings = len(self._secrets) - self._history_findings
+        older_commits = self._commits_total - self._recent_commits
+        if self._sampled_commits:
+            rate = self._history_findings / self._sampled_commits
+        elif self._recent_commits:
+            rate = recent_findings / self._recent_commits
+        else:
+            rate = 0.0
+        return recent_findings + rate * older_commits
+
+    @property
+    def estimated_seconds(self) -> Optional[float]:
+        """
+        :return: Estimated time of a full search of the history at the rate the
+        sampled commits were searched, None if no commit was searched
+        """
+        if not self.commits_scanned:
+            return None
+        return self._history_seconds / self.commits_scanned * self._commits_total
+
+    def to_dict(self):
+        """
+        :return: A dict with the TriageResult's counts and estimates, without the secrets
+        """
+        return {"path": self._path,
+                "findings": len(self._secrets),
+                "snapshot_findings": len(self._snapshot_secrets),
+                "commits_total": self._commits_total,
+                "recent_commits": self._recent_commits,
+                "sampled_commits": self._sampled_commits,
+                "estimated_findings": self.estimated_findings,
+                "estimated_seconds": self.estimated_seconds,
+                "elapsed_seconds": self._elapsed_seconds,
+                "budget_exhausted": self._budget_exhausted}
+
+    def __repr__(self):
+        """
+        :return: A string listing the TriageResult's counts and estimates
+        """
+        return ('TriageResult(path={0}, findings={1}, snapshot_findings={2}, '
+                'commits_scanned={3}/{4}, estimated_findings={5:.1f})'
+                .format(self._path, len(self._secrets), len(self._snapshot_secrets),
+                        self.commits_scanned, self._commits_total, self.estimated_findings))
+
+
+def triage_find_secrets(path: str,
+                        repo_config: RepoConfig = None,
+                        search_config: SearchConfig = None,
+                        recent_commits: int = 20,
+                        sampled_commits: int = 50,
+                        seed: int = 0,
+                        time_budget: float = None,
+                        snapshot: bool = True,
+                        scratch_space: ScratchSpace = None) -> TriageResult:
+    """Searches a sample of a repository's history for a quick estimate of its risk, see
+    execute_triage_request
+
+    :param str path:
+        Path or URL of the git repository
+
+    :param RepoConfig repo_config:
+        Repository options, as for find_secrets (default is None, the defaults)
+
+    :param SearchConfig search_config:
+        Checks to run, as for find_secrets (default is None, the defaults)
+
+    The further options are those of execute_triage_request
+
+    :raises TrufflehogApiError:
+        wraps an exception that occurred while cloning or searching the repository
+
+    :return: the findings and estimates
+    """
+    return execute_triage_request(FindSecretsRequest(path, repo_config, search_config),
+                                  recent_commits, sampled_commits, seed, time_budget, snapshot,
+                                  scratch_space)
+
+
+def execute_triage_request(request: FindSecretsRequest,
+                           recent_commits: int = 20,
+                           sampled_commits: int = 50,
+                           seed: int = 0,
+                           time_budget: float = None,
+                           snapshot: bool = True,
+                           scratch_space: ScratchSpace = None) -> TriageResult:
+    """Searches a sample of a repository's history for a quick estimate of its risk
+
+    :param FindSecretsRequest request:
+        The repository and its options, as for execute_find_secrets_request. The
+        max_depth of its SearchConfig bounds the history a full scan would walk. The
+        "git_log" scan backend is always used
+
+    :param int recent_commits:
+        Most recent commits of every branch walk searched in full, passed to the walk as
+        its max_depth (default is 20)
+
+    :param int sampled_commits:
+        Number of older commits picked at random (default is 50)
+
+    :param int seed:
+        Seed of the random sample, the same seed picks the same commits of the same
+        history (default is 0)
+
+    :param float time_budget:
+        Seconds after which the triage stops and extrapolates from what it searched
+        (default is None, no limit)
+
+    :param bool snapshot:
+        If True, first search every file at the head of the searched branch (or HEAD),
+        the secrets that are still present (default is True)
+
+    :param ScratchSpace scratch_space:
+        Where a remote repository is cloned, see iter_find_secrets_request
+
+    :raises TrufflehogApiError:
+        wraps an exception that occurred while cloning or searching the repository
+
+    :return: the findings and estimates
+    """
+    repo_config = request.repo_config or RepoConfig()
+    search_config = request.search_config or SearchConfig()
+    if search_config.scan_backend != GIT_LOG_BACKEND:
+        warnings.warn("Warning: triage is only supported by the git_log scan backend - "
+                      "it will be used instead")
+
+    with RepositoryCheckout(request, scratch_space) as repo_path:
+        return _triage_repository(repo_path, request.path, repo_config, search_config,
+                                  recent_commits, sampled_commits, seed, time_budget, snapshot)
+
+
+def batch_triage_requests(requests: Iterable[FindSecretsRequest],
+                          concurrency_level: int = 4,
+                          **triage_options) -> List[Tuple[FindSecretsRequest, TriageResult]]:
+    """Triages many requests concurrently, e.g. to order a fleet before a full sweep
+
+    :param requests:
+        Requests to triage
+
+    :param int concurrency_level:
+        Number of repositories triaged at once (default is 4)
+
+    :param triage_options:
+        Further keyword arguments of execute_triage_request, e.g. time_budget
+
+    :return: (request, result) pairs in the order of the requests, the result is None
+    for a request whose triage failed
+    """
+    def triage(request):
+        try:
+            return execute_triage_request(request, **triage_options)
+        except TrufflehogApiError as e:
+            warnings.warn("Warning: triage of {0} failed: {1}".format(request.path, e))
+            return None
+
+    requests = list(requests)
+    with ThreadPoolExecutor(max_workers=concurrency_level) as executor:
+        return list(zip(requests, executor.map(triage, requests)))
+
+
+def order_by_risk(triaged: Iterable[Tuple[FindSecretsRequest, Optional[TriageResult]]]
+                  ) -> List[FindSecretsRequest]:
+    """Orders requests for full scans by their triage, the most findings first. Pass
+    the result to a batch without a BatchScheduler, which keeps the list order
+
+    :param triaged:
+        (request, result) pairs, e.g. from batch_triage_requests
+
+    :return: the requests with secrets at the head first, then by estimated findings, the
+    cheapest first among equals, and requests without a triage result last
+    """
+    def key(pair):
+        _, result = pair
+        if result is None:
+            return (1, 0, 0, 0.0)
+        return (0, -len(result.snapshot_secrets), -result.estimated_findings,
+                result.estimated_seconds or 0.0)
+
+    return [request for request, _ in sorted(triaged, key=key)]
+
+
+def _triage_repository(repo_path: str,
+                       origin: str,
+                       repo_config: RepoConfig,
+                       search_config: SearchConfig,
+                       recent_commits: int,
+                       sampled_commits: int,
+                       seed: int,
+                       time_budget: Optional[float],
+                       snapshot: bool) -> TriageResult:
+    """Runs the phases of triage_find_secrets on a local repository or clone"""
+    start = time.perf_counter()
+
+    def out_of_time():
+        return time_budget is not None and time.perf_counter() - start > time_budget
+
+    try:
+        scanner = Scanner(search_config)
+        refs = git_log.list_branches(repo_path, repo_config.branch)
+        options = git_log.traversal_arguments(repo_config)
+        all_commits = git_log.walk_commits(repo_path, refs, repo_config.since_commit,
+                                           search_config.max_depth, options, repo_config.paths)
+        recent = dict()
+        if recent_commits > 0:
+            depth = min(recent_commits, search_config.max_depth or recent_commits)
+            recent = git_log.walk_commits(repo_path, refs, repo_config.since_commit, depth,
+                                          options, repo_config.paths)
+        older = [hexsha for hexsha in all_commits if hexsha not in recent]
+        chosen = set(random.Random(seed).sample(older, min(sampled_commits, len(older))))
+        # Walk the sample in history order, as a full scan would
+        sample = {hexsha: all_commits[hexsha] for hexsha in older if hexsha in chosen}
+
+        snapshot_secrets = []
+        exhausted = False
+        if snapshot:
+            ref = refs[0] if repo_config.branch and refs else 'HEAD'
+            hunks = git_log.iter_snapshot_hunks(repo_path, ref, repo_config,
+                                                path_filter=scanner.path_included,
+                                                max_hunk_bytes=search_config.max_hunk_bytes)
+            exhausted = _scan_within(scanner, hunks, snapshot_secrets, out_of_time)
+
+        # Secrets and commits searched of the recent commits and of the sample
+        phase_secrets = ([], [])
+        phase_commits = [0, 0]
+        history_start = time.perf_counter()
+        for phase, commits in enumerate((recent, sample)):
+            if exhausted or not commits:
+                continue
+
+            def on_commit(_commit, phase=phase):
+                phase_commits[phase] += 1
+
+            hunks = git_log.iter_commit_hunks(repo_path, commits, repo_config,
+                                              path_filter=scanner.path_included,
+                                              on_commit=on_commit,
+                                              max_hunk_bytes=search_config.max_hunk_bytes)
+            exhausted = _scan_within(scanner, hunks, phase_secrets[phase], out_of_time)
+        history_seconds = time.perf_counter() - history_start
+    except TrufflehogApiError:
+        raise
+    except Exception as e:
+        raise TrufflehogApiError(e)
+
+    return TriageResult(path=origin, secrets=phase_secrets[0] + phase_secrets[1],
+                        snapshot_secrets=snapshot_secrets, commits_total=len(all_commits),
+                        recent_commits=phase_commits[0], sampled_commits=phase_commits[1],
+                        history_findings=len(phase_secrets[1]),
+                        history_seconds=history_seconds,
+                        elapsed_seconds=time.perf_counter() - start,
+                        budget_exhausted=exhausted)
+
+
+def _scan_within(scanner: Scanner, hunks: Iterator[git_log.DiffHunk], secrets: List[Secret],
+                 out_of_time) -> bool:
+    """Scans hunks into secrets until out_of_time returns True
+
+    :return: True if the scan was cut short
+    """
+    for hunk in hunks:
+        if out_of_time():
+            hunks.close()
+            return True
+        secrets.extend(scanner.scan_hunk(hunk))
+    return False